@@ -0,0 +1,93 @@
+"""
+Authenticated Principal Cache
+Short-TTL, process-level cache of user documents for the auth dependencies,
+so authenticated requests don't re-read the user from MongoDB on every call
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class PrincipalCache:
+    """
+    LRU + TTL cache of user documents keyed by user id.
+
+    Entries are copied on the way in and out so handlers can mutate the dict
+    they receive. Writers to db.users call ``invalidate(user_id)``; other
+    workers pick up the change once the (short) TTL lapses.
+    """
+
+    def __init__(self, ttl_seconds: float = 15.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'invalidations': 0,
+            'evictions': 0,
+        }
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached user, or None on miss/expiry"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+
+        user, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[user_id]
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.stats['hits'] += 1
+        return dict(user)
+
+    def set(self, user_id: str, user: Dict[str, Any]):
+        """Cache a user document (without the Mongo _id)"""
+        cached = {k: v for k, v in user.items() if k != "_id"}
+        self._entries[user_id] = (cached, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(user_id)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, user_id: str):
+        """Drop a user after their document has been written"""
+        if self._entries.pop(user_id, None) is not None:
+            self.stats['invalidations'] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hit_ratio': round(self.stats['hits'] / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
+
+
+# Global principal cache instance
+principal_cache = PrincipalCache(
+    ttl_seconds=float(os.environ.get('AUTH_PRINCIPAL_CACHE_TTL', '15')),
+    max_entries=int(os.environ.get('AUTH_PRINCIPAL_CACHE_SIZE', '10000'))
+)
+
+# Export for use in other modules
+__all__ = ['PrincipalCache', 'principal_cache']
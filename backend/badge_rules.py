@@ -0,0 +1,126 @@
+"""
+Badge Rule Index
+Maps gamification events to the badge rules they can affect, so badge checks
+only evaluate rules an event could unlock, against counters kept on the user
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# requirement_type -> events that can move it. Events with no rules here
+# (e.g. "friend_invited" until a friend badge exists) cost no badge queries.
+REQUIREMENT_TRIGGERS = {
+    "amount_saved": ("income_created",),
+    "streak_days": ("streak_updated",),
+    "goals_completed": ("goal_completed",),
+    "hustles_completed": ("hustle_completed",),
+    "achievements_shared": ("achievement_shared",),
+    "campus_rank": ("streak_updated",),  # at most once a day per user
+    "budget_streak": ("budget_created", "expense_created"),
+}
+
+# requirement_type -> materialized counter on the user document
+COUNTER_FIELDS = {
+    "amount_saved": "net_savings",
+    "streak_days": "current_streak",
+    "goals_completed": "goals_completed",
+    "hustles_completed": "hustles_completed",
+    "achievements_shared": "achievements_shared",
+}
+
+# Fields check_and_award_badges() needs from the user document
+USER_PROJECTION = {
+    "_id": 1, "id": 1, "university": 1, "experience_points": 1, "total_earnings": 1, "badge_ids": 1,
+    **{field: 1 for field in COUNTER_FIELDS.values()}
+}
+
+
+class BadgeRuleIndex:
+    """
+    Active badge definitions grouped by triggering event. Definitions change
+    only when badges are seeded, so they are loaded once per ``ttl`` per
+    worker and ``invalidate()`` forces a reload after a write.
+
+    It also remembers (LRU, per worker) the badge ids each recently checked
+    user holds. Badges are never revoked, so a remembered set can only lag
+    behind the user's real one: when it already covers every rule of an
+    event, the event is skipped without reading the user.
+    """
+
+    def __init__(self, ttl: int = 300, max_users: int = 50000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._by_event: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._loaded_at = 0.0
+        self._earned: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+        self.stats = {'loads': 0, 'lookups': 0, 'skipped_events': 0, 'fully_earned_skips': 0}
+
+    async def _load(self, db):
+        badges = await db.badges.find({"is_active": True}).to_list(None)
+        by_event: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for badge in badges:
+            triggers = REQUIREMENT_TRIGGERS.get(badge.get("requirement_type"))
+            if not triggers:
+                logger.warning(f"Badge {badge.get('name')} has no trigger for {badge.get('requirement_type')}")
+                continue
+            for event_type in triggers:
+                by_event[event_type].append(badge)
+
+        self._by_event = dict(by_event)
+        self._loaded_at = time.monotonic()
+        self.stats['loads'] += 1
+        logger.info(f"🏅 Badge rule index loaded: {len(badges)} badges over {len(self._by_event)} events")
+
+    async def rules_for(self, db, event_type: str) -> List[Dict[str, Any]]:
+        """Active badges an event of ``event_type`` could unlock"""
+        if self._by_event is None or time.monotonic() - self._loaded_at >= self.ttl:
+            await self._load(db)
+        self.stats['lookups'] += 1
+        rules = self._by_event.get(event_type, [])
+        if not rules:
+            self.stats['skipped_events'] += 1
+        return rules
+
+    def invalidate(self):
+        self._by_event = None
+
+    def all_earned(self, user_id: str, rules: List[Dict[str, Any]]) -> bool:
+        """Whether the user is known to hold every badge in ``rules``"""
+        earned = self._earned.get(user_id)
+        if earned is None:
+            return False
+        self._earned.move_to_end(user_id)
+        if all(str(badge["_id"]) in earned for badge in rules):
+            self.stats['fully_earned_skips'] += 1
+            return True
+        return False
+
+    def remember_earned(self, user_id: str, badge_ids: Iterable[str]):
+        """Record badge ids the user holds (merged with what is already known)"""
+        self._earned[user_id] = self._earned.get(user_id, frozenset()) | frozenset(badge_ids)
+        self._earned.move_to_end(user_id)
+        while len(self._earned) > self.max_users:
+            self._earned.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'known_users': len(self._earned),
+            'events': {event: len(rules) for event, rules in (self._by_event or {}).items()},
+        }
+
+
+# Global badge rule index instance
+badge_rules = BadgeRuleIndex(
+    ttl=int(os.environ.get('BADGE_RULES_TTL', '300')),
+    max_users=int(os.environ.get('BADGE_EARNED_CACHE_SIZE', '50000'))
+)
+
+# Export for use in other modules
+__all__ = ['BadgeRuleIndex', 'badge_rules', 'REQUIREMENT_TRIGGERS', 'COUNTER_FIELDS', 'USER_PROJECTION']
@@ -4,7 +4,6 @@ Implements intelligent caching strategies to reduce OpenStreetMap API calls
 and ensure 24/7 availability for emergency hospital recommendations.
 """
 
-import redis
 import json
 import hashlib
 import logging
@@ -13,13 +12,20 @@ from datetime import datetime, timedelta
 import os
 import asyncio
 
+from redis_pool import redis_manager
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
 class HospitalCacheService:
+    REDIS_DB = 0
+
+    # Tag sets tracking hospital keys (replaces KEYS scans for stats/cleanup)
+    HOSPITAL_KEYS_TAG = "tag:hospitals"
+    LOCATION_KEYS_TAG = "tag:location_hospitals"
+
     def __init__(self):
-        """Initialize Redis connection with fallback configurations"""
-        self.redis_client = None
+        """Initialize cache configuration; Redis is connected lazily from the shared pool"""
         self.connected = False
         self.cache_enabled = True
         
@@ -27,52 +33,18 @@ class HospitalCacheService:
         self.DEFAULT_TTL = 24 * 60 * 60  # 24 hours for hospital data
         self.LOCATION_TTL = 12 * 60 * 60  # 12 hours for location-specific cache
         self.API_RATE_LIMIT_TTL = 10 * 60  # 10 minutes for API rate limit tracking
-        
-        # Initialize connection
-        self._initialize_connection()
     
-    def _initialize_connection(self):
-        """Initialize Redis connection with multiple fallback options"""
-        try:
-            # Try different Redis connection options
-            redis_configs = [
-                {"host": "localhost", "port": 6379, "db": 0},
-                {"host": "127.0.0.1", "port": 6379, "db": 0},
-                {"host": "redis", "port": 6379, "db": 0},  # Docker container name
-            ]
-            
-            for config in redis_configs:
-                try:
-                    # Use redis-py for both sync and async operations
-                    self.redis_client = redis.Redis(
-                        host=config["host"],
-                        port=config["port"],
-                        db=config["db"],
-                        socket_timeout=5,
-                        socket_connect_timeout=5,
-                        retry_on_timeout=True,
-                        decode_responses=True
-                    )
-                    
-                    # Test connection
-                    self.redis_client.ping()
-                    self.connected = True
-                    logger.info(f"✅ Redis connected successfully on {config['host']}:{config['port']}")
-                    return
-                    
-                except Exception as e:
-                    logger.warning(f"Failed to connect to Redis at {config['host']}:{config['port']}: {str(e)}")
-                    continue
-            
-            # If no connection successful, disable caching
-            logger.warning("❌ Redis connection failed - running without cache (degraded mode)")
-            self.cache_enabled = False
-            self.connected = False
-            
-        except Exception as e:
-            logger.error(f"Redis initialization error: {str(e)}")
-            self.cache_enabled = False
-            self.connected = False
+    async def _get_redis(self):
+        """Get the shared async Redis client (None means degraded, cache-less mode)"""
+        if not self.cache_enabled:
+            return None
+        client = await redis_manager.get_client(db=self.REDIS_DB, decode_responses=True)
+        self.connected = client is not None
+        return client
+
+    def _on_redis_error(self, operation: str, error: Exception):
+        logger.error(f"Cache {operation} error: {str(error)}")
+        redis_manager.report_error(error, db=self.REDIS_DB, decode_responses=True)
 
     def _generate_cache_key(self, latitude: float, longitude: float, 
                           emergency_type: str, radius: int = 25) -> str:
@@ -96,25 +68,25 @@ class HospitalCacheService:
     async def get_cached_hospitals(self, latitude: float, longitude: float, 
                                  emergency_type: str, radius: int = 25) -> Optional[List[Dict]]:
         """Retrieve cached hospital data"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return None
             
         try:
-            # Try emergency-type specific cache first
+            # Emergency-type specific cache first, general location cache as fallback,
+            # both fetched in a single round trip
             specific_key = self._generate_cache_key(latitude, longitude, emergency_type, radius)
-            cached_data = self.redis_client.get(specific_key)
+            location_key = self._generate_location_key(latitude, longitude, radius)
+            async with redis_manager.measure("mget"):
+                specific_data, location_data = await redis_client.mget(specific_key, location_key)
             
-            if cached_data:
-                hospitals = json.loads(cached_data)
+            if specific_data:
+                hospitals = json.loads(specific_data)
                 logger.info(f"✅ Cache HIT: Found {len(hospitals)} hospitals for {emergency_type}")
                 return hospitals
             
-            # Try general location cache as fallback
-            location_key = self._generate_location_key(latitude, longitude, radius)
-            cached_data = self.redis_client.get(location_key)
-            
-            if cached_data:
-                hospitals = json.loads(cached_data)
+            if location_data:
+                hospitals = json.loads(location_data)
                 logger.info(f"✅ Cache HIT (fallback): Found {len(hospitals)} hospitals for location")
                 return hospitals
                 
@@ -122,48 +94,49 @@ class HospitalCacheService:
             return None
             
         except Exception as e:
-            logger.error(f"Cache retrieval error: {str(e)}")
+            self._on_redis_error("retrieval", e)
             return None
 
     async def cache_hospitals(self, latitude: float, longitude: float, 
                             emergency_type: str, hospitals: List[Dict], 
                             radius: int = 25) -> bool:
         """Store hospital data in cache with intelligent TTL"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return False
             
         try:
-            # Cache emergency-type specific data
             specific_key = self._generate_cache_key(latitude, longitude, emergency_type, radius)
-            self.redis_client.setex(
-                specific_key, 
-                self.DEFAULT_TTL, 
-                json.dumps(hospitals, default=str)
-            )
-            
-            # Also cache general location data (broader cache)
             location_key = self._generate_location_key(latitude, longitude, radius)
-            self.redis_client.setex(
-                location_key, 
-                self.LOCATION_TTL, 
-                json.dumps(hospitals, default=str)
-            )
+            payload = json.dumps(hospitals, default=str)
+            
+            # Emergency-type specific data, broader location data and tag
+            # membership are written in one pipelined round trip
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.setex(specific_key, self.DEFAULT_TTL, payload)
+            pipe.setex(location_key, self.LOCATION_TTL, payload)
+            pipe.sadd(self.HOSPITAL_KEYS_TAG, specific_key)
+            pipe.sadd(self.LOCATION_KEYS_TAG, location_key)
+            async with redis_manager.measure("pipeline_cache_hospitals"):
+                await pipe.execute()
             
             logger.info(f"✅ Cached {len(hospitals)} hospitals for {emergency_type} (TTL: {self.DEFAULT_TTL}s)")
             return True
             
         except Exception as e:
-            logger.error(f"Cache storage error: {str(e)}")
+            self._on_redis_error("storage", e)
             return False
 
     async def check_api_rate_limit(self, api_endpoint: str = "overpass") -> Tuple[bool, int]:
         """Check if API calls are within rate limits"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return True, 0  # Allow calls if cache not available
             
         try:
             rate_key = f"api_rate_limit:{api_endpoint}"
-            current_calls = self.redis_client.get(rate_key)
+            async with redis_manager.measure("get"):
+                current_calls = await redis_client.get(rate_key)
             
             if current_calls is None:
                 current_calls = 0
@@ -178,116 +151,130 @@ class HospitalCacheService:
             return True, current_calls
             
         except Exception as e:
-            logger.error(f"Rate limit check error: {str(e)}")
+            self._on_redis_error("rate limit check", e)
             return True, 0  # Allow on error
 
     async def increment_api_calls(self, api_endpoint: str = "overpass") -> int:
         """Increment API call counter"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return 0
             
         try:
             rate_key = f"api_rate_limit:{api_endpoint}"
             
-            # Increment counter with expiry
-            current = self.redis_client.incr(rate_key)
-            if current == 1:  # First call, set expiry
-                self.redis_client.expire(rate_key, self.API_RATE_LIMIT_TTL)
+            # Create the window with its expiry (no-op if it exists), then increment
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(rate_key, 0, ex=self.API_RATE_LIMIT_TTL, nx=True)
+            pipe.incr(rate_key)
+            async with redis_manager.measure("pipeline_incr"):
+                _, current = await pipe.execute()
             
             logger.info(f"📊 API calls for {api_endpoint}: {current}")
             return current
             
         except Exception as e:
-            logger.error(f"API counter increment error: {str(e)}")
+            self._on_redis_error("API counter increment", e)
             return 0
 
     async def get_popular_locations_cache(self) -> List[Dict]:
         """Get cached data for popular/frequently searched locations"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return []
             
         try:
             popular_key = "popular_locations:hospitals"
-            cached_data = self.redis_client.get(popular_key)
+            async with redis_manager.measure("get"):
+                cached_data = await redis_client.get(popular_key)
             
             if cached_data:
                 return json.loads(cached_data)
             return []
             
         except Exception as e:
-            logger.error(f"Popular locations cache error: {str(e)}")
+            self._on_redis_error("popular locations", e)
             return []
 
     async def cache_popular_location(self, city: str, hospitals: List[Dict]) -> bool:
         """Cache hospital data for popular cities"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return False
             
         try:
             popular_key = f"popular_city:{city.lower().replace(' ', '_')}"
-            self.redis_client.setex(
-                popular_key, 
-                self.DEFAULT_TTL * 2,  # Longer TTL for popular locations
-                json.dumps(hospitals, default=str)
-            )
+            async with redis_manager.measure("setex"):
+                await redis_client.setex(
+                    popular_key, 
+                    self.DEFAULT_TTL * 2,  # Longer TTL for popular locations
+                    json.dumps(hospitals, default=str)
+                )
             
             logger.info(f"✅ Cached popular location data for {city}")
             return True
             
         except Exception as e:
-            logger.error(f"Popular location cache error: {str(e)}")
+            self._on_redis_error("popular location", e)
             return False
 
     async def get_cache_stats(self) -> Dict:
         """Get cache statistics for monitoring"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return {
                 "status": "disabled",
                 "connected": False,
                 "total_keys": 0,
-                "memory_usage": "N/A"
+                "memory_usage": "N/A",
+                "redis_pool": redis_manager.get_stats()
             }
             
         try:
-            # Get Redis info
-            info = self.redis_client.info()
-            
-            # Count hospital-related keys
-            keys = self.redis_client.keys("hospitals:*")
-            location_keys = self.redis_client.keys("location_hospitals:*")
+            # Redis info plus tag-set cardinalities (O(1), no KEYS scan)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.info()
+            pipe.scard(self.HOSPITAL_KEYS_TAG)
+            pipe.scard(self.LOCATION_KEYS_TAG)
+            async with redis_manager.measure("pipeline_stats"):
+                info, hospital_keys, location_keys = await pipe.execute()
             
             return {
                 "status": "enabled",
                 "connected": self.connected,
-                "total_hospital_keys": len(keys),
-                "total_location_keys": len(location_keys),
+                "total_hospital_keys": hospital_keys,
+                "total_location_keys": location_keys,
                 "memory_usage": info.get('used_memory_human', 'N/A'),
                 "total_commands_processed": info.get('total_commands_processed', 0),
-                "connected_clients": info.get('connected_clients', 0)
+                "connected_clients": info.get('connected_clients', 0),
+                "redis_pool": redis_manager.get_stats()
             }
             
         except Exception as e:
-            logger.error(f"Cache stats error: {str(e)}")
+            self._on_redis_error("stats", e)
             return {"status": "error", "error": str(e)}
 
     async def clear_expired_cache(self) -> int:
-        """Clear expired cache entries (maintenance function)"""
-        if not self.cache_enabled or not self.connected:
+        """Prune tag-set members whose cache entries have expired (maintenance function)"""
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return 0
             
         try:
-            # Redis handles TTL expiry automatically, but we can manually clean if needed
+            # Redis expires the values itself; only the tag sets need pruning
             deleted_count = 0
             
-            # Get all hospital cache keys
-            keys = self.redis_client.keys("hospitals:*")
-            keys.extend(self.redis_client.keys("location_hospitals:*"))
-            
-            for key in keys:
-                ttl = self.redis_client.ttl(key)
-                if ttl == -2:  # Key expired
-                    self.redis_client.delete(key)
-                    deleted_count += 1
+            for tag in (self.HOSPITAL_KEYS_TAG, self.LOCATION_KEYS_TAG):
+                async for batch in self._iter_tag_batches(redis_client, tag):
+                    pipe = redis_client.pipeline(transaction=False)
+                    for key in batch:
+                        pipe.exists(key)
+                    exists = await pipe.execute()
+                    
+                    expired = [key for key, present in zip(batch, exists) if not present]
+                    if expired:
+                        await redis_client.srem(tag, *expired)
+                        deleted_count += len(expired)
             
             if deleted_count > 0:
                 logger.info(f"🧹 Cleaned {deleted_count} expired cache entries")
@@ -295,12 +282,24 @@ class HospitalCacheService:
             return deleted_count
             
         except Exception as e:
-            logger.error(f"Cache cleanup error: {str(e)}")
+            self._on_redis_error("cleanup", e)
             return 0
 
+    async def _iter_tag_batches(self, redis_client, tag: str, batch_size: int = 500):
+        """Yield tag-set members in batches using SSCAN"""
+        batch = []
+        async for key in redis_client.sscan_iter(tag, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     async def warm_popular_locations(self):
         """Pre-warm cache with popular Indian cities (background task)"""
-        if not self.cache_enabled or not self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is None:
             return
             
         # Popular Indian cities with coordinates
@@ -319,22 +318,22 @@ class HospitalCacheService:
         
         logger.info("🔄 Starting cache warming for popular cities...")
         
-        for city in popular_cities:
-            try:
-                # Check if already cached
-                cache_key = self._generate_location_key(city["lat"], city["lon"])
-                cached = self.redis_client.get(cache_key)
-                
-                if not cached:
-                    logger.info(f"⏳ Cache warming needed for {city['name']}")
-                    # Note: Actual warming would require calling the hospital fetch function
-                    # This is a placeholder for the warming logic
-                else:
-                    logger.info(f"✅ {city['name']} already cached")
-                    
-            except Exception as e:
-                logger.error(f"Cache warming error for {city['name']}: {str(e)}")
-                continue
+        # Check every city in a single MGET
+        cache_keys = [self._generate_location_key(city["lat"], city["lon"]) for city in popular_cities]
+        try:
+            async with redis_manager.measure("mget"):
+                cached_values = await redis_client.mget(cache_keys)
+        except Exception as e:
+            self._on_redis_error("warming", e)
+            return
+        
+        for city, cached in zip(popular_cities, cached_values):
+            if not cached:
+                logger.info(f"⏳ Cache warming needed for {city['name']}")
+                # Note: Actual warming would require calling the hospital fetch function
+                # This is a placeholder for the warming logic
+            else:
+                logger.info(f"✅ {city['name']} already cached")
 
 # Global cache service instance
 cache_service = HospitalCacheService()
@@ -0,0 +1,138 @@
+"""
+Batched Participant Scoring
+Set-based scoring for prize challenges and inter-college competitions: one
+grouped aggregation per chunk of participants instead of per-user queries
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from financial_rollups import financial_rollups
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+SAVINGS_METRICS = ["amount_saved", "savings_amount", "savings_based"]
+
+
+def resolve_prize_metric(challenge_category: str, target_metric: str) -> Optional[str]:
+    """Map a prize challenge's category/metric onto a scoring kind"""
+    if challenge_category in ["savings", "individual", "savings_based"] or target_metric in SAVINGS_METRICS:
+        return "savings"
+    if challenge_category == "streak" and target_metric == "days_streak":
+        return "streak"
+    if challenge_category == "referrals" and target_metric == "referrals_made":
+        return "referrals"
+    if challenge_category == "goals" and target_metric == "goals_completed":
+        return "goals"
+    if challenge_category == "engagement":
+        return "engagement"
+    return None
+
+
+def resolve_competition_metric(competition_type: str, target_metric: str) -> Optional[str]:
+    """Map a competition's type/metric onto a scoring kind"""
+    if competition_type in ["campus_savings", "savings", "individual", "savings_based"] or \
+            target_metric in ["total_savings"] + SAVINGS_METRICS:
+        return "savings"
+    if competition_type in ["campus_streak", "streak"] and target_metric in ["average_streak", "days_streak"]:
+        return "streak"
+    if competition_type in ["campus_referrals", "referrals"] and target_metric in ["referral_count", "referrals_made"]:
+        return "referrals"
+    if competition_type in ["campus_goals", "goals"] and target_metric in ["goals_completed"]:
+        return "goals"
+    if competition_type == "engagement":
+        return "engagement"
+    return None
+
+
+class ParticipantScorer:
+    """
+    Computes scores for many participants at once.
+
+    Each participant is scored from their own start date (join/registration
+    time). Transaction metrics come from the per-user financial rollups; the
+    others are processed in chunks where participants sharing a start date
+    share one ``$or`` clause, so a chunk costs a single aggregation.
+    """
+
+    def __init__(self, chunk_size: int = 500):
+        self.chunk_size = chunk_size
+
+    async def score(self, db, kind: Optional[str], starts: Dict[str, datetime]) -> Dict[str, float]:
+        """Return {user_id: score} for every user in ``starts`` (0.0 when nothing counts)"""
+        scores = {user_id: 0.0 for user_id in starts}
+        if not starts or kind is None:
+            return scores
+
+        if kind == "savings":
+            totals = await financial_rollups.get_totals_since_many(starts)
+            for user_id, values in totals.items():
+                scores[user_id] = max(0, values["income"] - values["expense"])
+
+        elif kind == "engagement":
+            totals = await financial_rollups.get_totals_since_many(starts)
+            for user_id, values in totals.items():
+                scores[user_id] = float(values["income_count"] + values["expense_count"])
+
+        elif kind == "streak":
+            users = await db.users.find(
+                {"id": {"$in": list(starts)}}, {"_id": 0, "id": 1, "current_streak": 1}
+            ).to_list(None)
+            for user in users:
+                scores[user["id"]] = float(user.get("current_streak", 0))
+
+        elif kind == "referrals":
+            # Only users with a referral program can score
+            referrers = set(await db.referral_programs.distinct("referrer_id", {"referrer_id": {"$in": list(starts)}}))
+            counts = await self._grouped_since(
+                db.referred_users, "referrer_id", "completed_at",
+                {user_id: start for user_id, start in starts.items() if user_id in referrers},
+                {"status": "completed"}
+            )
+            for row in counts:
+                scores[row["_id"]["user_id"]] = float(row["count"])
+
+        elif kind == "goals":
+            counts = await self._grouped_since(
+                db.financial_goals, "user_id", "updated_at", starts, {"is_completed": True}
+            )
+            for row in counts:
+                scores[row["_id"]["user_id"]] = float(row["count"])
+
+        return scores
+
+    async def _grouped_since(self, collection, user_field: str, date_field: str,
+                             starts: Dict[str, datetime], extra_match: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Count documents per user from each user's start date"""
+        group = {"_id": {"user_id": f"${user_field}"}, "count": {"$sum": 1}}
+
+        rows: List[Dict[str, Any]] = []
+        items = list(starts.items())
+        for offset in range(0, len(items), self.chunk_size):
+            users_by_start: Dict[datetime, List[str]] = defaultdict(list)
+            for user_id, start in items[offset:offset + self.chunk_size]:
+                users_by_start[start].append(user_id)
+
+            match = {
+                "$or": [
+                    {user_field: {"$in": user_ids}, date_field: {"$gte": start}}
+                    for start, user_ids in users_by_start.items()
+                ],
+                **extra_match
+            }
+            rows.extend(await collection.aggregate([
+                {"$match": match},
+                {"$group": group}
+            ]).to_list(None))
+
+        return rows
+
+
+# Global participant scorer instance
+participant_scorer = ParticipantScorer()
+
+# Export for use in other modules
+__all__ = ['ParticipantScorer', 'participant_scorer', 'resolve_prize_metric', 'resolve_competition_metric']
@@ -12,6 +12,7 @@ from datetime import datetime, timezone
 sys.path.append(os.path.dirname(__file__))
 
 from database import get_database
+from friend_graph import friend_graph
 from gamification_service import GamificationService
 import logging
 
@@ -55,13 +56,18 @@ async def cleanup_test_users_and_fake_data():
         })
         logger.info(f"🗑️ Removed {deleted_transactions.deleted_count} test transactions")
         
-        # Remove their friendships
-        deleted_friendships = await db.friendships.delete_many({
+        # Remove their friendships and the cached friend sets of both sides
+        test_friendships_query = {
             "$or": [
                 {"user1_id": {"$regex": "^68e4c08"}},
                 {"user2_id": {"$regex": "^68e4c08"}}
             ]
-        })
+        }
+        affected_user_ids = set()
+        async for friendship in db.friendships.find(test_friendships_query, {"_id": 0, "user1_id": 1, "user2_id": 1}):
+            affected_user_ids.update((friendship["user1_id"], friendship["user2_id"]))
+        deleted_friendships = await db.friendships.delete_many(test_friendships_query)
+        await friend_graph.invalidate(*affected_user_ids)
         logger.info(f"🗑️ Removed {deleted_friendships.deleted_count} test friendships")
         
         # 2. CLEAN ALL LEADERBOARD ENTRIES
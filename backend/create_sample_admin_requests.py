@@ -3,8 +3,6 @@ Script to create sample campus admin requests for testing the super admin dashbo
 Usage: python create_sample_admin_requests.py
 """
 import asyncio
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from security import hash_password
 import uuid
@@ -12,12 +10,11 @@ from datetime import datetime, timezone
 
 load_dotenv()
 
+from mongo_pool import mongo_manager
+
 async def create_sample_data():
     # Connect to MongoDB
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    db_name = os.environ.get('DB_NAME', 'moneymojo_db')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
+    db = mongo_manager.get_database()  # Use the configured database
     
     # Create sample users who will request to become campus admins
     sample_users = [
@@ -203,7 +200,7 @@ async def create_sample_data():
     print(f"   - Access: https://admin-dashboard-275.preview.emergentagent.com/super-admin")
     print(f"   - Login: superadmin@earnnest.com / SuperAdmin@123")
     
-    client.close()
+    mongo_manager.close()
 
 if __name__ == "__main__":
     asyncio.run(create_sample_data())
@@ -3,19 +3,16 @@ Script to create or update a super admin user
 Usage: python create_super_admin.py
 """
 import asyncio
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from security import hash_password
 
 load_dotenv()
 
+from mongo_pool import mongo_manager
+
 async def create_super_admin():
     # Connect to MongoDB
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    db_name = os.environ.get('DB_NAME', 'moneymojo_db')
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]  # Use the configured database
+    db = mongo_manager.get_database()  # Use the configured database
     
     # Super admin details
     super_admin_email = "yash@earnaura.com"
@@ -91,7 +88,7 @@ async def create_super_admin():
     )
     print(f"✅ Updated {result.modified_count} existing admin users")
     
-    client.close()
+    mongo_manager.close()
 
 if __name__ == "__main__":
     asyncio.run(create_super_admin())
@@ -1,8 +1,15 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
 from datetime import datetime, timezone
-import os
+from typing import Any, Optional, Tuple
+import base64
+import json
 import logging
 
+from auth_cache import principal_cache
+from financial_rollups import financial_rollups
+from index_manifest import apply_index_manifest
+from mongo_pool import mongo_manager
+
 logger = logging.getLogger(__name__)
 
 def clean_mongo_doc(doc):
@@ -20,207 +27,24 @@ def clean_mongo_doc(doc):
         return cleaned
     return doc
 
-# MongoDB connection 
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'moneymojo_db')
+# MongoDB connection (shared pool, see mongo_pool.py)
+mongo_url = mongo_manager.mongo_url
+db_name = mongo_manager.db_name
 
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+client = mongo_manager.client
+db = mongo_manager.get_database()
 
-async def get_database():
-    """Get database instance"""
-    return db
+async def get_database(profile: str = "default"):
+    """Get database instance, optionally with a workload's read/write concerns"""
+    if profile == "default":
+        return db
+    return mongo_manager.get_database(profile)
 
 async def init_database():
     """Initialize database with indexes and constraints"""
     try:
-        # Create indexes for better performance
-        
-        # Users collection indexes
-        await db.users.create_index("email", unique=True)
-        await db.users.create_index("id", unique=True)
-        await db.users.create_index("created_at")
-        await db.users.create_index("email_verified")
-        await db.users.create_index("is_active")
-        await db.users.create_index("last_login")
-        
-        # Transactions collection indexes
-        await db.transactions.create_index("user_id")
-        await db.transactions.create_index("date")
-        await db.transactions.create_index([("user_id", 1), ("date", -1)])
-        await db.transactions.create_index("type")
-        await db.transactions.create_index("is_hustle_related")
-        
-        # User hustles collection indexes
-        await db.user_hustles.create_index("created_by")
-        await db.user_hustles.create_index("status")
-        await db.user_hustles.create_index("category")
-        await db.user_hustles.create_index("created_at")
-        await db.user_hustles.create_index("is_admin_posted")
-        await db.user_hustles.create_index("application_deadline")
-        
-        # Hustle applications collection indexes
-        await db.hustle_applications.create_index("hustle_id")
-        await db.hustle_applications.create_index("applicant_id")
-        await db.hustle_applications.create_index([("hustle_id", 1), ("applicant_id", 1)], unique=True)
-        await db.hustle_applications.create_index("applied_at")
-        await db.hustle_applications.create_index("status")
-        
-        # Budgets collection indexes
-        await db.budgets.create_index("user_id")
-        await db.budgets.create_index("month")
-        await db.budgets.create_index([("user_id", 1), ("month", 1), ("category", 1)], unique=True)
-        
-        # Email verification collection indexes
-        await db.email_verifications.create_index("email")
-        await db.email_verifications.create_index("expires_at", expireAfterSeconds=0)
-        
-        # Password reset collection indexes
-        await db.password_resets.create_index("email")
-        await db.password_resets.create_index("expires_at", expireAfterSeconds=0)
-        
-        # Financial goals collection indexes
-        await db.financial_goals.create_index("user_id")
-        await db.financial_goals.create_index("category")
-        await db.financial_goals.create_index("is_active")
-        await db.financial_goals.create_index([("user_id", 1), ("category", 1)])
-        
-        # Category suggestions collection indexes
-        await db.category_suggestions.create_index("category")
-        await db.category_suggestions.create_index("is_active")
-        await db.category_suggestions.create_index([("category", 1), ("priority", -1)])
-        
-        # Emergency types collection indexes
-        await db.emergency_types.create_index("name", unique=True)
-        await db.emergency_types.create_index("urgency_level")
-        
-        # Hospitals collection indexes
-        await db.hospitals.create_index("city")
-        await db.hospitals.create_index("state")
-        await db.hospitals.create_index([("latitude", 1), ("longitude", 1)])
-        await db.hospitals.create_index("rating")
-        await db.hospitals.create_index("is_emergency")
-        
-        # Click analytics collection indexes
-        await db.click_analytics.create_index("user_id")
-        await db.click_analytics.create_index("category")
-        await db.click_analytics.create_index("clicked_at")
-        await db.click_analytics.create_index([("category", 1), ("clicked_at", -1)])
-        
-        # Auto import sources collection indexes
-        await db.auto_import_sources.create_index("user_id")
-        await db.auto_import_sources.create_index("source_type")
-        await db.auto_import_sources.create_index("provider")
-        await db.auto_import_sources.create_index("is_active")
-        await db.auto_import_sources.create_index("created_at")
-        
-        # Parsed transactions collection indexes
-        await db.parsed_transactions.create_index("user_id")
-        await db.parsed_transactions.create_index("source_id")
-        await db.parsed_transactions.create_index("created_at")
-        await db.parsed_transactions.create_index("confidence_score")
-        
-        # Transaction suggestions collection indexes
-        await db.transaction_suggestions.create_index("user_id")
-        await db.transaction_suggestions.create_index("parsed_transaction_id")
-        await db.transaction_suggestions.create_index("status")
-        await db.transaction_suggestions.create_index("created_at")
-        await db.transaction_suggestions.create_index([("user_id", 1), ("status", 1)])
-        await db.transaction_suggestions.create_index("confidence_score")
-        
-        # Learning feedback collection indexes
-        await db.learning_feedback.create_index("user_id")
-        await db.learning_feedback.create_index("suggestion_id")
-        await db.learning_feedback.create_index("feedback_type")
-        await db.learning_feedback.create_index("created_at")
-        await db.learning_feedback.create_index([("user_id", 1), ("feedback_type", 1)])
-        
-        # Universities collection indexes
-        await db.universities.create_index("name", unique=True)
-        await db.universities.create_index("city")
-        await db.universities.create_index("state")
-        await db.universities.create_index("type")
-        await db.universities.create_index("ranking")
-        await db.universities.create_index("is_verified")
-        await db.universities.create_index([("city", 1), ("state", 1)])
-        await db.universities.create_index([("state", 1), ("ranking", 1)])
-        await db.universities.create_index("student_levels")
-        
-        # ENHANCED INDEXES FOR CRITICAL COLLECTIONS
-        
-        # Notifications collection indexes (high-traffic collection)
-        await db.notifications.create_index("user_id")
-        await db.notifications.create_index("is_read")
-        await db.notifications.create_index("created_at")
-        await db.notifications.create_index([("user_id", 1), ("is_read", 1)])  # Compound for unread queries
-        await db.notifications.create_index([("user_id", 1), ("created_at", -1)])  # Sorted retrieval
-        await db.notifications.create_index("priority")  # For priority-based filtering
-        await db.notifications.create_index("notification_type")  # For type-based filtering
-        
-        # Friendships collection indexes (viral feature)
-        await db.friendships.create_index("user_id")
-        await db.friendships.create_index("friend_id")
-        await db.friendships.create_index([("user_id", 1), ("status", 1)])  # Active friends
-        await db.friendships.create_index([("friend_id", 1), ("status", 1)])  # Reverse lookup
-        await db.friendships.create_index("created_at")
-        await db.friendships.create_index("connection_type")  # referral_signup, manual, etc.
-        
-        # Referral programs collection indexes
-        await db.referral_programs.create_index("referrer_id", unique=True)
-        await db.referral_programs.create_index("referral_code", unique=True)
-        await db.referral_programs.create_index("total_referrals")
-        await db.referral_programs.create_index("successful_referrals")
-        
-        # Referred users collection indexes
-        await db.referred_users.create_index("referrer_id")
-        await db.referred_users.create_index("referred_user_id")
-        await db.referred_users.create_index("status")
-        await db.referred_users.create_index("signed_up_at")
-        await db.referred_users.create_index([("referrer_id", 1), ("status", 1)])
-        
-        # Gamification collections indexes
-        await db.gamification_profiles.create_index("user_id", unique=True)
-        await db.gamification_profiles.create_index("level")
-        await db.gamification_profiles.create_index("experience_points")
-        await db.gamification_profiles.create_index("current_streak")
-        
-        # Leaderboards collection indexes (high-read collection)
-        await db.leaderboards.create_index("leaderboard_type")
-        await db.leaderboards.create_index("period")
-        await db.leaderboards.create_index([("leaderboard_type", 1), ("period", 1)])
-        await db.leaderboards.create_index([("leaderboard_type", 1), ("period", 1), ("rank", 1)])
-        await db.leaderboards.create_index("user_id")
-        await db.leaderboards.create_index("university")
-        await db.leaderboards.create_index([("university", 1), ("leaderboard_type", 1)])
-        
-        # Group challenges collection indexes
-        await db.group_challenges.create_index("challenge_type")
-        await db.group_challenges.create_index("university")
-        await db.group_challenges.create_index("status")
-        await db.group_challenges.create_index("end_date")
-        await db.group_challenges.create_index([("status", 1), ("end_date", 1)])
-        
-        # Group challenge participants indexes
-        await db.group_challenge_participants.create_index("challenge_id")
-        await db.group_challenge_participants.create_index("user_id")
-        await db.group_challenge_participants.create_index([("challenge_id", 1), ("user_id", 1)], unique=True)
-        await db.group_challenge_participants.create_index("completed")
-        
-        # Campus admin collections indexes
-        await db.campus_admin_requests.create_index("user_id")
-        await db.campus_admin_requests.create_index("status")
-        await db.campus_admin_requests.create_index("admin_type")
-        await db.campus_admin_requests.create_index("college_name")
-        await db.campus_admin_requests.create_index("email_verified")
-        
-        # Performance monitoring indexes
-        await db.admin_audit_logs.create_index("admin_user_id")
-        await db.admin_audit_logs.create_index("action_type")
-        await db.admin_audit_logs.create_index("timestamp")
-        await db.admin_audit_logs.create_index([("timestamp", -1)])  # Recent first
-        await db.admin_audit_logs.create_index("severity")
-        
-        logger.info("✅ All database indexes created successfully (including enhanced performance indexes)")
+        # Create every index declared in the manifest
+        await apply_index_manifest(db)
         
         # Initialize seed data
         await init_seed_data()
@@ -763,12 +587,20 @@ async def cleanup_test_data():
             await db.user_hustles.delete_many({"created_by": {"$in": test_user_ids}})
             await db.hustle_applications.delete_many({"applicant_id": {"$in": test_user_ids}})
             await db.budgets.delete_many({"user_id": {"$in": test_user_ids}})
+            await financial_rollups.delete_users(test_user_ids)
             
             logger.info("Cleaned up related test data")
         
         # Remove transactions with unrealistic amounts (likely test data)
-        await db.transactions.delete_many({"amount": {"$gt": 10000000}})  # > 1 crore
-        await db.transactions.delete_many({"amount": {"$lt": 1}})  # < 1 rupee
+        unrealistic = {"$or": [
+            {"amount": {"$gt": 10000000}},  # > 1 crore
+            {"amount": {"$lt": 1}}  # < 1 rupee
+        ]}
+        affected_user_ids = await db.transactions.distinct("user_id", unrealistic)
+        await db.transactions.delete_many(unrealistic)
+        # Their rollups still count the deleted amounts
+        for user_id in affected_user_ids:
+            await financial_rollups.rebuild_user(user_id)
         
         # Remove hustles with unrealistic pay rates
         await db.user_hustles.delete_many({"pay_rate": {"$gt": 100000}})  # > 1 lakh per hour
@@ -794,12 +626,25 @@ async def create_user(user_data: dict):
 
 async def update_user(user_id: str, update_data: dict):
     """Update user data"""
-    return await db.users.update_one({"id": user_id}, {"$set": update_data})
+    result = await db.users.update_one({"id": user_id}, {"$set": update_data})
+    principal_cache.invalidate(user_id)
+    return result
 
-async def create_transaction(transaction_data: dict):
-    """Create new transaction"""
+async def create_transaction(transaction_data: dict, session=None):
+    """Create new transaction (inside ``session``'s transaction when given)"""
     transaction_data["date"] = datetime.now(timezone.utc)
-    return await db.transactions.insert_one(transaction_data)
+    money_db = await get_database("money")
+    result = await money_db.transactions.insert_one(transaction_data, session=session)
+    if session is not None:
+        # Same transaction as the insert: a failed rollup update aborts both
+        await financial_rollups.apply_transaction(transaction_data, session=session)
+        return result
+    try:
+        await financial_rollups.apply_transaction(transaction_data)
+    except Exception as e:
+        # The transaction is stored; verify_user()/rebuild_user() repair the rollup
+        logger.error(f"Financial rollup update failed for user {transaction_data.get('user_id')}: {str(e)}")
+    return result
 
 async def get_user_transactions(user_id: str, limit: int = 50, skip: int = 0):
     """Get user transactions"""
@@ -965,7 +810,8 @@ async def get_nearby_hospitals(latitude: float, longitude: float, radius_km: flo
 async def create_click_analytics(analytics_data: dict):
     """Record click analytics"""
     analytics_data["clicked_at"] = datetime.now(timezone.utc)
-    return await db.click_analytics.insert_one(analytics_data)
+    analytics_db = await get_database("analytics")
+    return await analytics_db.click_analytics.insert_one(analytics_data)
 
 async def get_popular_suggestions(category: str, days: int = 30):
     """Get popular suggestions based on click analytics"""
@@ -1100,45 +946,112 @@ async def get_user_transaction_patterns(user_id: str, days: int = 30):
 # PAGINATION HELPER FUNCTIONS
 # ===========================
 
-async def paginate_query(collection, query: dict, skip: int = 0, limit: int = 20, sort_field: str = "created_at", sort_order: int = -1):
+def _cursor_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    return value
+
+def _cursor_restore(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$date" in value:
+            return datetime.fromisoformat(value["$date"])
+        if "$oid" in value:
+            return ObjectId(value["$oid"])
+    return value
+
+def encode_cursor(sort_value: Any, tiebreaker: Any) -> str:
+    """Opaque keyset cursor: the last row's sort key plus its unique tiebreaker"""
+    raw = json.dumps([_cursor_value(sort_value), _cursor_value(tiebreaker)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        sort_value, tiebreaker = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return _cursor_restore(sort_value), _cursor_restore(tiebreaker)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError("Invalid pagination cursor")
+
+def keyset_filter(query: dict, cursor: str, sort_field: str, sort_order: int = -1, tiebreak_field: str = "_id") -> dict:
+    """Restrict ``query`` to rows after the cursor position in (sort_field, tiebreak_field) order"""
+    sort_value, tiebreaker = decode_cursor(cursor)
+    op = "$lt" if sort_order < 0 else "$gt"
+    return {"$and": [query, {"$or": [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, tiebreak_field: {op: tiebreaker}}
+    ]}]}
+
+async def paginate_query(collection, query: dict, skip: int = 0, limit: int = 20, sort_field: str = "created_at", sort_order: int = -1,
+                         cursor: Optional[str] = None, tiebreak_field: str = "_id", with_total: Optional[bool] = None,
+                         count_limit: Optional[int] = None):
     """
     Generic pagination helper with sorting
     
+    Pages either by offset (``skip``) or, when ``cursor`` is given, by keyset:
+    rows after the cursor's (sort_field, tiebreak_field) position, so deep
+    pages cost the same as the first. ``next_cursor`` is returned whenever
+    more rows exist.
+    
     Args:
         collection: MongoDB collection
         query: MongoDB query dict
-        skip: Number of documents to skip (offset)
+        skip: Number of documents to skip (offset; ignored with a cursor)
         limit: Max documents to return (page size)
         sort_field: Field to sort by
         sort_order: 1 for ascending, -1 for descending
+        cursor: Opaque cursor from a previous page's ``next_cursor``
+        tiebreak_field: Unique field that orders rows sharing a sort value
+        with_total: Count matching documents (default: only for offset paging)
+        count_limit: Stop counting here; ``total_is_estimate`` flags a capped total
     
     Returns:
         {
             "data": [...],
-            "total": int,
+            "total": int or None,
             "skip": int,
             "limit": int,
-            "has_more": bool
+            "has_more": bool,
+            "next_cursor": str or None
         }
     """
+    if with_total is None:
+        with_total = cursor is None
+    
     # Get total count
-    total = await collection.count_documents(query)
+    total = None
+    if with_total:
+        count_kwargs = {"limit": count_limit} if count_limit else {}
+        total = await collection.count_documents(query, **count_kwargs)
+    
+    # Get paginated data (one extra row tells us whether another page exists)
+    page_query = keyset_filter(query, cursor, sort_field, sort_order, tiebreak_field) if cursor else query
+    find = collection.find(page_query).sort([(sort_field, sort_order), (tiebreak_field, sort_order)])
+    if not cursor:
+        find = find.skip(skip)
+    data = await find.limit(limit + 1).to_list(limit + 1)
     
-    # Get paginated data
-    cursor = collection.find(query).sort(sort_field, sort_order).skip(skip).limit(limit)
-    data = await cursor.to_list(limit)
+    has_more = len(data) > limit
+    data = data[:limit]
+    next_cursor = None
+    if has_more and data:
+        next_cursor = encode_cursor(data[-1].get(sort_field), data[-1].get(tiebreak_field))
     
     return {
         "data": clean_mongo_doc(data),
         "total": total,
+        "total_is_estimate": bool(count_limit) and total is not None and total >= count_limit,
         "skip": skip,
         "limit": limit,
-        "has_more": (skip + limit) < total,
-        "page": (skip // limit) + 1 if limit > 0 else 1,
-        "total_pages": (total + limit - 1) // limit if limit > 0 else 1
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+        "page": (skip // limit) + 1 if limit > 0 and not cursor else None,
+        "total_pages": (total + limit - 1) // limit if limit > 0 and total is not None else None
     }
 
-async def get_transactions_paginated(user_id: str, skip: int = 0, limit: int = 20, transaction_type: str = None):
+async def get_transactions_paginated(user_id: str, skip: int = 0, limit: int = 20, transaction_type: str = None,
+                                     cursor: Optional[str] = None, with_total: Optional[bool] = None):
     """Get user transactions with pagination"""
     query = {"user_id": user_id}
     if transaction_type:
@@ -1150,10 +1063,13 @@ async def get_transactions_paginated(user_id: str, skip: int = 0, limit: int = 2
         skip=skip, 
         limit=limit,
         sort_field="date",
-        sort_order=-1  # Most recent first
+        sort_order=-1,  # Most recent first
+        cursor=cursor,
+        with_total=with_total
     )
 
-async def get_notifications_paginated(user_id: str, skip: int = 0, limit: int = 20, unread_only: bool = False):
+async def get_notifications_paginated(user_id: str, skip: int = 0, limit: int = 20, unread_only: bool = False,
+                                      cursor: Optional[str] = None):
     """Get user notifications with pagination"""
     query = {"user_id": user_id}
     if unread_only:
@@ -1165,7 +1081,8 @@ async def get_notifications_paginated(user_id: str, skip: int = 0, limit: int =
         skip=skip,
         limit=limit,
         sort_field="created_at",
-        sort_order=-1  # Most recent first
+        sort_order=-1,  # Most recent first
+        cursor=cursor
     )
 
 async def get_friends_paginated(user_id: str, skip: int = 0, limit: int = 50):
@@ -1185,26 +1102,32 @@ async def get_friends_paginated(user_id: str, skip: int = 0, limit: int = 50):
 # N+1 QUERY OPTIMIZATION
 # ===========================
 
-async def get_friends_with_details_optimized(user_id: str, limit: int = 50):
+async def get_friends_with_details_optimized(user_id: str, limit: int = 50, skip: int = 0, cursor: Optional[str] = None):
     """
     Get friends list with user details using aggregation (fixes N+1 query problem)
     Instead of fetching each friend's details separately, use aggregation pipeline
     
     FIXED: Handles bidirectional friendship structure (user1_id/user2_id)
+    Each row carries a ``cursor`` that continues the list after it.
     """
+    match = {
+        "$or": [
+            {"user1_id": user_id, "status": "active"},
+            {"user2_id": user_id, "status": "active"}
+        ]
+    }
+    if cursor:
+        match = keyset_filter(match, cursor, "created_at", -1)
+    
     pipeline = [
         # Match user's friendships - handle bidirectional structure
-        {"$match": {
-            "$or": [
-                {"user1_id": user_id, "status": "active"},
-                {"user2_id": user_id, "status": "active"}
-            ]
-        }},
+        {"$match": match},
         
         # Sort by creation date
-        {"$sort": {"created_at": -1}},
+        {"$sort": {"created_at": -1, "_id": -1}},
         
-        # Limit results
+        # Page (offset only without a cursor)
+        *([] if cursor or not skip else [{"$skip": skip}]),
         {"$limit": limit},
         
         # Add computed field for friend_id (the other user in the friendship)
@@ -1242,7 +1165,7 @@ async def get_friends_with_details_optimized(user_id: str, limit: int = 50):
         
         # Project final structure
         {"$project": {
-            "_id": 0,
+            "_id": 1,
             "friendship_id": "$id",
             "friend_id": 1,
             "created_at": 1,
@@ -1260,6 +1183,8 @@ async def get_friends_with_details_optimized(user_id: str, limit: int = 50):
     ]
     
     friends = await db.friendships.aggregate(pipeline).to_list(limit)
+    for friend in friends:
+        friend["cursor"] = encode_cursor(friend.get("created_at"), friend["_id"])
     return clean_mongo_doc(friends)
 
 async def get_notifications_with_details_optimized(user_id: str, limit: int = 20):
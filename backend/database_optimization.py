@@ -5,26 +5,27 @@ Connection pooling, query optimization, and performance monitoring
 
 import asyncio
 import logging
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo import MongoClient
 from pymongo.errors import ServerSelectionTimeoutError
 import time
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
-import os
 from concurrent.futures import ThreadPoolExecutor
 import threading
 
+from index_manifest import apply_index_manifest
+from mongo_pool import mongo_manager
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
 class DatabaseOptimizer:
     def __init__(self):
         """Initialize database optimizer with connection pooling"""
-        self.mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/earnnest')
         self.client = None
         self.database = None
-        self.connection_pool_size = 50
+        self.connection_pool_size = 0
         self.query_stats = {}
         self.slow_query_threshold = 1000  # ms
         self.query_cache = {}
@@ -43,83 +44,16 @@ class DatabaseOptimizer:
         self._initialize_connection()
     
     def _initialize_connection(self):
-        """Initialize optimized MongoDB connection"""
-        try:
-            # Configure connection with optimizations
-            self.client = AsyncIOMotorClient(
-                self.mongo_url,
-                maxPoolSize=self.connection_pool_size,
-                minPoolSize=10,
-                maxIdleTimeMS=30000,
-                waitQueueTimeoutMS=5000,
-                serverSelectionTimeoutMS=5000,
-                connectTimeoutMS=10000,
-                socketTimeoutMS=20000,
-                retryWrites=True,
-                # Write concern for performance
-                w='majority',
-                wtimeoutMS=10000
-            )
-            
-            # Extract database name from URL
-            db_name = self.mongo_url.split('/')[-1].split('?')[0]
-            self.database = self.client[db_name]
-            
-            logger.info(f"✅ Database optimizer initialized with pool size: {self.connection_pool_size}")
-            
-        except Exception as e:
-            logger.error(f"Database optimizer initialization error: {str(e)}")
-            raise
+        """Use the shared application client instead of a second pool"""
+        self.client = mongo_manager.client
+        self.database = mongo_manager.get_database()
+        self.connection_pool_size = mongo_manager.max_pool_size
+        logger.info(f"✅ Database optimizer attached to shared pool (max {self.connection_pool_size} connections)")
 
     async def create_performance_indexes(self):
-        """Create optimized indexes for better query performance"""
+        """Apply the shared index manifest to the application database"""
         try:
-            # User collection indexes
-            await self.database.users.create_index([("email", 1)], unique=True)
-            await self.database.users.create_index([("user_id", 1)], unique=True)
-            await self.database.users.create_index([("university", 1)])
-            await self.database.users.create_index([("role", 1)])
-            await self.database.users.create_index([("created_at", -1)])
-            
-            # Transaction collection indexes
-            await self.database.transactions.create_index([("user_id", 1), ("created_at", -1)])
-            await self.database.transactions.create_index([("category", 1)])
-            await self.database.transactions.create_index([("type", 1)])
-            await self.database.transactions.create_index([("amount", -1)])
-            
-            # Budget collection indexes
-            await self.database.budgets.create_index([("user_id", 1), ("category", 1)], unique=True)
-            await self.database.budgets.create_index([("user_id", 1)])
-            
-            # Financial goals collection indexes
-            await self.database.financial_goals.create_index([("user_id", 1)])
-            await self.database.financial_goals.create_index([("category", 1)])
-            await self.database.financial_goals.create_index([("target_date", 1)])
-            
-            # Gamification indexes
-            await self.database.gamification_profiles.create_index([("user_id", 1)], unique=True)
-            await self.database.gamification_profiles.create_index([("level", -1)])
-            await self.database.gamification_profiles.create_index([("experience_points", -1)])
-            await self.database.gamification_profiles.create_index([("current_streak", -1)])
-            
-            # Social sharing indexes
-            await self.database.social_shares.create_index([("user_id", 1), ("created_at", -1)])
-            await self.database.social_shares.create_index([("platform", 1)])
-            
-            # Notification indexes
-            await self.database.notifications.create_index([("user_id", 1), ("created_at", -1)])
-            await self.database.notifications.create_index([("read", 1)])
-            
-            # Compound indexes for complex queries
-            await self.database.transactions.create_index([
-                ("user_id", 1), ("type", 1), ("created_at", -1)
-            ])
-            
-            await self.database.gamification_profiles.create_index([
-                ("university", 1), ("experience_points", -1)
-            ])
-            
-            logger.info("✅ Performance indexes created successfully")
+            await apply_index_manifest(self.database)
             
         except Exception as e:
             logger.error(f"Index creation error: {str(e)}")
@@ -253,7 +187,8 @@ class DatabaseOptimizer:
             pool_stats = {
                 'max_pool_size': self.connection_pool_size,
                 'current_connections': server_stats.get('connections', {}).get('current', 0),
-                'available_connections': server_stats.get('connections', {}).get('available', 0)
+                'available_connections': server_stats.get('connections', {}).get('available', 0),
+                'checkout': mongo_manager.pool_monitor.get_stats()
             }
             
             # Query performance stats
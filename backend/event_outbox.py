@@ -0,0 +1,374 @@
+"""
+Durable Event Outbox Pipeline
+Persists domain events (e.g. transaction_created) in MongoDB and fans them out
+to registered consumers in the background with retries, idempotency and lag metrics
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+ConsumerHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class EventOutboxPipeline:
+    """
+    Outbox-based event pipeline.
+
+    Request handlers call ``emit()`` in the same Mongo transaction as their own
+    writes, so the event document - the durable record that side effects are
+    still owed - exists exactly when those writes do. Worker coroutines claim
+    pending events with a short lease (so several uvicorn workers can share one
+    outbox), run each consumer that has not yet acknowledged the event and
+    record a receipt keyed by ``{event_id}:{consumer}`` so a consumer never runs
+    twice for the same event.
+    """
+
+    def __init__(self, max_workers: int = 2, batch_size: int = 20,
+                 poll_interval: float = 2.0, max_attempts: int = 5,
+                 lease_seconds: int = 60):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        # event_type -> {consumer_name: handler}
+        self.consumers: Dict[str, Dict[str, ConsumerHandler]] = {}
+        self.is_running = False
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+        # Per-consumer metrics
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self.events_emitted = 0
+
+    def register_consumer(self, event_type: str, name: str, handler: ConsumerHandler):
+        """Register a consumer coroutine for an event type"""
+        self.consumers.setdefault(event_type, {})[name] = handler
+        self.stats.setdefault(name, {
+            'processed': 0,
+            'failed': 0,
+            'retries': 0,
+            'dead_lettered': 0,
+            'skipped_duplicates': 0,
+            'skipped_in_flight': 0,
+            'last_lag_seconds': 0.0,
+            'max_lag_seconds': 0.0,
+            'avg_lag_seconds': 0.0,
+            'avg_processing_time': 0.0,
+        })
+        logger.info(f"📬 Outbox consumer registered: {name} -> {event_type}")
+
+    async def _get_db(self):
+        from database import get_database
+        return await get_database()
+
+    async def emit(self, event_type: str, payload: Dict[str, Any], key: Optional[str] = None,
+                   session=None) -> str:
+        """
+        Persist an event in the outbox and wake up the workers. With a
+        ``session`` the event is written in the caller's transaction and the
+        caller calls ``wake()`` once it has committed.
+        """
+        db = await self._get_db()
+        now = datetime.now(timezone.utc)
+        consumers = list(self.consumers.get(event_type, {}).keys())
+
+        event_id = str(uuid.uuid4())
+        await db.event_outbox.insert_one({
+            "id": event_id,
+            "event_type": event_type,
+            "key": key,
+            "payload": payload,
+            "status": "pending" if consumers else "completed",
+            "pending_consumers": consumers,
+            "completed_consumers": [],
+            "failed_consumers": [],
+            "attempts": {},
+            "created_at": now,
+            "next_attempt_at": now,
+            "locked_until": None,
+            "locked_by": None,
+        }, session=session)
+
+        self.events_emitted += 1
+        if session is None:
+            self.wake()
+        return event_id
+
+    def wake(self):
+        """Let idle workers look for new events now instead of at the next poll"""
+        self._wakeup.set()
+
+    async def start_processing(self):
+        """Start outbox worker coroutines"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self._tasks = [
+            asyncio.create_task(self._worker(f"outbox-worker-{i}"))
+            for i in range(self.max_workers)
+        ]
+        logger.info(f"🚀 Event outbox started with {self.max_workers} workers ({self.worker_id})")
+
+    async def stop_processing(self):
+        """Stop outbox workers; unfinished events stay pending in the outbox"""
+        self.is_running = False
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("⏹️  Event outbox stopped")
+
+    async def _worker(self, worker_name: str):
+        """Claim and process events until stopped"""
+        while self.is_running:
+            try:
+                processed = 0
+                while processed < self.batch_size:
+                    event = await self._claim_next_event()
+                    if not event:
+                        break
+                    await self._process_event(event)
+                    processed += 1
+
+                if processed == 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Outbox {worker_name} error: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _claim_next_event(self) -> Optional[Dict[str, Any]]:
+        """Atomically lease the oldest due event"""
+        db = await self._get_db()
+        now = datetime.now(timezone.utc)
+        return await db.event_outbox.find_one_and_update(
+            {
+                "status": "pending",
+                "next_attempt_at": {"$lte": now},
+                "$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}]
+            },
+            {"$set": {
+                "locked_until": now + timedelta(seconds=self.lease_seconds),
+                "locked_by": self.worker_id
+            }},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _process_event(self, event: Dict[str, Any]):
+        """Run every consumer that still owes work for this event"""
+        db = await self._get_db()
+        handlers = self.consumers.get(event["event_type"], {})
+        attempts = dict(event.get("attempts", {}))
+        retry_delays: List[float] = []
+
+        for name in list(event.get("pending_consumers", [])):
+            handler = handlers.get(name)
+            if handler is None:
+                # Consumer was removed since the event was written
+                await db.event_outbox.update_one({"id": event["id"]}, {"$pull": {"pending_consumers": name}})
+                continue
+
+            idempotency_key = f"{event['id']}:{name}"
+            claim = await self._claim_receipt(db, event, name, idempotency_key)
+            if claim == "completed":
+                self.stats[name]['skipped_duplicates'] += 1
+                await self._ack(db, event, name)
+                continue
+            if claim == "in_flight":
+                # Another worker is still running this consumer; look again once its claim expires
+                self.stats[name]['skipped_in_flight'] += 1
+                retry_delays.append(self.lease_seconds)
+                continue
+
+            start_time = time.time()
+            try:
+                await handler(event)
+            except Exception as e:
+                attempts[name] = attempts.get(name, 0) + 1
+                self.stats[name]['failed'] += 1
+                logger.error(f"❌ Outbox consumer {name} failed for {event['id']} "
+                             f"(attempt {attempts[name]}): {str(e)}")
+
+                if attempts[name] >= self.max_attempts:
+                    self.stats[name]['dead_lettered'] += 1
+                    await db.event_outbox.update_one(
+                        {"id": event["id"]},
+                        {"$pull": {"pending_consumers": name},
+                         "$push": {"failed_consumers": {"consumer": name, "error": str(e)[:500]}},
+                         "$set": {f"attempts.{name}": attempts[name]}}
+                    )
+                    await db.event_consumer_receipts.update_one(
+                        {"idempotency_key": idempotency_key},
+                        {"$set": {"status": "failed", "error": str(e)[:500]}}
+                    )
+                    logger.error(f"💀 Outbox consumer {name} gave up on {event['id']}")
+                else:
+                    self.stats[name]['retries'] += 1
+                    retry_delays.append(2 ** attempts[name])
+                    await db.event_outbox.update_one(
+                        {"id": event["id"]},
+                        {"$set": {f"attempts.{name}": attempts[name]}}
+                    )
+                    await db.event_consumer_receipts.delete_one(
+                        {"idempotency_key": idempotency_key, "status": "processing", "worker": self.worker_id}
+                    )
+                continue
+
+            await db.event_consumer_receipts.update_one(
+                {"idempotency_key": idempotency_key},
+                {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc)}}
+            )
+            await self._ack(db, event, name)
+            self._record_success(name, event, time.time() - start_time)
+
+        await self._finalize_event(db, event, min(retry_delays) if retry_delays else None)
+
+    async def _claim_receipt(self, db, event: Dict[str, Any], name: str, idempotency_key: str) -> str:
+        """
+        Take the receipt for one consumer of an event: "claimed" when this worker
+        should run the consumer, "completed" when it already ran, "in_flight"
+        when another worker's claim is younger than the lease. A stale claim
+        (its worker died mid-handler) or a failed one is taken over with a
+        compare-and-set, so only one worker can win it.
+        """
+        now = datetime.now(timezone.utc)
+        claim = {"status": "processing", "started_at": now, "worker": self.worker_id}
+        try:
+            await db.event_consumer_receipts.insert_one({
+                "idempotency_key": idempotency_key,
+                "event_id": event["id"],
+                "consumer": name,
+                **claim
+            })
+            return "claimed"
+        except DuplicateKeyError:
+            pass
+
+        receipt = await db.event_consumer_receipts.find_one({"idempotency_key": idempotency_key})
+        if receipt is None:
+            # Released by a failing worker between our insert and read
+            return "in_flight"
+        if receipt.get("status") == "completed":
+            return "completed"
+
+        started_at = receipt.get("started_at")
+        if started_at is not None and started_at.tzinfo is None:
+            started_at = started_at.replace(tzinfo=timezone.utc)
+        if receipt.get("status") == "processing" and started_at and \
+                now - started_at < timedelta(seconds=self.lease_seconds):
+            return "in_flight"
+
+        result = await db.event_consumer_receipts.update_one(
+            {"idempotency_key": idempotency_key, "status": receipt.get("status"), "started_at": receipt.get("started_at")},
+            {"$set": claim, "$unset": {"error": ""}}
+        )
+        return "claimed" if result.modified_count else "in_flight"
+
+    async def _ack(self, db, event: Dict[str, Any], name: str):
+        await db.event_outbox.update_one(
+            {"id": event["id"]},
+            {"$pull": {"pending_consumers": name}, "$addToSet": {"completed_consumers": name}}
+        )
+
+    async def _finalize_event(self, db, event: Dict[str, Any], retry_delay: Optional[float]):
+        """Release the lease and either complete the event or schedule a retry after ``retry_delay`` seconds"""
+        now = datetime.now(timezone.utc)
+        if retry_delay is not None:
+            await db.event_outbox.update_one(
+                {"id": event["id"]},
+                {"$set": {"next_attempt_at": now + timedelta(seconds=retry_delay),
+                          "locked_until": None, "locked_by": None}}
+            )
+            return
+
+        current = await db.event_outbox.find_one({"id": event["id"]}, {"failed_consumers": 1})
+        status = "failed" if current and current.get("failed_consumers") else "completed"
+        await db.event_outbox.update_one(
+            {"id": event["id"]},
+            {"$set": {"status": status, "processed_at": now,
+                      "locked_until": None, "locked_by": None}}
+        )
+
+    def _record_success(self, name: str, event: Dict[str, Any], processing_time: float):
+        """Update per-consumer throughput and lag metrics"""
+        created_at = event["created_at"]
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        lag = (datetime.now(timezone.utc) - created_at).total_seconds()
+
+        consumer_stats = self.stats[name]
+        consumer_stats['processed'] += 1
+        count = consumer_stats['processed']
+        consumer_stats['last_lag_seconds'] = round(lag, 3)
+        consumer_stats['max_lag_seconds'] = round(max(consumer_stats['max_lag_seconds'], lag), 3)
+        consumer_stats['avg_lag_seconds'] = round(
+            (consumer_stats['avg_lag_seconds'] * (count - 1) + lag) / count, 3
+        )
+        consumer_stats['avg_processing_time'] = round(
+            (consumer_stats['avg_processing_time'] * (count - 1) + processing_time) / count, 3
+        )
+
+    async def get_statistics(self) -> Dict[str, Any]:
+        """Get outbox backlog and per-consumer metrics"""
+        stats = {
+            'worker_id': self.worker_id,
+            'running': self.is_running,
+            'events_emitted': self.events_emitted,
+            'consumers': {name: values.copy() for name, values in self.stats.items()},
+        }
+
+        try:
+            db = await self._get_db()
+            stats['pending_events'] = await db.event_outbox.count_documents({"status": "pending"})
+            stats['failed_events'] = await db.event_outbox.count_documents({"status": "failed"})
+
+            oldest = await db.event_outbox.find_one(
+                {"status": "pending"}, {"created_at": 1}, sort=[("created_at", 1)]
+            )
+            if oldest:
+                created_at = oldest["created_at"]
+                if created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=timezone.utc)
+                stats['oldest_pending_age_seconds'] = round(
+                    (datetime.now(timezone.utc) - created_at).total_seconds(), 3
+                )
+
+            # Backlog per consumer: events still waiting on that consumer
+            for name in self.stats:
+                stats['consumers'][name]['backlog'] = await db.event_outbox.count_documents(
+                    {"status": "pending", "pending_consumers": name}
+                )
+        except Exception as e:
+            logger.error(f"Outbox stats error: {str(e)}")
+
+        return stats
+
+
+# Global event pipeline instance
+event_pipeline = EventOutboxPipeline()
+
+# Export for use in other modules
+__all__ = ['EventOutboxPipeline', 'event_pipeline']
@@ -0,0 +1,452 @@
+"""
+Per-User Financial Rollups
+Maintains one ``user_financial_rollups`` document per user with lifetime,
+monthly and weekly income/expense buckets and per-category spend, plus
+``transaction_daily_stats`` (user, day, type, category -> total, count) for
+day-level and date-range queries, all updated with $inc in the same Mongo
+transaction as every transaction insert
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta, date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from pymongo.errors import DuplicateKeyError
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+TRANSACTION_TYPES = ("income", "expense")
+
+
+def _encode_key(name: str) -> str:
+    """Make a category usable as a MongoDB field name"""
+    return str(name).replace(".", "．").replace("$", "＄")
+
+
+def _decode_key(name: str) -> str:
+    return name.replace("．", ".").replace("＄", "$")
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _bucket_keys(when: datetime) -> Dict[str, str]:
+    when = _as_utc(when)
+    iso_year, iso_week, _ = when.isocalendar()
+    return {
+        "monthly": when.strftime("%Y-%m"),
+        "weekly": f"{iso_year}-W{iso_week:02d}",
+        "daily": when.strftime("%Y-%m-%d"),
+    }
+
+
+def _project(doc: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """Keep only ``fields`` ("lifetime", "monthly.2024-05", ...) of a rollup document"""
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        head, _, rest = field.partition(".")
+        if head not in doc:
+            continue
+        if not rest:
+            projected[head] = doc[head]
+        elif rest in doc[head]:
+            projected.setdefault(head, {})[rest] = doc[head][rest]
+    return projected
+
+
+def _empty_totals() -> Dict[str, float]:
+    return {"income": 0.0, "expense": 0.0, "income_count": 0, "expense_count": 0}
+
+
+class FinancialRollupService:
+    """
+    ``create_transaction`` calls ``apply_transaction()`` with the session of
+    its insert; a user's first rollup write (or first read) rebuilds the
+    document from their transaction history, so users who predate rollups are
+    picked up lazily. Day-level totals live only in ``transaction_daily_stats``
+    so the rollup document stays small, and readers project the buckets they
+    need. ``verify_user()``/``rebuild_user()`` repair drift caused by writes
+    that bypass ``create_transaction`` (seed scripts, test-data cleanup).
+
+    Every ``apply_transaction()`` bumps the document's ``revision``; a rebuild
+    outside the caller's session runs in its own transaction and only replaces
+    the revision it read, so a concurrent $inc is never overwritten.
+    """
+
+    COLLECTION = "user_financial_rollups"
+    DAILY_COLLECTION = "transaction_daily_stats"
+    DAILY_GROUP_FIELDS = ("user_id", "day", "type", "category")
+    VERSION = 2
+
+    def __init__(self, chunk_size: int = 500, rebuild_attempts: int = 5):
+        self.chunk_size = chunk_size
+        self.rebuild_attempts = rebuild_attempts
+        self.stats = {'applied': 0, 'rebuilt': 0, 'rebuild_conflicts': 0, 'reads': 0}
+
+    async def _get_db(self):
+        from database import get_database
+        return await get_database("money")
+
+    async def apply_transaction(self, transaction: Dict[str, Any], session=None):
+        """Fold one newly inserted transaction into its user's rollup (inside ``session``'s transaction when given)"""
+        tx_type = transaction.get("type")
+        if tx_type not in TRANSACTION_TYPES:
+            return
+
+        db = await self._get_db()
+        user_id = transaction["user_id"]
+        amount = transaction["amount"]
+        when = _as_utc(transaction.get("date") or datetime.now(timezone.utc))
+        keys = _bucket_keys(when)
+
+        inc = {"revision": 1, f"lifetime.{tx_type}": amount, f"lifetime.{tx_type}_count": 1}
+        for bucket in ("monthly", "weekly"):
+            key = keys[bucket]
+            inc[f"{bucket}.{key}.{tx_type}"] = amount
+            inc[f"{bucket}.{key}.{tx_type}_count"] = 1
+        if tx_type == "expense":
+            category = _encode_key(transaction.get("category", "other"))
+            inc[f"categories.{category}"] = amount
+            inc[f"monthly.{keys['monthly']}.categories.{category}"] = amount
+
+        result = await db[self.COLLECTION].update_one(
+            {"user_id": user_id},
+            {
+                "$inc": inc,
+                "$min": {"first_transaction_at": when},
+                "$max": {"last_transaction_at": when},
+                "$set": {"updated_at": datetime.now(timezone.utc)},
+                "$setOnInsert": {"user_id": user_id, "version": self.VERSION}
+            },
+            upsert=True,
+            session=session
+        )
+        await db[self.DAILY_COLLECTION].update_one(
+            {"user_id": user_id, "day": keys["daily"], "type": tx_type,
+             "category": transaction.get("category", "other")},
+            {"$inc": {"total": amount, "count": 1}},
+            upsert=True,
+            session=session
+        )
+        self.stats['applied'] += 1
+
+        if result.upserted_id is not None:
+            # First rollup for this user - fold in any earlier history
+            await self.rebuild_user(user_id, session=session)
+
+    async def _build_from_transactions(self, db, user_id: str, session=None):
+        """Compute the rollup document and daily stat rows from the user's raw transactions"""
+        rows = await db.transactions.aggregate([
+            {"$match": {"user_id": user_id, "type": {"$in": list(TRANSACTION_TYPES)}}},
+            {"$group": {
+                "_id": {
+                    "type": "$type",
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
+                    "category": "$category"
+                },
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1},
+                "first": {"$min": "$date"},
+                "last": {"$max": "$date"}
+            }}
+        ], session=session).to_list(None)
+
+        doc: Dict[str, Any] = {
+            "user_id": user_id,
+            "version": self.VERSION,
+            "lifetime": _empty_totals(),
+            "monthly": defaultdict(_empty_totals),
+            "weekly": defaultdict(_empty_totals),
+            "categories": defaultdict(float),
+            "first_transaction_at": None,
+            "last_transaction_at": None,
+            "updated_at": datetime.now(timezone.utc),
+        }
+
+        for row in rows:
+            tx_type = row["_id"]["type"]
+            keys = _bucket_keys(datetime.strptime(row["_id"]["day"], "%Y-%m-%d"))
+            for totals in (doc["lifetime"], doc["monthly"][keys["monthly"]], doc["weekly"][keys["weekly"]]):
+                totals[tx_type] += row["total"]
+                totals[f"{tx_type}_count"] += row["count"]
+            if tx_type == "expense":
+                category = _encode_key(row["_id"]["category"] or "other")
+                doc["categories"][category] += row["total"]
+                month = doc["monthly"][keys["monthly"]]
+                month.setdefault("categories", {})
+                month["categories"][category] = month["categories"].get(category, 0.0) + row["total"]
+
+            first, last = row["first"], row["last"]
+            if doc["first_transaction_at"] is None or first < doc["first_transaction_at"]:
+                doc["first_transaction_at"] = first
+            if doc["last_transaction_at"] is None or last > doc["last_transaction_at"]:
+                doc["last_transaction_at"] = last
+
+        for bucket in ("monthly", "weekly", "categories"):
+            doc[bucket] = dict(doc[bucket])
+
+        daily_rows: Dict[tuple, Dict[str, Any]] = {}
+        for row in rows:
+            key = (row["_id"]["day"], row["_id"]["type"], row["_id"]["category"] or "other")
+            daily = daily_rows.setdefault(key, {
+                "user_id": user_id, "day": key[0], "type": key[1], "category": key[2], "total": 0.0, "count": 0
+            })
+            daily["total"] += row["total"]
+            daily["count"] += row["count"]
+        return doc, list(daily_rows.values())
+
+    async def _rebuild(self, user_id: str, session=None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Build the rollup and store it only if its ``revision`` is still the
+        one read first; returns the document and whether it was stored
+        """
+        db = await self._get_db()
+        stored = await db[self.COLLECTION].find_one({"user_id": user_id}, {"revision": 1}, session=session)
+        doc, daily_rows = await self._build_from_transactions(db, user_id, session=session)
+
+        if stored is None:
+            # A concurrent first insert raises DuplicateKeyError (unique user_id)
+            doc["revision"] = 0
+            await db[self.COLLECTION].insert_one(dict(doc), session=session)
+        else:
+            doc["revision"] = stored.get("revision", 0)
+            result = await db[self.COLLECTION].replace_one(
+                {"user_id": user_id, "revision": stored["revision"] if "revision" in stored else {"$exists": False}},
+                doc,
+                session=session
+            )
+            if result.matched_count == 0:
+                return doc, False
+
+        await db[self.DAILY_COLLECTION].delete_many({"user_id": user_id}, session=session)
+        if daily_rows:
+            await db[self.DAILY_COLLECTION].insert_many(daily_rows, ordered=False, session=session)
+        self.stats['rebuilt'] += 1
+        return doc, True
+
+    async def rebuild_user(self, user_id: str, session=None) -> Dict[str, Any]:
+        """Recompute and store a user's rollup and daily stats from their transactions"""
+        if session is not None:
+            # Inside the caller's transaction a concurrent write aborts it instead
+            doc, _ = await self._rebuild(user_id, session=session)
+            return doc
+
+        from mongo_pool import mongo_manager
+        doc: Dict[str, Any] = {}
+        for _ in range(self.rebuild_attempts):
+            try:
+                doc, stored = await mongo_manager.run_transaction(
+                    lambda txn_session: self._rebuild(user_id, session=txn_session), profile="money"
+                )
+            except DuplicateKeyError:
+                stored = False
+            if stored:
+                return doc
+            self.stats['rebuild_conflicts'] += 1
+        logger.warning(f"⚠️ Rollup rebuild for user {user_id} kept racing concurrent writes; left as is")
+        return doc
+
+    async def delete_users(self, user_ids: Sequence[str]):
+        """Drop the rollups and daily stats of deleted users"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        db = await self._get_db()
+        await db[self.COLLECTION].delete_many({"user_id": {"$in": user_ids}})
+        await db[self.DAILY_COLLECTION].delete_many({"user_id": {"$in": user_ids}})
+
+    async def verify_user(self, user_id: str, repair: bool = False) -> Dict[str, Any]:
+        """Compare the stored rollup with the transactions; optionally rebuild on mismatch"""
+        db = await self._get_db()
+        expected, _ = await self._build_from_transactions(db, user_id)
+        stored = await db[self.COLLECTION].find_one({"user_id": user_id}) or {}
+
+        mismatches = {}
+        for field in ("income", "expense", "income_count", "expense_count"):
+            stored_value = stored.get("lifetime", {}).get(field, 0)
+            if abs(stored_value - expected["lifetime"][field]) > 0.005:
+                mismatches[f"lifetime.{field}"] = {"stored": stored_value, "expected": expected["lifetime"][field]}
+        for month, totals in expected["monthly"].items():
+            stored_month = stored.get("monthly", {}).get(month, {})
+            for field in TRANSACTION_TYPES:
+                if abs(stored_month.get(field, 0) - totals[field]) > 0.005:
+                    mismatches[f"monthly.{month}.{field}"] = {"stored": stored_month.get(field, 0), "expected": totals[field]}
+
+        if mismatches and repair:
+            await self.rebuild_user(user_id)
+
+        return {"user_id": user_id, "consistent": not mismatches, "mismatches": mismatches}
+
+    # ===== READ API =====
+
+    async def get_rollup(self, user_id: str, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        The user's rollup document (built on first access), projected to
+        ``fields`` such as ("lifetime", "categories", "monthly.2024-05")
+        """
+        db = await self._get_db()
+        self.stats['reads'] += 1
+        projection = {"_id": 0, **{field: 1 for field in fields}} if fields else {"_id": 0}
+        rollup = await db[self.COLLECTION].find_one({"user_id": user_id}, projection)
+        if rollup is None:
+            rollup = await self.rebuild_user(user_id)
+            if fields:
+                rollup = _project(rollup, fields)
+        return rollup
+
+    async def get_lifetime_totals(self, user_id: str) -> Dict[str, float]:
+        """Lifetime income/expense totals plus net savings"""
+        totals = {**_empty_totals(), **(await self.get_rollup(user_id, ("lifetime",))).get("lifetime", {})}
+        totals["net"] = totals["income"] - totals["expense"]
+        return totals
+
+    async def get_month_totals(self, user_id: str, month: Optional[str] = None) -> Dict[str, float]:
+        """Income/expense totals for a "YYYY-MM" month (default: current month)"""
+        month = month or datetime.now(timezone.utc).strftime("%Y-%m")
+        bucket = (await self.get_rollup(user_id, (f"monthly.{month}",))).get("monthly", {}).get(month, {})
+        totals = {**_empty_totals(), **{k: v for k, v in bucket.items() if k != "categories"}}
+        totals["net"] = totals["income"] - totals["expense"]
+        return totals
+
+    async def get_totals_since(self, user_id: str, start: datetime) -> Dict[str, float]:
+        """Income/expense totals for transactions dated at or after ``start``"""
+        return (await self.get_totals_since_many({user_id: start}))[user_id]
+
+    async def get_totals_since_many(self, starts: Dict[str, datetime]) -> Dict[str, Dict[str, float]]:
+        """
+        Totals since each user's own start: whole days come from the daily
+        stats (one ``daily_totals`` read per distinct start day); only the
+        partial start day is read from db.transactions.
+        """
+        db = await self._get_db()
+        results = {user_id: _empty_totals() for user_id in starts}
+        if not starts:
+            return results
+
+        # Users without a rollup predate rollups and have no daily stats yet
+        known = set(await db[self.COLLECTION].distinct("user_id", {"user_id": {"$in": list(starts)}}))
+        for user_id in starts:
+            if user_id not in known:
+                await self.rebuild_user(user_id)
+
+        partial_day_windows = {}
+        users_by_day: Dict[date, List[str]] = defaultdict(list)
+        for user_id, start in starts.items():
+            start = _as_utc(start)
+            day_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+            users_by_day[day_start.date()].append(user_id)
+            partial_day_windows[user_id] = (start, day_start + timedelta(days=1))
+
+        for start_day, user_ids in users_by_day.items():
+            rows = await self.daily_totals(user_ids, start_day + timedelta(days=1), date.max)
+            for user_id, totals in self.totals_by_user(rows).items():
+                for field in totals:
+                    results[user_id][field] += totals[field]
+
+        # One aggregation per chunk for the partial start days
+        items = list(partial_day_windows.items())
+        for offset in range(0, len(items), self.chunk_size):
+            chunk = items[offset:offset + self.chunk_size]
+            rows = await db.transactions.aggregate([
+                {"$match": {"$or": [
+                    {"user_id": user_id, "date": {"$gte": start, "$lt": day_end}}
+                    for user_id, (start, day_end) in chunk
+                ]}},
+                {"$group": {
+                    "_id": {"user_id": "$user_id", "type": "$type"},
+                    "total": {"$sum": "$amount"},
+                    "count": {"$sum": 1}
+                }}
+            ]).to_list(None)
+            for row in rows:
+                tx_type = row["_id"]["type"]
+                if tx_type in TRANSACTION_TYPES:
+                    results[row["_id"]["user_id"]][tx_type] += row["total"]
+                    results[row["_id"]["user_id"]][f"{tx_type}_count"] += row["count"]
+
+        return results
+
+    async def daily_totals(self, user_ids: Union[str, Iterable[str]],
+                           start: Union[date, datetime], end: Union[date, datetime],
+                           group_by: Sequence[str] = ("user_id", "type"),
+                           types: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Totals for one or many users between two days (inclusive), grouped by
+        any of user_id/day/type/category - one indexed read on the daily stats.
+        Each row holds the group fields plus ``total`` and ``count``.
+        """
+        if isinstance(user_ids, str):
+            user_ids = [user_ids]
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+
+        unknown = set(group_by) - set(self.DAILY_GROUP_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot group daily stats by {sorted(unknown)}")
+
+        def day_key(value):
+            if isinstance(value, datetime):
+                value = _as_utc(value)
+            return value.strftime("%Y-%m-%d")
+
+        match: Dict[str, Any] = {
+            "user_id": {"$in": user_ids} if len(user_ids) > 1 else user_ids[0],
+            "day": {"$gte": day_key(start), "$lte": day_key(end)}
+        }
+        if types:
+            match["type"] = {"$in": list(types)}
+
+        db = await self._get_db()
+        rows = await db[self.DAILY_COLLECTION].aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {field: f"${field}" for field in group_by},
+                "total": {"$sum": "$total"},
+                "count": {"$sum": "$count"}
+            }}
+        ]).to_list(None)
+        return [{**row["_id"], "total": row["total"], "count": row["count"]} for row in rows]
+
+    @staticmethod
+    def totals_by_user(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+        """Fold ``daily_totals(group_by=("user_id", "type"))`` rows into per-user income/expense"""
+        totals: Dict[str, Dict[str, float]] = defaultdict(_empty_totals)
+        for row in rows:
+            if row.get("type") in TRANSACTION_TYPES:
+                totals[row["user_id"]][row["type"]] += row["total"]
+                totals[row["user_id"]][f"{row['type']}_count"] += row["count"]
+        return totals
+
+    async def income_days(self, user_id: str, since: Optional[Union[date, datetime]] = None) -> List[date]:
+        """Distinct days with income (optionally from ``since`` on), for streak calculations"""
+        query: Dict[str, Any] = {"user_id": user_id, "type": "income", "count": {"$gt": 0}}
+        if since is not None:
+            if isinstance(since, datetime):
+                since = _as_utc(since)
+            query["day"] = {"$gte": since.strftime("%Y-%m-%d")}
+        db = await self._get_db()
+        days = await db[self.DAILY_COLLECTION].distinct("day", query)
+        return sorted(datetime.strptime(day, "%Y-%m-%d").date() for day in days)
+
+    @staticmethod
+    def category_spend(rollup: Dict[str, Any], month: Optional[str] = None) -> Dict[str, float]:
+        """Spend per category, lifetime or for one "YYYY-MM" month"""
+        source = rollup.get("categories", {}) if month is None else \
+            rollup.get("monthly", {}).get(month, {}).get("categories", {})
+        return {_decode_key(category): amount for category, amount in source.items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+# Global financial rollup service instance
+financial_rollups = FinancialRollupService()
+
+# Export for use in other modules
+__all__ = ['FinancialRollupService', 'financial_rollups']
@@ -0,0 +1,157 @@
+"""
+Friend Graph Service
+Per-user friend adjacency sets cached in Redis (or an in-process LRU when Redis
+is unavailable), plus batched user hydration for social endpoints
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from redis_pool import redis_manager
+from repositories import Projection, user_repository
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class FriendGraphService:
+    """
+    ``db.friendships`` (user1_id/user2_id, status "active") is the source of
+    truth. ``friends_of()`` loads a user's adjacency set once and serves it from
+    the ``friends:{user_id}`` Redis set until a friendship write calls
+    ``invalidate()``; without Redis the sets live in a bounded LRU on this
+    worker. Redis sets cannot be empty, so a sentinel member marks "no friends".
+    """
+
+    KEY_PREFIX = "friends:"
+    EMPTY_MARKER = "__none__"
+    DEFAULT_FIELDS = ("id", "full_name", "avatar", "university")
+
+    def __init__(self, ttl: int = 3600, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # user_id -> (friend ids, expires_at)
+        self._local: "OrderedDict[str, Tuple[Tuple[str, ...], float]]" = OrderedDict()
+
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'hydrations': 0}
+
+    async def _get_db(self):
+        from database import get_database
+        return await get_database()
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+
+    async def _load(self, user_id: str) -> List[str]:
+        """Read a user's active friendships from MongoDB"""
+        db = await self._get_db()
+        friendships = await db.friendships.find(
+            {"$or": [{"user1_id": user_id}, {"user2_id": user_id}], "status": "active"},
+            {"_id": 0, "user1_id": 1, "user2_id": 1}
+        ).to_list(None)
+
+        friend_ids = []
+        for friendship in friendships:
+            friend_id = friendship["user2_id"] if friendship["user1_id"] == user_id else friendship["user1_id"]
+            if friend_id not in friend_ids:
+                friend_ids.append(friend_id)
+        return friend_ids
+
+    def _get_local(self, user_id: str) -> Optional[List[str]]:
+        entry = self._local.get(user_id)
+        if entry is None:
+            return None
+        friend_ids, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._local[user_id]
+            return None
+        self._local.move_to_end(user_id)
+        return list(friend_ids)
+
+    def _set_local(self, user_id: str, friend_ids: Sequence[str]):
+        self._local[user_id] = (tuple(friend_ids), time.monotonic() + self.ttl)
+        self._local.move_to_end(user_id)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def friends_of(self, user_id: str) -> List[str]:
+        """Friend ids of ``user_id`` (one cache read; MongoDB only on a miss)"""
+        client = await redis_manager.get_client(db=0, decode_responses=True)
+
+        if client is not None:
+            try:
+                async with redis_manager.measure("friend_graph_get"):
+                    members = await client.smembers(self._key(user_id))
+                if members:
+                    self.stats['hits'] += 1
+                    return [member for member in members if member != self.EMPTY_MARKER]
+            except Exception as e:
+                redis_manager.report_error(e, db=0, decode_responses=True)
+                logger.warning(f"Friend graph Redis read failed for {user_id}: {str(e)}")
+                client = None
+        else:
+            friend_ids = self._get_local(user_id)
+            if friend_ids is not None:
+                self.stats['hits'] += 1
+                return friend_ids
+
+        self.stats['misses'] += 1
+        friend_ids = await self._load(user_id)
+
+        if client is not None:
+            try:
+                key = self._key(user_id)
+                pipe = client.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.sadd(key, *(friend_ids or [self.EMPTY_MARKER]))
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            except Exception as e:
+                redis_manager.report_error(e, db=0, decode_responses=True)
+                logger.warning(f"Friend graph Redis write failed for {user_id}: {str(e)}")
+        else:
+            self._set_local(user_id, friend_ids)
+
+        return friend_ids
+
+    async def are_friends(self, user_id: str, other_id: str) -> bool:
+        return other_id in await self.friends_of(user_id)
+
+    async def invalidate(self, *user_ids: str):
+        """Drop cached adjacency sets after a friendship is created or removed"""
+        for user_id in user_ids:
+            self._local.pop(user_id, None)
+        self.stats['invalidations'] += len(user_ids)
+
+        client = await redis_manager.get_client(db=0, decode_responses=True)
+        if client is None or not user_ids:
+            return
+        try:
+            await client.delete(*(self._key(user_id) for user_id in user_ids))
+        except Exception as e:
+            redis_manager.report_error(e, db=0, decode_responses=True)
+            logger.error(f"Friend graph invalidation failed for {user_ids}: {str(e)}")
+
+    async def hydrate_users(self, user_ids: Iterable[str],
+                            fields: Sequence[str] = DEFAULT_FIELDS) -> Dict[str, Dict[str, Any]]:
+        """Fetch many users in one projected ``$in`` query, keyed by id"""
+        users = await user_repository.find_by_ids(user_ids, Projection.fields_of(fields, "hydrate_users"))
+        self.stats['hydrations'] += 1
+        return users
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'local_entries': len(self._local), 'ttl': self.ttl}
+
+
+# Global friend graph instance
+friend_graph = FriendGraphService(
+    ttl=int(os.environ.get('FRIEND_GRAPH_TTL', '3600')),
+    max_entries=int(os.environ.get('FRIEND_GRAPH_MAX_ENTRIES', '10000'))
+)
+
+# Export for use in other modules
+__all__ = ['FriendGraphService', 'friend_graph']
@@ -5,6 +5,10 @@ from typing import List, Dict, Any, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from database import get_database, get_user_by_id
+from leaderboard_rank_engine import rank_engine
+from friend_graph import friend_graph
+from badge_rules import badge_rules, COUNTER_FIELDS, USER_PROJECTION
+from notification_store import notification_store
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,6 +16,7 @@ logger = logging.getLogger(__name__)
 class GamificationService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        self.rank_engine = rank_engine
 
     # ===== BADGE SYSTEM =====
     
@@ -193,128 +198,137 @@ class GamificationService:
                 badge_data["created_at"] = datetime.now(timezone.utc)
                 await self.db.badges.insert_one(badge_data)
                 logger.info(f"Initialized badge: {badge_data['name']}")
+        
+        badge_rules.invalidate()
 
     async def check_and_award_badges(self, user_id: str, event_type: str, event_data: Dict[str, Any]):
         """Check if user has earned new badges based on an event"""
-        user = await get_user_by_id(user_id)
-        if not user:
+        # Only rules this event can move; none means no badge queries at all
+        rules = await badge_rules.rules_for(self.db, event_type)
+        if not rules:
+            return []
+        # Nor does an event whose every badge the user already holds
+        if badge_rules.all_earned(user_id, rules):
             return []
         
-        # Get all active badges
-        badges = await self.db.badges.find({"is_active": True}).to_list(None)
+        user = await self.db.users.find_one({"id": user_id}, USER_PROJECTION)
+        if not user:
+            return []
         
-        # Get user's current badges
-        user_badges = await self.db.user_badges.find({"user_id": user_id}).to_list(None)
-        earned_badge_ids = [ub["badge_id"] for ub in user_badges]
+        earned_badge_ids = user.get("badge_ids")
+        if earned_badge_ids is None:
+            earned_badge_ids = await self._load_earned_badge_ids(user_id)
+        earned_badge_ids = set(earned_badge_ids)
+        badge_rules.remember_earned(user_id, earned_badge_ids)
         
         newly_earned_badges = []
-        
-        for badge in badges:
-            # Convert badge ObjectId to string for comparison
-            badge_id_str = str(badge["_id"])
-            if badge_id_str in earned_badge_ids:
+        for badge in rules:
+            if str(badge["_id"]) in earned_badge_ids:
                 continue  # User already has this badge
-                
             if await self._check_badge_requirement(user, badge, event_type, event_data):
-                # Award the badge
-                user_badge = {
-                    "user_id": user_id,
+                newly_earned_badges.append(dict(badge))
+        
+        if not newly_earned_badges:
+            return []
+        awarded = await self._award_badges(user, newly_earned_badges)
+        badge_rules.remember_earned(user_id, (str(badge["_id"]) for badge in awarded))
+        return awarded
+
+    async def _load_earned_badge_ids(self, user_id: str) -> List[str]:
+        """Materialize users.badge_ids for accounts created before it existed"""
+        badge_ids = await self.db.user_badges.distinct("badge_id", {"user_id": user_id})
+        await self.db.users.update_one(
+            {"id": user_id, "badge_ids": {"$exists": False}},
+            {"$set": {"badge_ids": badge_ids}}
+        )
+        return badge_ids
+
+    async def _award_badges(self, user: Dict, badges: List[Dict]) -> List[Dict]:
+        """Write all awards at once: one guarded user update, then one insert per collection"""
+        user_id = user["id"]
+        badge_ids = [str(badge["_id"]) for badge in badges]
+        points = sum(badge["points_awarded"] for badge in badges)
+        new_experience = user.get("experience_points", 0) + points
+        new_level, new_title = self._calculate_level_and_title(new_experience)
+        
+        # The $nin guard makes a concurrent evaluation of the same event award nothing
+        claimed = await self.db.users.update_one(
+            {"id": user_id, "badge_ids": {"$nin": badge_ids}},
+            {
+                "$addToSet": {"badge_ids": {"$each": badge_ids}},
+                "$inc": {"experience_points": points},
+                "$set": {"level": new_level, "title": new_title}
+            }
+        )
+        if claimed.modified_count == 0:
+            return []
+        
+        now = datetime.now(timezone.utc)
+        progress = {
+            "net_savings": user.get("net_savings", 0),
+            "current_streak": user.get("current_streak", 0),
+            "total_earnings": user.get("total_earnings", 0),
+            "experience_points": user.get("experience_points", 0)
+        }
+        await self.db.user_badges.insert_many([
+            {
+                "user_id": user_id,
+                "badge_id": badge_id,
+                "earned_at": now,
+                "progress_when_earned": progress,
+                "is_showcased": index == 0,  # Showcase first earned badge
+                "shared_count": 0
+            }
+            for index, badge_id in enumerate(badge_ids)
+        ])
+        
+        result = await self.db.achievements.insert_many([
+            {
+                "user_id": user_id,
+                "type": "badge_earned",
+                "title": f"Earned {badge['name']} Badge!",
+                "description": badge["description"],
+                "icon": badge["icon"],
+                "achievement_data": {
                     "badge_id": str(badge["_id"]),
-                    "earned_at": datetime.now(timezone.utc),
-                    "progress_when_earned": {
-                        "net_savings": user.get("net_savings", 0),
-                        "current_streak": user.get("current_streak", 0),
-                        "total_earnings": user.get("total_earnings", 0),
-                        "experience_points": user.get("experience_points", 0)
-                    },
-                    "is_showcased": len(newly_earned_badges) == 0,  # Showcase first earned badge
-                    "shared_count": 0
-                }
-                
-                await self.db.user_badges.insert_one(user_badge)
-                
-                # Update user's experience points
-                new_experience = user.get("experience_points", 0) + badge["points_awarded"]
-                new_level, new_title = self._calculate_level_and_title(new_experience)
-                
-                await self.db.users.update_one(
-                    {"_id": user["_id"]},
-                    {
-                        "$set": {
-                            "experience_points": new_experience,
-                            "level": new_level,
-                            "title": new_title
-                        }
-                    }
-                )
-                
-                # Create achievement record
-                achievement = {
-                    "user_id": user_id,
-                    "type": "badge_earned",
-                    "title": f"Earned {badge['name']} Badge!",
-                    "description": badge["description"],
-                    "icon": badge["icon"],
-                    "achievement_data": {
-                        "badge_id": str(badge["_id"]),
-                        "badge_name": badge["name"],
-                        "badge_rarity": badge["rarity"],
-                        "points_earned": badge["points_awarded"]
-                    },
-                    "points_earned": badge["points_awarded"],
-                    "created_at": datetime.now(timezone.utc),
-                    "is_shared": False,
-                    "reaction_count": 0
-                }
-                
-                result = await self.db.achievements.insert_one(achievement)
-                badge["achievement_id"] = str(result.inserted_id)
-                newly_earned_badges.append(badge)
-                
-                logger.info(f"User {user_id} earned badge: {badge['name']}")
+                    "badge_name": badge["name"],
+                    "badge_rarity": badge["rarity"],
+                    "points_earned": badge["points_awarded"]
+                },
+                "points_earned": badge["points_awarded"],
+                "created_at": now,
+                "is_shared": False,
+                "reaction_count": 0
+            }
+            for badge in badges
+        ])
+        
+        for badge, achievement_id in zip(badges, result.inserted_ids):
+            badge["achievement_id"] = str(achievement_id)
+            logger.info(f"User {user_id} earned badge: {badge['name']}")
         
-        return newly_earned_badges
+        return badges
 
     async def _check_badge_requirement(self, user: Dict, badge: Dict, event_type: str, event_data: Dict) -> bool:
         """Check if user meets the requirement for a specific badge"""
         requirement_type = badge["requirement_type"]
         requirement_value = badge["requirement_value"]
         
-        if requirement_type == "amount_saved":
-            return user.get("net_savings", 0) >= requirement_value
-            
-        elif requirement_type == "streak_days":
-            return user.get("current_streak", 0) >= requirement_value
-            
-        elif requirement_type == "goals_completed":
-            completed_goals = await self.db.financial_goals.count_documents({
-                "user_id": user["_id"],
-                "is_completed": True
-            })
-            return completed_goals >= requirement_value
-            
-        elif requirement_type == "hustles_completed":
-            # Count applications that were accepted/completed
-            completed_hustles = await self.db.hustle_applications.count_documents({
-                "user_id": user["_id"],
-                "status": "accepted"  # or you might have a "completed" status
-            })
-            return completed_hustles >= requirement_value
-            
-        elif requirement_type == "achievements_shared":
-            return user.get("achievements_shared", 0) >= requirement_value
+        counter_field = COUNTER_FIELDS.get(requirement_type)
+        if counter_field:
+            return (user.get(counter_field) or 0) >= requirement_value
             
         elif requirement_type == "campus_rank":
             # Check if user is in top N in their campus leaderboard
             if not user.get("university"):
                 return False
-            rank = await self._get_user_campus_rank(user["_id"], user["university"])
+            rank = await self._get_user_campus_rank(user["id"], user["university"])
             return rank <= requirement_value if rank else False
             
         elif requirement_type == "budget_streak":
             # Check if user has maintained budget for consecutive days
             # This would need more complex logic based on transaction history
-            return await self._check_budget_streak(user["_id"], requirement_value)
+            return await self._check_budget_streak(user["id"], requirement_value)
         
         return False
 
@@ -363,18 +377,11 @@ class GamificationService:
         # Get user_id - handle both "id" and "_id" fields
         user_id = user.get("id") or str(user.get("_id"))
         
-        # Get previous entry to compare rank changes
-        previous_entry = await self.db.leaderboards.find_one({
-            "user_id": user_id,
-            "leaderboard_type": leaderboard_type,
-            "period": period,
-            "university": university
-        })
+        # Previous rank/score come from the rank engine instead of a Mongo read
+        previous_rank, previous_score = await self.rank_engine.get_entry(leaderboard_type, period, university, user_id)
+        previous_score = previous_score or 0
         
-        previous_rank = previous_entry.get("rank") if previous_entry else None
-        previous_score = previous_entry.get("score", 0) if previous_entry else 0
-        
-        # Update or create leaderboard entry
+        # Persist the score; the rank is written back by the rank engine's reconciler
         await self.db.leaderboards.update_one(
             {
                 "user_id": user_id,
@@ -391,24 +398,15 @@ class GamificationService:
             upsert=True
         )
         
-        # Recalculate ranks for this leaderboard
-        await self._recalculate_leaderboard_ranks(leaderboard_type, period, university)
+        # O(log N) score update on this board only
+        new_rank = await self.rank_engine.update_score(leaderboard_type, period, university, user_id, score)
         
         # 🔥 REAL-TIME NOTIFICATIONS: Send leaderboard update notifications
         try:
-            # Get new rank after recalculation
-            updated_entry = await self.db.leaderboards.find_one({
-                "user_id": user_id,
-                "leaderboard_type": leaderboard_type,
-                "period": period,
-                "university": university
-            })
-            
-            if updated_entry and (score != previous_score or updated_entry.get("rank") != previous_rank):
+            if new_rank and (score != previous_score or new_rank != previous_rank):
                 from websocket_service import get_notification_service
                 notification_service = await get_notification_service()
                 
-                new_rank = updated_entry.get("rank", 0)
                 leaderboard_name = f"{leaderboard_type.title()} ({period.replace('_', ' ').title()})"
                 if university:
                     leaderboard_name += f" - {university}"
@@ -470,110 +468,25 @@ class GamificationService:
         
         return 0.0
 
-    async def _recalculate_leaderboard_ranks(self, leaderboard_type: str, period: str, university: Optional[str] = None):
-        """Recalculate ranks for a specific leaderboard"""
-        filter_query = {
-            "leaderboard_type": leaderboard_type,
-            "period": period
-        }
-        if university:
-            filter_query["university"] = university
-        
-        # Get all entries sorted by score (descending)
-        entries = await self.db.leaderboards.find(filter_query).sort("score", -1).to_list(None)
-        
-        # Update ranks
-        for i, entry in enumerate(entries):
-            await self.db.leaderboards.update_one(
-                {"_id": entry["_id"]},
-                {"$set": {"rank": i + 1}}
-            )
-
     async def get_leaderboard(self, leaderboard_type: str, period: str = "all_time", university: Optional[str] = None, limit: int = 10) -> Dict[str, Any]:
-        """Get leaderboard rankings - ensures each user appears only once"""
-        
-        if university:
-            # If university is specified, get only university-specific entries
-            filter_query = {
-                "leaderboard_type": leaderboard_type,
-                "period": period,
-                "university": university
-            }
-        else:
-            # For global leaderboard, use aggregation to get unique users with best scores
-            # Prioritize university-specific entries over global entries
-            pipeline = [
-                {
-                    "$match": {
-                        "leaderboard_type": leaderboard_type,
-                        "period": period
-                    }
-                },
-                {
-                    "$sort": {
-                        "user_id": 1,
-                        "university": 1,  # Prioritize university-specific (non-null) entries
-                        "score": -1
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": "$user_id",  # Group by user_id to ensure uniqueness
-                        "score": {"$first": "$score"},
-                        "university": {"$first": "$university"},
-                        "updated_at": {"$first": "$updated_at"},
-                        "leaderboard_type": {"$first": "$leaderboard_type"},
-                        "period": {"$first": "$period"}
-                    }
-                },
-                {
-                    "$sort": {"score": -1}  # Sort by score descending
-                },
-                {
-                    "$limit": limit
-                }
-            ]
-            
-            entries = await self.db.leaderboards.aggregate(pipeline).to_list(None)
-            
-            # Convert aggregation results to match expected format
-            formatted_entries = []
-            for i, entry in enumerate(entries):
-                formatted_entries.append({
-                    "user_id": entry["_id"],
-                    "score": entry["score"],
-                    "rank": i + 1,  # Assign sequential ranks
-                    "university": entry.get("university"),
-                    "leaderboard_type": entry["leaderboard_type"],
-                    "period": entry["period"]
-                })
-            entries = formatted_entries
+        """Get leaderboard rankings straight from the rank engine (one entry per user)"""
+        entries = await self.rank_engine.get_top(leaderboard_type, period, university, limit=limit)
         
-        if university:
-            # For university-specific queries, use the original method
-            entries = await self.db.leaderboards.find(filter_query).sort("rank", 1).limit(limit).to_list(None)
+        # Hydrate all ranked users in a single query
+        user_ids = [entry["user_id"] for entry in entries]
+        users = await self.db.users.find(
+            {"id": {"$in": user_ids}},
+            {"_id": 0, "id": 1, "full_name": 1, "avatar": 1, "university": 1, "level": 1, "title": 1}
+        ).to_list(len(user_ids))
+        users_by_id = {user["id"]: user for user in users}
         
-        # Get user details for each entry
         rankings = []
-        seen_users = set()  # Extra safety to prevent duplicates
-        
         for entry in entries:
-            user_id = str(entry["user_id"])
-            
-            # Skip if we've already seen this user (extra safety check)
-            if user_id in seen_users:
-                continue
-            seen_users.add(user_id)
-            
-            # Try to get user by _id (ObjectId) first, then by id (UUID string)
-            user = await self.db.users.find_one({"_id": entry["user_id"]})
-            if not user and isinstance(entry["user_id"], str):
-                user = await get_user_by_id(entry["user_id"])
-            
+            user = users_by_id.get(entry["user_id"])
             if user:
                 rankings.append({
                     "rank": entry["rank"],
-                    "user_id": user_id,
+                    "user_id": entry["user_id"],
                     "full_name": user.get("full_name", "Unknown"),
                     "avatar": user.get("avatar", "boy"),
                     "university": user.get("university"),
@@ -582,7 +495,7 @@ class GamificationService:
                     "score": entry["score"]
                 })
         
-        # Re-rank the final results to ensure proper sequential ranking
+        # Re-rank the final results in case a ranked user no longer exists
         for i, ranking in enumerate(rankings):
             ranking["rank"] = i + 1
         
@@ -598,16 +511,7 @@ class GamificationService:
 
     async def get_user_rank(self, user_id: str, leaderboard_type: str, period: str = "all_time", university: Optional[str] = None) -> Optional[int]:
         """Get user's rank in a specific leaderboard"""
-        filter_query = {
-            "user_id": user_id,
-            "leaderboard_type": leaderboard_type,
-            "period": period
-        }
-        if university:
-            filter_query["university"] = university
-        
-        entry = await self.db.leaderboards.find_one(filter_query)
-        return entry["rank"] if entry else None
+        return await self.rank_engine.get_rank(leaderboard_type, period, university, user_id)
 
     async def _get_user_campus_rank(self, user_id: str, university: str) -> Optional[int]:
         """Get user's overall campus rank (based on points)"""
@@ -846,7 +750,7 @@ class GamificationService:
             "priority": "high" if milestone_data["threshold"] >= 30 else "normal"
         }
         
-        await self.db.notifications.insert_one(notification)
+        await notification_store.insert(notification)
 
     async def _create_streak_break_notification(self, user_id: str, lost_streak: int, days_missed: int):
         """Create notification when streak breaks"""
@@ -883,7 +787,7 @@ class GamificationService:
             "priority": "high" if days_missed >= 3 else "normal"
         }
         
-        await self.db.notifications.insert_one(notification)
+        await notification_store.insert(notification)
 
     # ===== SOCIAL PROOF SYSTEM - PHASE 1 =====
     
@@ -905,7 +809,7 @@ class GamificationService:
         })
         
         # Get user's friends achievements for comparison
-        user_friends = await self._get_user_friends(user_id)
+        user_friends = await friend_graph.friends_of(user_id)
         friends_achievements = []
         
         if user_friends:
@@ -914,8 +818,11 @@ class GamificationService:
                 "created_at": {"$gte": datetime.combine(week_start, datetime.min.time()).replace(tzinfo=timezone.utc)}
             }).sort("created_at", -1).limit(10).to_list(None)
             
+            friends = await friend_graph.hydrate_users(
+                (achievement["user_id"] for achievement in friends_recent_achievements), ["full_name"]
+            )
             for achievement in friends_recent_achievements:
-                friend = await get_user_by_id(achievement["user_id"])
+                friend = friends.get(achievement["user_id"])
                 if friend:
                     friends_achievements.append({
                         "friend_name": friend.get("full_name", "Friend"),
@@ -961,8 +868,12 @@ class GamificationService:
                 "is_current_user": True
             })
             
-            for friend_id in user_friends[:20]:  # Limit to top 20 friends
-                friend = await get_user_by_id(friend_id)
+            top_friends = user_friends[:20]  # Limit to top 20 friends
+            friends = await friend_graph.hydrate_users(
+                top_friends, ["full_name", "experience_points", "current_streak"]
+            )
+            for friend_id in top_friends:
+                friend = friends.get(friend_id)
                 if friend:
                     friends_data.append({
                         "user_id": friend_id,
@@ -1006,25 +917,6 @@ class GamificationService:
         
         return messages
 
-    async def _get_user_friends(self, user_id: str) -> List[str]:
-        """Get list of user's friend IDs"""
-        # FIXED: Use correct friendship schema (user1_id/user2_id)
-        friendships = await self.db.friendships.find({
-            "$or": [
-                {"user1_id": user_id, "status": "active"},
-                {"user2_id": user_id, "status": "active"}
-            ]
-        }).to_list(None)
-        
-        friend_ids = []
-        for friendship in friendships:
-            if friendship["user1_id"] == user_id:
-                friend_ids.append(friendship["user2_id"])
-            else:
-                friend_ids.append(friendship["user1_id"])
-        
-        return friend_ids
-
     # ===== CELEBRATION QUEUE SYSTEM =====
     
     async def queue_celebration(self, user_id: str, celebration_data: Dict[str, Any]):
@@ -0,0 +1,376 @@
+"""
+Index Manifest
+The single declaration of every MongoDB index the application relies on,
+applied once at startup by database.init_database()
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+IndexKeys = Tuple[Tuple[str, int], ...]
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """Key pattern plus create_index() options (unique, expireAfterSeconds, ...)"""
+    keys: IndexKeys
+    options: Dict[str, Any] = field(default_factory=dict, hash=False, compare=False)
+
+    @property
+    def name(self) -> str:
+        """The name MongoDB gives the index by default, e.g. ``user_id_1_date_-1``"""
+        return "_".join(f"{key}_{direction}" for key, direction in self.keys)
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return tuple(key for key, _ in self.keys)
+
+
+def index(keys: Union[str, Sequence[Tuple[str, int]]], **options) -> IndexSpec:
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return IndexSpec(tuple((key, direction) for key, direction in keys), options)
+
+
+# Reconciled from database.init_database() and DatabaseOptimizer.create_performance_indexes().
+# Dropped from the optimizer's list because no query uses them or they conflict:
+# users.user_id (users are keyed by "id"), transactions(..., created_at) (transactions
+# sort on "date"), budgets(user_id, category) unique (budgets are per month),
+# notifications.read (the flag is "is_read"), transactions.amount (never filtered)
+# and single-key indexes that only repeated an existing one in the other direction.
+INDEX_MANIFEST: Dict[str, List[IndexSpec]] = {
+    # Users collection indexes
+    "users": [
+        index("email", unique=True),
+        index("id", unique=True),
+        index("created_at"),
+        index("email_verified"),
+        index("is_active"),
+        index("last_login"),
+        index("university"),
+        index("role"),
+    ],
+    # Transactions collection indexes
+    "transactions": [
+        index("user_id"),
+        index("date"),
+        index([("user_id", 1), ("date", -1)]),
+        index([("user_id", 1), ("date", -1), ("_id", -1)]),  # Keyset pagination
+        index("type"),
+        index("is_hustle_related"),
+        index("category"),
+        index([("user_id", 1), ("type", 1), ("date", -1)]),
+    ],
+    # User hustles collection indexes
+    "user_hustles": [
+        index("created_by"),
+        index("status"),
+        index("category"),
+        index("created_at"),
+        index("is_admin_posted"),
+        index("application_deadline"),
+    ],
+    # Hustle applications collection indexes
+    "hustle_applications": [
+        index("hustle_id"),
+        index("applicant_id"),
+        index([("hustle_id", 1), ("applicant_id", 1)], unique=True),
+        index("applied_at"),
+        index("status"),
+    ],
+    # Budgets collection indexes
+    "budgets": [
+        index("user_id"),
+        index("month"),
+        index([("user_id", 1), ("month", 1), ("category", 1)], unique=True),
+    ],
+    # Email verification collection indexes
+    "email_verifications": [
+        index("email"),
+        index("expires_at", expireAfterSeconds=0),
+    ],
+    # Password reset collection indexes
+    "password_resets": [
+        index("email"),
+        index("expires_at", expireAfterSeconds=0),
+    ],
+    # Financial goals collection indexes
+    "financial_goals": [
+        index("user_id"),
+        index("category"),
+        index("is_active"),
+        index([("user_id", 1), ("category", 1)]),
+        index("target_date"),
+    ],
+    # Category suggestions collection indexes
+    "category_suggestions": [
+        index("category"),
+        index("is_active"),
+        index([("category", 1), ("priority", -1)]),
+    ],
+    # Emergency types collection indexes
+    "emergency_types": [
+        index("name", unique=True),
+        index("urgency_level"),
+    ],
+    # Hospitals collection indexes
+    "hospitals": [
+        index("city"),
+        index("state"),
+        index([("latitude", 1), ("longitude", 1)]),
+        index("rating"),
+        index("is_emergency"),
+    ],
+    # Click analytics collection indexes
+    "click_analytics": [
+        index("user_id"),
+        index("category"),
+        index("clicked_at"),
+        index([("category", 1), ("clicked_at", -1)]),
+    ],
+    # Auto import sources collection indexes
+    "auto_import_sources": [
+        index("user_id"),
+        index("source_type"),
+        index("provider"),
+        index("is_active"),
+        index("created_at"),
+    ],
+    # Parsed transactions collection indexes
+    "parsed_transactions": [
+        index("user_id"),
+        index("source_id"),
+        index("created_at"),
+        index("confidence_score"),
+    ],
+    # Transaction suggestions collection indexes
+    "transaction_suggestions": [
+        index("user_id"),
+        index("parsed_transaction_id"),
+        index("status"),
+        index("created_at"),
+        index([("user_id", 1), ("status", 1)]),
+        index("confidence_score"),
+    ],
+    # Learning feedback collection indexes
+    "learning_feedback": [
+        index("user_id"),
+        index("suggestion_id"),
+        index("feedback_type"),
+        index("created_at"),
+        index([("user_id", 1), ("feedback_type", 1)]),
+    ],
+    # Universities collection indexes
+    "universities": [
+        index("name", unique=True),
+        index("city"),
+        index("state"),
+        index("type"),
+        index("ranking"),
+        index("is_verified"),
+        index([("city", 1), ("state", 1)]),
+        index([("state", 1), ("ranking", 1)]),
+        index("student_levels"),
+    ],
+    # Notifications collection indexes (high-traffic collection)
+    "notifications": [
+        index("user_id"),
+        index("is_read"),
+        index("created_at"),
+        index([("user_id", 1), ("is_read", 1)]),  # Compound for unread queries
+        index([("user_id", 1), ("created_at", -1)]),  # Sorted retrieval
+        index([("user_id", 1), ("created_at", -1), ("_id", -1)]),  # Keyset pagination
+        index("priority"),  # For priority-based filtering
+        index("notification_type"),  # For type-based filtering
+        # Mark-read by notification id; unique so a retried batch cannot write a notification twice
+        index("id", unique=True, partialFilterExpression={"id": {"$type": "string"}}),
+        index("expires_at", expireAfterSeconds=0),  # TTL: expire at the stored date
+    ],
+    # Per-user unread notification counters (notification_store)
+    "notification_counters": [
+        index("user_id", unique=True),
+    ],
+    # Friendships collection indexes (viral feature)
+    "friendships": [
+        index("user_id"),
+        index("friend_id"),
+        index([("user_id", 1), ("status", 1)]),  # Active friends
+        index([("friend_id", 1), ("status", 1)]),  # Reverse lookup
+        index("created_at"),
+        index("connection_type"),  # referral_signup, manual, etc.
+        index([("user1_id", 1), ("status", 1)]),  # Friend graph loads
+        index([("user2_id", 1), ("status", 1)]),
+    ],
+    # Timeline events indexes (friend feeds merge per-user event_date ranges)
+    "timeline_events": [
+        index("id"),
+        index([("user_id", 1), ("event_date", -1), ("id", -1)]),
+    ],
+    "timeline_reactions": [
+        index([("timeline_event_id", 1), ("user_id", 1)]),
+    ],
+    # Earned badges (backfills users.badge_ids, profile badge lists)
+    "user_badges": [
+        index([("user_id", 1), ("badge_id", 1)]),
+    ],
+    # Referral programs collection indexes
+    "referral_programs": [
+        index("referrer_id", unique=True),
+        index("referral_code", unique=True),
+        index("total_referrals"),
+        index("successful_referrals"),
+    ],
+    # Referred users collection indexes
+    "referred_users": [
+        index("referrer_id"),
+        index("referred_user_id"),
+        index("status"),
+        index("signed_up_at"),
+        index([("referrer_id", 1), ("status", 1)]),
+    ],
+    # Gamification collections indexes
+    "gamification_profiles": [
+        index("user_id", unique=True),
+        index("level"),
+        index("experience_points"),
+        index("current_streak"),
+        index([("university", 1), ("experience_points", -1)]),
+    ],
+    "social_shares": [
+        index([("user_id", 1), ("created_at", -1)]),
+        index("platform"),
+    ],
+    # Leaderboards collection indexes (high-read collection)
+    "leaderboards": [
+        index("leaderboard_type"),
+        index("period"),
+        index([("leaderboard_type", 1), ("period", 1)]),
+        index([("leaderboard_type", 1), ("period", 1), ("rank", 1)]),
+        index("user_id"),
+        index("university"),
+        index([("university", 1), ("leaderboard_type", 1)]),
+    ],
+    # Group challenges collection indexes
+    "group_challenges": [
+        index("challenge_type"),
+        index("university"),
+        index("status"),
+        index("end_date"),
+        index([("status", 1), ("end_date", 1)]),
+    ],
+    # Group challenge participants indexes
+    "group_challenge_participants": [
+        index("challenge_id"),
+        index("user_id"),
+        index([("challenge_id", 1), ("user_id", 1)], unique=True),
+        index("completed"),
+    ],
+    # Campus admin collections indexes
+    "campus_admin_requests": [
+        index("user_id"),
+        index("status"),
+        index("admin_type"),
+        index("college_name"),
+        index("email_verified"),
+    ],
+    # Performance monitoring indexes
+    "admin_audit_logs": [
+        index("admin_user_id"),
+        index("action_type"),
+        index("timestamp"),
+        index([("timestamp", -1), ("_id", -1)]),  # Keyset pagination
+        index("severity"),
+    ],
+    # Event outbox indexes (post-commit side-effect pipeline)
+    "event_outbox": [
+        index("id", unique=True),
+        index([("status", 1), ("next_attempt_at", 1)]),  # Worker claim
+        index([("status", 1), ("created_at", 1)]),  # Lag / backlog stats
+        index("processed_at", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "event_consumer_receipts": [
+        index("idempotency_key", unique=True),
+        index("started_at", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    # Materialized per-user financial totals
+    "user_financial_rollups": [
+        index("user_id", unique=True),
+    ],
+    "transaction_daily_stats": [
+        index([("user_id", 1), ("day", 1), ("type", 1), ("category", 1)], unique=True),
+    ],
+    # Prize challenge participations (joins, progress updates, leaderboards)
+    "prize_challenge_participations": [
+        index([("challenge_id", 1), ("user_id", 1)]),
+        index([("challenge_id", 1), ("participation_status", 1)]),
+        index([("challenge_id", 1), ("current_progress", -1)]),
+        index([("challenge_id", 1), ("joined_at", -1)]),
+        index([("user_id", 1), ("participation_status", 1)]),
+    ],
+    # Inter-college competition participations
+    "campus_competition_participations": [
+        index([("competition_id", 1), ("user_id", 1)]),
+        index([("competition_id", 1), ("registration_status", 1)]),
+        index([("competition_id", 1), ("campus", 1), ("registration_status", 1)]),
+        index([("competition_id", 1), ("individual_score", -1)]),
+        index([("competition_id", 1), ("current_progress", -1)]),
+        index([("competition_id", 1), ("registered_at", -1)]),
+        index([("user_id", 1), ("registration_status", 1)]),
+    ],
+    # Push subscriptions (preference lookups and the reminder scheduler's due-slot claim)
+    "push_subscriptions": [
+        index("user_id"),
+        index("subscription_data.endpoint"),
+        index("reminder_due_at", partialFilterExpression={"is_active": True}),
+    ],
+}
+
+
+async def apply_index_manifest(db, manifest: Dict[str, List[IndexSpec]] = INDEX_MANIFEST) -> Dict[str, Any]:
+    """
+    Create every declared index. Each index is created on its own so one
+    conflict (e.g. an existing index with different options) does not stop
+    the rest; create_index() is a no-op for indexes that already exist.
+    """
+    created = 0
+    failures: List[Dict[str, str]] = []
+
+    for collection_name, specs in manifest.items():
+        for spec in specs:
+            try:
+                await db[collection_name].create_index(list(spec.keys), **spec.options)
+                created += 1
+            except Exception as e:
+                failures.append({"collection": collection_name, "index": spec.name, "error": str(e)})
+                logger.warning(f"⚠️ Index {collection_name}.{spec.name} not created: {str(e)}")
+
+    summary = {"collections": len(manifest), "indexes": created, "failed": len(failures), "failures": failures}
+    logger.info(f"📇 Index manifest applied: {created} indexes on {len(manifest)} collections, {len(failures)} failed")
+    return summary
+
+
+def covering_index(collection_name: str, keys: Sequence[Tuple[str, int]], match_directions: bool = True,
+                   manifest: Dict[str, List[IndexSpec]] = INDEX_MANIFEST) -> Optional[str]:
+    """
+    Name of a declared index that can serve ``keys``: its key pattern starts
+    with the same fields, in the same or the fully reversed directions (any
+    directions when the query does not sort)
+    """
+    keys = tuple((key, direction) for key, direction in keys)
+    reversed_keys = tuple((key, -direction) for key, direction in keys)
+    fields = tuple(key for key, _ in keys)
+    for spec in manifest.get(collection_name, []):
+        prefix = spec.keys[:len(keys)]
+        if prefix == keys or prefix == reversed_keys:
+            return spec.name
+        if not match_directions and spec.fields[:len(fields)] == fields:
+            return spec.name
+    return None
+
+
+# Export for use in other modules
+__all__ = ['IndexSpec', 'index', 'INDEX_MANIFEST', 'apply_index_manifest', 'covering_index']
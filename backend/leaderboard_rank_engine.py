@@ -0,0 +1,603 @@
+"""
+Leaderboard Rank Engine
+Keeps every (leaderboard_type, period, university) board ordered in a structure
+that updates one member's score in O(log N) and answers rank / top-K queries
+without touching MongoDB. Ranks are persisted to db.leaderboards in the background.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from redis_pool import redis_manager
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+BoardKey = Tuple[str, str, Optional[str]]
+
+
+class _SkipNode:
+    __slots__ = ("key", "forward", "span")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.forward: List[Optional["_SkipNode"]] = [None] * level
+        self.span: List[int] = [0] * level
+
+
+class OrderStatisticSkipList:
+    """
+    Indexable skip list (same layout as Redis' zskiplist).
+    Every forward pointer carries the number of nodes it jumps over, so insert,
+    delete, rank-of-key and key-at-rank are all O(log N) expected.
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.head = _SkipNode(None, self.MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [self.head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        x = self.head
+
+        for i in range(self.level - 1, -1, -1):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            while x.forward[i] is not None and x.forward[i].key < key:
+                rank[i] += x.span[i]
+                x = x.forward[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = self.length
+            self.level = level
+
+        node = _SkipNode(key, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = (rank[0] - rank[i]) + 1
+
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+
+        self.length += 1
+
+    def delete(self, key) -> bool:
+        update = [self.head] * self.MAX_LEVEL
+        x = self.head
+
+        for i in range(self.level - 1, -1, -1):
+            while x.forward[i] is not None and x.forward[i].key < key:
+                x = x.forward[i]
+            update[i] = x
+
+        x = x.forward[0]
+        if x is None or x.key != key:
+            return False
+
+        for i in range(self.level):
+            if update[i].forward[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].forward[i] = x.forward[i]
+            else:
+                update[i].span[i] -= 1
+
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+
+        self.length -= 1
+        return True
+
+    def rank(self, key) -> Optional[int]:
+        """1-based position of key, or None if absent"""
+        traversed = 0
+        x = self.head
+        for i in range(self.level - 1, -1, -1):
+            while x.forward[i] is not None and x.forward[i].key <= key:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if x is not self.head and x.key == key:
+                return traversed
+        return None
+
+    def slice(self, start: int, count: int) -> List[Any]:
+        """Keys at 0-based positions [start, start + count)"""
+        if start < 0 or count <= 0 or start >= self.length:
+            return []
+
+        target = start + 1
+        traversed = 0
+        x = self.head
+        for i in range(self.level - 1, -1, -1):
+            while x.forward[i] is not None and traversed + x.span[i] <= target:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if traversed == target:
+                break
+
+        keys = []
+        while x is not None and len(keys) < count:
+            keys.append(x.key)
+            x = x.forward[0]
+        return keys
+
+
+class _LocalBoard:
+    """In-process board: skip list ordered by (-score, user_id) plus a score index"""
+
+    def __init__(self):
+        self.ordering = OrderStatisticSkipList()
+        self.scores: Dict[str, float] = {}
+
+    def set_score(self, user_id: str, score: float):
+        previous = self.scores.get(user_id)
+        if previous is not None:
+            if previous == score:
+                return
+            self.ordering.delete((-previous, user_id))
+        self.scores[user_id] = score
+        self.ordering.insert((-score, user_id))
+
+    def remove(self, user_id: str):
+        previous = self.scores.pop(user_id, None)
+        if previous is not None:
+            self.ordering.delete((-previous, user_id))
+
+    def rank(self, user_id: str) -> Optional[int]:
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.ordering.rank((-score, user_id))
+
+    def top(self, start: int, count: int) -> List[Tuple[str, float]]:
+        return [(user_id, -neg_score) for neg_score, user_id in self.ordering.slice(start, count)]
+
+
+class LeaderboardRankEngine:
+    """
+    Rank engine for gamification leaderboards.
+
+    Uses one Redis sorted set per board when Redis is reachable (shared by all
+    workers) and falls back to an in-process order-statistic skip list. Scores
+    are stored negated so ties order by user_id ascending on both backends.
+    Boards are bootstrapped lazily from db.leaderboards (a Redis board found
+    empty is re-seeded, so an evicted sorted set recovers by itself).
+
+    Every write records the 1-based rank range whose members it moved - on
+    the ``{key}:shifted`` sorted set in Redis (members "lo"/"hi", widened with
+    ZADD LT/GT) or in-process - and marks the board dirty. ``reconcile()``
+    writes back only the ranks inside that range, read from the shared board
+    at write time, so no worker relies on what it persisted earlier.
+    """
+
+    KEY_PREFIX = "lb"
+    DIRTY_SET = "lb:dirty"
+
+    def __init__(self, reconcile_interval: int = 60, redis_db: int = 3, load_check_interval: int = 60):
+        self.reconcile_interval = reconcile_interval
+        # A Redis db of its own, so cache invalidation never touches the boards
+        self.redis_db = redis_db
+        # How long a worker trusts that a Redis board is still populated
+        self.load_check_interval = load_check_interval
+        self.redis_client = None
+        self._boards: Dict[BoardKey, _LocalBoard] = {}
+        self._loaded: Dict[BoardKey, float] = {}
+        self._dirty: Set[BoardKey] = set()
+        self._shifted: Dict[BoardKey, Tuple[int, int]] = {}
+        self._load_locks: Dict[BoardKey, asyncio.Lock] = {}
+        self._reconciler_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'score_updates': 0,
+            'rank_queries': 0,
+            'top_queries': 0,
+            'boards_loaded': 0,
+            'reconcile_runs': 0,
+            'ranks_persisted': 0,
+            'redis_fallbacks': 0,
+        }
+
+    # ===== BACKEND =====
+
+    def _switch_backend(self, client):
+        if (client is None) != (self.redis_client is None):
+            # Backend switched (Redis lost or regained): re-bootstrap boards from MongoDB
+            self._loaded.clear()
+            self._boards.clear()
+            self._shifted.clear()
+        self.redis_client = client
+
+    async def _get_redis(self):
+        """Shared Redis client from the connection manager; None means in-process boards"""
+        client = await redis_manager.get_client(db=self.redis_db, decode_responses=True)
+        self._switch_backend(client)
+        return client
+
+    def _fallback(self, error: Exception):
+        """A Redis call failed: report it and serve this call from the in-process boards"""
+        logger.warning(f"⚠️ Rank engine Redis error, using in-process boards: {str(error)}")
+        redis_manager.report_error(error, db=self.redis_db, decode_responses=True)
+        self._switch_backend(None)
+        self.stats['redis_fallbacks'] += 1
+
+    async def _get_db(self):
+        from database import get_database
+        return await get_database()
+
+    def _board_key(self, board: BoardKey) -> str:
+        leaderboard_type, period, university = board
+        return f"{self.KEY_PREFIX}:{leaderboard_type}:{period}:{university or '*'}"
+
+    def _parse_board_key(self, key: str) -> BoardKey:
+        _, leaderboard_type, period, university = key.split(":", 3)
+        return leaderboard_type, period, None if university == "*" else university
+
+    def _is_loaded(self, board: BoardKey) -> bool:
+        loaded_at = self._loaded.get(board)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.load_check_interval
+
+    async def _ensure_loaded(self, board: BoardKey, redis_client) -> Optional[_LocalBoard]:
+        """
+        Bootstrap a board from db.leaderboards the first time it is touched on
+        the given backend. A Redis board is re-checked every
+        ``load_check_interval`` seconds and re-seeded when it is empty.
+        Returns the in-process board when ``redis_client`` is None; Redis
+        errors propagate to the caller's fallback.
+        """
+        if redis_client is None:
+            if board in self._boards:
+                return self._boards[board]
+        elif self._is_loaded(board):
+            return None
+
+        lock = self._load_locks.setdefault(board, asyncio.Lock())
+        async with lock:
+            if redis_client is None and board in self._boards:
+                return self._boards[board]
+            if redis_client is not None and self._is_loaded(board):
+                return None
+
+            key = self._board_key(board)
+            if redis_client is not None and await redis_client.zcard(key):
+                self._loaded[board] = time.monotonic()
+                return None
+
+            leaderboard_type, period, university = board
+            db = await self._get_db()
+            cursor = db.leaderboards.find(
+                {"leaderboard_type": leaderboard_type, "period": period, "university": university},
+                {"_id": 0, "user_id": 1, "score": 1}
+            )
+
+            members: Dict[str, float] = {}
+            async for entry in cursor:
+                members[str(entry["user_id"])] = float(entry.get("score") or 0)
+
+            self.stats['boards_loaded'] += 1
+            if redis_client is not None:
+                if members:
+                    # NX: never overwrite a score another worker wrote since the ZCARD
+                    await redis_client.zadd(key, {user_id: -score for user_id, score in members.items()}, nx=True)
+                    # Stored ranks predate this board; the next reconcile rewrites them all
+                    await self._mark_shifted(board, redis_client, 1, len(members))
+                self._loaded[board] = time.monotonic()
+                return None
+
+            local_board = _LocalBoard()
+            for user_id, score in members.items():
+                local_board.set_score(user_id, score)
+            self._boards[board] = local_board
+            if members:
+                await self._mark_shifted(board, None, 1, len(members))
+            return local_board
+
+    @staticmethod
+    def _shifted_range(old_rank: Optional[int], new_rank: Optional[int], size: int) -> Optional[Tuple[int, int]]:
+        """
+        1-based rank range whose members moved when one member went from
+        ``old_rank`` to ``new_rank`` (1-based, None when absent); ``size`` is
+        the board size afterwards. None when no rank changed.
+        """
+        if old_rank == new_rank:
+            return None
+        if old_rank is None or new_rank is None:
+            # Joining or leaving moves everyone below by one place
+            low, high = old_rank or new_rank, size
+        else:
+            low, high = min(old_rank, new_rank), max(old_rank, new_rank)
+        return (low, high) if low <= high else None
+
+    async def _mark_shifted(self, board: BoardKey, redis_client, low: int, high: int):
+        """Widen the board's pending rank range and mark it dirty"""
+        if redis_client is not None:
+            key = self._board_key(board)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.zadd(f"{key}:shifted", {"lo": low}, lt=True)
+            pipe.zadd(f"{key}:shifted", {"hi": high}, gt=True)
+            pipe.sadd(self.DIRTY_SET, key)
+            await pipe.execute()
+            return
+
+        pending = self._shifted.get(board)
+        if pending is not None:
+            low, high = min(low, pending[0]), max(high, pending[1])
+        self._shifted[board] = (low, high)
+        self._dirty.add(board)
+
+    # ===== QUERIES =====
+
+    async def update_score(self, leaderboard_type: str, period: str, university: Optional[str],
+                           user_id: str, score: float) -> Optional[int]:
+        """Set a member's score and return its new 1-based rank"""
+        board = (leaderboard_type, period, university)
+        self.stats['score_updates'] += 1
+
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                await self._ensure_loaded(board, redis_client)
+                key = self._board_key(board)
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.zrank(key, user_id)
+                pipe.zadd(key, {user_id: -float(score)})
+                pipe.zrank(key, user_id)
+                pipe.zcard(key)
+                old_rank, _, new_rank, size = await pipe.execute()
+                old_rank = old_rank + 1 if old_rank is not None else None
+                new_rank = new_rank + 1 if new_rank is not None else None
+                shifted = self._shifted_range(old_rank, new_rank, size)
+                if shifted:
+                    await self._mark_shifted(board, redis_client, *shifted)
+                return new_rank
+            except Exception as e:
+                self._fallback(e)
+
+        local_board = await self._ensure_loaded(board, None)
+        old_rank = local_board.rank(user_id)
+        local_board.set_score(user_id, float(score))
+        new_rank = local_board.rank(user_id)
+        shifted = self._shifted_range(old_rank, new_rank, len(local_board.scores))
+        if shifted:
+            await self._mark_shifted(board, None, *shifted)
+        return new_rank
+
+    async def remove_member(self, leaderboard_type: str, period: str, university: Optional[str], user_id: str):
+        """Drop a member from a board"""
+        board = (leaderboard_type, period, university)
+
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                await self._ensure_loaded(board, redis_client)
+                key = self._board_key(board)
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.zrank(key, user_id)
+                pipe.zrem(key, user_id)
+                pipe.zcard(key)
+                old_rank, _, size = await pipe.execute()
+                shifted = self._shifted_range(old_rank + 1 if old_rank is not None else None, None, size)
+                if shifted:
+                    await self._mark_shifted(board, redis_client, *shifted)
+                return
+            except Exception as e:
+                self._fallback(e)
+
+        local_board = await self._ensure_loaded(board, None)
+        old_rank = local_board.rank(user_id)
+        local_board.remove(user_id)
+        shifted = self._shifted_range(old_rank, None, len(local_board.scores))
+        if shifted:
+            await self._mark_shifted(board, None, *shifted)
+
+    async def get_rank(self, leaderboard_type: str, period: str, university: Optional[str],
+                       user_id: str) -> Optional[int]:
+        """1-based rank of a member, or None if they are not on the board"""
+        board = (leaderboard_type, period, university)
+        self.stats['rank_queries'] += 1
+
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                await self._ensure_loaded(board, redis_client)
+                rank = await redis_client.zrank(self._board_key(board), user_id)
+                return rank + 1 if rank is not None else None
+            except Exception as e:
+                self._fallback(e)
+
+        local_board = await self._ensure_loaded(board, None)
+        return local_board.rank(user_id)
+
+    async def get_entry(self, leaderboard_type: str, period: str, university: Optional[str],
+                        user_id: str) -> Tuple[Optional[int], Optional[float]]:
+        """(rank, score) of a member"""
+        board = (leaderboard_type, period, university)
+
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                await self._ensure_loaded(board, redis_client)
+                key = self._board_key(board)
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.zrank(key, user_id)
+                pipe.zscore(key, user_id)
+                rank, neg_score = await pipe.execute()
+                if rank is None:
+                    return None, None
+                return rank + 1, -float(neg_score)
+            except Exception as e:
+                self._fallback(e)
+
+        local_board = await self._ensure_loaded(board, None)
+        return local_board.rank(user_id), local_board.scores.get(user_id)
+
+    async def get_top(self, leaderboard_type: str, period: str, university: Optional[str],
+                      limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """Top-K members as [{"user_id", "score", "rank"}]"""
+        board = (leaderboard_type, period, university)
+        self.stats['top_queries'] += 1
+
+        members = None
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                await self._ensure_loaded(board, redis_client)
+                members = await redis_client.zrange(self._board_key(board), offset, offset + limit - 1, withscores=True)
+                members = [(user_id, -float(neg_score)) for user_id, neg_score in members]
+            except Exception as e:
+                self._fallback(e)
+                members = None
+
+        if members is None:
+            local_board = await self._ensure_loaded(board, None)
+            members = local_board.top(offset, limit)
+
+        return [
+            {"user_id": user_id, "score": score, "rank": offset + i + 1}
+            for i, (user_id, score) in enumerate(members)
+        ]
+
+    async def get_board_size(self, leaderboard_type: str, period: str, university: Optional[str]) -> int:
+        board = (leaderboard_type, period, university)
+
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                await self._ensure_loaded(board, redis_client)
+                return await redis_client.zcard(self._board_key(board))
+            except Exception as e:
+                self._fallback(e)
+
+        local_board = await self._ensure_loaded(board, None)
+        return len(local_board.scores)
+
+    # ===== RECONCILER =====
+
+    async def _pop_dirty_boards(self) -> List[BoardKey]:
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                keys = await redis_client.spop(self.DIRTY_SET, 1000) or []
+                return [self._parse_board_key(key) for key in keys]
+            except Exception as e:
+                self._fallback(e)
+
+        boards = list(self._dirty)
+        self._dirty.clear()
+        return boards
+
+    async def _pop_shifted(self, board: BoardKey) -> Optional[Tuple[int, int]]:
+        """Take (and clear) the rank range a board's writes moved since the last reconcile"""
+        redis_client = await self._get_redis()
+        if redis_client is not None:
+            try:
+                shifted_key = f"{self._board_key(board)}:shifted"
+                pipe = redis_client.pipeline(transaction=True)
+                pipe.zrange(shifted_key, 0, -1, withscores=True)
+                pipe.delete(shifted_key)
+                bounds, _ = await pipe.execute()
+                bounds = {name: int(value) for name, value in bounds}
+                if "lo" not in bounds or "hi" not in bounds:
+                    return None
+                return bounds["lo"], bounds["hi"]
+            except Exception as e:
+                self._fallback(e)
+
+        return self._shifted.pop(board, None)
+
+    async def reconcile(self) -> int:
+        """Persist the moved ranks of every dirty board to db.leaderboards; returns rows written"""
+        db = await self._get_db()
+        written = 0
+
+        for board in await self._pop_dirty_boards():
+            shifted = await self._pop_shifted(board)
+            if shifted is None:
+                continue
+            leaderboard_type, period, university = board
+            low, high = shifted
+            entries = await self.get_top(leaderboard_type, period, university, limit=high - low + 1, offset=low - 1)
+
+            operations = [
+                UpdateOne(
+                    {"user_id": entry["user_id"], "leaderboard_type": leaderboard_type,
+                     "period": period, "university": university},
+                    {"$set": {"rank": entry["rank"]}}
+                )
+                for entry in entries
+            ]
+            if operations:
+                await db.leaderboards.bulk_write(operations, ordered=False)
+                written += len(operations)
+
+        self.stats['reconcile_runs'] += 1
+        self.stats['ranks_persisted'] += written
+        if written:
+            logger.info(f"🏆 Rank reconciler persisted {written} leaderboard ranks")
+        return written
+
+    async def _reconcile_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.reconcile_interval)
+                await self.reconcile()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Rank reconciler error: {str(e)}")
+
+    async def start_reconciler(self):
+        """Start the periodic rank persistence loop"""
+        if self._reconciler_task is None or self._reconciler_task.done():
+            self._reconciler_task = asyncio.create_task(self._reconcile_loop())
+            logger.info(f"🚀 Leaderboard rank reconciler started (every {self.reconcile_interval}s)")
+
+    async def stop_reconciler(self):
+        """Stop the reconciler after a final flush"""
+        if self._reconciler_task is not None:
+            self._reconciler_task.cancel()
+            await asyncio.gather(self._reconciler_task, return_exceptions=True)
+            self._reconciler_task = None
+        try:
+            await self.reconcile()
+        except Exception as e:
+            logger.error(f"Final rank reconcile failed: {str(e)}")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            'backend': 'redis' if self.redis_client is not None else 'memory',
+            'boards_loaded': len(self._loaded),
+            'dirty_boards': len(self._dirty),
+            **self.stats
+        }
+
+
+# Global rank engine instance
+rank_engine = LeaderboardRankEngine(redis_db=int(os.environ.get('LEADERBOARD_REDIS_DB', '3')))
+
+# Export for use in other modules
+__all__ = ['LeaderboardRankEngine', 'OrderStatisticSkipList', 'rank_engine']
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Migrate Notifications Into The Unified Store
+Rewrites legacy-shaped documents in db.notifications onto the store schema,
+copies db.in_app_notifications into db.notifications, and recounts every
+user's unread counter.
+
+Usage:
+    python migrate_notifications.py                 # normalize, copy, recount
+    python migrate_notifications.py --drop-legacy   # also drop in_app_notifications
+"""
+
+import argparse
+import asyncio
+import sys
+import os
+import logging
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from pymongo import ReplaceOne
+from database import get_database
+from notification_store import notification_store, FIELD_ALIASES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+async def normalize_existing(db) -> int:
+    """Rewrite notifications that still use legacy field names or have no expiry"""
+    legacy_query = {"$or": [{field: {"$exists": True}} for field in FIELD_ALIASES] + [{"expires_at": {"$exists": False}}]}
+
+    rewritten = 0
+    batch = []
+    async for doc in db.notifications.find(legacy_query):
+        batch.append(ReplaceOne({"_id": doc["_id"]}, notification_store.normalize(doc)))
+        if len(batch) >= BATCH_SIZE:
+            rewritten += (await db.notifications.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        rewritten += (await db.notifications.bulk_write(batch, ordered=False)).modified_count
+    return rewritten
+
+async def copy_in_app(db) -> int:
+    """Copy in_app_notifications into notifications, skipping ids already present"""
+    copied = 0
+    batch = []
+
+    async def write(docs):
+        ids = [doc["id"] for doc in docs]
+        existing = set(await db.notifications.distinct("id", {"id": {"$in": ids}}))
+        fresh = [doc for doc in docs if doc["id"] not in existing]
+        if fresh:
+            await db.notifications.insert_many(fresh, ordered=False)
+        return len(fresh)
+
+    async for doc in db.in_app_notifications.find({}, {"_id": 0}):
+        batch.append(notification_store.normalize(doc))
+        if len(batch) >= BATCH_SIZE:
+            copied += await write(batch)
+            batch = []
+    if batch:
+        copied += await write(batch)
+    return copied
+
+async def run(drop_legacy: bool = False):
+    db = await get_database()
+    logger.info("🚀 Migrating notifications into the unified store...")
+
+    rewritten = await normalize_existing(db)
+    logger.info(f"   ... {rewritten} legacy notifications normalized")
+
+    copied = await copy_in_app(db)
+    logger.info(f"   ... {copied} in-app notifications copied")
+
+    user_ids = await db.notifications.distinct("user_id")
+    for index, user_id in enumerate(user_ids, start=1):
+        await notification_store.recount(user_id)
+        if index % 500 == 0:
+            logger.info(f"   ... {index}/{len(user_ids)} unread counters recounted")
+
+    if drop_legacy:
+        await db.in_app_notifications.drop()
+        logger.info("   ... in_app_notifications dropped")
+
+    summary = {"normalized": rewritten, "copied": copied, "counters": len(user_ids)}
+    logger.info(f"✅ Notification migration done: {summary}")
+    return summary
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrate notifications into the unified notification store")
+    parser.add_argument("--drop-legacy", action="store_true", help="Drop in_app_notifications after copying it")
+    args = parser.parse_args()
+
+    return await run(drop_legacy=args.drop_legacy)
+
+if __name__ == "__main__":
+    asyncio.run(main())
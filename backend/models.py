@@ -52,6 +52,8 @@ class User(BaseModel):
     level: int = 1
     experience_points: int = 0
     title: str = "Beginner"  # e.g., "Savings Champion", "Budget Master"
+    badge_ids: List[str] = []  # Earned badge ids, mirrors user_badges for badge rules
+    goals_completed: int = 0
     
     # Community features
     achievements_shared: int = 0  # Count of achievements shared
@@ -650,6 +652,15 @@ class HustleApplicationCreate(BaseModel):
             raise ValueError('Cover message cannot exceed 500 characters')
         return v.strip()
 
+class HustleApplicationStatusUpdate(BaseModel):
+    status: str  # "accepted", "rejected"
+
+    @validator('status')
+    def validate_status(cls, v):
+        if v not in ("accepted", "rejected"):
+            raise ValueError('Status must be "accepted" or "rejected"')
+        return v
+
 class HustleOpportunity(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
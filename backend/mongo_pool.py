@@ -0,0 +1,233 @@
+"""
+Shared MongoDB Connection Layer
+One AsyncIOMotorClient (one connection pool) for the whole process, with
+per-workload read/write concern profiles and connection checkout statistics
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference, monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+from query_telemetry import query_monitor
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Workload -> options for Database.with_options(); "default" uses the client's settings
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    # Balances, rollups and anything a payout is computed from
+    "money": {
+        "write_concern": WriteConcern(w="majority", j=True, wtimeout=10000),
+        "read_concern": ReadConcern("majority"),
+    },
+    # Re-creatable on loss; acknowledged by the primary only
+    "notifications": {
+        "write_concern": WriteConcern(w=1),
+    },
+    "analytics": {
+        "write_concern": WriteConcern(w=1),
+        "read_preference": ReadPreference.SECONDARY_PREFERRED,
+    },
+}
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Counts connection checkouts and how long callers waited for one. pymongo
+    checks connections out on the calling thread, so the start of a checkout
+    is kept in a thread-local when the event itself carries no duration.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {
+            'checkouts': 0, 'checkout_failures': 0, 'checked_in': 0,
+            'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+            'connections_created': 0, 'connections_closed': 0, 'pool_clears': 0,
+        }
+        self.failure_reasons: Dict[str, int] = {}
+
+    def _wait_ms(self, event) -> float:
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration * 1000
+        started = getattr(self._local, "started", None)
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms(event)
+        with self._lock:
+            self.stats['checkouts'] += 1
+            self.stats['wait_ms_total'] += wait_ms
+            self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+
+    def connection_check_out_failed(self, event):
+        reason = str(getattr(event, "reason", "unknown"))
+        with self._lock:
+            self.stats['checkout_failures'] += 1
+            self.failure_reasons[reason] = self.failure_reasons.get(reason, 0) + 1
+        logger.warning(f"⚠️ MongoDB connection checkout failed ({reason}) after {self._wait_ms(event):.1f}ms")
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.stats['checked_in'] += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.stats['connections_created'] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.stats['connections_closed'] += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.stats['pool_clears'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            failure_reasons = dict(self.failure_reasons)
+        return {
+            'checkouts': stats['checkouts'],
+            'checkout_failures': stats['checkout_failures'],
+            'failure_reasons': failure_reasons,
+            'in_use': stats['checkouts'] - stats['checked_in'],
+            'open_connections': stats['connections_created'] - stats['connections_closed'],
+            'avg_wait_ms': round(stats['wait_ms_total'] / stats['checkouts'], 3) if stats['checkouts'] else 0.0,
+            'max_wait_ms': round(stats['wait_ms_max'], 3),
+            'pool_clears': stats['pool_clears'],
+        }
+
+
+class MongoConnectionManager:
+    """
+    Owns the process-wide Motor client. The client is created on first use
+    (Motor connects lazily anyway) and every module, script and service gets
+    databases from here instead of building its own pool.
+    """
+
+    def __init__(self):
+        self.mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+        self.db_name = os.environ.get('DB_NAME', 'moneymojo_db')
+        self.max_pool_size = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+        self.min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+        self.max_idle_ms = int(os.environ.get('MONGO_MAX_IDLE_MS', '30000'))
+        self.wait_queue_timeout_ms = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+
+        self.pool_monitor = PoolMonitor()
+        self._client: Optional[AsyncIOMotorClient] = None
+        self._databases: Dict[str, Any] = {}
+        self._supports_transactions: Optional[bool] = None
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        if self._client is None:
+            self._client = AsyncIOMotorClient(
+                self.mongo_url,
+                maxPoolSize=self.max_pool_size,
+                minPoolSize=self.min_pool_size,
+                maxIdleTimeMS=self.max_idle_ms,
+                waitQueueTimeoutMS=self.wait_queue_timeout_ms,
+                serverSelectionTimeoutMS=5000,
+                connectTimeoutMS=10000,
+                retryWrites=True,
+                event_listeners=[self.pool_monitor, *query_monitor.listeners()]
+            )
+            logger.info(f"✅ MongoDB client ready for {self.db_name} "
+                        f"(pool {self.min_pool_size}-{self.max_pool_size} connections)")
+        return self._client
+
+    def get_database(self, profile: str = "default"):
+        """The application database with ``profile``'s read/write concerns"""
+        database = self._databases.get(profile)
+        if database is None:
+            if profile not in PROFILES:
+                raise ValueError(f"Unknown MongoDB workload profile: {profile}")
+            database = self.client[self.db_name]
+            if PROFILES[profile]:
+                database = database.with_options(**PROFILES[profile])
+            self._databases[profile] = database
+        return database
+
+    async def supports_transactions(self) -> bool:
+        """Whether the deployment is a replica set or sharded cluster (checked once)"""
+        if self._supports_transactions is None:
+            hello = await self.client.admin.command("hello")
+            self._supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+            if not self._supports_transactions:
+                logger.warning("⚠️ MongoDB is a standalone server - multi-document writes run without a transaction")
+        return self._supports_transactions
+
+    async def run_transaction(self, callback: Callable[[Any], Awaitable[Any]], profile: str = "money") -> Any:
+        """
+        Run ``callback(session)`` in one multi-document transaction with
+        ``profile``'s concerns, retried on transient errors. Every operation in
+        the callback must pass ``session=session`` and read from the primary.
+        On a standalone server the callback runs with ``session=None``.
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown MongoDB workload profile: {profile}")
+        if not await self.supports_transactions():
+            return await callback(None)
+
+        options = PROFILES[profile]
+        async with await self.client.start_session() as session:
+            return await session.with_transaction(
+                callback,
+                read_concern=options.get("read_concern"),
+                write_concern=options.get("write_concern"),
+                read_preference=ReadPreference.PRIMARY
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'connected': self._client is not None,
+            'transactions': self._supports_transactions,
+            'database': self.db_name,
+            'max_pool_size': self.max_pool_size,
+            'min_pool_size': self.min_pool_size,
+            'wait_queue_timeout_ms': self.wait_queue_timeout_ms,
+            'profiles': list(PROFILES),
+            'pool': self.pool_monitor.get_stats(),
+        }
+
+    def close(self):
+        """Close the client and its pool (application shutdown / end of a script)"""
+        if self._client is None:
+            return
+        self._client.close()
+        self._client = None
+        self._databases.clear()
+        logger.info("✅ MongoDB connection pool closed")
+
+
+# Global MongoDB connection manager instance
+mongo_manager = MongoConnectionManager()
+
+# Export for use in other modules
+__all__ = ['MongoConnectionManager', 'PoolMonitor', 'PROFILES', 'mongo_manager']
@@ -0,0 +1,223 @@
+"""
+In-App Notification Coalescing
+Buffers in-app notifications for a short window per (user, type), merges
+repeats into one document with a count, and flushes each window with a
+single notification_store.insert_many plus one WebSocket frame per user
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from notification_store import notification_store
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class PendingNotification:
+    """One buffered (user, type) notification and how many events it absorbed"""
+
+    def __init__(self, doc: Dict[str, Any], frame: Dict[str, Any], deadline: float):
+        self.doc = doc
+        self.frame = frame
+        self.deadline = deadline
+        self.count = 1
+        self.attempts = 0
+
+    def merge(self, doc: Dict[str, Any], frame: Dict[str, Any]):
+        """Keep the newest content and the first id/created_at; count the repeat"""
+        self.count += 1
+        for field in ("title", "message", "action_url", "related_id", "data", "priority"):
+            if field in doc:
+                self.doc[field] = doc[field]
+        self.doc["count"] = self.count
+        self.doc["updated_at"] = doc["created_at"]
+        self.frame = {**frame, "notification_id": self.doc["id"], "count": self.count}
+
+
+class NotificationAggregator:
+    """
+    ``submit()`` never touches MongoDB: it either opens a pending entry for
+    (user_id, type) or merges into the open one. A single flusher task writes
+    every entry whose window has closed with one ``insert_many`` and sends each
+    affected user one frame - the notification itself, or a
+    ``notification_batch`` when several types were flushed together.
+
+    Entries the write did not store are re-queued for the next window (up to
+    ``max_retries`` times, and only while fewer than ``max_pending`` are
+    buffered) and get no frame until they are stored.
+    """
+
+    def __init__(self, window: float = 2.0, max_pending: int = 5000, max_retries: int = 3):
+        self.window = window
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._pending: "OrderedDict[Tuple[str, str], PendingNotification]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._draining = False
+        self._send: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None
+
+        self.stats = {'submitted': 0, 'coalesced': 0, 'written': 0, 'flushes': 0, 'frames': 0, 'write_failures': 0,
+                      'requeued': 0, 'dropped': 0}
+
+    def attach(self, send: Callable[[str, Dict[str, Any]], Awaitable[None]]):
+        """Set how flushed frames reach users (ConnectionManager.send_user_notification)"""
+        self._send = send
+
+    def submit(self, user_id: str, doc: Dict[str, Any], frame: Dict[str, Any]) -> Dict[str, Any]:
+        """Buffer a notification; returns the (possibly merged) document that will be written"""
+        self.stats['submitted'] += 1
+        key = (user_id, doc.get("notification_type", "general"))
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.merge(doc, frame)
+            self.stats['coalesced'] += 1
+            return pending.doc
+
+        doc.setdefault("id", str(uuid.uuid4()))
+        doc["count"] = 1
+        frame = {**frame, "notification_id": doc["id"], "count": 1}
+        self._pending[key] = PendingNotification(doc, frame, time.monotonic() + self.window)
+        self._ensure_flusher()
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+        return doc
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self._pending:
+                oldest = next(iter(self._pending.values()))
+                delay = oldest.deadline - time.monotonic()
+                if delay > 0 and len(self._pending) < self.max_pending and not self._draining:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                await self.flush(due_only=len(self._pending) < self.max_pending and not self._draining)
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self, due_only: bool = False):
+        """Write buffered notifications (only closed windows when ``due_only``) and push frames"""
+        now = time.monotonic()
+        batch: List[PendingNotification] = []
+        for key in list(self._pending):
+            pending = self._pending[key]
+            if due_only and pending.deadline > now:
+                break  # entries are kept in window order
+            batch.append(self._pending.pop(key))
+        if not batch:
+            return
+
+        self.stats['flushes'] += 1
+        try:
+            await notification_store.insert_many([pending.doc for pending in batch])
+        except Exception as e:
+            unwritten = self._unwritten(batch, e)
+            self.stats['write_failures'] += len(unwritten)
+            logger.error(f"Notification batch write failed ({len(unwritten)}/{len(batch)} notifications): {str(e)}")
+            self._requeue(unwritten)
+            unwritten_ids = {id(pending) for pending in unwritten}
+            batch = [pending for pending in batch if id(pending) not in unwritten_ids]
+        self.stats['written'] += len(batch)
+
+        frames: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for pending in batch:
+            frames[pending.doc["user_id"]].append(pending.frame)
+
+        if self._send is None:
+            return
+        for user_id, user_frames in frames.items():
+            if len(user_frames) == 1:
+                message = user_frames[0]
+            else:
+                message = {
+                    "type": "notification_batch",
+                    "notifications": user_frames,
+                    "count": sum(frame.get("count", 1) for frame in user_frames),
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                }
+            try:
+                await self._send(user_id, message)
+                self.stats['frames'] += 1
+            except Exception as e:
+                logger.error(f"Notification frame to {user_id} failed: {str(e)}")
+
+    @staticmethod
+    def _unwritten(batch: List[PendingNotification], error: Exception) -> List[PendingNotification]:
+        """Entries of a failed batch that are not stored (a duplicate id means an earlier attempt stored it)"""
+        if isinstance(error, BulkWriteError):
+            failed = {write_error["index"] for write_error in error.details.get("writeErrors", [])
+                      if write_error.get("code") != 11000}
+            return [pending for index, pending in enumerate(batch) if index in failed]
+        return batch
+
+    def _requeue(self, unwritten: List[PendingNotification]):
+        """Buffer unwritten entries again behind everything already pending"""
+        for pending in unwritten:
+            pending.attempts += 1
+            if pending.attempts > self.max_retries or len(self._pending) >= self.max_pending:
+                self.stats['dropped'] += 1
+                continue
+
+            key = (pending.doc["user_id"], pending.doc.get("notification_type", "general"))
+            current = self._pending.get(key)
+            if current is not None:
+                # A newer notification of the same type opened a window meanwhile: it absorbs this one
+                current.count += pending.count
+                current.doc["count"] = current.count
+                current.frame["count"] = current.count
+                continue
+
+            pending.deadline = time.monotonic() + self.window
+            self._pending[key] = pending
+            self.stats['requeued'] += 1
+
+    async def stop(self):
+        """Flush everything still buffered (application shutdown)"""
+        # Let the flusher finish its in-flight batch and drain the rest without
+        # waiting for windows, rather than cancelling it mid-write
+        self._draining = True
+        try:
+            if self._task is not None:
+                self._wakeup.set()
+                await self._task
+                self._task = None
+            await self.flush()
+        finally:
+            self._draining = False
+        if self._pending:
+            logger.warning(f"⚠️ {len(self._pending)} notifications could not be written before shutdown")
+            self._pending.clear()
+        logger.info("✅ Notification aggregator flushed")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'pending': len(self._pending), 'window_seconds': self.window}
+
+
+# Global notification aggregator instance
+notification_aggregator = NotificationAggregator(
+    window=float(os.environ.get('NOTIFICATION_COALESCE_WINDOW', '2.0')),
+    max_pending=int(os.environ.get('NOTIFICATION_MAX_PENDING', '5000')),
+    max_retries=int(os.environ.get('NOTIFICATION_MAX_RETRIES', '3'))
+)
+
+# Export for use in other modules
+__all__ = ['NotificationAggregator', 'PendingNotification', 'notification_aggregator']
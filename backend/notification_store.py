@@ -0,0 +1,157 @@
+"""
+Unified Notification Store
+Every in-app notification is written to db.notifications in one schema, with
+a TTL expiry and a per-user unread counter kept in step with reads
+"""
+
+import logging
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List
+
+from pymongo import UpdateOne
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Legacy field name -> schema field name
+FIELD_ALIASES = {
+    "type": "notification_type",
+    "notification_id": "id",
+    "read": "is_read",
+    "metadata": "data",
+}
+
+
+class NotificationStore:
+    """
+    ``notification_counters`` holds ``{user_id, unread, recounted_at}``: inserts
+    ``$inc`` it, marking one notification read decrements it, and mark-all-read
+    zeroes it, so badge counts are a single indexed read. The counter cannot
+    see TTL deletions of unread notifications, so it is recounted once it is
+    older than ``recount_hours`` (and whenever it has never been counted).
+    """
+
+    COLLECTION = "notifications"
+    COUNTERS = "notification_counters"
+
+    def __init__(self, ttl_days: int = 90, recount_hours: int = 24):
+        self.ttl_days = ttl_days
+        self.recount_hours = recount_hours
+        self.stats = {'inserted': 0, 'marked_read': 0, 'counter_reads': 0, 'recounts': 0}
+
+    async def _get_db(self):
+        from database import get_database
+        return await get_database("notifications")
+
+    def normalize(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Map any of the historical notification shapes onto the store schema"""
+        notification = dict(doc)
+        for legacy, field in FIELD_ALIASES.items():
+            if legacy in notification:
+                value = notification.pop(legacy)
+                notification.setdefault(field, value)
+
+        created_at = notification.get("created_at") or datetime.now(timezone.utc)
+        notification.setdefault("id", str(uuid.uuid4()))
+        notification.setdefault("notification_type", "general")
+        notification.setdefault("data", {})
+        notification.setdefault("count", 1)
+        notification["is_read"] = bool(notification.get("is_read", False))
+        notification["created_at"] = created_at
+        notification.setdefault("expires_at", created_at + timedelta(days=self.ttl_days))
+        return notification
+
+    async def insert(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        notifications = await self.insert_many([doc])
+        return notifications[0]
+
+    async def insert_many(self, docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write notifications in one insert_many and bump each recipient's unread counter once"""
+        notifications = [self.normalize(doc) for doc in docs]
+        if not notifications:
+            return []
+
+        db = await self._get_db()
+        await db[self.COLLECTION].insert_many(notifications, ordered=False)
+        self.stats['inserted'] += len(notifications)
+
+        unread = Counter(n["user_id"] for n in notifications if not n["is_read"])
+        if unread:
+            await db[self.COUNTERS].bulk_write([
+                UpdateOne({"user_id": user_id}, {"$inc": {"unread": count}}, upsert=True)
+                for user_id, count in unread.items()
+            ], ordered=False)
+
+        for notification in notifications:
+            notification.pop("_id", None)
+        return notifications
+
+    async def recount(self, user_id: str) -> int:
+        """Rebuild a user's counter from the notifications themselves"""
+        db = await self._get_db()
+        unread = await db[self.COLLECTION].count_documents({"user_id": user_id, "is_read": False})
+        await db[self.COUNTERS].update_one(
+            {"user_id": user_id},
+            {"$set": {"unread": unread, "recounted_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self.stats['recounts'] += 1
+        return unread
+
+    async def unread_count(self, user_id: str) -> int:
+        db = await self._get_db()
+        counter = await db[self.COUNTERS].find_one({"user_id": user_id}, {"_id": 0, "unread": 1, "recounted_at": 1})
+        self.stats['counter_reads'] += 1
+
+        recounted_at = counter.get("recounted_at") if counter else None
+        if recounted_at is not None and recounted_at.tzinfo is None:
+            recounted_at = recounted_at.replace(tzinfo=timezone.utc)
+        if recounted_at is None or datetime.now(timezone.utc) - recounted_at > timedelta(hours=self.recount_hours):
+            return await self.recount(user_id)
+        return max(0, counter.get("unread", 0))
+
+    async def mark_read(self, user_id: str, notification_id: str) -> bool:
+        """Mark one notification read; False if it does not exist or was already read"""
+        db = await self._get_db()
+        result = await db[self.COLLECTION].update_one(
+            {"id": notification_id, "user_id": user_id, "is_read": False},
+            {"$set": {"is_read": True, "read_at": datetime.now(timezone.utc)}}
+        )
+        if result.modified_count == 0:
+            return False
+
+        await db[self.COUNTERS].update_one({"user_id": user_id, "unread": {"$gt": 0}}, {"$inc": {"unread": -1}})
+        self.stats['marked_read'] += 1
+        return True
+
+    async def mark_all_read(self, user_id: str) -> int:
+        """One update_many over the user's unread notifications, then zero the counter"""
+        db = await self._get_db()
+        now = datetime.now(timezone.utc)
+        result = await db[self.COLLECTION].update_many(
+            {"user_id": user_id, "is_read": False},
+            {"$set": {"is_read": True, "read_at": now}}
+        )
+        await db[self.COUNTERS].update_one(
+            {"user_id": user_id},
+            {"$set": {"unread": 0, "recounted_at": now}},
+            upsert=True
+        )
+        self.stats['marked_read'] += result.modified_count
+        return result.modified_count
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'ttl_days': self.ttl_days}
+
+
+# Global notification store instance
+notification_store = NotificationStore(
+    ttl_days=int(os.environ.get('NOTIFICATION_TTL_DAYS', '90')),
+    recount_hours=int(os.environ.get('NOTIFICATION_RECOUNT_HOURS', '24'))
+)
+
+# Export for use in other modules
+__all__ = ['NotificationStore', 'notification_store']
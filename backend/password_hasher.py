@@ -0,0 +1,123 @@
+"""
+Async Password Hashing Service
+Runs bcrypt hashing/verification on a bounded thread pool so password work
+never blocks the event loop, with queue-depth back-pressure and latency metrics
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from security import hash_password, verify_password
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class PasswordHashingService:
+    """
+    bcrypt releases the GIL while it works, so a small thread pool gives real
+    parallelism. At most ``max_pending`` calls may be running or queued; beyond
+    that callers get a 503 straight away instead of piling onto the pool.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 32, rounds: int = 12):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+
+        self.stats: Dict[str, Dict[str, float]] = {
+            operation: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            for operation in ('hash', 'verify')
+        }
+        self.rejected = 0
+        self.rehashed = 0
+
+    async def _run(self, operation: str, func, *args):
+        """Run a bcrypt call on the pool, failing fast when saturated"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"⚠️ Password hashing pool saturated ({self.pending} pending) - rejecting {operation}")
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stats = self.stats[operation]
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured cost"""
+        return await self._run('hash', hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Verify a password against its stored hash"""
+        return await self._run('verify', verify_password, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True when a stored hash was made with a different cost than configured"""
+        try:
+            # bcrypt hashes look like $2b$<cost>$<salt+hash>
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    async def rehash_if_needed(self, password: str, hashed: str) -> Optional[str]:
+        """Return a fresh hash after a successful login if the cost has changed"""
+        if not self.needs_rehash(hashed):
+            return None
+        new_hash = await self.hash(password)
+        self.rehashed += 1
+        return new_hash
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool saturation and bcrypt latency"""
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'rounds': self.rounds,
+            'pending': self.pending,
+            'rejected': self.rejected,
+            'rehashed': self.rehashed,
+            'latency': {
+                operation: {
+                    'count': int(stats['count']),
+                    'avg_ms': round(stats['total_ms'] / stats['count'], 3) if stats['count'] else 0.0,
+                    'max_ms': round(stats['max_ms'], 3),
+                }
+                for operation, stats in self.stats.items()
+            }
+        }
+
+    def shutdown(self):
+        """Stop the worker threads (application shutdown)"""
+        self.executor.shutdown(wait=True)
+
+
+# Global password hashing service instance
+password_hasher = PasswordHashingService(
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', '4')),
+    max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32')),
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12'))
+)
+
+# Export for use in other modules
+__all__ = ['PasswordHashingService', 'password_hasher']
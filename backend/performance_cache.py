@@ -3,27 +3,228 @@ Advanced Performance Caching Service
 Comprehensive caching strategy for API responses, user data, and computational results
 """
 
-import redis
-import json
 import hashlib
 import logging
 import asyncio
-from typing import Any, Dict, List, Optional, Tuple, Union
-from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 from functools import wraps
 import pickle
 import os
+import time
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 
+from redis_pool import redis_manager
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
+class CacheTags:
+    """Dependency tag names shared by cache writers and invalidators"""
+
+    @staticmethod
+    def user(user_id: str) -> str:
+        return f"user:{user_id}"
+
+    @staticmethod
+    def user_transactions(user_id: str) -> str:
+        return f"user:{user_id}:transactions"
+
+    @staticmethod
+    def user_budgets(user_id: str) -> str:
+        return f"user:{user_id}:budgets"
+
+    @staticmethod
+    def user_goals(user_id: str) -> str:
+        return f"user:{user_id}:goals"
+
+    @staticmethod
+    def leaderboard(leaderboard_type: str, period: str) -> str:
+        return f"leaderboard:{leaderboard_type}:{period}"
+
+    @staticmethod
+    def university(name: str) -> str:
+        return f"university:{name}"
+
+
+class MemoryCacheTier:
+    """
+    Bounded in-process cache tier.
+    
+    Entries live in one LRU list per cache type. The tier is bounded by a total
+    entry count and a byte budget (sizes are the pickled payload length); each
+    cache type additionally has a share of the byte budget, and when the tier is
+    full the type that is furthest over its share gives up its least recently
+    used entry. Expired entries are dropped on read and by ``sweep_expired()``.
+    Entries can carry dependency tags so ``delete_tags()`` is O(tagged keys).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, quotas: Dict[str, float], default_quota: float = 0.05):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.quotas = quotas
+        self.default_quota = default_quota
+        
+        # cache_type -> OrderedDict[key, (value, expires_at, size, tags)]
+        self._entries: Dict[str, OrderedDict] = {}
+        self._key_types: Dict[str, str] = {}
+        self._tag_keys: Dict[str, Set[str]] = {}
+        self._bytes: Dict[str, int] = {}
+        self.total_bytes = 0
+        
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _type_stats(self, cache_type: str) -> Dict[str, int]:
+        stats = self.stats.get(cache_type)
+        if stats is None:
+            stats = self.stats[cache_type] = {
+                'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0
+            }
+        return stats
+
+    def _quota_bytes(self, cache_type: str) -> int:
+        return int(self.max_bytes * self.quotas.get(cache_type, self.default_quota))
+
+    def __len__(self) -> int:
+        return len(self._key_types)
+
+    def get(self, cache_type: str, key: str) -> Optional[Any]:
+        entries = self._entries.get(cache_type)
+        entry = entries.get(key) if entries is not None else None
+        stats = self._type_stats(cache_type)
+        
+        if entry is None:
+            stats['misses'] += 1
+            return None
+        
+        value, expires_at, _, _ = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            stats['expirations'] += 1
+            stats['misses'] += 1
+            return None
+        
+        entries.move_to_end(key)
+        stats['hits'] += 1
+        return value
+
+    def set(self, cache_type: str, key: str, value: Any, ttl: int, size: int, tags: Tuple[str, ...] = ()):
+        if size > self._quota_bytes(cache_type):
+            # Never let one oversized payload flush a whole type
+            self._remove(key)
+            return
+        
+        self._remove(key)
+        entries = self._entries.setdefault(cache_type, OrderedDict())
+        entries[key] = (value, time.monotonic() + ttl, size, tags)
+        self._key_types[key] = cache_type
+        for tag in tags:
+            self._tag_keys.setdefault(tag, set()).add(key)
+        self._bytes[cache_type] = self._bytes.get(cache_type, 0) + size
+        self.total_bytes += size
+        
+        # Keep the type within its own share first, then the tier within its budget
+        while self._bytes[cache_type] > self._quota_bytes(cache_type) and len(entries) > 1:
+            self._evict_lru(cache_type)
+        while len(self._key_types) > self.max_entries or self.total_bytes > self.max_bytes:
+            if not self._evict_lru(self._most_over_quota_type()):
+                break
+
+    def delete(self, key: str) -> bool:
+        return self._remove(key)
+
+    def delete_tags(self, tags) -> int:
+        """Drop every entry registered under any of ``tags``"""
+        removed = 0
+        for tag in tags:
+            for key in self._tag_keys.pop(tag, ()):
+                if self._remove(key):
+                    removed += 1
+        return removed
+
+    def delete_matching(self, pattern: str) -> int:
+        keys = [key for key in self._key_types if pattern in key]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def sweep_expired(self) -> int:
+        """Drop every expired entry; returns the number removed"""
+        now = time.monotonic()
+        expired = [
+            (cache_type, key)
+            for cache_type, entries in self._entries.items()
+            for key, (_, expires_at, _, _) in entries.items()
+            if now >= expires_at
+        ]
+        for cache_type, key in expired:
+            self._remove(key)
+            self._type_stats(cache_type)['expirations'] += 1
+        return len(expired)
+
+    def _remove(self, key: str) -> bool:
+        cache_type = self._key_types.pop(key, None)
+        if cache_type is None:
+            return False
+        _, _, size, tags = self._entries[cache_type].pop(key)
+        for tag in tags:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+        self._bytes[cache_type] -= size
+        self.total_bytes -= size
+        return True
+
+    def _evict_lru(self, cache_type: Optional[str]) -> bool:
+        entries = self._entries.get(cache_type) if cache_type else None
+        if not entries:
+            return False
+        key = next(iter(entries))
+        self._remove(key)
+        self._type_stats(cache_type)['evictions'] += 1
+        return True
+
+    def _most_over_quota_type(self) -> Optional[str]:
+        candidates = [cache_type for cache_type, entries in self._entries.items() if entries]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda t: self._bytes.get(t, 0) / max(1, self._quota_bytes(t)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        by_type = {}
+        for cache_type in set(self.stats) | set(self._entries):
+            stats = dict(self._type_stats(cache_type))
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'entries': len(self._entries.get(cache_type, ())),
+                'bytes': self._bytes.get(cache_type, 0),
+                'quota_bytes': self._quota_bytes(cache_type),
+                'hit_ratio': round(stats['hits'] / lookups, 3) if lookups else 0.0,
+            })
+            by_type[cache_type] = stats
+        
+        return {
+            'size': len(self._key_types),
+            'max_size': self.max_entries,
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'tags': len(self._tag_keys),
+            'by_type': by_type,
+        }
+
+
 class AdvancedCacheService:
+    REDIS_DB = 1
+    TAG_PREFIX = "tag:"
+
     def __init__(self):
         """Initialize advanced caching with multiple cache layers"""
-        self.redis_client = None
-        self.memory_cache = {}
         self.memory_cache_size = 1000  # Max items in memory cache
+        self.memory_cache_bytes = int(os.environ.get('CACHE_MEMORY_BYTES', 64 * 1024 * 1024))
+        self.sweep_interval = 60  # Seconds between expired-entry sweeps
+        self._sweep_task = None
         self.connected = False
         self.cache_enabled = True
         
@@ -41,48 +242,46 @@ class AdvancedCacheService:
             'computation_heavy': 1800,  # 30 minutes
         }
         
-        # Initialize connection and thread pool
-        self._initialize_connection()
+        # Share of the memory tier's byte budget per cache type (TTL_CONFIG keys
+        # other than the Redis-only types below)
+        self.MEMORY_QUOTA_CONFIG = {
+            'user_profile': 0.25,
+            'analytics': 0.15,
+            'leaderboards': 0.25,
+            'hustle_recommendations': 0.10,
+            'trending_skills': 0.02,
+            'static_data': 0.03,
+            'computation_heavy': 0.20,
+        }
+        
+        self.max_ttl = max(self.TTL_CONFIG.values())
+        
+        # Per-user data that write paths invalidate by tag. invalidate_tags() can only
+        # clear this worker's memory tier, so these types are cached in Redis only and
+        # every worker sees an invalidation at once.
+        self.REDIS_ONLY_TYPES = {'transactions', 'budgets', 'financial_goals'}
+        
+        self.memory_cache = MemoryCacheTier(
+            max_entries=self.memory_cache_size,
+            max_bytes=self.memory_cache_bytes,
+            quotas=self.MEMORY_QUOTA_CONFIG
+        )
+        
+        # Redis-tier hit/miss counters per cache type
+        self.redis_stats: Dict[str, Dict[str, int]] = {}
+        
+        # Thread pool for CPU-bound helpers
         self.thread_pool = ThreadPoolExecutor(max_workers=4)
     
-    def _initialize_connection(self):
-        """Initialize Redis connection with fallback"""
-        try:
-            redis_configs = [
-                {"host": "localhost", "port": 6379, "db": 1},
-                {"host": "127.0.0.1", "port": 6379, "db": 1},
-                {"host": "redis", "port": 6379, "db": 1},
-            ]
-            
-            for config in redis_configs:
-                try:
-                    self.redis_client = redis.Redis(
-                        host=config["host"],
-                        port=config["port"],
-                        db=config["db"],
-                        socket_timeout=3,
-                        socket_connect_timeout=3,
-                        retry_on_timeout=True,
-                        decode_responses=False  # For pickle support
-                    )
-                    
-                    self.redis_client.ping()
-                    self.connected = True
-                    logger.info(f"✅ Advanced Cache connected to Redis on {config['host']}:{config['port']}")
-                    return
-                    
-                except Exception as e:
-                    logger.warning(f"Failed to connect to Redis at {config['host']}:{config['port']}: {str(e)}")
-                    continue
-            
-            logger.info("⚠️ Redis not available - using memory-only cache mode")
-            self.cache_enabled = True  # Still enable caching with memory only
-            self.connected = False
-            
-        except Exception as e:
-            logger.error(f"Cache initialization error: {str(e)}")
-            self.cache_enabled = False
-            self.connected = False
+    async def _get_redis(self):
+        """Get the shared async Redis client (None means memory-only mode)"""
+        client = await redis_manager.get_client(db=self.REDIS_DB)
+        self.connected = client is not None
+        return client
+
+    def _on_redis_error(self, operation: str, error: Exception):
+        logger.error(f"Redis {operation} error: {str(error)}")
+        redis_manager.report_error(error, db=self.REDIS_DB)
 
     def _generate_cache_key(self, prefix: str, *args, **kwargs) -> str:
         """Generate a unique cache key from prefix and parameters"""
@@ -98,74 +297,100 @@ class AdvancedCacheService:
         
         return key_string
 
-    def _get_from_memory_cache(self, key: str) -> Optional[Any]:
-        """Get item from memory cache"""
-        if key in self.memory_cache:
-            item, expiry = self.memory_cache[key]
-            if datetime.now() < expiry:
-                return item
-            else:
-                del self.memory_cache[key]
-        return None
+    def _record_redis_lookup(self, cache_type: str, hit: bool):
+        stats = self.redis_stats.setdefault(cache_type, {'hits': 0, 'misses': 0})
+        stats['hits' if hit else 'misses'] += 1
 
-    def _set_in_memory_cache(self, key: str, value: Any, ttl: int):
-        """Set item in memory cache with TTL"""
-        # Manage memory cache size
-        if len(self.memory_cache) >= self.memory_cache_size:
-            # Remove oldest items
-            oldest_keys = list(self.memory_cache.keys())[:100]
-            for old_key in oldest_keys:
-                del self.memory_cache[old_key]
-        
-        expiry = datetime.now() + timedelta(seconds=ttl)
-        self.memory_cache[key] = (value, expiry)
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.sweep_interval)
+                removed = self.memory_cache.sweep_expired()
+                if removed:
+                    logger.debug(f"🧹 Swept {removed} expired memory cache entries")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Memory cache sweep error: {str(e)}")
+
+    def start_maintenance(self):
+        """Start periodic TTL sweeping of the memory tier"""
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    def stop_maintenance(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
 
     async def get(self, cache_type: str, *args, **kwargs) -> Optional[Any]:
         """Get cached data with multi-layer lookup"""
         key = self._generate_cache_key(cache_type, *args, **kwargs)
         
+        redis_only = cache_type in self.REDIS_ONLY_TYPES
+        
         # Try memory cache first (fastest)
-        value = self._get_from_memory_cache(key)
-        if value is not None:
-            logger.debug(f"✅ Memory cache HIT: {cache_type}")
-            return value
+        if not redis_only:
+            value = self.memory_cache.get(cache_type, key)
+            if value is not None:
+                logger.debug(f"✅ Memory cache HIT: {cache_type}")
+                return value
         
         # Try Redis cache
-        if self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is not None:
             try:
-                cached_data = self.redis_client.get(key)
+                async with redis_manager.measure("get"):
+                    cached_data = await redis_client.get(key)
+                self._record_redis_lookup(cache_type, bool(cached_data))
                 if cached_data:
                     value = pickle.loads(cached_data)
                     # Store in memory cache for faster access
-                    ttl = self.TTL_CONFIG.get(cache_type, 300)
-                    self._set_in_memory_cache(key, value, ttl // 2)  # Shorter TTL for memory
+                    if not redis_only:
+                        ttl = self.TTL_CONFIG.get(cache_type, 300)
+                        self.memory_cache.set(cache_type, key, value, ttl // 2, len(cached_data))  # Shorter TTL for memory
                     logger.debug(f"✅ Redis cache HIT: {cache_type}")
                     return value
             except Exception as e:
-                logger.error(f"Redis get error: {str(e)}")
+                self._on_redis_error("get", e)
         
         logger.debug(f"❌ Cache MISS: {cache_type}")
         return None
 
-    async def set(self, cache_type: str, value: Any, *args, **kwargs) -> bool:
-        """Set cached data in both memory and Redis"""
+    async def set(self, cache_type: str, value: Any, *args, tags: Optional[Iterable[str]] = None, **kwargs) -> bool:
+        """
+        Set cached data in both memory and Redis.
+        ``tags`` registers the entry under dependency tags (see ``CacheTags``)
+        so writers can drop it with ``invalidate_tags()``.
+        """
         key = self._generate_cache_key(cache_type, *args, **kwargs)
         ttl = self.TTL_CONFIG.get(cache_type, 300)
+        tags = tuple(tags or ())
         
         try:
-            # Set in memory cache
-            self._set_in_memory_cache(key, value, ttl)
+            # Serialize once: the payload size drives memory-tier accounting
+            serialized_value = pickle.dumps(value)
+            
+            # Set in memory cache (not for types only Redis can invalidate across workers)
+            if cache_type not in self.REDIS_ONLY_TYPES:
+                self.memory_cache.set(cache_type, key, value, ttl, len(serialized_value), tags)
             
-            # Set in Redis cache
-            if self.connected:
-                serialized_value = pickle.dumps(value)
-                self.redis_client.setex(key, ttl, serialized_value)
-                logger.debug(f"✅ Cached: {cache_type} (TTL: {ttl}s)")
+            # Set in Redis cache; tag sets live as long as the longest-lived entry type
+            redis_client = await self._get_redis()
+            if redis_client is not None:
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.setex(key, ttl, serialized_value)
+                for tag in tags:
+                    pipe.sadd(f"{self.TAG_PREFIX}{tag}", key)
+                    pipe.expire(f"{self.TAG_PREFIX}{tag}", self.max_ttl)
+                async with redis_manager.measure("pipeline_set"):
+                    await pipe.execute()
+                logger.debug(f"✅ Cached: {cache_type} (TTL: {ttl}s, tags: {len(tags)})")
             
             return True
             
         except Exception as e:
-            logger.error(f"Cache set error for {cache_type}: {str(e)}")
+            self._on_redis_error("set", e)
             return False
 
     async def delete(self, cache_type: str, *args, **kwargs) -> bool:
@@ -174,43 +399,86 @@ class AdvancedCacheService:
         
         try:
             # Remove from memory cache
-            if key in self.memory_cache:
-                del self.memory_cache[key]
+            self.memory_cache.delete(key)
             
             # Remove from Redis
-            if self.connected:
-                self.redis_client.delete(key)
+            redis_client = await self._get_redis()
+            if redis_client is not None:
+                async with redis_manager.measure("delete"):
+                    await redis_client.delete(key)
             
             logger.debug(f"🗑️  Deleted cache: {cache_type}")
             return True
             
         except Exception as e:
-            logger.error(f"Cache delete error for {cache_type}: {str(e)}")
+            self._on_redis_error("delete", e)
             return False
 
+    async def invalidate_tags(self, *tags: str) -> int:
+        """Invalidate every entry registered under any of the given dependency tags"""
+        deleted_count = self.memory_cache.delete_tags(tags)
+        
+        try:
+            redis_client = await self._get_redis()
+            if redis_client is not None and tags:
+                tag_keys = [f"{self.TAG_PREFIX}{tag}" for tag in tags]
+                pipe = redis_client.pipeline(transaction=False)
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                async with redis_manager.measure("pipeline_tag_members"):
+                    members = await pipe.execute()
+                
+                keys = set()
+                for tag_members in members:
+                    keys.update(tag_members)
+                
+                async with redis_manager.measure("unlink"):
+                    await redis_client.unlink(*keys, *tag_keys)
+                deleted_count += len(keys)
+            
+        except Exception as e:
+            self._on_redis_error("invalidate_tags", e)
+        
+        logger.debug(f"🧹 Invalidated {deleted_count} cache entries for tags {tags}")
+        return deleted_count
+
+    async def invalidate_user(self, user_id: str, *scopes: str) -> int:
+        """Invalidate a user's cached reads; ``scopes`` narrows it (transactions, budgets, goals)"""
+        if not scopes:
+            return await self.invalidate_tags(CacheTags.user(user_id))
+        return await self.invalidate_tags(*(f"{CacheTags.user(user_id)}:{scope}" for scope in scopes))
+
     async def invalidate_pattern(self, pattern: str) -> int:
-        """Invalidate all cache keys matching a pattern"""
+        """
+        Invalidate all cache keys matching a pattern.
+        Walks the whole keyspace - prefer ``invalidate_tags()`` for write paths.
+        """
         deleted_count = 0
         
         try:
             # Clear matching keys from memory cache
-            keys_to_delete = [key for key in self.memory_cache.keys() if pattern in key]
-            for key in keys_to_delete:
-                del self.memory_cache[key]
-                deleted_count += 1
+            deleted_count += self.memory_cache.delete_matching(pattern)
             
-            # Clear matching keys from Redis
-            if self.connected:
-                keys = self.redis_client.keys(f"*{pattern}*")
-                if keys:
-                    self.redis_client.delete(*keys)
-                    deleted_count += len(keys)
+            # Clear matching keys from Redis incrementally (SCAN, not KEYS)
+            redis_client = await self._get_redis()
+            if redis_client is not None:
+                batch = []
+                async with redis_manager.measure("scan_invalidate"):
+                    async for key in redis_client.scan_iter(match=f"*{pattern}*", count=500):
+                        batch.append(key)
+                        if len(batch) >= 500:
+                            await redis_client.unlink(*batch)
+                            deleted_count += len(batch)
+                            batch = []
+                    if batch:
+                        await redis_client.unlink(*batch)
+                        deleted_count += len(batch)
             
             logger.info(f"🧹 Invalidated {deleted_count} cache entries matching '{pattern}'")
             return deleted_count
             
         except Exception as e:
-            logger.error(f"Cache pattern invalidation error: {str(e)}")
+            self._on_redis_error("invalidate_pattern", e)
             return 0
 
     async def get_stats(self) -> Dict:
@@ -218,18 +486,20 @@ class AdvancedCacheService:
         stats = {
             "memory_cache": {
                 "enabled": True,
-                "size": len(self.memory_cache),
-                "max_size": self.memory_cache_size
+                **self.memory_cache.get_stats()
             },
+            "redis_lookups_by_type": {cache_type: dict(stats) for cache_type, stats in self.redis_stats.items()},
             "redis_cache": {
                 "enabled": self.connected,
                 "connected": self.connected
-            }
+            },
+            "redis_pool": redis_manager.get_stats()
         }
         
-        if self.connected:
+        redis_client = await self._get_redis()
+        if redis_client is not None:
             try:
-                info = self.redis_client.info()
+                info = await redis_client.info()
                 stats["redis_cache"].update({
                     "memory_usage": info.get('used_memory_human', 'N/A'),
                     "connected_clients": info.get('connected_clients', 0),
@@ -310,4 +580,4 @@ def cache_result(cache_type: str, ttl: Optional[int] = None):
 advanced_cache = AdvancedCacheService()
 
 # Export for use in other modules
-__all__ = ['AdvancedCacheService', 'advanced_cache', 'cache_result']
+__all__ = ['AdvancedCacheService', 'CacheTags', 'MemoryCacheTier', 'advanced_cache', 'cache_result']
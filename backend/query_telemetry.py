@@ -0,0 +1,356 @@
+"""
+Query Shape Telemetry
+A pymongo command listener that groups every read/write by its normalized
+shape (collection, filter fields and operators, sort) with latency totals,
+plus an advisor that explains the hottest shapes to find collection scans and
+compares the live indexes with the index manifest
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from index_manifest import INDEX_MANIFEST, covering_index
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# command name -> (filter field, sort field) inside the command document
+TRACKED_COMMANDS = {
+    "find": ("filter", "sort"),
+    "count": ("query", None),
+    "distinct": ("query", None),
+    "findAndModify": ("query", "sort"),
+    "aggregate": (None, None),
+    "update": (None, None),
+    "delete": (None, None),
+}
+
+EQUALITY, MULTI, RANGE, OTHER = "eq", "in", "range", "other"
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin"}
+
+
+def _operator(value: Any) -> str:
+    if isinstance(value, dict) and value and all(str(key).startswith("$") for key in value):
+        operators = set(value)
+        if operators <= {"$eq"}:
+            return EQUALITY
+        if operators <= {"$in"}:
+            return MULTI
+        if operators <= RANGE_OPERATORS:
+            return RANGE
+        return OTHER
+    return EQUALITY
+
+
+def _filter_shape(query: Optional[Dict[str, Any]], prefix: str = "") -> List[Tuple[str, str]]:
+    """[(field, operator class)] with values dropped; $and/$or branches are flattened"""
+    shape = []
+    for key, value in (query or {}).items():
+        if key in ("$and", "$or", "$nor") and isinstance(value, list):
+            for branch in value:
+                shape.extend(_filter_shape(branch, prefix))
+        elif not key.startswith("$"):
+            shape.append((prefix + key, _operator(value)))
+    return sorted(set(shape))
+
+
+def _command_parts(command_name: str, command: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """The filter and sort a command runs with"""
+    if command_name == "aggregate":
+        query, sort = {}, None
+        for stage in command.get("pipeline", []):
+            if "$match" in stage and not query:
+                query = stage["$match"]
+            elif "$sort" in stage:
+                sort = stage["$sort"]
+                break
+            elif "$match" not in stage:
+                break
+        return query, sort
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        return statements[0].get("q") or {}, None
+
+    filter_field, sort_field = TRACKED_COMMANDS[command_name]
+    return command.get(filter_field) or {}, command.get(sort_field) if sort_field else None
+
+
+class QueryShape:
+    """Aggregated statistics for one (collection, command, filter, sort) shape"""
+
+    def __init__(self, collection: str, command: str, filter_shape: List[Tuple[str, str]],
+                 sort: List[Tuple[str, int]], sample: Dict[str, Any]):
+        self.collection = collection
+        self.command = command
+        self.filter_shape = filter_shape
+        self.sort = sort
+        self.sample = sample
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.docs_returned = 0
+        self.docs_examined: Optional[int] = None
+        self.plan: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        fields = ", ".join(f"{field}:{operator}" for field, operator in self.filter_shape)
+        sort = ", ".join(f"{field}:{direction}" for field, direction in self.sort)
+        return f"{self.collection}.{self.command} {{{fields}}}" + (f" sort {{{sort}}}" if sort else "")
+
+    def candidate_index(self) -> List[Tuple[str, int]]:
+        """Equality fields, then sort fields, then range fields (ESR order)"""
+        keys: List[Tuple[str, int]] = []
+        seen = set()
+
+        def add(field, direction=1):
+            if field not in seen and not field.startswith("_id"):
+                seen.add(field)
+                keys.append((field, direction))
+
+        for field, operator in self.filter_shape:
+            if operator == EQUALITY:
+                add(field)
+        for field, direction in self.sort:
+            add(field, direction)
+        for field, operator in self.filter_shape:
+            if operator in (MULTI, RANGE):
+                add(field)
+        return keys
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'shape': self.key,
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0,
+            'max_ms': round(self.max_ms, 2),
+            'total_ms': round(self.total_ms, 2),
+            'avg_docs_returned': round(self.docs_returned / self.count, 1) if self.count else 0,
+            'docs_examined': self.docs_examined,
+            'plan': self.plan,
+        }
+
+
+class QueryShapeMonitor(monitoring.CommandListener):
+    """
+    Registered on the application MongoClient. Listener callbacks run on
+    pymongo's threads, so shared state is guarded by a lock; only one sample
+    filter (with real values) is kept per shape, for the advisor's explain.
+    """
+
+    def __init__(self, enabled: bool = True, max_shapes: int = 1000, slow_ms: float = 200.0):
+        self.enabled = enabled
+        self.max_shapes = max_shapes
+        self.slow_ms = slow_ms
+        self.shapes: Dict[str, QueryShape] = {}
+        self._inflight: Dict[Tuple[Any, int], QueryShape] = {}
+        self._lock = threading.Lock()
+        self.stats = {'commands': 0, 'slow_commands': 0, 'dropped_shapes': 0}
+
+    def listeners(self) -> List[monitoring.CommandListener]:
+        """Value for MongoClient(event_listeners=...)"""
+        return [self] if self.enabled else []
+
+    def _shape_for(self, event: monitoring.CommandStartedEvent) -> Optional[QueryShape]:
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str) or event.database_name in ("admin", "config", "local"):
+            return None
+
+        query, sort = _command_parts(event.command_name, event.command)
+        filter_shape = _filter_shape(query)
+        sort_keys = [(field, int(direction)) for field, direction in (sort or {}).items()
+                     if isinstance(direction, (int, float))]
+        shape = QueryShape(collection, event.command_name, filter_shape, sort_keys,
+                           {"filter": query, "sort": sort})
+
+        existing = self.shapes.get(shape.key)
+        if existing is not None:
+            return existing
+        if len(self.shapes) >= self.max_shapes:
+            self.stats['dropped_shapes'] += 1
+            return None
+        self.shapes[shape.key] = shape
+        return shape
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name not in TRACKED_COMMANDS:
+            return
+        try:
+            with self._lock:
+                shape = self._shape_for(event)
+                if shape is not None:
+                    self._inflight[(event.connection_id, event.request_id)] = shape
+        except Exception as e:
+            logger.debug(f"Query telemetry skipped {event.command_name}: {str(e)}")
+
+    def _finish(self, event, reply: Optional[Dict[str, Any]]):
+        with self._lock:
+            shape = self._inflight.pop((event.connection_id, event.request_id), None)
+            if shape is None:
+                return
+            elapsed_ms = event.duration_micros / 1000
+            shape.count += 1
+            shape.total_ms += elapsed_ms
+            shape.max_ms = max(shape.max_ms, elapsed_ms)
+            self.stats['commands'] += 1
+
+            if reply is None:
+                shape.errors += 1
+            else:
+                batch = (reply.get("cursor") or {}).get("firstBatch")
+                if batch is not None:
+                    shape.docs_returned += len(batch)
+                elif "n" in reply:
+                    shape.docs_returned += reply["n"]
+
+        if elapsed_ms >= self.slow_ms:
+            self.stats['slow_commands'] += 1
+            logger.warning(f"🐢 Slow query {shape.key}: {elapsed_ms:.1f}ms")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        if event.command_name in TRACKED_COMMANDS:
+            self._finish(event, event.reply)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        if event.command_name in TRACKED_COMMANDS:
+            self._finish(event, None)
+
+    def top_shapes(self, limit: int = 20) -> List[QueryShape]:
+        with self._lock:
+            shapes = list(self.shapes.values())
+        return sorted(shapes, key=lambda shape: shape.total_ms, reverse=True)[:limit]
+
+    def by_collection(self) -> Dict[str, Dict[str, Any]]:
+        """Commands, latency and explained docs-examined summed per collection"""
+        totals: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            shapes = list(self.shapes.values())
+        for shape in shapes:
+            total = totals.setdefault(shape.collection, {'commands': 0, 'total_ms': 0.0, 'docs_examined': 0, 'shapes': 0})
+            total['commands'] += shape.count
+            total['total_ms'] = round(total['total_ms'] + shape.total_ms, 2)
+            total['docs_examined'] += shape.docs_examined or 0
+            total['shapes'] += 1
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self.shapes.clear()
+            self._inflight.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'enabled': self.enabled, 'shapes': len(self.shapes)}
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    stages = [plan]
+    for child in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child), dict):
+            stages.extend(_plan_stages(plan[child]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+class IndexAdvisor:
+    """
+    Turns the monitor's hottest shapes into index advice: each sample is
+    explained with executionStats, shapes that scan the collection or examine
+    far more documents than they return get an ESR-ordered candidate index,
+    and the live indexes are diffed against INDEX_MANIFEST.
+    """
+
+    def __init__(self, monitor: QueryShapeMonitor, scan_ratio: float = 10.0, min_examined: int = 100):
+        self.monitor = monitor
+        self.scan_ratio = scan_ratio
+        self.min_examined = min_examined
+
+    async def _explain(self, db, shape: QueryShape) -> Optional[Dict[str, Any]]:
+        command: Dict[str, Any] = {"find": shape.collection, "filter": shape.sample["filter"]}
+        if shape.sample.get("sort"):
+            command["sort"] = shape.sample["sort"]
+        try:
+            result = await db.command({"explain": command, "verbosity": "executionStats"})
+        except Exception as e:
+            logger.warning(f"Explain failed for {shape.key}: {str(e)}")
+            return None
+
+        stages = _plan_stages(result.get("queryPlanner", {}).get("winningPlan", {}))
+        execution = result.get("executionStats", {})
+        index_names = [stage["indexName"] for stage in stages if stage.get("indexName")]
+        return {
+            "collscan": any(stage.get("stage") == "COLLSCAN" for stage in stages),
+            "index": index_names[0] if index_names else None,
+            "docs_examined": execution.get("totalDocsExamined", 0),
+            "returned": execution.get("nReturned", 0),
+        }
+
+    async def manifest_drift(self, db) -> Dict[str, Dict[str, List[str]]]:
+        """Per collection: declared indexes that are missing and live ones nobody declared"""
+        drift: Dict[str, Dict[str, List[str]]] = {}
+        for collection_name, specs in INDEX_MANIFEST.items():
+            try:
+                live = await db[collection_name].index_information()
+            except Exception as e:
+                logger.warning(f"Could not list indexes for {collection_name}: {str(e)}")
+                continue
+            live_keys = {tuple((key, int(direction)) for key, direction in info["key"]): name
+                         for name, info in live.items() if name != "_id_"}
+            declared = {spec.keys for spec in specs}
+
+            missing = [spec.name for spec in specs if spec.keys not in live_keys]
+            undeclared = [name for keys, name in live_keys.items() if keys not in declared]
+            if missing or undeclared:
+                drift[collection_name] = {"missing": missing, "undeclared": undeclared}
+        return drift
+
+    async def report(self, db, limit: int = 20, explain: bool = True) -> Dict[str, Any]:
+        shapes = []
+        suggestions: Dict[Tuple[str, Tuple[Tuple[str, int], ...]], Dict[str, Any]] = {}
+
+        for shape in self.monitor.top_shapes(limit):
+            plan = await self._explain(db, shape) if explain else None
+            if plan is not None:
+                shape.docs_examined, shape.plan = plan["docs_examined"], plan["index"] or "COLLSCAN"
+
+                wasteful = plan["docs_examined"] >= self.min_examined and \
+                    plan["docs_examined"] > self.scan_ratio * max(1, plan["returned"])
+                keys = shape.candidate_index()
+                if (plan["collscan"] or wasteful) and keys:
+                    suggestion = suggestions.setdefault((shape.collection, tuple(keys)), {
+                        "collection": shape.collection,
+                        "keys": keys,
+                        "manifest_index": covering_index(shape.collection, keys, match_directions=bool(shape.sort)),
+                        "shapes": [],
+                    })
+                    suggestion["shapes"].append(shape.key)
+
+            entry = shape.to_dict()
+            entry["unindexed"] = shape.plan == "COLLSCAN"
+            shapes.append(entry)
+
+        return {
+            "shapes": shapes,
+            "suggested_indexes": list(suggestions.values()),
+            "collections": self.monitor.by_collection(),
+            "manifest_drift": await self.manifest_drift(db),
+            "telemetry": self.monitor.get_stats(),
+        }
+
+
+# Global query shape monitor and advisor
+query_monitor = QueryShapeMonitor(
+    enabled=os.environ.get('QUERY_TELEMETRY', 'true').lower() == 'true',
+    max_shapes=int(os.environ.get('QUERY_TELEMETRY_MAX_SHAPES', '1000')),
+    slow_ms=float(os.environ.get('QUERY_TELEMETRY_SLOW_MS', '200'))
+)
+index_advisor = IndexAdvisor(query_monitor)
+
+# Export for use in other modules
+__all__ = ['QueryShape', 'QueryShapeMonitor', 'IndexAdvisor', 'query_monitor', 'index_advisor']
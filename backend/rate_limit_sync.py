@@ -0,0 +1,209 @@
+"""
+Cross-Worker Rate Limit Counters
+Sliding-window rate limit checks answered from process memory, with per-window
+hit counts exchanged with Redis in one pipelined batch per sync interval
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from limits.storage import Storage
+
+from redis_pool import redis_manager
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class RateLimitSync:
+    """
+    Sliding-window counter per rate-limit key: the estimate is the current
+    fixed window's hits plus the previous window's hits weighted by how much
+    of it still overlaps the sliding window. Each (key, window) keeps
+    ``[remote, pending]`` - the cluster-wide count last read from Redis and
+    this worker's hits not yet pushed - so a check is a dict lookup.
+
+    A background task pushes every pending delta with ``INCRBY`` (whose reply
+    is the new cluster-wide total) and refreshes idle keys with ``GET``, all in
+    one pipeline every ``interval`` seconds. Other workers' hits are therefore
+    seen at most one interval late. While Redis is unreachable each worker
+    enforces limits on its own hits and pushes them once Redis is back.
+    """
+
+    def __init__(self, redis_db: int = 2, interval: float = 0.5, prefix: str = "ratelimit"):
+        self.redis_db = redis_db
+        self.interval = interval
+        self.prefix = prefix
+
+        self._windows: Dict[Tuple[str, int], List[int]] = {}
+        self._expiry: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'hits': 0, 'syncs': 0, 'sync_errors': 0, 'keys_synced': 0}
+
+    def _window(self, key: str, expiry: int, now: float) -> Tuple[int, float]:
+        self._expiry[key] = expiry
+        return int(now // expiry), (now % expiry) / expiry
+
+    def _estimate(self, key: str, window: int, elapsed: float) -> int:
+        current = self._windows.get((key, window))
+        previous = self._windows.get((key, window - 1))
+        count = sum(current) if current else 0
+        if previous:
+            count += sum(previous) * (1 - elapsed)
+        return math.ceil(count)
+
+    def hit(self, key: str, expiry: int, amount: int = 1) -> int:
+        """Record ``amount`` hits and return the sliding-window count including them"""
+        window, elapsed = self._window(key, expiry, time.time())
+        self._windows.setdefault((key, window), [0, 0])[1] += amount
+        self.stats['hits'] += 1
+        return self._estimate(key, window, elapsed)
+
+    def count(self, key: str) -> int:
+        expiry = self._expiry.get(key)
+        if expiry is None:
+            return 0
+        window, elapsed = self._window(key, expiry, time.time())
+        return self._estimate(key, window, elapsed)
+
+    def window_end(self, key: str) -> int:
+        expiry = self._expiry.get(key)
+        now = time.time()
+        return int(now) if expiry is None else (int(now // expiry) + 1) * expiry
+
+    def clear(self, key: str):
+        self._expiry.pop(key, None)
+        for window_key in [window_key for window_key in self._windows if window_key[0] == key]:
+            del self._windows[window_key]
+
+    def reset(self) -> int:
+        cleared = len(self._expiry)
+        self._windows.clear()
+        self._expiry.clear()
+        return cleared
+
+    def _prune(self, now: float):
+        """Forget windows that can no longer affect an estimate"""
+        for key, window in list(self._windows):
+            expiry = self._expiry.get(key)
+            if expiry is None or window < int(now // expiry) - 1:
+                del self._windows[(key, window)]
+        live = {key for key, _ in self._windows}
+        for key in [key for key in self._expiry if key not in live]:
+            del self._expiry[key]
+
+    async def sync(self):
+        """Push pending hits and pull cluster-wide totals in one pipeline"""
+        self._prune(time.time())
+        if not self._windows:
+            return
+        client = await redis_manager.get_client(db=self.redis_db)
+        if client is None:
+            return
+
+        batch = [(window_key, state[1]) for window_key, state in self._windows.items()]
+        pipe = client.pipeline(transaction=False)
+        for (key, window), delta in batch:
+            redis_key = f"{self.prefix}:{key}:{window}"
+            if delta:
+                pipe.incrby(redis_key, delta)
+                pipe.expire(redis_key, self._expiry[key] * 2)
+            else:
+                pipe.get(redis_key)
+
+        try:
+            async with redis_manager.measure("rate_limit_sync"):
+                results = await pipe.execute()
+        except Exception as e:
+            self.stats['sync_errors'] += 1
+            redis_manager.report_error(e, db=self.redis_db)
+            logger.warning(f"Rate limit sync failed: {str(e)}")
+            return
+
+        replies = iter(results)
+        for window_key, delta in batch:
+            total = int(next(replies) or 0)
+            if delta:
+                next(replies)  # EXPIRE reply
+            state = self._windows.get(window_key)
+            if state is not None:
+                # hits recorded while the pipeline was in flight stay pending
+                state[0] = total
+                state[1] -= delta
+        self.stats['syncs'] += 1
+        self.stats['keys_synced'] += len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.sleep(self.interval)
+                await self.sync()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Rate limit sync loop error: {str(e)}")
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🚀 Rate limit sync started (every {self.interval}s, Redis db {self.redis_db})")
+
+    async def stop(self):
+        """Stop syncing after pushing the last pending hits"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.sync()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'active_keys': len(self._expiry), 'interval_seconds': self.interval}
+
+
+class SyncedWindowStorage(Storage):
+    """
+    ``limits`` storage (``synced-window://``) over the global RateLimitSync.
+    Meant for the fixed-window strategy, which only compares ``incr()``'s
+    result with the limit, so the sliding-window estimate is what is enforced.
+    """
+
+    STORAGE_SCHEME = ["synced-window"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return ValueError
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        return rate_limit_sync.hit(key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        return rate_limit_sync.count(key)
+
+    def get_expiry(self, key: str) -> int:
+        return rate_limit_sync.window_end(key)
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> Optional[int]:
+        return rate_limit_sync.reset()
+
+    def clear(self, key: str) -> None:
+        rate_limit_sync.clear(key)
+
+
+# Global rate limit counter instance
+rate_limit_sync = RateLimitSync(
+    redis_db=int(os.environ.get('RATE_LIMIT_REDIS_DB', '2')),
+    interval=float(os.environ.get('RATE_LIMIT_SYNC_INTERVAL', '0.5'))
+)
+
+# Export for use in other modules
+__all__ = ['RateLimitSync', 'SyncedWindowStorage', 'rate_limit_sync']
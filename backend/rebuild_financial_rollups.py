@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Rebuild / Verify Per-User Financial Rollups
+Recomputes user_financial_rollups from db.transactions, or (with --verify)
+reports users whose stored rollup has drifted and optionally repairs them.
+A rebuild also drops the per-day buckets that version-1 rollup documents
+carried (day totals now live only in transaction_daily_stats).
+
+Usage:
+    python rebuild_financial_rollups.py                  # rebuild every user
+    python rebuild_financial_rollups.py --verify         # report drift only
+    python rebuild_financial_rollups.py --verify --repair
+    python rebuild_financial_rollups.py --user <user_id>
+"""
+
+import argparse
+import asyncio
+import sys
+import os
+import logging
+
+# Add backend directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from database import get_database
+from financial_rollups import financial_rollups
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run(verify: bool = False, repair: bool = False, user_id: str = None):
+    """Rebuild or verify rollups for one user or every user with transactions"""
+    db = await get_database()
+
+    user_ids = [user_id] if user_id else await db.transactions.distinct("user_id")
+    logger.info(f"🚀 {'Verifying' if verify else 'Rebuilding'} financial rollups for {len(user_ids)} users...")
+
+    inconsistent = 0
+    for index, uid in enumerate(user_ids, start=1):
+        if verify:
+            result = await financial_rollups.verify_user(uid, repair=repair)
+            if not result["consistent"]:
+                inconsistent += 1
+                logger.warning(f"⚠️ Rollup drift for {uid}: {result['mismatches']}")
+        else:
+            await financial_rollups.rebuild_user(uid)
+
+        if index % 500 == 0:
+            logger.info(f"   ... {index}/{len(user_ids)} users processed")
+
+    summary = {"users": len(user_ids), "inconsistent": inconsistent, "repaired": inconsistent if repair else 0}
+    logger.info(f"✅ Financial rollups done: {summary}")
+    return summary
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild or verify per-user financial rollups")
+    parser.add_argument("--verify", action="store_true", help="Compare rollups with transactions instead of rebuilding")
+    parser.add_argument("--repair", action="store_true", help="With --verify, rebuild rollups that have drifted")
+    parser.add_argument("--user", help="Only process this user id")
+    args = parser.parse_args()
+
+    return await run(verify=args.verify, repair=args.repair, user_id=args.user)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,185 @@
+"""
+Shared Async Redis Connection Layer
+One redis.asyncio connection pool per logical database, shared by every cache
+service, with lazy connection, reconnect backoff and latency/pool statistics
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+    REDIS_AVAILABLE = True
+    REDIS_CONNECTION_ERRORS = (RedisConnectionError, RedisTimeoutError, OSError)
+except ImportError:
+    aioredis = None
+    REDIS_AVAILABLE = False
+    REDIS_CONNECTION_ERRORS = (OSError,)
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+class RedisConnectionManager:
+    """
+    Lazily connects to the first reachable Redis host and hands out clients
+    backed by a shared ``redis.asyncio.ConnectionPool`` per (db, decode_responses).
+    A failed connection attempt is not retried until ``retry_interval`` has
+    passed, so an unavailable Redis costs callers nothing but a dict lookup.
+    """
+
+    def __init__(self):
+        hosts = os.environ.get('REDIS_HOSTS', 'localhost,127.0.0.1,redis')
+        self.hosts = [host.strip() for host in hosts.split(',') if host.strip()]
+        self.port = int(os.environ.get('REDIS_PORT', '6379'))
+        self.max_connections = int(os.environ.get('REDIS_MAX_CONNECTIONS', '50'))
+        self.socket_timeout = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '2'))
+        self.retry_interval = 30
+
+        self._clients: Dict[Tuple[int, bool], Any] = {}
+        self._pools: Dict[Tuple[int, bool], Any] = {}
+        self._failed_at: Dict[Tuple[int, bool], float] = {}
+        self._locks: Dict[Tuple[int, bool], asyncio.Lock] = {}
+        self._host: Optional[str] = None
+
+        # Per-operation latency statistics
+        self.latency: Dict[str, Dict[str, float]] = {}
+
+    async def get_client(self, db: int = 0, decode_responses: bool = False):
+        """Return a pooled async client for ``db`` or None if Redis is unreachable"""
+        if not REDIS_AVAILABLE:
+            return None
+
+        pool_key = (db, decode_responses)
+        client = self._clients.get(pool_key)
+        if client is not None:
+            return client
+
+        failed_at = self._failed_at.get(pool_key)
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+            return None
+
+        lock = self._locks.setdefault(pool_key, asyncio.Lock())
+        async with lock:
+            if pool_key in self._clients:
+                return self._clients[pool_key]
+
+            hosts = [self._host] if self._host else self.hosts
+            for host in hosts:
+                pool = aioredis.ConnectionPool(
+                    host=host,
+                    port=self.port,
+                    db=db,
+                    max_connections=self.max_connections,
+                    socket_timeout=self.socket_timeout,
+                    socket_connect_timeout=self.socket_timeout,
+                    retry_on_timeout=True,
+                    decode_responses=decode_responses
+                )
+                client = aioredis.Redis(connection_pool=pool)
+                try:
+                    await client.ping()
+                except Exception as e:
+                    logger.warning(f"Failed to connect to Redis at {host}:{self.port}/{db}: {str(e)}")
+                    await pool.disconnect()
+                    continue
+
+                self._host = host
+                self._pools[pool_key] = pool
+                self._clients[pool_key] = client
+                self._failed_at.pop(pool_key, None)
+                logger.info(f"✅ Async Redis pool ready on {host}:{self.port}/{db} "
+                            f"(max {self.max_connections} connections)")
+                return client
+
+            self._failed_at[pool_key] = time.monotonic()
+            logger.info(f"⚠️ Redis db {db} not available - retrying in {self.retry_interval}s")
+            return None
+
+    def report_error(self, error: Exception, db: int = 0, decode_responses: bool = False):
+        """Drop the client on connection-level failures so callers degrade quickly"""
+        if isinstance(error, REDIS_CONNECTION_ERRORS):
+            self.mark_failed(db, decode_responses)
+
+    def mark_failed(self, db: int = 0, decode_responses: bool = False):
+        """Forget a client and back off before reconnecting"""
+        pool_key = (db, decode_responses)
+        if self._clients.pop(pool_key, None) is not None:
+            pool = self._pools.pop(pool_key, None)
+            if pool is not None:
+                asyncio.ensure_future(pool.disconnect())
+            self._failed_at[pool_key] = time.monotonic()
+            logger.warning(f"⚠️ Redis db {db} marked unavailable")
+
+    @asynccontextmanager
+    async def measure(self, operation: str):
+        """Record latency and errors for a Redis round trip"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stats = self.latency.setdefault(operation, {
+                'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if error:
+                stats['errors'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool utilisation and per-operation latency"""
+        pools = {}
+        for (db, decode_responses), pool in self._pools.items():
+            pools[f"db{db}{':text' if decode_responses else ''}"] = {
+                'max_connections': pool.max_connections,
+                'in_use': len(getattr(pool, '_in_use_connections', ())),
+                'available': len(getattr(pool, '_available_connections', ())),
+            }
+
+        latency = {
+            operation: {
+                'count': int(stats['count']),
+                'errors': int(stats['errors']),
+                'avg_ms': round(stats['total_ms'] / stats['count'], 3) if stats['count'] else 0.0,
+                'max_ms': round(stats['max_ms'], 3),
+            }
+            for operation, stats in self.latency.items()
+        }
+
+        return {
+            'available': REDIS_AVAILABLE,
+            'host': self._host,
+            'pools': pools,
+            'latency': latency,
+        }
+
+    async def close(self):
+        """Close every pool (application shutdown)"""
+        for client in list(self._clients.values()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Redis client close error: {str(e)}")
+        for pool in list(self._pools.values()):
+            await pool.disconnect()
+        self._clients.clear()
+        self._pools.clear()
+        logger.info("✅ Redis connection pools closed")
+
+
+# Global Redis connection manager instance
+redis_manager = RedisConnectionManager()
+
+# Export for use in other modules
+__all__ = ['RedisConnectionManager', 'redis_manager', 'REDIS_AVAILABLE']
@@ -0,0 +1,257 @@
+"""
+Time-Bucketed Reminder Scheduler
+Keeps each push subscription's next daily-reminder slot (local time, rounded
+down to a bucket) on the subscription itself, so every tick reads only the
+subscriptions that are due instead of scanning all of them
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from datetime import time as clock_time
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from pymongo import UpdateOne
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+DEFAULT_REMINDER_TIME = "19:00"
+
+
+class ReminderScheduler:
+    """
+    ``reminder_due_at`` on a push subscription is the UTC instant of its next
+    reminder slot, or absent when daily reminders are off. A tick:
+
+    1. claims every due, enabled subscription with one ``update_many`` lease
+       (so concurrent workers never share a subscription),
+    2. reads the claimed ones with the few user fields needed in one projected
+       ``$lookup`` aggregation,
+    3. moves each to its next slot in one ``bulk_write`` (conditioned on the
+       claim) and sends the reminders through the WebPush pool in one batch.
+
+    Slots missed by more than ``max_lateness`` (downtime, or reminders just
+    re-enabled with a stale slot) are rescheduled without sending.
+    """
+
+    def __init__(self, bucket_minutes: int = 15, default_timezone: str = "UTC",
+                 max_lateness_minutes: int = 60, batch_size: int = 500, lease_seconds: int = 600):
+        self.bucket_minutes = bucket_minutes
+        self.default_timezone = default_timezone
+        self.max_lateness = timedelta(minutes=max_lateness_minutes)
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"reminders-{uuid.uuid4().hex[:8]}"
+
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'ticks': 0, 'claimed': 0, 'sent': 0, 'skipped_active': 0,
+                      'skipped_late': 0, 'rescheduled': 0, 'backfilled': 0, 'last_tick_ms': 0.0}
+
+    async def _get_db(self):
+        from database import get_database
+        return await get_database("notifications")
+
+    def _zone(self, name: Optional[str]) -> ZoneInfo:
+        try:
+            return ZoneInfo(name or self.default_timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            return ZoneInfo(self.default_timezone)
+
+    def next_slot(self, preferences: Dict[str, Any], after: datetime) -> Optional[datetime]:
+        """UTC start of the first reminder bucket strictly after ``after``; None when reminders are off"""
+        if not preferences.get("daily_reminders") or preferences.get("streak_reminders") is False:
+            return None
+        reminder_time = preferences.get("reminder_time", DEFAULT_REMINDER_TIME)
+        try:
+            hour, minute = map(int, reminder_time.split(":"))
+            slot_time = clock_time(hour, minute - minute % self.bucket_minutes)
+        except (AttributeError, ValueError):
+            logger.error(f"Invalid reminder time format: {reminder_time}")
+            return None
+
+        zone = self._zone(preferences.get("timezone"))
+        local_date = after.astimezone(zone).date()
+        for days in range(2):
+            slot = datetime.combine(local_date + timedelta(days=days), slot_time, tzinfo=zone).astimezone(timezone.utc)
+            if slot > after:
+                return slot
+        return None
+
+    async def reschedule_user(self, user_id: str, preferences: Optional[Dict[str, Any]] = None):
+        """Recompute the slot of every subscription of a user (after subscribing or a preference change)"""
+        db = await self._get_db()
+        now = datetime.now(timezone.utc)
+        subscriptions = await db.push_subscriptions.find(
+            {"user_id": user_id}, {"_id": 1, "notification_preferences": 1}
+        ).to_list(None)
+        operations = [self._slot_update(subscription["_id"], preferences or subscription.get("notification_preferences") or {}, now)
+                      for subscription in subscriptions]
+        if operations:
+            await db.push_subscriptions.bulk_write(operations, ordered=False)
+
+    def _slot_update(self, subscription_id, preferences: Dict[str, Any], now: datetime,
+                     claimed: bool = False) -> UpdateOne:
+        slot = self.next_slot(preferences, now)
+        update = {"$set": {"reminder_due_at": slot}} if slot else {"$unset": {"reminder_due_at": ""}}
+        query = {"_id": subscription_id}
+        if claimed:
+            query["reminder_locked_by"] = self.worker_id
+            update.setdefault("$set", {}).update({"reminder_locked_by": None, "reminder_locked_until": None})
+        return UpdateOne(query, update)
+
+    async def backfill(self) -> int:
+        """Give a slot to active subscriptions created before the scheduler existed"""
+        db = await self._get_db()
+        now = datetime.now(timezone.utc)
+        cursor = db.push_subscriptions.find(
+            {"is_active": True, "reminder_due_at": {"$exists": False}, "notification_preferences.daily_reminders": True},
+            {"_id": 1, "notification_preferences": 1}
+        )
+        operations = []
+        backfilled = 0
+        async for subscription in cursor:
+            operations.append(self._slot_update(subscription["_id"], subscription.get("notification_preferences") or {}, now))
+            if len(operations) >= self.batch_size:
+                backfilled += (await db.push_subscriptions.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            backfilled += (await db.push_subscriptions.bulk_write(operations, ordered=False)).modified_count
+        self.stats['backfilled'] += backfilled
+        return backfilled
+
+    def _active_today(self, last_activity, zone: ZoneInfo, now: datetime) -> bool:
+        if not last_activity:
+            return False
+        if isinstance(last_activity, datetime):
+            if last_activity.tzinfo is None:
+                last_activity = last_activity.replace(tzinfo=timezone.utc)
+            return last_activity.astimezone(zone).date() == now.astimezone(zone).date()
+        return last_activity == now.astimezone(zone).date()
+
+    async def tick(self, push_service) -> Dict[str, int]:
+        """Send every reminder whose slot has come and move those subscriptions to their next slot"""
+        from webpush_pool import webpush_pool
+
+        start = time.perf_counter()
+        db = await self._get_db()
+        now = datetime.now(timezone.utc)
+        due = {
+            "is_active": True,
+            "reminder_due_at": {"$lte": now},
+            "notification_preferences.daily_reminders": True,
+            "$or": [{"reminder_locked_until": None}, {"reminder_locked_until": {"$lt": now}}],
+        }
+        claim = await db.push_subscriptions.update_many(due, {"$set": {
+            "reminder_locked_by": self.worker_id,
+            "reminder_locked_until": now + timedelta(seconds=self.lease_seconds),
+        }})
+        summary = {'claimed': claim.modified_count, 'sent': 0}
+        if claim.modified_count == 0:
+            self._record_tick(start, summary)
+            return summary
+
+        cursor = db.push_subscriptions.aggregate([
+            {"$match": {"reminder_locked_by": self.worker_id}},
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "id", "as": "user"}},
+            {"$project": {
+                "_id": 1,
+                "user_id": 1,
+                "subscription_data": 1,
+                "notification_preferences": 1,
+                "reminder_due_at": 1,
+                "current_streak": {"$arrayElemAt": ["$user.current_streak", 0]},
+                "last_activity_date": {"$arrayElemAt": ["$user.last_activity_date", 0]},
+            }},
+        ], batchSize=self.batch_size)
+
+        batch: List[Dict[str, Any]] = []
+        async for subscription in cursor:
+            batch.append(subscription)
+            if len(batch) >= self.batch_size:
+                summary['sent'] += await self._process(db, push_service, webpush_pool, batch, now)
+                batch = []
+        if batch:
+            summary['sent'] += await self._process(db, push_service, webpush_pool, batch, now)
+
+        self._record_tick(start, summary)
+        logger.info(f"⏰ Reminder tick: {summary['sent']}/{summary['claimed']} due reminders sent")
+        return summary
+
+    async def _process(self, db, push_service, webpush_pool, batch: List[Dict[str, Any]], now: datetime) -> int:
+        """Reschedule a batch of claimed subscriptions, then push to the ones that still need a reminder"""
+        operations = []
+        deliveries: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        for subscription in batch:
+            preferences = subscription.get("notification_preferences") or {}
+            operations.append(self._slot_update(subscription["_id"], preferences, now, claimed=True))
+
+            due_at = subscription["reminder_due_at"]
+            if due_at.tzinfo is None:
+                due_at = due_at.replace(tzinfo=timezone.utc)
+            if now - due_at > self.max_lateness:
+                self.stats['skipped_late'] += 1
+                continue
+            if self._active_today(subscription.get("last_activity_date"), self._zone(preferences.get("timezone")), now):
+                self.stats['skipped_active'] += 1
+                continue
+            streak_data = {"current_streak": subscription.get("current_streak") or 0}
+            deliveries.append((subscription["subscription_data"], push_service.streak_reminder_payload("daily", streak_data)))
+
+        await db.push_subscriptions.bulk_write(operations, ordered=False)
+        self.stats['rescheduled'] += len(operations)
+        sent = await webpush_pool.send_many(deliveries) if deliveries else 0
+        self.stats['sent'] += sent
+        return sent
+
+    def _record_tick(self, start: float, summary: Dict[str, int]):
+        self.stats['ticks'] += 1
+        self.stats['claimed'] += summary['claimed']
+        self.stats['last_tick_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    async def _run(self):
+        bucket_seconds = self.bucket_minutes * 60
+        while True:
+            try:
+                # Wake just after each bucket boundary (UTC and local boundaries coincide)
+                await asyncio.sleep(bucket_seconds - time.time() % bucket_seconds + 1)
+                from push_notification_service import get_push_service
+                await self.tick(await get_push_service())
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {str(e)}")
+
+    async def start(self):
+        """Backfill missing slots and start ticking once per bucket"""
+        if self._task is None or self._task.done():
+            try:
+                await self.backfill()
+            except Exception as e:
+                logger.error(f"Reminder slot backfill failed: {str(e)}")
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🚀 Reminder scheduler started ({self.bucket_minutes}-minute buckets)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'bucket_minutes': self.bucket_minutes, 'running': self._task is not None and not self._task.done()}
+
+
+# Global reminder scheduler instance
+reminder_scheduler = ReminderScheduler(
+    bucket_minutes=int(os.environ.get('REMINDER_BUCKET_MINUTES', '15')),
+    default_timezone=os.environ.get('REMINDER_DEFAULT_TIMEZONE', 'UTC'),
+    max_lateness_minutes=int(os.environ.get('REMINDER_MAX_LATENESS_MINUTES', '60'))
+)
+
+# Export for use in other modules
+__all__ = ['ReminderScheduler', 'reminder_scheduler']
@@ -0,0 +1,228 @@
+"""
+Projection-Aware Repositories
+Typed read helpers over database.py: named projections for the shapes
+endpoints actually use, bounded or streamed reads instead of to_list(None),
+and per-query wire-size accounting
+"""
+
+import logging
+import os
+import random
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, TypedDict
+
+from bson import encode as bson_encode
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+# ===== NAMED READ SHAPES =====
+
+class UserCard(TypedDict, total=False):
+    """What social lists render for a person"""
+    id: str
+    full_name: str
+    avatar: str
+    university: str
+
+
+class UserStats(TypedDict, total=False):
+    """Gamification counters shown next to a user card"""
+    id: str
+    full_name: str
+    avatar: str
+    university: str
+    experience_points: int
+    achievement_points: int
+    current_streak: int
+    level: int
+    total_earnings: float
+    net_savings: float
+
+
+class TxAmount(TypedDict, total=False):
+    """Enough of a transaction to aggregate money by user/type/category"""
+    user_id: str
+    amount: float
+    type: str
+    category: str
+    date: Any
+
+
+class Projection:
+    """A named MongoDB projection; ``name`` labels the wire-size statistics"""
+
+    def __init__(self, name: str, fields: Iterable[str]):
+        self.name = name
+        self.fields = tuple(fields)
+        self.spec = {"_id": 0, **{field: 1 for field in self.fields}}
+
+    @classmethod
+    def of(cls, shape) -> "Projection":
+        """Projection for a TypedDict read shape"""
+        return cls(shape.__name__, shape.__annotations__)
+
+    @classmethod
+    def fields_of(cls, fields: Sequence[str], name: str = "adhoc") -> "Projection":
+        return cls(name, fields)
+
+    def __repr__(self) -> str:
+        return f"Projection({self.name})"
+
+
+USER_CARD = Projection.of(UserCard)
+USER_STATS = Projection.of(UserStats)
+TX_AMOUNT = Projection.of(TxAmount)
+
+
+class UnboundedReadError(ValueError):
+    """A list read without a limit; use stream() or pass allow_unbounded=True"""
+
+
+# ===== WIRE-SIZE ACCOUNTING =====
+
+class WireStats:
+    """
+    Documents and BSON bytes returned per (collection, projection). Queries
+    and documents are always counted; only ``sample_rate`` of the queries are
+    BSON-encoded to measure bytes, and ``bytes`` is extrapolated from them.
+    """
+
+    def __init__(self, enabled: bool = True, sample_rate: float = 0.01):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, collection: str, operation: str, projection: Projection, docs: Sequence[Dict[str, Any]]):
+        if not self.enabled:
+            return
+        key = f"{collection}:{projection.name}"
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = {'queries': 0, 'docs': 0, 'sampled_docs': 0, 'sampled_bytes': 0}
+        stats['queries'] += 1
+        stats['docs'] += len(docs)
+        if not docs or random.random() >= self.sample_rate:
+            return
+        wire_bytes = sum(len(bson_encode(doc)) for doc in docs)
+        stats['sampled_docs'] += len(docs)
+        stats['sampled_bytes'] += wire_bytes
+        logger.debug(f"📦 {collection}.{operation} [{projection.name}] {len(docs)} docs, {wire_bytes} bytes")
+
+    def get_stats(self) -> Dict[str, Any]:
+        results = {}
+        for key, stats in self.stats.items():
+            avg_doc_bytes = stats['sampled_bytes'] / stats['sampled_docs'] if stats['sampled_docs'] else 0
+            results[key] = {
+                **stats,
+                'avg_doc_bytes': round(avg_doc_bytes, 1),
+                'bytes': round(avg_doc_bytes * stats['docs'])
+            }
+        return results
+
+
+wire_stats = WireStats(
+    enabled=os.environ.get('REPOSITORY_WIRE_STATS', 'true').lower() == 'true',
+    sample_rate=float(os.environ.get('REPOSITORY_WIRE_STATS_SAMPLE_RATE', '0.01'))
+)
+
+
+# ===== REPOSITORIES =====
+
+class Repository:
+    """
+    Reads from one collection, always through a projection. ``find()`` needs a
+    limit (or an explicit ``allow_unbounded=True``); large scans go through
+    ``stream()``, which iterates the cursor in batches.
+    """
+
+    def __init__(self, collection_name: str, id_field: str = "id"):
+        self.collection_name = collection_name
+        self.id_field = id_field
+
+    async def _collection(self):
+        from database import get_database
+        db = await get_database()
+        return db[self.collection_name]
+
+    async def find_one(self, query: Dict[str, Any], projection: Projection) -> Optional[Dict[str, Any]]:
+        collection = await self._collection()
+        doc = await collection.find_one(query, projection.spec)
+        wire_stats.record(self.collection_name, "find_one", projection, [doc] if doc else [])
+        return doc
+
+    async def find(self, query: Dict[str, Any], projection: Projection, limit: Optional[int] = None,
+                   sort: Optional[List[Tuple[str, int]]] = None, allow_unbounded: bool = False) -> List[Dict[str, Any]]:
+        if limit is None and not allow_unbounded:
+            raise UnboundedReadError(f"{self.collection_name}.find() needs a limit - use stream() for scans")
+
+        collection = await self._collection()
+        cursor = collection.find(query, projection.spec)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        docs = await cursor.to_list(limit)
+        wire_stats.record(self.collection_name, "find", projection, docs)
+        return docs
+
+    async def stream(self, query: Dict[str, Any], projection: Projection,
+                     sort: Optional[List[Tuple[str, int]]] = None, batch_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate every match without holding the whole result in memory"""
+        collection = await self._collection()
+        cursor = collection.find(query, projection.spec, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort(sort)
+
+        batch: List[Dict[str, Any]] = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                wire_stats.record(self.collection_name, "stream", projection, batch)
+                batch = []
+            yield doc
+        wire_stats.record(self.collection_name, "stream", projection, batch)
+
+    async def find_by_ids(self, ids: Iterable[str], projection: Projection) -> Dict[str, Dict[str, Any]]:
+        """One ``$in`` query, keyed by ``id_field``"""
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        if self.id_field not in projection.fields:
+            projection = Projection(projection.name, projection.fields + (self.id_field,))
+        docs = await self.find({self.id_field: {"$in": ids}}, projection, limit=len(ids))
+        return {doc[self.id_field]: doc for doc in docs}
+
+
+class UserRepository(Repository):
+
+    def __init__(self):
+        super().__init__("users")
+
+    async def get_card(self, user_id: str) -> Optional[UserCard]:
+        return await self.find_one({"id": user_id}, USER_CARD)
+
+    async def cards(self, user_ids: Iterable[str]) -> Dict[str, UserCard]:
+        return await self.find_by_ids(user_ids, USER_CARD)
+
+
+class TransactionRepository(Repository):
+
+    def __init__(self):
+        super().__init__("transactions")
+
+    def amounts(self, query: Dict[str, Any], batch_size: int = 1000) -> AsyncIterator[TxAmount]:
+        """Stream the money fields of every matching transaction"""
+        return self.stream(query, TX_AMOUNT, batch_size=batch_size)
+
+
+# Global repository instances
+user_repository = UserRepository()
+transaction_repository = TransactionRepository()
+
+# Export for use in other modules
+__all__ = [
+    'Projection', 'UserCard', 'UserStats', 'TxAmount', 'USER_CARD', 'USER_STATS', 'TX_AMOUNT',
+    'Repository', 'UserRepository', 'TransactionRepository', 'UnboundedReadError',
+    'user_repository', 'transaction_repository', 'wire_stats'
+]
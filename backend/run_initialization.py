@@ -2,9 +2,7 @@
 Standalone initialization script that runs both super admin creation and university initialization
 """
 import asyncio
-import os
 import sys
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 import uuid
@@ -12,6 +10,8 @@ from datetime import datetime, timezone
 
 load_dotenv()
 
+from mongo_pool import mongo_manager
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def hash_password(password: str) -> str:
@@ -364,15 +364,11 @@ async def main():
     print("="*60)
     
     # Connect to MongoDB
-    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    db_name = os.environ.get('DB_NAME', 'moneymojo_db')
-    
     print(f"\n📡 Connecting to MongoDB...")
-    print(f"   URL: {mongo_url}")
-    print(f"   Database: {db_name}")
+    print(f"   URL: {mongo_manager.mongo_url}")
+    print(f"   Database: {mongo_manager.db_name}")
     
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
+    db = mongo_manager.get_database()
     
     try:
         # Test connection
@@ -397,7 +393,7 @@ async def main():
         import traceback
         traceback.print_exc()
     finally:
-        client.close()
+        mongo_manager.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -10,22 +10,43 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import logging
 
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address)
+# Importing the storage class registers its scheme with ``limits``
+from rate_limit_sync import SyncedWindowStorage
 
 # JWT Configuration
 JWT_SECRET = "earnaura-production-secret-key-2024-secure"
 JWT_ALGORITHM = "HS256"
 
+def rate_limit_key(request: Request) -> str:
+    """Rate-limit key: the JWT subject for authenticated calls, else the client IP"""
+    auth_header = request.headers.get("authorization", "")
+    if auth_header[:7].lower() == "bearer ":
+        try:
+            payload = jwt.decode(auth_header[7:].strip(), JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            if payload.get("user_id") and payload.get("type") == "access":
+                return f"user:{payload['user_id']}"
+        except jwt.InvalidTokenError:
+            pass
+    return f"ip:{get_remote_address(request)}"
+
+# Rate limiting - sliding-window counters checked in process memory and
+# exchanged with Redis in batches by rate_limit_sync (see rate_limit_sync.py)
+limiter = Limiter(
+    key_func=rate_limit_key,
+    storage_uri=f"{SyncedWindowStorage.STORAGE_SCHEME[0]}://",
+    strategy="fixed-window",
+    key_prefix="ratelimit"
+)
+
 # Security constants
 MAX_LOGIN_ATTEMPTS = 5
 LOCKOUT_DURATION = timedelta(minutes=30)
 EMAIL_VERIFICATION_EXPIRY = timedelta(hours=24)
 PASSWORD_RESET_EXPIRY = timedelta(hours=1)
 
-def hash_password(password: str) -> str:
+def hash_password(password: str, rounds: int = 12) -> str:
     """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     """Verify password against hash"""
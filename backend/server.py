@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,6 +16,7 @@ import json
 import asyncio
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Dict, Any
+from pymongo import ReturnDocument, UpdateOne
 
 # Import our enhanced modules
 from models import *
@@ -32,10 +33,26 @@ from admin_verification_service import admin_workflow_manager, email_verifier, d
 from websocket_service import connection_manager, get_notification_service
 
 # Performance optimization imports
-from performance_cache import advanced_cache, cache_result
+from performance_cache import advanced_cache, cache_result, CacheTags
 from database_optimization import db_optimizer
 from api_optimization import api_optimizer, PerformanceTrackingMiddleware
 from background_tasks import background_processor, TaskPriority, cache_warming_task, database_maintenance_task
+from event_outbox import event_pipeline
+from auth_cache import principal_cache
+from redis_pool import redis_manager
+from password_hasher import password_hasher
+from financial_rollups import financial_rollups
+from challenge_scoring import participant_scorer, resolve_competition_metric, resolve_prize_metric
+from friend_graph import friend_graph
+from repositories import Projection, USER_STATS, user_repository, transaction_repository, wire_stats
+from query_telemetry import query_monitor, index_advisor
+from mongo_pool import mongo_manager
+from badge_rules import badge_rules
+from notification_aggregator import notification_aggregator
+from notification_store import notification_store
+from reminder_scheduler import reminder_scheduler
+from rate_limit_sync import rate_limit_sync
+from leaderboard_rank_engine import rank_engine
 try:
     from social_sharing_service import get_social_sharing_service
     SOCIAL_SHARING_AVAILABLE = True
@@ -48,6 +65,7 @@ except ImportError as e:
 
 try:
     from push_notification_service import get_push_service
+    from webpush_pool import webpush_pool
     PUSH_NOTIFICATION_AVAILABLE = True
 except ImportError as e:
     print(f"Push notification service unavailable due to missing dependencies: {e}")
@@ -231,6 +249,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Trust only specific hosts in production
@@ -332,65 +351,54 @@ async def global_exception_handler(request: Request, exc: Exception):
             }
         )
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    """Get current authenticated user"""
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """
+    Resolve the authenticated user document once per request.
+    FastAPI caches this dependency per request, and the user document itself
+    is served from the short-TTL principal cache instead of MongoDB.
+    """
     user_id = verify_jwt_token(credentials.credentials)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
-    # Check if user exists and is active
-    user = await get_user_by_id(user_id)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = await get_user_by_id(user_id)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal_cache.set(user_id, user)
+        user = principal_cache.get(user_id)
     
     if not user.get("is_active", True):
         raise HTTPException(status_code=401, detail="Account deactivated")
     
-    return user_id
+    return user
+
+async def get_current_user(principal: dict = Depends(get_current_principal)) -> str:
+    """Get current authenticated user"""
+    return principal["id"]
 
-async def get_current_user_dict(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+async def get_current_user_dict(principal: dict = Depends(get_current_principal)) -> dict:
     """Get current authenticated user as dictionary object"""
-    user_id = verify_jwt_token(credentials.credentials)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    # Check if user exists and is active
-    user = await get_user_by_id(user_id)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    if not user.get("is_active", True):
-        raise HTTPException(status_code=401, detail="Account deactivated")
-    
-    # Convert MongoDB document to clean dictionary
-    if user:
-        if "_id" in user:
-            del user["_id"]  # Remove MongoDB _id field
-    
-    return user
+    return dict(principal)
 
-async def get_current_admin(user_id: str = Depends(get_current_user)) -> str:
+async def get_current_admin(principal: dict = Depends(get_current_principal)) -> str:
     """Get current authenticated admin user (backward compatibility)"""
-    user = await get_user_by_id(user_id)
-    if not user or not user.get("is_admin", False):
+    if not principal.get("is_admin", False):
         raise HTTPException(status_code=403, detail="Admin access required")
-    return user_id
+    return principal["id"]
 
-async def get_current_super_admin(user_id: str = Depends(get_current_user)) -> Dict[str, Any]:
+async def get_current_super_admin(principal: dict = Depends(get_current_principal)) -> Dict[str, Any]:
     """Get current authenticated super admin user"""
-    user = await get_user_by_id(user_id)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     # Check both new super_admin flag and legacy is_admin flag
-    is_super = user.get("is_super_admin", False) or (user.get("admin_level") == "super_admin") or user.get("is_admin", False)
+    is_super = principal.get("is_super_admin", False) or (principal.get("admin_level") == "super_admin") or principal.get("is_admin", False)
     
     if not is_super:
         raise HTTPException(status_code=403, detail="Super admin privileges required")
     
     # Return user with proper user_id field for consistency
-    user_dict = dict(user) if user else {}
-    user_dict["user_id"] = user.get("id", user_id)
+    user_dict = dict(principal)
+    user_dict["user_id"] = principal["id"]
     return user_dict
 
 async def get_current_campus_admin(user_id: str = Depends(get_current_user)) -> Dict[str, Any]:
@@ -426,15 +434,12 @@ async def get_current_club_admin(user_id: str = Depends(get_current_user)) -> Di
     return club_admin
 
 
-async def get_current_admin_with_challenge_permissions(user_id: str = Depends(get_current_user)) -> Dict[str, Any]:
+async def get_current_admin_with_challenge_permissions(user: dict = Depends(get_current_principal)) -> Dict[str, Any]:
     """Get current authenticated admin (campus or club) with challenge creation privileges"""
     db = await get_database()
+    user_id = user["id"]
     
     # Check if user is system admin first
-    user = await get_user_by_id(user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-        
     is_system_admin = user.get("is_admin", False) or user.get("is_super_admin", False)
     if is_system_admin:
         return {
@@ -736,16 +741,17 @@ async def get_dynamic_financial_insights(user_id: str) -> Dict[str, Any]:
     try:
         # Get user's financial data
         user_doc = await get_user_by_id(user_id)
-        transactions = await get_user_transactions(user_id, limit=50)
+        rollup = await financial_rollups.get_rollup(user_id, ("lifetime", "categories"))
         budgets = await get_user_budgets(user_id)
         goals = await get_user_financial_goals(user_id)
         
-        if not transactions:
+        lifetime = rollup.get("lifetime", {})
+        if not lifetime.get("income_count") and not lifetime.get("expense_count"):
             return {"insights": ["Start tracking your expenses to get personalized insights!"]}
         
         # Calculate comprehensive stats
-        total_income = sum(t["amount"] for t in transactions if t["type"] == "income")
-        total_expenses = sum(t["amount"] for t in transactions if t["type"] == "expense")
+        total_income = lifetime.get("income", 0.0)
+        total_expenses = lifetime.get("expense", 0.0)
         net_savings = total_income - total_expenses
         
         # Calculate budget utilization
@@ -772,8 +778,7 @@ async def get_dynamic_financial_insights(user_id: str) -> Dict[str, Any]:
             }
         
         # Income streak calculation (days with income since registration)
-        income_transactions = [t for t in transactions if t["type"] == "income"]
-        income_dates = [t["date"] for t in income_transactions]
+        income_dates = await financial_rollups.income_days(user_id)
         income_streak = calculate_income_streak(income_dates, user_doc.get("created_at"))
         
         # Generate dynamic insights
@@ -822,11 +827,7 @@ async def get_dynamic_financial_insights(user_id: str) -> Dict[str, Any]:
             insights.append(f"💼 Good momentum! You're on a {income_streak}-day income streak. Keep it up!")
         
         # Spending pattern insights
-        expense_categories = {}
-        for transaction in transactions:
-            if transaction["type"] == "expense":
-                category = transaction["category"]
-                expense_categories[category] = expense_categories.get(category, 0) + transaction["amount"]
+        expense_categories = financial_rollups.category_spend(rollup)
         
         if expense_categories:
             highest_expense_category = max(expense_categories, key=expense_categories.get)
@@ -897,19 +898,8 @@ async def update_monthly_income_goal_progress(user_id: str):
         if not monthly_goal:
             return  # No monthly income goal to update
         
-        # Calculate current month's income
-        current_month = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        next_month = current_month.replace(month=current_month.month + 1) if current_month.month < 12 else current_month.replace(year=current_month.year + 1, month=1)
-        
-        # Get income transactions for current month
-        income_transactions = await db.transactions.find({
-            "user_id": user_id,
-            "type": "income",
-            "date": {"$gte": current_month, "$lt": next_month}
-        }).to_list(None)
-        
-        # Calculate total monthly income
-        monthly_income = sum(transaction["amount"] for transaction in income_transactions)
+        # Current month's income from the financial rollup
+        monthly_income = (await financial_rollups.get_month_totals(user_id))["income"]
         
         # Update the goal's current amount
         is_completed = monthly_income >= monthly_goal["target_amount"]
@@ -925,6 +915,7 @@ async def update_monthly_income_goal_progress(user_id: str):
                 }
             }
         )
+        await advanced_cache.invalidate_tags(CacheTags.user_goals(user_id))
         
         # 🔥 REAL-TIME NOTIFICATIONS: Send goal progress updates
         try:
@@ -1276,7 +1267,7 @@ async def register_user(request: Request, user_data: UserCreate):
         user_dict["location"] = sanitize_input(user_dict.get("location", ""))
         
         # Hash password and create user
-        hashed_password = hash_password(user_data.password)
+        hashed_password = await password_hasher.hash(user_data.password)
         del user_dict["password"]
         
         user = User(**user_dict)
@@ -1390,6 +1381,7 @@ async def register_user(request: Request, user_data: UserCreate):
                                 "automatic": True  # Mark as automatically created
                             }
                             await db.friendships.insert_one(friendship)
+                            await friend_graph.invalidate(referrer["referrer_id"], user_doc["id"])
                             
                             # Award additional friendship bonus points
                             friendship_bonus_points = 25
@@ -1515,7 +1507,7 @@ async def login_user(request: Request, login_data: UserLogin):
             )
         
         # Verify password
-        if not verify_password(login_data.password, user_doc["password_hash"]):
+        if not await password_hasher.verify(login_data.password, user_doc["password_hash"]):
             # Increment failed login attempts
             failed_attempts = user_doc.get("failed_login_attempts", 0) + 1
             await update_user(
@@ -1532,14 +1524,18 @@ async def login_user(request: Request, login_data: UserLogin):
             raise HTTPException(status_code=401, detail="Account deactivated")
         
         # Reset failed login attempts on successful login
-        await update_user(
-            user_doc["id"],
-            {
-                "failed_login_attempts": 0,
-                "last_failed_login": None,
-                "last_login": datetime.now(timezone.utc)
-            }
-        )
+        login_update = {
+            "failed_login_attempts": 0,
+            "last_failed_login": None,
+            "last_login": datetime.now(timezone.utc)
+        }
+        
+        # Upgrade the stored hash if the configured bcrypt cost has changed
+        new_hash = await password_hasher.rehash_if_needed(login_data.password, user_doc["password_hash"])
+        if new_hash:
+            login_update["password_hash"] = new_hash
+        
+        await update_user(user_doc["id"], login_update)
         
         # Create JWT token
         token = create_jwt_token(user_doc["id"])
@@ -1664,7 +1660,7 @@ async def reset_password(request: Request, reset_data: dict):
             )
         
         # Update password
-        hashed_password = hash_password(new_password)
+        hashed_password = await password_hasher.hash(new_password)
         await update_user(
             user["id"], 
             {
@@ -1698,10 +1694,11 @@ async def get_user_profile(request: Request, user_id: str = Depends(get_current_
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Calculate total earnings from transactions
-    transactions = await get_user_transactions(user_id, limit=1000)
-    total_earnings = sum(t["amount"] for t in transactions if t["type"] == "income")
-    total_expenses = sum(t["amount"] for t in transactions if t["type"] == "expense")
+    # Earnings and savings from the maintained financial rollup
+    rollup = await financial_rollups.get_rollup(user_id, ("lifetime",))
+    lifetime = rollup.get("lifetime", {})
+    total_earnings = lifetime.get("income", 0.0)
+    total_expenses = lifetime.get("expense", 0.0)
     net_savings = total_earnings - total_expenses
     
     # Calculate achievements
@@ -1737,8 +1734,7 @@ async def get_user_profile(request: Request, user_id: str = Depends(get_current_
         })
     
     # Streak-based achievements
-    income_transactions = [t for t in transactions if t["type"] == "income"]
-    income_dates = [t["date"] for t in income_transactions]
+    income_dates = await financial_rollups.income_days(user_id)
     current_streak = calculate_income_streak(income_dates, user_doc.get("created_at"))
     
     if current_streak >= 30:
@@ -1895,267 +1891,44 @@ async def create_transaction_endpoint(request: Request, transaction_data: Transa
                     detail=f"No money, you reached the limit! Remaining budget for '{transaction_dict['category']}': ₹{remaining_budget:.2f}, but you're trying to spend ₹{transaction_data.amount:.2f}"
                 )
             
-            # Create the transaction first
             transaction = Transaction(**transaction_dict)
-            await create_transaction(transaction.dict())
-            
-            # Update the budget's spent amount
-            await db.budgets.update_one(
-                {"_id": budget["_id"]},
-                {"$inc": {"spent_amount": transaction_data.amount}}
-            )
-            
-            # Update challenge progress for savings challenges
-            await update_user_challenge_progress(user_id)
-            
-            # Update group challenge progress
-            await update_group_challenge_progress(user_id)
-            
-            # 🔥 UPDATE PRIZE CHALLENGE PROGRESS
-            # Get all active prize challenges the user is participating in
-            try:
-                prize_participations = await db.prize_challenge_participations.find({
-                    "user_id": user_id,
-                    "participation_status": "active"
-                }).to_list(None)
-                
-                for participation in prize_participations:
-                    await update_single_prize_challenge_progress(participation["challenge_id"])
-            except Exception as e:
-                logger.error(f"Failed to update prize challenge progress: {e}")
-            
-            # 🔥 UPDATE INTER-COLLEGE COMPETITION PROGRESS
-            # Get all active competitions the user is participating in
-            try:
-                competition_participations = await db.campus_competition_participations.find({
-                    "user_id": user_id,
-                    "registration_status": {"$in": ["registered", "active"]}
-                }).to_list(None)
-                
-                for participation in competition_participations:
-                    await update_single_competition_progress(participation["competition_id"])
-            except Exception as e:
-                logger.error(f"Failed to update competition progress: {e}")
-            
-            # Enhanced Gamification hooks for expense transactions - Phase 1
-            gamification = await get_gamification_service()
-            streak_result = await gamification.update_user_streak(user_id)
-            
-            # Check for milestone achievements and trigger notifications
-            if streak_result and streak_result.get("milestone_reached"):
-                milestone_data = streak_result["milestone_reached"]
-                # Send push notification for milestone
-                try:
-                    if PUSH_NOTIFICATION_AVAILABLE:
-                        push_service = await get_push_service()
-                        await push_service.send_milestone_notification(user_id, milestone_data)
-                except Exception as e:
-                    logger.error(f"Failed to send milestone push notification: {e}")
-            
-            # Check and award badges
-            newly_earned_badges = await gamification.check_and_award_badges(user_id, "expense_created", {
-                "amount": transaction_data.amount,
-                "category": transaction_dict["category"]
-            })
-            
-            # Send notifications for new badges
-            for badge in newly_earned_badges:
-                try:
-                    if PUSH_NOTIFICATION_AVAILABLE:
-                        push_service = await get_push_service()
-                        badge_milestone_data = {
-                            "title": f"Badge Earned: {badge['name']}!",
-                            "message": badge["description"],
-                            "type": "badge",
-                            "icon": badge["icon"],
-                            "achievement_id": badge.get("achievement_id")
-                        }
-                        await push_service.send_milestone_notification(user_id, badge_milestone_data)
-                except Exception as e:
-                    logger.error(f"Failed to send badge push notification: {e}")
-            
-            await gamification.update_leaderboards(user_id)
+            # The budget's spent amount moves with the transaction
+            balance_update = (db.budgets, {"_id": budget["_id"]}, {"$inc": {"spent_amount": transaction_data.amount}})
+            
+            budget_snapshot = {
+                "category": budget.get("category"),
+                "month": budget.get("month"),
+                "allocated_amount": budget["allocated_amount"],
+                "spent_amount": budget["spent_amount"] + transaction_data.amount
+            }
             
         else:
             # For income transactions, no budget validation needed
             transaction = Transaction(**transaction_dict)
-            await create_transaction(transaction.dict())
-            
-            # Update user's total earnings and net savings
-            await db.users.update_one(
-                {"id": user_id},
-                {"$inc": {"total_earnings": transaction.amount, "net_savings": transaction.amount}}
-            )
-            
-            # Recalculate and update income streak
-            user_doc = await get_user_by_id(user_id)
-            user_transactions = await get_user_transactions(user_id, limit=1000)
-            income_transactions = [t for t in user_transactions if t["type"] == "income"]
-            income_dates = [t["date"] for t in income_transactions]
-            current_streak = calculate_income_streak(income_dates, user_doc.get("created_at"))
-            
-            await db.users.update_one(
-                {"id": user_id},
-                {"$set": {"current_streak": current_streak}}
-            )
-
-            # Update Monthly Income Goal progress automatically
-            await update_monthly_income_goal_progress(user_id)
-            
-            # Update challenge progress for savings challenges
-            await update_user_challenge_progress(user_id)
-            
-            # Update group challenge progress
-            await update_group_challenge_progress(user_id)
-            
-            # 🔥 UPDATE PRIZE CHALLENGE PROGRESS
-            # Get all active prize challenges the user is participating in
-            try:
-                prize_participations = await db.prize_challenge_participations.find({
-                    "user_id": user_id,
-                    "participation_status": "active"
-                }).to_list(None)
-                
-                for participation in prize_participations:
-                    await update_single_prize_challenge_progress(participation["challenge_id"])
-            except Exception as e:
-                logger.error(f"Failed to update prize challenge progress: {e}")
-            
-            # 🔥 UPDATE INTER-COLLEGE COMPETITION PROGRESS
-            # Get all active competitions the user is participating in
-            try:
-                competition_participations = await db.campus_competition_participations.find({
-                    "user_id": user_id,
-                    "registration_status": {"$in": ["registered", "active"]}
-                }).to_list(None)
-                
-                for participation in competition_participations:
-                    await update_single_competition_progress(participation["competition_id"])
-            except Exception as e:
-                logger.error(f"Failed to update competition progress: {e}")
-            
-            # Enhanced Gamification hooks for income transactions - Phase 1
-            gamification = await get_gamification_service()
-            streak_result = await gamification.update_user_streak(user_id)
-            
-            # Check for milestone achievements and trigger notifications
-            if streak_result and streak_result.get("milestone_reached"):
-                milestone_data = streak_result["milestone_reached"]
-                # Send push notification for milestone
-                try:
-                    if PUSH_NOTIFICATION_AVAILABLE:
-                        push_service = await get_push_service()
-                        await push_service.send_milestone_notification(user_id, milestone_data)
-                except Exception as e:
-                    logger.error(f"Failed to send milestone push notification: {e}")
-            
-            # Check and award badges
-            newly_earned_badges = await gamification.check_and_award_badges(user_id, "income_created", {
-                "amount": transaction.amount,
-                "source": transaction_dict.get("source"),
-                "total_earnings": user_doc.get("total_earnings", 0) + transaction.amount
-            })
-            
-            # Send notifications for new badges
-            for badge in newly_earned_badges:
-                try:
-                    if PUSH_NOTIFICATION_AVAILABLE:
-                        push_service = await get_push_service()
-                        badge_milestone_data = {
-                            "title": f"Badge Earned: {badge['name']}!",
-                            "message": badge["description"],
-                            "type": "badge",
-                            "icon": badge["icon"],
-                            "achievement_id": badge.get("achievement_id")
-                        }
-                        await push_service.send_milestone_notification(user_id, badge_milestone_data)
-                except Exception as e:
-                    logger.error(f"Failed to send badge push notification: {e}")
-            
-            await gamification.update_leaderboards(user_id)
-            
-            # Create milestone achievements for first transactions
-            if len(await get_user_transactions(user_id, limit=2)) == 1:  # First transaction
-                await gamification.create_milestone_achievement(user_id, "first_transaction", {
-                    "type": "income",
-                    "amount": transaction.amount
-                })
+            # So do the user's total earnings and net savings
+            balance_update = (db.users, {"id": user_id}, {"$inc": {"total_earnings": transaction.amount, "net_savings": transaction.amount}})
+            
+            budget_snapshot = None
+        
+        # The transaction, the budget/earnings update and the transaction_created
+        # outbox event (challenge, gamification, leaderboard and notification side
+        # effects, delivered by the consumers registered below) commit together
+        async def write_transaction(session):
+            collection, query, update = balance_update
+            await create_transaction(transaction.dict(), session=session)
+            await collection.update_one(query, update, session=session)
+            await event_pipeline.emit("transaction_created", {
+                "user_id": user_id,
+                "transaction": transaction.dict(),
+                "budget": budget_snapshot
+            }, key=transaction.id, session=session)
         
-        # 🔥 REAL-TIME NOTIFICATIONS: Send WebSocket notifications for all transactions
-        try:
-            notification_service = await get_notification_service()
-            
-            if transaction_data.type == "expense":
-                # Send expense notification with budget info
-                budget = await db.budgets.find_one({
-                    "user_id": user_id,
-                    "category": transaction_dict["category"],
-                    "month": datetime.now(timezone.utc).strftime("%Y-%m")
-                })
-                remaining_budget = budget["allocated_amount"] - budget["spent_amount"] if budget else 0
-                
-                await notification_service.create_and_notify_in_app_notification(user_id, {
-                    "type": "transaction_expense",
-                    "title": f"💸 Expense Added: ₹{transaction.amount}",
-                    "message": f"Spent ₹{transaction.amount} on {transaction.category}. Remaining budget: ₹{remaining_budget:.2f}",
-                    "priority": "high" if remaining_budget < (budget["allocated_amount"] * 0.1) else "medium",
-                    "data": {
-                        "transaction_id": transaction.id,
-                        "category": transaction.category,
-                        "amount": transaction.amount,
-                        "remaining_budget": remaining_budget,
-                        "budget_alert": remaining_budget < (budget["allocated_amount"] * 0.2) if budget else False
-                    }
-                })
-                
-                # Send budget alert if low budget
-                if budget and remaining_budget < (budget["allocated_amount"] * 0.2):
-                    await notification_service.create_and_notify_in_app_notification(user_id, {
-                        "type": "budget_alert",
-                        "title": "⚠️ Budget Alert!",
-                        "message": f"Only ₹{remaining_budget:.2f} left in {transaction.category} budget this month",
-                        "priority": "high",
-                        "data": {
-                            "category": transaction.category,
-                            "remaining_budget": remaining_budget,
-                            "allocated_amount": budget["allocated_amount"]
-                        }
-                    })
-            
-            else:  # Income transaction
-                # Get updated user stats
-                user_doc = await get_user_by_id(user_id)
-                total_earnings = user_doc.get("total_earnings", 0)
-                
-                await notification_service.create_and_notify_in_app_notification(user_id, {
-                    "type": "transaction_income",
-                    "title": f"💰 Income Added: ₹{transaction.amount}",
-                    "message": f"Great! You've earned ₹{transaction.amount}. Total earnings: ₹{total_earnings:.2f}",
-                    "priority": "medium",
-                    "data": {
-                        "transaction_id": transaction.id,
-                        "amount": transaction.amount,
-                        "total_earnings": total_earnings,
-                        "income_streak": user_doc.get("current_streak", 0)
-                    }
-                })
-                
-                # Send streak milestone notification if applicable
-                current_streak = user_doc.get("current_streak", 0)
-                if current_streak > 0 and current_streak % 5 == 0:  # Every 5 days
-                    await notification_service.create_and_notify_in_app_notification(user_id, {
-                        "type": "streak_milestone",
-                        "title": f"🔥 {current_streak}-Day Income Streak!",
-                        "message": f"Amazing! You're on a {current_streak}-day income streak. Keep it up!",
-                        "priority": "high",
-                        "data": {
-                            "streak_days": current_streak,
-                            "milestone_type": "income_streak"
-                        }
-                    })
-            
-        except Exception as e:
-            logger.error(f"Failed to send transaction notification: {str(e)}")
+        await mongo_manager.run_transaction(write_transaction, profile="money")
+        event_pipeline.wake()
+        
+        await advanced_cache.invalidate_tags(
+            CacheTags.user_transactions(user_id), CacheTags.user_budgets(user_id)
+        )
         
         return transaction
         
@@ -2165,12 +1938,204 @@ async def create_transaction_endpoint(request: Request, transaction_data: Transa
         logger.error(f"Transaction creation error: {str(e)}")
         raise HTTPException(status_code=500, detail="Transaction creation failed")
 
+# ==================== TRANSACTION EVENT CONSUMERS ====================
+
+async def _send_gamification_push(user_id: str, milestone_data: Dict[str, Any], kind: str):
+    """Send a milestone/badge push notification if push is available"""
+    try:
+        if PUSH_NOTIFICATION_AVAILABLE:
+            push_service = await get_push_service()
+            await push_service.send_milestone_notification(user_id, milestone_data)
+    except Exception as e:
+        logger.error(f"Failed to send {kind} push notification: {e}")
+
+async def consume_transaction_challenges(event: Dict[str, Any]):
+    """Update savings, group, prize and inter-college challenge progress"""
+    payload = event["payload"]
+    user_id = payload["user_id"]
+    transaction = payload["transaction"]
+    
+    if transaction["type"] == "income":
+        # Update Monthly Income Goal progress automatically
+        await update_monthly_income_goal_progress(user_id)
+    
+    # Update challenge progress for savings challenges
+    await update_user_challenge_progress(user_id)
+    
+    # Update group challenge progress
+    await update_group_challenge_progress(user_id)
+    
+    # 🔥 UPDATE PRIZE CHALLENGE PROGRESS
+    prize_participations = await db.prize_challenge_participations.find({
+        "user_id": user_id,
+        "participation_status": "active"
+    }, {"challenge_id": 1}).to_list(None)
+    
+    for participation in prize_participations:
+        await update_single_prize_challenge_progress(participation["challenge_id"])
+    
+    # 🔥 UPDATE INTER-COLLEGE COMPETITION PROGRESS
+    competition_participations = await db.campus_competition_participations.find({
+        "user_id": user_id,
+        "registration_status": {"$in": ["registered", "active"]}
+    }, {"competition_id": 1}).to_list(None)
+    
+    for participation in competition_participations:
+        await update_single_competition_progress(participation["competition_id"])
+
+async def consume_transaction_gamification(event: Dict[str, Any]):
+    """Streaks, badges and first-transaction milestones"""
+    payload = event["payload"]
+    user_id = payload["user_id"]
+    transaction = payload["transaction"]
+    gamification = await get_gamification_service()
+    
+    if transaction["type"] == "income":
+        # Recalculate and update income streak
+        user_doc = await get_user_by_id(user_id)
+        user_transactions = await get_user_transactions(user_id, limit=1000)
+        income_dates = [t["date"] for t in user_transactions if t["type"] == "income"]
+        current_streak = calculate_income_streak(income_dates, user_doc.get("created_at"))
+        
+        await db.users.update_one(
+            {"id": user_id},
+            {"$set": {"current_streak": current_streak}}
+        )
+    
+    streak_result = await gamification.update_user_streak(user_id)
+    
+    # Check for milestone achievements and trigger notifications
+    if streak_result and streak_result.get("milestone_reached"):
+        await _send_gamification_push(user_id, streak_result["milestone_reached"], "milestone")
+    
+    # Check and award badges
+    if transaction["type"] == "expense":
+        newly_earned_badges = await gamification.check_and_award_badges(user_id, "expense_created", {
+            "amount": transaction["amount"],
+            "category": transaction["category"]
+        })
+    else:
+        newly_earned_badges = await gamification.check_and_award_badges(user_id, "income_created", {
+            "amount": transaction["amount"],
+            "source": transaction.get("source"),
+            "total_earnings": user_doc.get("total_earnings", 0)
+        })
+    
+    # Send notifications for new badges
+    for badge in newly_earned_badges:
+        await _send_gamification_push(user_id, {
+            "title": f"Badge Earned: {badge['name']}!",
+            "message": badge["description"],
+            "type": "badge",
+            "icon": badge["icon"],
+            "achievement_id": badge.get("achievement_id")
+        }, "badge")
+    
+    # Create milestone achievements for first transactions
+    if transaction["type"] == "income" and len(await get_user_transactions(user_id, limit=2)) == 1:
+        await gamification.create_milestone_achievement(user_id, "first_transaction", {
+            "type": "income",
+            "amount": transaction["amount"]
+        })
+
+async def consume_transaction_leaderboards(event: Dict[str, Any]):
+    """Refresh the user's leaderboard entries"""
+    gamification = await get_gamification_service()
+    await gamification.update_leaderboards(event["payload"]["user_id"])
+
+async def consume_transaction_notifications(event: Dict[str, Any]):
+    """🔥 REAL-TIME NOTIFICATIONS: Send WebSocket notifications for the transaction"""
+    payload = event["payload"]
+    user_id = payload["user_id"]
+    transaction = payload["transaction"]
+    notification_service = await get_notification_service()
+    
+    if transaction["type"] == "expense":
+        # Budget state as of the commit that created this transaction
+        budget = payload.get("budget")
+        remaining_budget = budget["allocated_amount"] - budget["spent_amount"] if budget else 0
+        
+        await notification_service.create_and_notify_in_app_notification(user_id, {
+            "type": "transaction_expense",
+            "title": f"💸 Expense Added: ₹{transaction['amount']}",
+            "message": f"Spent ₹{transaction['amount']} on {transaction['category']}. Remaining budget: ₹{remaining_budget:.2f}",
+            "priority": "high" if budget and remaining_budget < (budget["allocated_amount"] * 0.1) else "medium",
+            "data": {
+                "transaction_id": transaction["id"],
+                "category": transaction["category"],
+                "amount": transaction["amount"],
+                "remaining_budget": remaining_budget,
+                "budget_alert": remaining_budget < (budget["allocated_amount"] * 0.2) if budget else False
+            }
+        })
+        
+        # Send budget alert if low budget
+        if budget and remaining_budget < (budget["allocated_amount"] * 0.2):
+            await notification_service.create_and_notify_in_app_notification(user_id, {
+                "type": "budget_alert",
+                "title": "⚠️ Budget Alert!",
+                "message": f"Only ₹{remaining_budget:.2f} left in {transaction['category']} budget this month",
+                "priority": "high",
+                "data": {
+                    "category": transaction["category"],
+                    "remaining_budget": remaining_budget,
+                    "allocated_amount": budget["allocated_amount"]
+                }
+            })
+    
+    else:  # Income transaction
+        # Get updated user stats
+        user_doc = await get_user_by_id(user_id)
+        total_earnings = user_doc.get("total_earnings", 0)
+        current_streak = user_doc.get("current_streak", 0)
+        
+        await notification_service.create_and_notify_in_app_notification(user_id, {
+            "type": "transaction_income",
+            "title": f"💰 Income Added: ₹{transaction['amount']}",
+            "message": f"Great! You've earned ₹{transaction['amount']}. Total earnings: ₹{total_earnings:.2f}",
+            "priority": "medium",
+            "data": {
+                "transaction_id": transaction["id"],
+                "amount": transaction["amount"],
+                "total_earnings": total_earnings,
+                "income_streak": current_streak
+            }
+        })
+        
+        # Send streak milestone notification if applicable
+        if current_streak > 0 and current_streak % 5 == 0:  # Every 5 days
+            await notification_service.create_and_notify_in_app_notification(user_id, {
+                "type": "streak_milestone",
+                "title": f"🔥 {current_streak}-Day Income Streak!",
+                "message": f"Amazing! You're on a {current_streak}-day income streak. Keep it up!",
+                "priority": "high",
+                "data": {
+                    "streak_days": current_streak,
+                    "milestone_type": "income_streak"
+                }
+            })
+
+# Consumers run in registration order for each event
+event_pipeline.register_consumer("transaction_created", "challenges", consume_transaction_challenges)
+event_pipeline.register_consumer("transaction_created", "gamification", consume_transaction_gamification)
+event_pipeline.register_consumer("transaction_created", "leaderboards", consume_transaction_leaderboards)
+event_pipeline.register_consumer("transaction_created", "notifications", consume_transaction_notifications)
+
+# ==================== END TRANSACTION EVENT CONSUMERS ====================
+
 @api_router.get("/transactions", response_model=List[Transaction])
 @limiter.limit("30/minute")
-async def get_transactions_endpoint(request: Request, user_id: str = Depends(get_current_user), limit: int = 50, skip: int = 0):
-    """Get user transactions"""
-    transactions = await get_user_transactions(user_id, limit, skip)
-    return [Transaction(**t) for t in transactions]
+async def get_transactions_endpoint(request: Request, response: Response, user_id: str = Depends(get_current_user),
+                                    limit: int = 50, skip: int = 0, cursor: Optional[str] = None):
+    """Get user transactions (the X-Next-Cursor response header is the ``cursor`` for the next page)"""
+    try:
+        page = await get_transactions_paginated(user_id, skip=skip, limit=limit, cursor=cursor, with_total=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return [Transaction(**t) for t in page["data"]]
 
 @api_router.get("/transactions/summary")
 @limiter.limit("30/minute")
@@ -2179,6 +2144,10 @@ async def get_transaction_summary_endpoint(request: Request, user_id: str = Depe
     # Get current month transactions
     current_month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
+    cached_summary = await advanced_cache.get("transactions", "summary", user_id, current_month_start.strftime("%Y-%m"))
+    if cached_summary is not None:
+        return cached_summary
+    
     results = await get_transaction_summary(user_id, current_month_start)
     
     summary = {"income": 0, "expense": 0, "income_count": 0, "expense_count": 0}
@@ -2191,6 +2160,11 @@ async def get_transaction_summary_endpoint(request: Request, user_id: str = Depe
             summary["expense_count"] = result["count"]
     
     summary["net_savings"] = summary["income"] - summary["expense"]
+    
+    await advanced_cache.set(
+        "transactions", summary, "summary", user_id, current_month_start.strftime("%Y-%m"),
+        tags=[CacheTags.user(user_id), CacheTags.user_transactions(user_id)]
+    )
     return summary
 
 # Hustle Routes
@@ -2342,6 +2316,41 @@ async def apply_to_hustle_endpoint(request: Request, hustle_id: str, application
         logger.error(f"Hustle application error: {str(e)}")
         raise HTTPException(status_code=500, detail="Hustle application failed")
 
+@api_router.put("/hustles/{hustle_id}/applications/{application_id}")
+@limiter.limit("20/minute")
+async def update_hustle_application_status_endpoint(request: Request, hustle_id: str, application_id: str, status_update: HustleApplicationStatusUpdate, user_id: str = Depends(get_current_user)):
+    """Accept or reject an application to one of the user's posted hustles"""
+    try:
+        hustle = await db.user_hustles.find_one({"id": hustle_id, "created_by": user_id}, {"_id": 0, "id": 1})
+        if not hustle:
+            raise HTTPException(status_code=404, detail="Hustle not found or not authorized")
+        
+        # Only the pending -> decided transition counts, so a repeated accept changes nothing
+        application = await db.hustle_applications.find_one_and_update(
+            {"id": application_id, "hustle_id": hustle_id, "status": "pending"},
+            {"$set": {"status": status_update.status, "decided_at": datetime.now(timezone.utc)}},
+            projection={"_id": 0, "applicant_id": 1}
+        )
+        if not application:
+            raise HTTPException(status_code=404, detail="Application not found or already decided")
+        
+        if status_update.status == "accepted":
+            applicant_id = application["applicant_id"]
+            # Keep the applicant's hustles_completed counter current for badge rules
+            await db.users.update_one({"id": applicant_id}, {"$inc": {"hustles_completed": 1}})
+            principal_cache.invalidate(applicant_id)
+            
+            gamification = await get_gamification_service()
+            await gamification.check_and_award_badges(applicant_id, "hustle_completed", {"hustle_id": hustle_id})
+        
+        return {"message": f"Application {status_update.status}"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Hustle application status error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Hustle application update failed")
+
 @api_router.get("/hustles/my-applications")
 @limiter.limit("20/minute")
 async def get_my_applications_endpoint(request: Request, user_id: str = Depends(get_current_user)):
@@ -2485,6 +2494,7 @@ async def create_budget_endpoint(request: Request, budget_data: BudgetCreate, us
     
     budget = Budget(**budget_dict)
     await create_budget(budget.dict())
+    await advanced_cache.invalidate_tags(CacheTags.user_budgets(user_id))
     
     # Gamification hooks for budget creation
     gamification = await get_gamification_service()
@@ -2506,8 +2516,16 @@ async def create_budget_endpoint(request: Request, budget_data: BudgetCreate, us
 @limiter.limit("20/minute")
 async def get_budgets_endpoint(request: Request, user_id: str = Depends(get_current_user)):
     """Get user budgets"""
-    budgets = await get_user_budgets(user_id)
-    return [Budget(**b) for b in budgets]
+    cached_budgets = await advanced_cache.get("budgets", user_id)
+    if cached_budgets is not None:
+        return [Budget(**b) for b in cached_budgets]
+    
+    budgets = [Budget(**b) for b in await get_user_budgets(user_id)]
+    await advanced_cache.set(
+        "budgets", [b.dict() for b in budgets], user_id,
+        tags=[CacheTags.user(user_id), CacheTags.user_budgets(user_id)]
+    )
+    return budgets
 
 @api_router.delete("/budgets/{budget_id}")
 @limiter.limit("10/minute")
@@ -2520,6 +2538,7 @@ async def delete_budget_endpoint(request: Request, budget_id: str, user_id: str
             raise HTTPException(status_code=404, detail="Budget not found")
         
         await db.budgets.delete_one({"id": budget_id, "user_id": user_id})
+        await advanced_cache.invalidate_tags(CacheTags.user_budgets(user_id))
         return {"message": "Budget deleted successfully"}
         
     except HTTPException:
@@ -2549,6 +2568,7 @@ async def update_budget_endpoint(request: Request, budget_id: str, budget_update
             {"id": budget_id, "user_id": user_id}, 
             {"$set": update_data}
         )
+        await advanced_cache.invalidate_tags(CacheTags.user_budgets(user_id))
         
         # Return updated budget
         updated_budget = await db.budgets.find_one({"id": budget_id, "user_id": user_id})
@@ -2582,6 +2602,7 @@ async def create_financial_goal_endpoint(request: Request, goal_data: FinancialG
         
         goal = FinancialGoal(**goal_dict)
         await create_financial_goal(goal.dict())
+        await advanced_cache.invalidate_tags(CacheTags.user_goals(user_id))
         
         return goal
         
@@ -2593,8 +2614,16 @@ async def create_financial_goal_endpoint(request: Request, goal_data: FinancialG
 @limiter.limit("20/minute")
 async def get_financial_goals_endpoint(request: Request, user_id: str = Depends(get_current_user)):
     """Get user's financial goals"""
-    goals = await get_user_financial_goals(user_id)
-    return [FinancialGoal(**g) for g in goals]
+    cached_goals = await advanced_cache.get("financial_goals", user_id)
+    if cached_goals is not None:
+        return [FinancialGoal(**g) for g in cached_goals]
+    
+    goals = [FinancialGoal(**g) for g in await get_user_financial_goals(user_id)]
+    await advanced_cache.set(
+        "financial_goals", [g.dict() for g in goals], user_id,
+        tags=[CacheTags.user(user_id), CacheTags.user_goals(user_id)]
+    )
+    return goals
 
 @api_router.put("/financial-goals/{goal_id}")
 @limiter.limit("10/minute")
@@ -2611,16 +2640,19 @@ async def update_financial_goal_endpoint(request: Request, goal_id: str, goal_up
         # Get database connection for all operations
         db = await get_database()
         
-        # Check if goal is being marked as completed
+        # Check if goal is being marked as completed: only the request that
+        # flips is_completed counts the completion
         was_completed = False
         if "is_completed" in update_data and update_data["is_completed"]:
-            # Get the goal before updating to check if it wasn't already completed
-            existing_goal = await db.financial_goals.find_one({"id": goal_id, "user_id": user_id})
-            if existing_goal and not existing_goal.get("is_completed", False):
-                was_completed = True
+            transition = await db.financial_goals.update_one(
+                {"id": goal_id, "user_id": user_id, "is_completed": {"$ne": True}},
+                {"$set": {"is_completed": True}}
+            )
+            was_completed = transition.modified_count == 1
         
         if update_data:
             await update_financial_goal(goal_id, user_id, update_data)
+            await advanced_cache.invalidate_tags(CacheTags.user_goals(user_id))
         
         # Update challenge progress for goal completion challenges
         if was_completed:
@@ -2643,12 +2675,30 @@ async def update_financial_goal_endpoint(request: Request, goal_id: str, goal_up
                     "completion_date": datetime.now(timezone.utc).isoformat()
                 })
             
-            # Check for goal-related badges
-            await gamification.check_and_award_badges(user_id, "goal_completed", {
-                "completed_goals": await db.financial_goals.count_documents({
+            # Keep the user's goals_completed counter current for badge rules
+            counter = await db.users.find_one_and_update(
+                {"id": user_id, "goals_completed": {"$exists": True}},
+                {"$inc": {"goals_completed": 1}},
+                projection={"_id": 0, "goals_completed": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if counter:
+                completed_goals = counter["goals_completed"]
+            else:
+                # Accounts from before the counter: count their history once
+                completed_goals = await db.financial_goals.count_documents({
                     "user_id": user_id,
                     "is_completed": True
                 })
+                await db.users.update_one(
+                    {"id": user_id, "goals_completed": {"$exists": False}},
+                    {"$set": {"goals_completed": completed_goals}}
+                )
+            principal_cache.invalidate(user_id)
+            
+            # Check for goal-related badges
+            await gamification.check_and_award_badges(user_id, "goal_completed", {
+                "completed_goals": completed_goals
             })
             
             await gamification.update_leaderboards(user_id)
@@ -2715,6 +2765,7 @@ async def delete_financial_goal_endpoint(request: Request, goal_id: str, user_id
     """Delete financial goal"""
     try:
         await delete_financial_goal(goal_id, user_id)
+        await advanced_cache.invalidate_tags(CacheTags.user_goals(user_id))
         return {"message": "Financial goal deleted successfully"}
         
     except Exception as e:
@@ -4196,8 +4247,10 @@ async def approve_suggestion_endpoint(
                             detail=f"No money, you reached the limit! Remaining budget: ₹{remaining:.2f}"
                         )
             
-            # Create the transaction
-            await create_transaction(transaction_data)
+            # Create the transaction (and its rollup update) in one Mongo transaction
+            await mongo_manager.run_transaction(
+                lambda session: create_transaction(transaction_data, session=session), profile="money"
+            )
             
             # Update budget if expense
             if transaction_data["type"] == "expense":
@@ -4206,6 +4259,10 @@ async def approve_suggestion_endpoint(
                     new_spent = budget["spent_amount"] + transaction_data["amount"]
                     await update_user_budget(budget["id"], {"spent_amount": new_spent})
             
+            await advanced_cache.invalidate_tags(
+                CacheTags.user_transactions(user_id), CacheTags.user_budgets(user_id)
+            )
+            
             # Update suggestion status
             await update_suggestion_status(
                 approval_request.suggestion_id, 
@@ -4957,6 +5014,7 @@ async def subscribe_to_push_notifications(
             {"$set": subscription_doc},
             upsert=True
         )
+        await reminder_scheduler.reschedule_user(user_id, subscription_doc["notification_preferences"])
         
         return {"message": "Successfully subscribed to push notifications"}
         
@@ -4981,6 +5039,7 @@ async def update_notification_preferences(
             {"$set": {"notification_preferences": preferences}},
             upsert=True
         )
+        await reminder_scheduler.reschedule_user(user_id, preferences)
         
         return {"message": "Notification preferences updated"}
         
@@ -6267,19 +6326,21 @@ async def create_group_expense_endpoint(
                 settlements.append(settlement)
         
         # Send notifications to participants
-        for participant in expense_data["participants"]:
-            if participant["user_id"] != user_id:
-                notification = {
-                    "user_id": participant["user_id"],
-                    "type": "group_expense_created",
-                    "title": "New Group Expense",
-                    "message": f"{await get_user_name(user_id)} added you to a group expense: {expense_data['title']}",
-                    "action_url": f"/expenses/group/{group_expense['id']}",
-                    "related_id": group_expense["id"],
-                    "created_at": datetime.now(timezone.utc),
-                    "read": False
-                }
-                await db.notifications.insert_one(notification)
+        creator_name = await get_user_name(user_id)
+        await notification_store.insert_many([
+            {
+                "user_id": participant["user_id"],
+                "notification_type": "group_expense_created",
+                "title": "New Group Expense",
+                "message": f"{creator_name} added you to a group expense: {expense_data['title']}",
+                "action_url": f"/expenses/group/{group_expense['id']}",
+                "related_id": group_expense["id"],
+                "created_at": datetime.now(timezone.utc),
+                "is_read": False
+            }
+            for participant in expense_data["participants"]
+            if participant["user_id"] != user_id
+        ])
         
         return {
             "group_expense": group_expense,
@@ -6558,7 +6619,7 @@ async def earn_bonus_invites_endpoint(
             "created_at": datetime.now(timezone.utc),
             "read": False
         }
-        await db.notifications.insert_one(notification)
+        await notification_store.insert(notification)
         
         return {
             "success": True,
@@ -6849,7 +6910,7 @@ async def request_beta_feature_access_endpoint(
             "created_at": datetime.now(timezone.utc),
             "read": False
         }
-        await db.notifications.insert_one(notification)
+        await notification_store.insert(notification)
         
         return {
             "success": True,
@@ -8856,63 +8917,48 @@ async def update_single_competition_progress(competition_id: str):
             "registration_status": {"$in": ["registered", "active"]}
         }).to_list(None)
         
-        competition_type = competition["competition_type"]
-        target_metric = competition["target_metric"]
         target_value = competition.get("target_value", 0)
         
-        # Calculate progress for all participants and sort by score
-        participant_scores = []
-        for participant in participants:
-            user_id = participant["user_id"]
-            
-            # Calculate new score based on competition type (same logic as prize challenges)
-            new_score = await calculate_competition_score(user_id, competition_type, target_metric, participant["registered_at"])
+        # Score every participant in batched aggregations (same logic as prize challenges)
+        scores = await participant_scorer.score(
+            db,
+            resolve_competition_metric(competition["competition_type"], competition["target_metric"]),
+            {p["user_id"]: p["registered_at"] for p in participants}
+        )
+        
+        # Sort by score descending to calculate ranks
+        participants.sort(key=lambda p: scores[p["user_id"]], reverse=True)
+        
+        now = datetime.now(timezone.utc)
+        operations = []
+        for rank, participant in enumerate(participants, start=1):
+            score = scores[participant["user_id"]]
             
             # Calculate progress percentage
             progress_percentage = 0.0
             if target_value and target_value > 0:
-                progress_percentage = min((new_score / target_value) * 100, 100.0)
+                progress_percentage = min((score / target_value) * 100, 100.0)
             
-            # Check if target is completed
-            is_completed = new_score >= target_value if target_value else False
-            
-            participant_scores.append({
-                "_id": participant["_id"],
-                "user_id": user_id,
-                "campus": participant["campus"],
-                "score": new_score,
-                "progress_percentage": progress_percentage,
-                "is_completed": is_completed
-            })
-        
-        # Sort by score descending to calculate ranks
-        participant_scores.sort(key=lambda x: x["score"], reverse=True)
-        
-        # Update each participant with score, rank, and progress
-        for rank, participant_data in enumerate(participant_scores, start=1):
             update_data = {
-                "individual_score": participant_data["score"],
-                "campus_contribution": participant_data["score"],
-                "current_progress": participant_data["score"],
-                "progress_percentage": participant_data["progress_percentage"],
+                "individual_score": score,
+                "campus_contribution": score,
+                "current_progress": score,
+                "progress_percentage": progress_percentage,
                 "current_rank": rank,
-                "last_updated": datetime.now(timezone.utc)
+                "last_updated": now
             }
             
-            # Mark as completed if target reached
-            if participant_data["is_completed"]:
-                # Only update status if not already completed
-                existing = await db.campus_competition_participations.find_one({"_id": participant_data["_id"]})
-                if existing and existing.get("registration_status") != "completed":
-                    update_data["registration_status"] = "completed"
-                    
-                    # Award completion reward if applicable
-                    await award_competition_completion(competition_id, participant_data["user_id"], rank)
+            # Mark as completed if target reached (participants were loaded as registered/active)
+            if target_value and score >= target_value:
+                update_data["registration_status"] = "completed"
+                
+                # Award completion reward if applicable
+                await award_competition_completion(competition_id, participant["user_id"], rank)
             
-            await db.campus_competition_participations.update_one(
-                {"_id": participant_data["_id"]},
-                {"$set": update_data}
-            )
+            operations.append(UpdateOne({"_id": participant["_id"]}, {"$set": update_data}))
+        
+        if operations:
+            await db.campus_competition_participations.bulk_write(operations, ordered=False)
         
         # Update campus totals
         await update_campus_leaderboards(competition_id)
@@ -8920,72 +8966,6 @@ async def update_single_competition_progress(competition_id: str):
     except Exception as e:
         logger.error(f"Update single competition progress error: {str(e)}")
 
-async def calculate_competition_score(user_id: str, competition_type: str, target_metric: str, start_date: datetime) -> float:
-    """Calculate user's score for competition based on type - matches prize challenge logic"""
-    try:
-        db = await get_database()
-        score = 0.0
-        
-        # Handle savings-based competitions (matches prize challenge logic)
-        if competition_type in ["campus_savings", "savings", "individual", "savings_based"] or target_metric in ["total_savings", "amount_saved", "savings_amount", "savings_based"]:
-            # Calculate savings progress (income - expenses since competition start)
-            # Use 'date' field which is the actual field name in transactions
-            income_pipeline = [
-                {"$match": {"user_id": user_id, "type": "income", "date": {"$gte": start_date}}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            income_result = await db.transactions.aggregate(income_pipeline).to_list(None)
-            total_income = income_result[0]["total"] if income_result else 0.0
-            
-            expense_pipeline = [
-                {"$match": {"user_id": user_id, "type": "expense", "date": {"$gte": start_date}}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            expense_result = await db.transactions.aggregate(expense_pipeline).to_list(None)
-            total_expenses = expense_result[0]["total"] if expense_result else 0.0
-            
-            score = max(0, total_income - total_expenses)
-        
-        elif competition_type in ["campus_streak", "streak"]:
-            if target_metric in ["average_streak", "days_streak"]:
-                user = await db.users.find_one({"id": user_id})
-                score = float(user.get("current_streak", 0)) if user else 0.0
-        
-        elif competition_type in ["campus_referrals", "referrals"]:
-            if target_metric in ["referral_count", "referrals_made"]:
-                referral_program = await db.referral_programs.find_one({"referrer_id": user_id})
-                if referral_program:
-                    # Count successful referrals since competition start
-                    recent_referrals = await db.referred_users.count_documents({
-                        "referrer_id": user_id,
-                        "status": "completed",
-                        "completed_at": {"$gte": start_date}
-                    })
-                    score = float(recent_referrals)
-        
-        elif competition_type in ["campus_goals", "goals"]:
-            if target_metric in ["goals_completed"]:
-                completed_goals = await db.financial_goals.count_documents({
-                    "user_id": user_id,
-                    "is_completed": True,
-                    "updated_at": {"$gte": start_date}
-                })
-                score = float(completed_goals)
-        
-        elif competition_type == "engagement":
-            # Count transactions, logins, or other engagement metrics
-            transaction_count = await db.transactions.count_documents({
-                "user_id": user_id,
-                "date": {"$gte": start_date}
-            })
-            score = float(transaction_count)
-        
-        return score
-        
-    except Exception as e:
-        logger.error(f"Calculate competition score error: {str(e)}")
-        return 0.0
-
 async def update_campus_leaderboards(competition_id: str):
     """Update campus leaderboards for a competition"""
     try:
@@ -9117,111 +9097,65 @@ async def update_single_prize_challenge_progress(challenge_id: str):
         if not challenge:
             return
         
+        # Only active and completed participants are ranked: completers keep the
+        # places they finished in (by completed_at) ahead of everyone still
+        # active, who are ordered by fresh progress; withdrawn participants drop out
         participants = await db.prize_challenge_participations.find({
             "challenge_id": challenge_id,
-            "participation_status": "active"
+            "participation_status": {"$in": ["active", "completed"]}
         }).to_list(None)
+        active = [p for p in participants if p.get("participation_status") == "active"]
+        completed = [p for p in participants if p.get("participation_status") == "completed"]
         
-        challenge_category = challenge["challenge_category"]
-        target_metric = challenge["target_metric"]
+        scores = await participant_scorer.score(
+            db,
+            resolve_prize_metric(challenge["challenge_category"], challenge["target_metric"]),
+            {p["user_id"]: p["joined_at"] for p in active}
+        )
         
-        for participant in participants:
-            user_id = participant["user_id"]
-            
-            # Calculate new progress based on challenge category
-            new_progress = await calculate_prize_challenge_progress(
-                user_id, challenge_category, target_metric, participant["joined_at"]
-            )
+        target_value = challenge["target_value"]
+        for participant in active:
+            participant["current_progress"] = scores[participant["user_id"]]
+        completed.sort(key=lambda p: (p["completed_at"].replace(tzinfo=None) if p.get("completed_at") else datetime.min,
+                                      p.get("current_rank") or 0))
+        active.sort(key=lambda p: p["current_progress"], reverse=True)
+        
+        now = datetime.now(timezone.utc)
+        operations = []
+        for rank, participant in enumerate(completed + active, start=1):
+            update_data = {"current_rank": rank}
             
-            # Update progress
-            progress_percentage = min(100, (new_progress / challenge["target_value"]) * 100) if challenge["target_value"] > 0 else 0
-            is_completed = new_progress >= challenge["target_value"]
+            if participant.get("participation_status") != "active":
+                if participant.get("current_rank") != rank:
+                    operations.append(UpdateOne({"_id": participant["_id"]}, {"$set": update_data}))
+                continue
             
-            update_data = {
-                "current_progress": new_progress,
-                "progress_percentage": progress_percentage
-            }
+            new_progress = participant["current_progress"]
+            update_data["current_progress"] = new_progress
+            update_data["progress_percentage"] = min(100, (new_progress / target_value) * 100) if target_value > 0 else 0
             
-            # Mark as completed if target reached
-            if is_completed and participant.get("participation_status") != "completed":
+            if new_progress >= target_value:
+                # Claim the completion first; only the run whose update matched awards the prize
                 update_data["participation_status"] = "completed"
-                
-                # Award completion reward
-                await award_prize_challenge_completion(challenge_id, user_id, participant["current_rank"])
+                update_data["completed_at"] = now
+                claimed = await db.prize_challenge_participations.update_one(
+                    {"_id": participant["_id"], "participation_status": "active"},
+                    {"$set": update_data}
+                )
+                if claimed.modified_count:
+                    await award_prize_challenge_completion(challenge_id, participant["user_id"], rank)
+                continue
             
-            await db.prize_challenge_participations.update_one(
-                {"_id": participant["_id"]},
+            operations.append(UpdateOne(
+                {"_id": participant["_id"], "participation_status": "active"},
                 {"$set": update_data}
-            )
-        
-    except Exception as e:
-        logger.error(f"Update single prize challenge progress error: {str(e)}")
-
-async def calculate_prize_challenge_progress(user_id: str, challenge_category: str, target_metric: str, start_date: datetime) -> float:
-    """Calculate user's progress for prize challenge"""
-    try:
-        db = await get_database()
-        progress = 0.0
-        
-        # Handle both "savings" and "individual" with "savings_amount" or "savings_based" metrics
-        if challenge_category in ["savings", "individual", "savings_based"] or target_metric in ["amount_saved", "savings_amount", "savings_based"]:
-            # Calculate savings progress (income - expenses since challenge start)
-            # Use 'date' field which is the actual field name in transactions
-            income_pipeline = [
-                {"$match": {"user_id": user_id, "type": "income", "date": {"$gte": start_date}}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            income_result = await db.transactions.aggregate(income_pipeline).to_list(None)
-            total_income = income_result[0]["total"] if income_result else 0.0
-            
-            expense_pipeline = [
-                {"$match": {"user_id": user_id, "type": "expense", "date": {"$gte": start_date}}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            expense_result = await db.transactions.aggregate(expense_pipeline).to_list(None)
-            total_expenses = expense_result[0]["total"] if expense_result else 0.0
-            
-            progress = max(0, total_income - total_expenses)
-        
-        elif challenge_category == "streak":
-            if target_metric == "days_streak":
-                user = await db.users.find_one({"id": user_id})
-                progress = float(user.get("current_streak", 0)) if user else 0.0
-        
-        elif challenge_category == "referrals":
-            if target_metric == "referrals_made":
-                referral_program = await db.referral_programs.find_one({"referrer_id": user_id})
-                if referral_program:
-                    # Count successful referrals since challenge start
-                    recent_referrals = await db.referred_users.count_documents({
-                        "referrer_id": user_id,
-                        "status": "completed",
-                        "completed_at": {"$gte": start_date}
-                    })
-                    progress = float(recent_referrals)
-        
-        elif challenge_category == "goals":
-            if target_metric == "goals_completed":
-                completed_goals = await db.financial_goals.count_documents({
-                    "user_id": user_id,
-                    "is_completed": True,
-                    "updated_at": {"$gte": start_date}
-                })
-                progress = float(completed_goals)
-        
-        elif challenge_category == "engagement":
-            # Count transactions, logins, or other engagement metrics
-            transaction_count = await db.transactions.count_documents({
-                "user_id": user_id,
-                "timestamp": {"$gte": start_date}
-            })
-            progress = float(transaction_count)
+            ))
         
-        return progress
+        if operations:
+            await db.prize_challenge_participations.bulk_write(operations, ordered=False)
         
     except Exception as e:
-        logger.error(f"Calculate prize challenge progress error: {str(e)}")
-        return 0.0
+        logger.error(f"Update single prize challenge progress error: {str(e)}")
 
 async def award_prize_challenge_completion(challenge_id: str, user_id: str, rank: int):
     """Award prizes for challenge completion"""
@@ -9898,8 +9832,6 @@ async def award_competition_reputation(competition_id: str, participant_rankings
 async def create_notification(user_id: str, notification_type: str, title: str, message: str, action_url: str = None, related_id: str = None):
     """Create an in-app notification for user"""
     try:
-        db = await get_database()
-        
         notification = InAppNotification(
             user_id=user_id,
             notification_type=notification_type,
@@ -9909,7 +9841,7 @@ async def create_notification(user_id: str, notification_type: str, title: str,
             related_id=related_id
         )
         
-        await db.notifications.insert_one(notification.dict())
+        await notification_store.insert(notification.dict())
         
     except Exception as e:
         logger.error(f"Create notification error: {str(e)}")
@@ -10973,23 +10905,28 @@ async def get_friends(
     request: Request, 
     current_user: Dict[str, Any] = Depends(get_current_user_dict),
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
     """
     Get user's friends list with pagination
     
     ENHANCED WITH:
-    - Pagination support
+    - Pagination support (skip/limit, or keyset via cursor/next_cursor)
     - Optimized N+1 query resolution (single aggregation query)
     - Gamification data included
     """
     try:
-        db = await get_database()
         user_id = current_user["id"]
         
         # Use optimized aggregation query (fixes N+1 problem)
         # This replaces the loop that fetches each friend individually
-        friends_optimized = await get_friends_with_details_optimized(user_id, limit=limit)
+        friends_optimized = await get_friends_with_details_optimized(user_id, limit=limit, skip=skip, cursor=cursor)
+        
+        # Get friends' actual financial data (one projected lookup for the page)
+        friend_users = await user_repository.find_by_ids(
+            (item.get("friend_id") for item in friends_optimized), USER_STATS
+        )
         
         # Transform data to match expected format
         friends_list = []
@@ -10998,8 +10935,7 @@ async def get_friends(
             gamification = item.get("gamification", {})
             friend_id = item.get("friend_id")
             
-            # Get friend's actual financial data
-            friend_user = await db.users.find_one({"id": friend_id})
+            friend_user = friend_users.get(friend_id)
             total_earnings = friend_user.get("total_earnings", 0.0) if friend_user else 0.0
             achievement_points = friend_user.get("achievement_points", 0) if friend_user else 0
             
@@ -11018,9 +10954,12 @@ async def get_friends(
         
         return {
             "friends": friends_list,
-            "total_friends": len(friends_list)
+            "total_friends": len(friends_list),
+            "next_cursor": friends_optimized[-1]["cursor"] if len(friends_optimized) == limit else None
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get friends error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get friends list")
@@ -11140,6 +11079,7 @@ async def accept_friend_invitation(request: Request, referral_code: str, current
             "automatic": False
         }
         await db.friendships.insert_one(friendship)
+        await friend_graph.invalidate(inviter_id, user_id)
         
         # Update invitation status (only if it was a formal invitation)
         if invitation:
@@ -11225,17 +11165,7 @@ async def get_friend_suggestions(request: Request, current_user: Dict[str, Any]
             return {"suggestions": [], "message": "Add your university to get campus friend suggestions"}
         
         # Get existing friends to exclude them
-        existing_friends = await db.friendships.find({
-            "$or": [
-                {"user1_id": user["id"]},
-                {"user2_id": user["id"]}
-            ]
-        }).to_list(None)
-        
-        excluded_user_ids = [user["id"]]  # Exclude self
-        for friendship in existing_friends:
-            friend_id = friendship["user2_id"] if friendship["user1_id"] == user["id"] else friendship["user1_id"]
-            excluded_user_ids.append(friend_id)
+        excluded_user_ids = [user["id"]] + await friend_graph.friends_of(user["id"])  # Exclude self
         
         # Get pending invitations to exclude them too
         pending_invites = await db.friend_invitations.find({
@@ -11255,37 +11185,37 @@ async def get_friend_suggestions(request: Request, current_user: Dict[str, Any]
             "university": user_university,
             "id": {"$nin": excluded_user_ids},
             "is_active": True
+        }, {
+            "_id": 0, "id": 1, "full_name": 1, "avatar": 1, "university": 1, "skills": 1,
+            "current_streak": 1, "experience_points": 1, "net_savings": 1, "level": 1, "title": 1
         }).limit(10).to_list(None)
         
         # Enhance suggestions with user stats
         enhanced_suggestions = []
         for suggestion in suggestions:
-            # Get user's gamification stats
-            user_stats = await db.users.find_one({"id": suggestion["id"]})
-            if user_stats:
-                enhanced_suggestion = {
-                    "id": suggestion["id"],
-                    "full_name": suggestion.get("full_name", "User"),
-                    "avatar": suggestion.get("avatar", "man"),
-                    "university": suggestion.get("university"),
-                    "skills": suggestion.get("skills", []),
-                    "current_streak": user_stats.get("current_streak", 0),
-                    "experience_points": user_stats.get("experience_points", 0),
-                    "total_savings": user_stats.get("net_savings", 0),
-                    "level": user_stats.get("level", 1),
-                    "title": user_stats.get("title", "Beginner"),
-                    "mutual_skills": len(set(user.get("skills", [])) & set(suggestion.get("skills", []))),
-                    "suggestion_reason": f"Same university ({user_university})"
-                }
-                
-                # Add suggestion reason based on similarities
-                if enhanced_suggestion["mutual_skills"] > 0:
-                    enhanced_suggestion["suggestion_reason"] += f" • {enhanced_suggestion['mutual_skills']} shared skills"
-                
-                if enhanced_suggestion["current_streak"] > 7:
-                    enhanced_suggestion["suggestion_reason"] += f" • Active tracker ({enhanced_suggestion['current_streak']} day streak)"
-                
-                enhanced_suggestions.append(enhanced_suggestion)
+            enhanced_suggestion = {
+                "id": suggestion["id"],
+                "full_name": suggestion.get("full_name", "User"),
+                "avatar": suggestion.get("avatar", "man"),
+                "university": suggestion.get("university"),
+                "skills": suggestion.get("skills", []),
+                "current_streak": suggestion.get("current_streak", 0),
+                "experience_points": suggestion.get("experience_points", 0),
+                "total_savings": suggestion.get("net_savings", 0),
+                "level": suggestion.get("level", 1),
+                "title": suggestion.get("title", "Beginner"),
+                "mutual_skills": len(set(user.get("skills", [])) & set(suggestion.get("skills", []))),
+                "suggestion_reason": f"Same university ({user_university})"
+            }
+            
+            # Add suggestion reason based on similarities
+            if enhanced_suggestion["mutual_skills"] > 0:
+                enhanced_suggestion["suggestion_reason"] += f" • {enhanced_suggestion['mutual_skills']} shared skills"
+            
+            if enhanced_suggestion["current_streak"] > 7:
+                enhanced_suggestion["suggestion_reason"] += f" • Active tracker ({enhanced_suggestion['current_streak']} day streak)"
+            
+            enhanced_suggestions.append(enhanced_suggestion)
         
         # Sort by relevance (mutual skills, then streak, then points)
         enhanced_suggestions.sort(key=lambda x: (
@@ -11438,12 +11368,7 @@ async def get_live_friend_stats(request: Request, current_user: Dict[str, Any] =
         user_id = current_user["id"]
         
         # Get friends count
-        friends_count = await db.friendships.count_documents({
-            "$or": [
-                {"user1_id": user_id, "status": "active"},
-                {"user2_id": user_id, "status": "active"}
-            ]
-        })
+        friends_count = len(await friend_graph.friends_of(user_id))
         
         # Get pending invitations (sent by user)
         pending_invitations = await db.friend_invitations.count_documents({
@@ -11817,13 +11742,14 @@ async def get_notifications(
     current_user: Dict[str, Any] = Depends(get_current_user_dict),
     skip: int = 0,
     limit: int = 20,
-    unread_only: bool = False
+    unread_only: bool = False,
+    cursor: Optional[str] = None
 ):
     """
     Get user's notifications with pagination
     
     ENHANCED WITH:
-    - Pagination support (skip/limit)
+    - Pagination support (skip/limit, or keyset via cursor/next_cursor)
     - Filter by unread notifications
     - Optimized N+1 query resolution
     """
@@ -11835,18 +11761,13 @@ async def get_notifications(
             user_id=user_id,
             skip=skip,
             limit=limit,
-            unread_only=unread_only
+            unread_only=unread_only,
+            cursor=cursor
         )
 
         
-        # Get notifications with filter
-        db = await get_database()
-    
-        unread_count = await db.notifications.count_documents({
-            "user_id": user_id,
-            "is_read": False
-        })
-        
+        # Maintained counter instead of counting unread documents per poll
+        unread_count = await notification_store.unread_count(user_id)
         
         return {
             "notifications": paginated_notifications["data"],
@@ -11856,11 +11777,14 @@ async def get_notifications(
                 "skip": skip,
                 "limit": limit,
                 "has_more": paginated_notifications["has_more"],
+                "next_cursor": paginated_notifications["next_cursor"],
                 "page": paginated_notifications["page"],
                 "total_pages": paginated_notifications["total_pages"]
             }
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get notifications error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get notifications")
@@ -11870,25 +11794,9 @@ async def get_notifications(
 async def mark_notification_read(request: Request, notification_id: str, current_user: Dict[str, Any] = Depends(get_current_user_dict)):
     """Mark notification as read"""
     try:
-        db = await get_database()
         user_id = current_user.get("id")
         
-        # Update notification
-        result = await db.notifications.update_one(
-            {
-                "id": notification_id,
-                "user_id": user_id,
-                "is_read": False
-            },
-            {
-                "$set": {
-                    "is_read": True,
-                    "read_at": datetime.now(timezone.utc)
-                }
-            }
-        )
-        
-        if result.modified_count == 0:
+        if not await notification_store.mark_read(user_id, notification_id):
             raise HTTPException(status_code=404, detail="Notification not found or already read")
         
         return {"message": "Notification marked as read"}
@@ -11902,26 +11810,14 @@ async def mark_notification_read(request: Request, notification_id: str, current
 async def mark_all_notifications_read(request: Request, current_user: Dict[str, Any] = Depends(get_current_user_dict)):
     """Mark all notifications as read"""
     try:
-        db = await get_database()
         user_id = current_user.get("id")
         
-        # Update all unread notifications
-        result = await db.notifications.update_many(
-            {
-                "user_id": user_id,
-                "is_read": False
-            },
-            {
-                "$set": {
-                    "is_read": True,
-                    "read_at": datetime.now(timezone.utc)
-                }
-            }
-        )
+        # One bulk update; the unread counter is reset with it
+        updated_count = await notification_store.mark_all_read(user_id)
         
         return {
             "message": "All notifications marked as read",
-            "updated_count": result.modified_count
+            "updated_count": updated_count
         }
         
     except Exception as e:
@@ -11974,8 +11870,6 @@ async def get_campus_leaderboards(
 async def create_notification(user_id: str, notification_type: str, title: str, message: str, action_url: str = None, related_id: str = None):
     """Helper function to create notifications"""
     try:
-        db = await get_database()
-        
         notification = InAppNotification(
             user_id=user_id,
             notification_type=notification_type,
@@ -11985,7 +11879,7 @@ async def create_notification(user_id: str, notification_type: str, title: str,
             related_id=related_id
         )
         
-        await db.notifications.insert_one(notification.dict())
+        await notification_store.insert(notification.dict())
         return notification.id
         
     except Exception as e:
@@ -12111,24 +12005,8 @@ async def calculate_group_challenge_progress(user_id: str, challenge_type: str,
         db = await get_database()
         
         if challenge_type == "group_savings":
-            # Calculate total income since challenge start
-            income_result = await db.transactions.aggregate([
-                {
-                    "$match": {
-                        "user_id": user_id,
-                        "type": "income",
-                        "date": {"$gte": start_date}
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": None,
-                        "total_income": {"$sum": "$amount"}
-                    }
-                }
-            ]).to_list(None)
-            
-            return income_result[0]["total_income"] if income_result else 0.0
+            # Total income since challenge start
+            return (await financial_rollups.get_totals_since(user_id, start_date))["income"]
             
         elif challenge_type == "group_streak":
             # Use current user streak (simplified)
@@ -12266,24 +12144,14 @@ async def get_university_comparison(leaderboard_type: str, period: str, limit: i
 async def get_user_total_income(user_id: str) -> float:
     """Calculate user's total income"""
     try:
-        income_transactions = await db.transactions.find({
-            "user_id": user_id,
-            "type": "income"
-        }).to_list(None)
-        return sum(tx["amount"] for tx in income_transactions)
+        return (await financial_rollups.get_lifetime_totals(user_id))["income"]
     except:
         return 0
 
 async def get_user_total_savings(user_id: str) -> float:
     """Calculate user's total savings (income - expenses)"""
     try:
-        income = await get_user_total_income(user_id)
-        expense_transactions = await db.transactions.find({
-            "user_id": user_id,
-            "type": "expense"
-        }).to_list(None)
-        expenses = sum(tx["amount"] for tx in expense_transactions)
-        return income - expenses
+        return (await financial_rollups.get_lifetime_totals(user_id))["net"]
     except:
         return 0
 
@@ -12303,18 +12171,7 @@ async def get_friend_activity_feed(
     """Get real-time activity feed from friends"""
     try:
         # Get user's friends
-        friends = await db.friends.find({
-            "$or": [
-                {"user_id": user_id},
-                {"friend_id": user_id}
-            ],
-            "status": "accepted"
-        }).to_list(None)
-        
-        friend_ids = []
-        for friend in friends:
-            friend_id = friend["friend_id"] if friend["user_id"] == user_id else friend["user_id"]
-            friend_ids.append(friend_id)
+        friend_ids = await friend_graph.friends_of(user_id)
         
         if not friend_ids:
             return {"activities": [], "total": 0}
@@ -12407,15 +12264,7 @@ async def challenge_friend_to_goal(
         duration_days = challenge_data.get("duration_days", 30)
         
         # Verify friendship
-        friendship = await db.friends.find_one({
-            "$or": [
-                {"user_id": user_id, "friend_id": friend_id},
-                {"user_id": friend_id, "friend_id": user_id}
-            ],
-            "status": "accepted"
-        })
-        
-        if not friendship:
+        if not await friend_graph.are_friends(user_id, friend_id):
             raise HTTPException(status_code=400, detail="You are not friends with this user")
         
         # Create challenge
@@ -12448,7 +12297,7 @@ async def challenge_friend_to_goal(
             "created_at": datetime.now(timezone.utc)
         }
         
-        await db.notifications.insert_one(notification)
+        await notification_store.insert(notification)
         
         return {"success": True, "challenge_id": challenge["challenge_id"]}
         
@@ -12623,35 +12472,26 @@ async def get_peer_comparison(
         university = current_user.get("university", "")
         role = current_user.get("role", "Student")
         
-        # Get user's savings rate (last 30 days)
-        thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-        user_transactions = await db.transactions.find({
-            "user_id": user_id,
-            "created_at": {"$gte": thirty_days_ago}
-        }).to_list(None)
-        
-        user_income = sum(tx["amount"] for tx in user_transactions if tx["type"] == "income")
-        user_savings = user_income - sum(tx["amount"] for tx in user_transactions if tx["type"] == "expense")
-        user_savings_rate = (user_savings / user_income * 100) if user_income > 0 else 0
-        
         # Get peer data (same university and role)
         peer_users = await db.users.find({
             "university": university,
             "role": role,
             "user_id": {"$ne": user_id}
         }).to_list(None)
+        peer_ids = [peer["user_id"] for peer in peer_users[:50]]  # Limit to 50 peers
         
-        peer_savings_rates = []
-        for peer in peer_users[:50]:  # Limit to 50 peers for performance
-            peer_transactions = await db.transactions.find({
-                "user_id": peer["user_id"],
-                "created_at": {"$gte": thirty_days_ago}
-            }).to_list(None)
-            
-            peer_income = sum(tx["amount"] for tx in peer_transactions if tx["type"] == "income")
-            peer_savings = peer_income - sum(tx["amount"] for tx in peer_transactions if tx["type"] == "expense")
-            peer_rate = (peer_savings / peer_income * 100) if peer_income > 0 else 0
-            peer_savings_rates.append(peer_rate)
+        # Savings rates for the last 30 days - one read of the daily stats for everyone
+        now = datetime.now(timezone.utc)
+        totals = financial_rollups.totals_by_user(
+            await financial_rollups.daily_totals([user_id] + peer_ids, now - timedelta(days=30), now)
+        )
+        
+        def savings_rate(values):
+            income = values["income"]
+            return ((income - values["expense"]) / income * 100) if income > 0 else 0
+        
+        user_savings_rate = savings_rate(totals[user_id])
+        peer_savings_rates = [savings_rate(totals[peer_id]) for peer_id in peer_ids]
         
         enhanced_comparison = await generate_enhanced_peer_comparison(
             user_savings_rate, peer_savings_rates, university, role, user_id
@@ -12683,33 +12523,23 @@ async def get_peer_motivation_messages(
         week_ago = datetime.now(timezone.utc) - timedelta(days=7)
         
         # Friends' recent achievements
-        friends = await db.friends.find({
-            "$or": [{"user_id": user_id}, {"friend_id": user_id}],
-            "status": "accepted"
-        }).to_list(None)
-        
-        friend_ids = []
-        for friend in friends:
-            friend_id = friend["friend_id"] if friend["user_id"] == user_id else friend["user_id"] 
-            friend_ids.append(friend_id)
+        friend_ids = await friend_graph.friends_of(user_id)
         
         peer_messages = []
         
         if friend_ids:
             # Friends who saved more this week
             friend_savings = []
-            for friend_id in friend_ids[:10]:  # Limit to 10 friends for performance
-                friend_transactions = await db.transactions.find({
-                    "user_id": friend_id,
-                    "created_at": {"$gte": week_ago}
-                }).to_list(None)
-                
-                friend_income = sum(tx["amount"] for tx in friend_transactions if tx["type"] == "income")
-                friend_expenses = sum(tx["amount"] for tx in friend_transactions if tx["type"] == "expense")
-                net_savings = friend_income - friend_expenses
+            top_friend_ids = friend_ids[:10]  # Limit to 10 friends for performance
+            weekly_totals = await financial_rollups.get_totals_since_many(
+                {friend_id: week_ago for friend_id in top_friend_ids}
+            )
+            friend_users = await friend_graph.hydrate_users(top_friend_ids, ["name", "avatar"])
+            for friend_id in top_friend_ids:
+                net_savings = weekly_totals[friend_id]["income"] - weekly_totals[friend_id]["expense"]
                 
                 if net_savings > 0:
-                    friend_user = await db.users.find_one({"user_id": friend_id})
+                    friend_user = friend_users.get(friend_id, {})
                     friend_savings.append({
                         "friend_id": friend_id,
                         "name": friend_user.get("name", "Friend"),
@@ -12858,10 +12688,13 @@ async def get_social_proof_notifications(
         
         # Friends joined this week
         week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        new_friends_count = await db.friends.count_documents({
-            "$or": [{"user_id": user_id}, {"friend_id": user_id}],
-            "created_at": {"$gte": week_ago}
-        })
+        new_friends_count = 0
+        if await friend_graph.friends_of(user_id):
+            new_friends_count = await db.friendships.count_documents({
+                "$or": [{"user1_id": user_id}, {"user2_id": user_id}],
+                "status": "active",
+                "created_at": {"$gte": week_ago}
+            })
         
         if new_friends_count > 0:
             notifications.append({
@@ -12904,15 +12737,7 @@ async def get_social_proof_notifications(
             })
         
         # Recent achievements by friends
-        friends = await db.friends.find({
-            "$or": [{"user_id": user_id}, {"friend_id": user_id}],
-            "status": "accepted"
-        }).to_list(None)
-        
-        friend_ids = []
-        for friend in friends:
-            friend_id = friend["friend_id"] if friend["user_id"] == user_id else friend["user_id"]
-            friend_ids.append(friend_id)
+        friend_ids = await friend_graph.friends_of(user_id)
         
         if friend_ids:
             friend_achievements = await db.user_achievements.count_documents({
@@ -13008,7 +12833,7 @@ async def create_individual_friend_challenge(
             "created_at": datetime.now(timezone.utc)
         }
         
-        await db.in_app_notifications.insert_one(notification)
+        await notification_store.insert(notification)
         
         return {
             "success": True,
@@ -13074,7 +12899,7 @@ async def respond_to_individual_challenge(
                 "created_at": datetime.now(timezone.utc)
             }
             
-            await db.in_app_notifications.insert_one(notification)
+            await notification_store.insert(notification)
             
             return {"success": True, "message": "Challenge accepted! Let the battle begin!", "status": "active"}
             
@@ -13098,7 +12923,7 @@ async def respond_to_individual_challenge(
                 "created_at": datetime.now(timezone.utc)
             }
             
-            await db.in_app_notifications.insert_one(notification)
+            await notification_store.insert(notification)
             
             return {"success": True, "message": "Challenge declined", "status": "declined"}
         
@@ -13378,7 +13203,7 @@ async def send_challenge_completion_notifications(challenge_id: str, winner: str
             challenged_notification["message"] = f"🤝 Tie! Great effort on: {challenge['title']}"
             challenged_notification["title"] = "🤝 It's a Tie!"
         
-        await db.in_app_notifications.insert_many([challenger_notification, challenged_notification])
+        await notification_store.insert_many([challenger_notification, challenged_notification])
         
     except Exception as e:
         logger.error(f"Send challenge completion notifications error: {str(e)}")
@@ -13402,15 +13227,7 @@ async def create_friend_activity_notification(
         details = notification_data.get("details", {})
         
         # Verify friendship
-        friendship = await db.friends.find_one({
-            "$or": [
-                {"user_id": user_id, "friend_id": target_friend_id},
-                {"user_id": target_friend_id, "friend_id": user_id}
-            ],
-            "status": "accepted"
-        })
-        
-        if not friendship:
+        if not await friend_graph.are_friends(user_id, target_friend_id):
             return {"success": False, "message": "Not friends"}
         
         # Get user info for notification
@@ -13447,18 +13264,16 @@ async def create_friend_activity_notification(
             })
         
         # Create notifications
-        created_count = 0
-        for notif_data in notifications_to_create:
-            notification = {
-                "notification_id": str(uuid.uuid4()),
+        created = await notification_store.insert_many([
+            {
                 "is_read": False,
                 "created_at": datetime.now(timezone.utc),
                 **notif_data
             }
-            await db.notifications.insert_one(notification)
-            created_count += 1
+            for notif_data in notifications_to_create
+        ])
         
-        return {"success": True, "notifications_created": created_count}
+        return {"success": True, "notifications_created": len(created)}
         
     except Exception as e:
         logger.error(f"Friend notification creation error: {str(e)}")
@@ -14258,54 +14073,33 @@ async def get_habit_tracking_status(
         
         checkin_dates = set(c["date"] for c in checkin_days)
         
-        # Track transaction logging days
-        transaction_days = await db.transactions.distinct("created_at", {
-            "user_id": user_id,
-            "created_at": {"$gte": datetime.combine(thirty_days_ago, datetime.min.time())}
-        })
-        transaction_dates = set(d.date().isoformat() for d in transaction_days)
-        
-        # Track budget adherence days
-        budget_check_days = await db.transactions.find({
-            "user_id": user_id,
-            "type": "expense",
-            "created_at": {"$gte": datetime.combine(thirty_days_ago, datetime.min.time())}
-        }).to_list(None)
-        
-        budget_adherence_dates = set()
-        for transaction in budget_check_days:
-            # Check if expense was within budget (simplified check)
-            date_str = transaction["created_at"].date().isoformat()
-            budget_adherence_dates.add(date_str)
+        # Track transaction logging days and budget adherence (expense) days
+        activity_days = await financial_rollups.daily_totals(
+            user_id, thirty_days_ago, today, group_by=("day", "type")
+        )
+        transaction_dates = set(row["day"] for row in activity_days)
+        budget_adherence_dates = set(row["day"] for row in activity_days if row["type"] == "expense")
         
         # Get friends for social pressure
-        friends = await db.friendships.find({
-            "$or": [
-                {"user1_id": user_id, "status": "active"},
-                {"user2_id": user_id, "status": "active"}
-            ]
-        }).to_list(None)
-        
-        friend_ids = []
-        for friendship in friends:
-            friend_id = friendship["user2_id"] if friendship["user1_id"] == user_id else friendship["user1_id"]
-            friend_ids.append(friend_id)
+        friend_ids = await friend_graph.friends_of(user_id)
         
         # Get friends' habit performance for social comparison
+        friend_ids = friend_ids[:10]  # Limit for performance
+        friend_docs = await friend_graph.hydrate_users(friend_ids, ["name", "avatar"])
+        friend_activity_days = {}
+        for row in await financial_rollups.daily_totals(friend_ids, thirty_days_ago, today, group_by=("user_id", "day")):
+            friend_activity_days[row["user_id"]] = friend_activity_days.get(row["user_id"], 0) + 1
+        
         friends_performance = []
-        for friend_id in friend_ids[:10]:  # Limit for performance
+        for friend_id in friend_ids:
             friend_checkins = await db.daily_checkins.count_documents({
                 "user_id": friend_id,
                 "date": {"$gte": thirty_days_ago.isoformat()}
             })
             
-            friend_transactions = await db.transactions.distinct("created_at", {
-                "user_id": friend_id,
-                "created_at": {"$gte": datetime.combine(thirty_days_ago, datetime.min.time())}
-            })
-            friend_transaction_days = len(set(d.date() for d in friend_transactions))
+            friend_transaction_days = friend_activity_days.get(friend_id, 0)
             
-            friend_doc = await get_user_by_id(friend_id)
+            friend_doc = friend_docs.get(friend_id)
             friends_performance.append({
                 "friend_id": friend_id,
                 "name": friend_doc.get("name", "Friend") if friend_doc else "Friend",
@@ -14443,57 +14237,43 @@ async def get_weekly_recap(
         week_end = week_start + timedelta(days=6)  # Sunday
         
         # Get this week's user activity
-        week_start_dt = datetime.combine(week_start, datetime.min.time()).replace(tzinfo=timezone.utc)
-        week_end_dt = datetime.combine(week_end, datetime.max.time()).replace(tzinfo=timezone.utc)
-        
-        # User's weekly stats
-        weekly_transactions = await db.transactions.find({
-            "user_id": user_id,
-            "created_at": {"$gte": week_start_dt, "$lte": week_end_dt}
-        }).to_list(None)
-        
         weekly_checkins = await db.daily_checkins.count_documents({
             "user_id": user_id,
             "date": {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()}
         })
         
-        # Calculate user metrics
-        weekly_income = sum(t.get("amount", 0) for t in weekly_transactions if t["type"] == "income")
-        weekly_expenses = sum(t.get("amount", 0) for t in weekly_transactions if t["type"] == "expense")
-        weekly_savings = weekly_income - weekly_expenses
-        
         # Get friends for comparison
-        friends = await db.friendships.find({
-            "$or": [
-                {"user1_id": user_id, "status": "active"},
-                {"user2_id": user_id, "status": "active"}
-            ]
-        }).to_list(None)
+        friend_ids = await friend_graph.friends_of(user_id)
+        friend_ids = friend_ids[:20]  # Limit for performance
+        friend_docs = await friend_graph.hydrate_users(friend_ids, ["name", "avatar"])
         
-        friend_ids = []
-        for friendship in friends:
-            friend_id = friendship["user2_id"] if friendship["user1_id"] == user_id else friendship["user1_id"]
-            friend_ids.append(friend_id)
+        # This week's income/expense for the user and friends in one read of the daily stats
+        weekly_totals = financial_rollups.totals_by_user(
+            await financial_rollups.daily_totals([user_id] + friend_ids, week_start, week_end)
+        )
+        
+        # Calculate user metrics
+        user_week = weekly_totals[user_id]
+        weekly_income = user_week["income"]
+        weekly_expenses = user_week["expense"]
+        weekly_savings = weekly_income - weekly_expenses
+        weekly_transaction_count = user_week["income_count"] + user_week["expense_count"]
         
         # Get friends' weekly performance
         friends_weekly_stats = []
         
-        for friend_id in friend_ids[:20]:  # Limit for performance
-            friend_transactions = await db.transactions.find({
-                "user_id": friend_id,
-                "created_at": {"$gte": week_start_dt, "$lte": week_end_dt}
-            }).to_list(None)
+        for friend_id in friend_ids:
+            friend_week = weekly_totals[friend_id]
+            friend_transaction_count = friend_week["income_count"] + friend_week["expense_count"]
             
             friend_checkins = await db.daily_checkins.count_documents({
                 "user_id": friend_id,
                 "date": {"$gte": week_start.isoformat(), "$lte": week_end.isoformat()}
             })
             
-            friend_income = sum(t.get("amount", 0) for t in friend_transactions if t["type"] == "income")
-            friend_expenses = sum(t.get("amount", 0) for t in friend_transactions if t["type"] == "expense")
-            friend_savings = friend_income - friend_expenses
+            friend_savings = friend_week["income"] - friend_week["expense"]
             
-            friend_doc = await get_user_by_id(friend_id)
+            friend_doc = friend_docs.get(friend_id)
             
             friends_weekly_stats.append({
                 "friend_id": friend_id,
@@ -14501,8 +14281,8 @@ async def get_weekly_recap(
                 "avatar": friend_doc.get("avatar", "man") if friend_doc else "man",
                 "savings": friend_savings,
                 "checkins": friend_checkins,
-                "transactions": len(friend_transactions),
-                "activity_score": friend_checkins + len(friend_transactions)
+                "transactions": friend_transaction_count,
+                "activity_score": friend_checkins + friend_transaction_count
             })
         
         # Calculate comparative metrics
@@ -14516,7 +14296,7 @@ async def get_weekly_recap(
             friends_by_activity = sorted(friends_weekly_stats, key=lambda x: x["activity_score"], reverse=True)
             
             user_savings_rank = sum(1 for f in friends_weekly_stats if f["savings"] < weekly_savings) + 1
-            user_activity_rank = sum(1 for f in friends_weekly_stats if f["activity_score"] < weekly_checkins + len(weekly_transactions)) + 1
+            user_activity_rank = sum(1 for f in friends_weekly_stats if f["activity_score"] < weekly_checkins + weekly_transaction_count) + 1
         else:
             avg_friend_savings = 0
             avg_friend_checkins = 0
@@ -14588,8 +14368,8 @@ async def get_weekly_recap(
                 "expenses": weekly_expenses,
                 "savings": weekly_savings,
                 "checkins": weekly_checkins,
-                "transactions": len(weekly_transactions),
-                "activity_score": weekly_checkins + len(weekly_transactions)
+                "transactions": weekly_transaction_count,
+                "activity_score": weekly_checkins + weekly_transaction_count
             },
             "social_comparison": {
                 "friend_averages": {
@@ -14953,16 +14733,9 @@ async def create_group_expense_split(
         custom_splits = split_data.get("custom_splits", {})
         
         # Validate participants are friends
+        friend_ids = set(await friend_graph.friends_of(user_id))
         for participant_id in participants:
-            friendship = await db.friends.find_one({
-                "$or": [
-                    {"user_id": user_id, "friend_id": participant_id},
-                    {"user_id": participant_id, "friend_id": user_id}
-                ],
-                "status": "accepted"
-            })
-            
-            if not friendship:
+            if participant_id not in friend_ids:
                 raise HTTPException(status_code=400, detail=f"User {participant_id} is not your friend")
         
         # Calculate splits
@@ -14993,11 +14766,10 @@ async def create_group_expense_split(
         await db.expense_splits.insert_one(expense_split)
         
         # Create notifications for participants
-        for participant_id in participants:
-            notification = {
-                "notification_id": str(uuid.uuid4()),
+        await notification_store.insert_many([
+            {
                 "user_id": participant_id,
-                "type": "expense_split",
+                "notification_type": "expense_split",
                 "title": "New Expense Split",
                 "message": f"You owe ₹{splits.get(participant_id, 0):.2f} for '{expense_title}'",
                 "data": {
@@ -15007,7 +14779,8 @@ async def create_group_expense_split(
                 "is_read": False,
                 "created_at": datetime.now(timezone.utc)
             }
-            await db.notifications.insert_one(notification)
+            for participant_id in participants
+        ])
         
         return {
             "success": True,
@@ -15383,10 +15156,7 @@ async def get_fomo_alerts(
             })
         
         # Social pressure (friends' activity)
-        friend_count = await db.friends.count_documents({
-            "$or": [{"user_id": user_id}, {"friend_id": user_id}],
-            "status": "accepted"
-        })
+        friend_count = len(await friend_graph.friends_of(user_id))
         
         if friend_count >= 5:
             active_friends = friend_count // 2  # Estimate active friends
@@ -15712,11 +15482,14 @@ async def get_financial_journey_timeline(
                 "amount": milestone.get("amount", 0)
             })
         
-        # Friend connections
-        first_friend = await db.friends.find_one(
-            {"$or": [{"user_id": user_id}, {"friend_id": user_id}]},
-            sort=[("created_at", 1)]
-        )
+        # Friend connections (dates only live on the friendships themselves)
+        first_friend = None
+        if await friend_graph.friends_of(user_id):
+            first_friend = await db.friendships.find_one(
+                {"$or": [{"user1_id": user_id}, {"user2_id": user_id}], "status": "active"},
+                {"_id": 0, "created_at": 1},
+                sort=[("created_at", 1)]
+            )
         if first_friend:
             timeline_events.append({
                 "type": "social",
@@ -15917,6 +15690,7 @@ async def get_timeline_endpoint(
     timeline_type: str = "combined",  # "personal", "social", "combined"
     limit: int = 20,
     offset: int = 0,
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user)
 ):
     """Get user's timeline (personal, social, or combined)"""
@@ -15924,10 +15698,12 @@ async def get_timeline_endpoint(
         from timeline_service import get_timeline_service
         
         timeline_service = await get_timeline_service()
-        timeline = await timeline_service.get_user_timeline(user_id, timeline_type, limit, offset)
+        page = await timeline_service.get_timeline_page(user_id, timeline_type, limit, cursor=cursor, offset=offset)
         
-        return {"timeline": timeline}
+        return {"timeline": page["events"], "next_cursor": page["next_cursor"]}
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get timeline error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get timeline")
@@ -15938,6 +15714,7 @@ async def get_friend_timeline_endpoint(
     request: Request,
     limit: int = 15,
     offset: int = 0,
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user)
 ):
     """Get friend activities timeline"""
@@ -15945,10 +15722,12 @@ async def get_friend_timeline_endpoint(
         from timeline_service import get_timeline_service
         
         timeline_service = await get_timeline_service()
-        activities = await timeline_service.get_friend_activities_timeline(user_id, limit, offset)
+        page = await timeline_service.get_friend_activities_page(user_id, limit, cursor=cursor, offset=offset)
         
-        return {"activities": activities}
+        return {"activities": page["activities"], "next_cursor": page["next_cursor"]}
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get friend timeline error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get friend activities")
@@ -16357,8 +16136,22 @@ async def get_friends_timeline_endpoint(
             "created_at": {"$exists": True}
         }).sort("created_at", -1).limit(15).to_list(length=15)
         
+        # Get recent transactions for timeline
+        recent_transactions = await transaction_repository.find(
+            {"user_id": {"$in": all_user_ids}, "type": "income"},  # Only show income for privacy
+            Projection.fields_of(["id", "user_id", "amount", "category", "created_at"], "TxTimeline"),
+            limit=10,
+            sort=[("created_at", -1)]
+        )
+        
+        # Names for every author on the page in one projected lookup
+        users = await user_repository.cards(
+            [achievement.get("user_id") for achievement in achievements] +
+            [transaction.get("user_id") for transaction in recent_transactions]
+        )
+        
         for achievement in achievements:
-            user_data = await db.users.find_one({"id": achievement.get("user_id")})
+            user_data = users.get(achievement.get("user_id"))
             user_name = user_data.get("full_name", "Unknown") if user_data else "Unknown"
             is_self = achievement.get("user_id") == user_id
             
@@ -16375,19 +16168,13 @@ async def get_friends_timeline_endpoint(
                 "points": achievement.get('points', 0)
             })
         
-        # Get recent transactions for timeline
-        recent_transactions = await db.transactions.find({
-            "user_id": {"$in": all_user_ids},
-            "type": "income"  # Only show income for privacy
-        }).sort("created_at", -1).limit(10).to_list(length=10)
-        
         for transaction in recent_transactions:
-            user_data = await db.users.find_one({"id": transaction.get("user_id")})
+            user_data = users.get(transaction.get("user_id"))
             user_name = user_data.get("full_name", "Unknown") if user_data else "Unknown"
             is_self = transaction.get("user_id") == user_id
             
             timeline_events.append({
-                "id": str(transaction.get("_id", "")),
+                "id": transaction.get("id", ""),
                 "type": "income",
                 "user_id": transaction.get("user_id"),
                 "user_name": user_name,
@@ -16436,8 +16223,9 @@ async def get_social_timeline_endpoint(
             "created_at": {"$exists": True}
         }).sort("created_at", -1).limit(25).to_list(length=25)
         
+        users = await user_repository.cards(achievement.get("user_id") for achievement in public_achievements)
         for achievement in public_achievements:
-            user_data = await db.users.find_one({"id": achievement.get("user_id")})
+            user_data = users.get(achievement.get("user_id"))
             if not user_data:
                 continue
                 
@@ -16754,11 +16542,29 @@ async def get_cache_statistics(request: Request, current_user: str = Depends(get
         # Get background task stats
         task_stats = background_processor.get_statistics()
         
+        # Get event outbox backlog and consumer lag
+        outbox_stats = await event_pipeline.get_statistics()
+        
         return api_optimizer.optimize_json_response({
             "cache_performance": cache_stats,
             "database_performance": db_stats,
             "api_performance": api_stats,
             "background_tasks": task_stats,
+            "event_outbox": outbox_stats,
+            "leaderboard_rank_engine": rank_engine.get_statistics(),
+            "principal_cache": principal_cache.get_stats(),
+            "password_hasher": password_hasher.get_stats(),
+            "rate_limit_sync": rate_limit_sync.get_stats(),
+            "financial_rollups": financial_rollups.get_stats(),
+            "friend_graph": friend_graph.get_stats(),
+            "query_wire_bytes": wire_stats.get_stats(),
+            "query_telemetry": query_monitor.get_stats(),
+            "mongo_pool": mongo_manager.get_stats(),
+            "badge_rules": badge_rules.get_stats(),
+            "notification_aggregator": notification_aggregator.get_stats(),
+            "notification_store": notification_store.get_stats(),
+            "webpush_pool": webpush_pool.get_stats() if PUSH_NOTIFICATION_AVAILABLE else None,
+            "reminder_scheduler": reminder_scheduler.get_stats(),
             "timestamp": datetime.now(timezone.utc).isoformat()
         })
         
@@ -16766,6 +16572,23 @@ async def get_cache_statistics(request: Request, current_user: str = Depends(get
         logger.error(f"Get performance stats error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get performance statistics")
 
+@api_router.get("/super-admin/index-advisor")
+@limiter.limit("5/minute")
+async def get_index_advisor_report(
+    request: Request,
+    limit: int = 20,
+    explain: bool = True,
+    current_user: Dict[str, Any] = Depends(get_current_super_admin)
+):
+    """Hottest query shapes, the indexes they are missing and drift from the index manifest"""
+    try:
+        db = await get_database()
+        return await index_advisor.report(db, limit=min(max(limit, 1), 100), explain=explain)
+        
+    except Exception as e:
+        logger.error(f"Index advisor error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to build index advisor report")
+
 @api_router.post("/admin/performance/cache/warm")
 @limiter.limit("2/hour")
 async def warm_application_cache(request: Request, current_user: Dict[str, Any] = Depends(get_current_super_admin)):
@@ -16853,14 +16676,32 @@ logger = logging.getLogger(__name__)
 async def startup_performance_services():
     """Initialize performance optimization services"""
     try:
-        # Initialize database optimizer and create indexes
-        await db_optimizer.create_performance_indexes()
-        logger.info("✅ Database performance indexes created")
-        
         # Start background task processor
         asyncio.create_task(background_processor.start_processing())
         logger.info("✅ Background task processor started")
         
+        # Start event outbox workers (transaction side effects)
+        await event_pipeline.start_processing()
+        logger.info("✅ Event outbox workers started")
+        
+        # Persist leaderboard ranks from the rank engine periodically
+        await rank_engine.start_reconciler()
+        logger.info("✅ Leaderboard rank reconciler started")
+        
+        # Join the cross-worker WebSocket backplane
+        await connection_manager.start_backplane()
+        logger.info("✅ WebSocket backplane started")
+        
+        # Exchange rate limit counters with the other workers
+        await rate_limit_sync.start()
+        
+        # Daily push reminders, read one due time bucket at a time
+        if PUSH_NOTIFICATION_AVAILABLE:
+            await reminder_scheduler.start()
+        
+        # Periodic TTL sweeping for the in-process cache tier
+        advanced_cache.start_maintenance()
+        
         # Warm up critical caches
         await background_processor.create_and_add_task(
             "initial_cache_warming",
@@ -16909,14 +16750,38 @@ async def shutdown_db_client():
         await background_processor.stop_processing()
         logger.info("✅ Background task processor stopped")
         
-        # Close database connection
-        client.close()
-        logger.info("✅ Database connection closed")
+        # Stop event outbox workers (pending events resume on next start)
+        await event_pipeline.stop_processing()
+        logger.info("✅ Event outbox workers stopped")
+        
+        # Flush pending leaderboard ranks
+        await rank_engine.stop_reconciler()
+        logger.info("✅ Leaderboard ranks flushed")
+        
+        # Write and push notifications still inside a coalescing window
+        await notification_aggregator.stop()
+        
+        await connection_manager.stop_backplane()
+        logger.info("✅ WebSocket backplane stopped")
+        
+        # Stop reminder ticks, then close push-service connections
+        await reminder_scheduler.stop()
+        if PUSH_NOTIFICATION_AVAILABLE:
+            await webpush_pool.close()
+        
+        # Close the shared MongoDB pool
+        mongo_manager.close()
         
         # Clean up thread pools
+        advanced_cache.stop_maintenance()
         advanced_cache.thread_pool.shutdown(wait=True)
+        password_hasher.shutdown()
         logger.info("✅ Thread pools shut down")
         
+        # Push the last rate limit hits, then close shared Redis connection pools
+        await rate_limit_sync.stop()
+        await redis_manager.close()
+        
         logger.info("🛑 All services shut down successfully")
         
     except Exception as e:
@@ -17647,6 +17512,7 @@ async def review_admin_request(
                     "is_admin": True
                 }}
             )
+            principal_cache.invalidate(actual_user_id)
         
         # Update admin request
         await db.campus_admin_requests.update_one(
@@ -17880,9 +17746,10 @@ async def get_admin_audit_logs(
     days: int = 30,
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
     current_user: Dict[str, Any] = Depends(get_current_super_admin)
 ):
-    """Get admin audit logs for system admin review"""
+    """Get admin audit logs for system admin review (``page`` or keyset ``cursor``)"""
     try:
         db = await get_database()
         
@@ -17900,47 +17767,65 @@ async def get_admin_audit_logs(
         if severity:
             query_filter["severity"] = severity
         
-        # Get total count
-        total_count = await db.admin_audit_logs.count_documents(query_filter)
+        # Total and per-severity counts in one aggregation
+        severity_rows = await db.admin_audit_logs.aggregate([
+            {"$match": query_filter},
+            {"$group": {"_id": "$severity", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        severity_totals = {row["_id"]: row["count"] for row in severity_rows}
+        total_count = sum(severity_totals.values())
         
         # Get paginated logs
-        skip = (page - 1) * limit
-        logs_cursor = db.admin_audit_logs.find(query_filter).sort("timestamp", -1).skip(skip).limit(limit)
-        audit_logs = await logs_cursor.to_list(None)
+        paginated_logs = await paginate_query(
+            db.admin_audit_logs,
+            query_filter,
+            skip=(page - 1) * limit,
+            limit=limit,
+            sort_field="timestamp",
+            sort_order=-1,
+            cursor=cursor,
+            with_total=False
+        )
+        audit_logs = paginated_logs["data"]
         
-        # Enrich with admin details
+        # Enrich with admin details (one lookup for the page)
+        admin_users = await user_repository.find_by_ids(
+            (log["admin_user_id"] for log in audit_logs if log.get("admin_user_id") and log["admin_user_id"] != "system"),
+            Projection.fields_of(["full_name", "email"], "AdminDetails")
+        )
         for log in audit_logs:
-            if log.get("admin_user_id") and log["admin_user_id"] != "system":
-                admin_user = await get_user_by_id(log["admin_user_id"])
-                if admin_user:
-                    log["admin_details"] = {
-                        "full_name": admin_user.get("full_name"),
-                        "email": admin_user.get("email")
-                    }
+            admin_user = admin_users.get(log.get("admin_user_id"))
+            if admin_user:
+                log["admin_details"] = {
+                    "full_name": admin_user.get("full_name"),
+                    "email": admin_user.get("email")
+                }
         
         return {
-            "audit_logs": clean_mongo_doc(audit_logs),
+            "audit_logs": audit_logs,
             "pagination": {
-                "page": page,
+                "page": page if not cursor else None,
                 "limit": limit,
                 "total_count": total_count,
-                "total_pages": (total_count + limit - 1) // limit
+                "total_pages": (total_count + limit - 1) // limit,
+                "has_more": paginated_logs["has_more"],
+                "next_cursor": paginated_logs["next_cursor"]
             },
             "summary": {
                 "total_actions": total_count,
                 "date_range": f"Last {days} days",
                 "action_types": await db.admin_audit_logs.distinct("action_type", query_filter),
                 "severity_counts": {
-                    "info": await db.admin_audit_logs.count_documents({**query_filter, "severity": "info"}),
-                    "warning": await db.admin_audit_logs.count_documents({**query_filter, "severity": "warning"}),
-                    "error": await db.admin_audit_logs.count_documents({**query_filter, "severity": "error"}),
-                    "critical": await db.admin_audit_logs.count_documents({**query_filter, "severity": "critical"})
+                    severity: severity_totals.get(severity, 0)
+                    for severity in ["info", "warning", "error", "critical"]
                 }
             }
         }
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get audit logs error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get audit logs")
@@ -19660,6 +19545,7 @@ async def approve_club_admin_request(
             {"id": club_request["user_id"]},
             {"$set": {"admin_level": "club_admin", "is_admin": True}}
         )
+        principal_cache.invalidate(club_request["user_id"])
         
         # Update campus admin's stats
         await db.campus_admins.update_one(
@@ -19959,6 +19845,7 @@ async def suspend_club_admin(
             {"id": club_admin["user_id"]},
             {"$set": {"admin_level": "user", "is_admin": False, "suspension_status": "suspended"}}
         )
+        principal_cache.invalidate(club_admin["user_id"])
         
         # Create audit log
         await create_audit_log(
@@ -20181,30 +20068,27 @@ async def get_campus_spending_insights(campus: str, current_user: Dict[str, Any]
     """Get anonymous spending insights for a specific campus (accessible to all authenticated users)"""
     try:
         # Get all users from this campus
-        campus_users = await db.users.find(
-            {"university": campus, "is_active": True}
-        ).to_list(None)
+        user_ids = [
+            user["id"] async for user in user_repository.stream(
+                {"university": campus, "is_active": True}, Projection.fields_of(["id"], "UserId")
+            )
+        ]
         
-        if not campus_users:
+        if not user_ids:
             raise HTTPException(status_code=404, detail="Campus not found or no active users")
         
-        user_ids = [user["id"] for user in campus_users]
-        
         # Get last 30 days of expense transactions
         thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
         
-        transactions_cursor = db.transactions.find({
-            "user_id": {"$in": user_ids},
-            "type": "expense",
-            "date": {"$gte": thirty_days_ago}
-        })
-        transactions = await transactions_cursor.to_list(None)
-        
         # Analyze spending by category
         category_spending = {}
         total_spending = 0
         
-        for transaction in transactions:
+        async for transaction in transaction_repository.amounts({
+            "user_id": {"$in": user_ids},
+            "type": "expense",
+            "date": {"$gte": thirty_days_ago}
+        }):
             category = transaction['category']
             amount = transaction['amount']
             
@@ -20242,7 +20126,7 @@ async def get_campus_spending_insights(campus: str, current_user: Dict[str, Any]
         return {
             "success": True,
             "campus": campus,
-            "total_users": len(campus_users),
+            "total_users": len(user_ids),
             "total_spending": round(total_spending, 2),
             "insights": insights,
             "shareable_text": shareable_text,
@@ -20360,13 +20244,6 @@ async def get_friend_comparison_insights(current_user = Depends(get_current_user
         # Get last 30 days transactions for user and friends
         thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
         
-        transactions_cursor = db.transactions.find({
-            "user_id": {"$in": friend_ids},
-            "type": "expense",
-            "date": {"$gte": thirty_days_ago}
-        })
-        transactions = await transactions_cursor.to_list(None)
-        
         # Calculate spending by user
         user_spending = {}
         for friend_id in friend_ids:
@@ -20378,7 +20255,11 @@ async def get_friend_comparison_insights(current_user = Depends(get_current_user
                 'categories': {}
             }
         
-        for transaction in transactions:
+        async for transaction in transaction_repository.amounts({
+            "user_id": {"$in": friend_ids},
+            "type": "expense",
+            "date": {"$gte": thirty_days_ago}
+        }):
             user_tx_id = transaction['user_id']
             category = transaction['category']
             amount = transaction['amount']
@@ -20455,37 +20336,36 @@ async def get_friend_comparison_insights(current_user = Depends(get_current_user
 async def get_media_ready_impact_stats():
     """Generate media-ready data stories for press/sharing"""
     try:
-        # Get all users and transactions for comprehensive stats
-        db = await get_database()
-        users_cursor = db.users.find({"is_active": True})
-        users = await users_cursor.to_list(None)
-        
+        # Stream last month's transactions once: activity totals and expense per user
         thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-        transactions_cursor = db.transactions.find({
-            "date": {"$gte": thirty_days_ago}
-        })
-        transactions = await transactions_cursor.to_list(None)
-        
-        # Calculate comprehensive statistics
-        total_users = len(users)
-        total_savings = sum(user.get('net_savings', 0) for user in users)
-        total_earnings = sum(user.get('total_earnings', 0) for user in users)
-        
-        # Monthly activity
-        monthly_transactions = len([t for t in transactions if t['date'] > thirty_days_ago])
-        monthly_volume = sum(t['amount'] for t in transactions if t['date'] > thirty_days_ago)
-        
-        # Campus analysis
+        monthly_transactions = 0
+        monthly_volume = 0
+        expense_by_user = {}
+        async for transaction in transaction_repository.amounts({"date": {"$gte": thirty_days_ago}}):
+            monthly_transactions += 1
+            monthly_volume += transaction['amount']
+            if transaction['type'] == 'expense':
+                expense_by_user[transaction['user_id']] = expense_by_user.get(transaction['user_id'], 0) + transaction['amount']
+        
+        # Stream active users with only the fields these stats use
+        total_users = 0
+        total_savings = 0
+        total_earnings = 0
         campus_spending = {}
-        for user in users:
+        async for user in user_repository.stream(
+            {"is_active": True},
+            Projection.fields_of(["id", "university", "net_savings", "total_earnings"], "UserImpact")
+        ):
+            total_users += 1
+            total_savings += user.get('net_savings', 0)
+            total_earnings += user.get('total_earnings', 0)
+            
+            # Campus analysis
             campus = user.get('university', 'Unknown')
             if campus != 'Unknown':
-                user_transactions = [t for t in transactions if t['user_id'] == user['id'] and t['type'] == 'expense']
-                campus_total = sum(t['amount'] for t in user_transactions)
-                
                 if campus not in campus_spending:
                     campus_spending[campus] = {'total': 0, 'users': 0}
-                campus_spending[campus]['total'] += campus_total
+                campus_spending[campus]['total'] += expense_by_user.get(user['id'], 0)
                 campus_spending[campus]['users'] += 1
         
         # Calculate average spending per campus
@@ -20726,11 +20606,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                     # Handle marking notifications as read
                     notification_id = message.get("notification_id")
                     if notification_id:
-                        db = await get_database()
-                        await db.in_app_notifications.update_one(
-                            {"id": notification_id, "user_id": user_id},
-                            {"$set": {"is_read": True, "read_at": datetime.now(timezone.utc)}}
-                        )
+                        await notification_store.mark_read(user_id, notification_id)
                 
         except WebSocketDisconnect:
             logger.info(f"WebSocket disconnected for user {user_id}")
@@ -20824,12 +20700,7 @@ async def admin_websocket_endpoint(websocket: WebSocket, user_id: str):
         }))
         
         # Add to connection manager
-        if user_id not in connection_manager.admin_connections:
-            connection_manager.admin_connections[user_id] = set()
-        connection_manager.admin_connections[user_id].add(websocket)
-        
-        if admin_type == "system_admin":
-            connection_manager.system_admin_connections.add(websocket)
+        await connection_manager.register_admin_connection(websocket, user_id, admin_type)
         
         try:
             while True:
@@ -20870,8 +20741,9 @@ async def admin_websocket_endpoint(websocket: WebSocket, user_id: str):
 async def websocket_status(request: Request):
     """Get WebSocket server status"""
     return {
-        "connected_users": connection_manager.get_connected_users_count(),
-        "connected_admins": connection_manager.get_connected_admins_count(),
+        "connected_users": await connection_manager.get_connected_users_count(),
+        "connected_admins": await connection_manager.get_connected_admins_count(),
+        "this_worker": connection_manager.get_local_stats(),
         "server_status": "running",
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
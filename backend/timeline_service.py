@@ -1,16 +1,57 @@
 import os
 import asyncio
+import heapq
+import itertools
 import logging
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from database import get_database, get_user_by_id
+from database import get_database, get_user_by_id, encode_cursor, decode_cursor
+from friend_graph import friend_graph
+from redis_pool import redis_manager
+from notification_store import notification_store
 
 logger = logging.getLogger(__name__)
 
+# Visibility values a friend may see
+FEED_VISIBILITY = ["friends", "public"]
+
+def _event_sort_key(event: Dict[str, Any]) -> Tuple[datetime, str]:
+    return event["event_date"], event["id"]
+
+def _timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def encode_feed_cursor(event: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past ``event`` (event_date, id tiebreaker)"""
+    return encode_cursor(event["event_date"], event["id"])
+
+def decode_feed_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """Inverse of encode_feed_cursor; raises ValueError for a malformed cursor"""
+    if not cursor:
+        return None
+    return decode_cursor(cursor)
+
 class TimelineService:
+    """
+    Timelines are assembled at read time (fan-out on read): a personal event is
+    stored once, in its author's timeline, and friend feeds are a newest-first
+    k-way merge over the friends' (user_id, event_date) index ranges. Readers
+    with many friends additionally get a bounded Redis inbox of recent friend
+    event ids, pushed on write, so their first pages skip the merge.
+    """
+
+    INBOX_PREFIX = "timeline:inbox:"
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
+        self.merge_chunk_size = 100
+        self.inbox_size = int(os.environ.get('TIMELINE_INBOX_SIZE', '200'))
+        # Readers with at least this many friends get an inbox (0 disables inboxes)
+        self.inbox_min_friends = int(os.environ.get('TIMELINE_INBOX_MIN_FRIENDS', '150'))
+        self.inbox_ttl = int(os.environ.get('TIMELINE_INBOX_TTL', '900'))
 
     async def create_timeline_event(self, user_id: str, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new timeline event"""
@@ -42,9 +83,9 @@ class TimelineService:
             
             await self.db.timeline_events.insert_one(event_doc)
             
-            # Auto-create social timeline events for friends
-            if event_data["event_type"] == "personal" and event_data.get("visibility") in ["friends", "public"]:
-                await self._create_friend_timeline_events(user_id, event_doc)
+            # Friends read this event from the author's timeline; only precomputed inboxes need a push
+            if event_doc["event_type"] == "personal" and event_doc["visibility"] in FEED_VISIBILITY:
+                await self._push_to_inboxes(user_id, event_doc)
             
             logger.info(f"Created timeline event: {event_doc['title']}")
             return event_doc
@@ -57,76 +98,219 @@ class TimelineService:
                               limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
         """Get user's timeline (personal, social, or combined)"""
         try:
-            query = {"user_id": user_id}
-            
-            if timeline_type == "personal":
-                query["event_type"] = "personal"
-            elif timeline_type == "social":
-                query["event_type"] = "social"
-            # For "combined", we get both personal and social events
-            
-            # Get timeline events
-            events = await self.db.timeline_events.find(query)\
-                .sort("event_date", -1)\
-                .skip(offset)\
-                .limit(limit)\
-                .to_list(None)
-            
-            # Enrich events with additional data
-            enriched_events = []
-            for event in events:
-                enriched_event = await self._enrich_timeline_event(event, user_id)
-                enriched_events.append(enriched_event)
-            
-            return enriched_events
+            page = await self.get_timeline_page(user_id, timeline_type, limit, offset=offset)
+            return page["events"]
             
         except Exception as e:
             logger.error(f"Get user timeline error: {str(e)}")
             return []
 
+    async def get_timeline_page(self, user_id: str, timeline_type: str = "combined", limit: int = 20,
+                                cursor: Optional[str] = None, offset: int = 0) -> Dict[str, Any]:
+        """Get one page of the user's timeline plus the cursor for the next page"""
+        before = decode_feed_cursor(cursor)
+        fetch = limit + offset
+        own_query = {"user_id": user_id, "event_type": "personal"}
+        
+        if timeline_type == "personal":
+            events = await self._merge_streams([own_query], fetch, before)
+        else:
+            friend_ids = await friend_graph.friends_of(user_id)
+            friend_events = [
+                self._as_friend_activity(event)
+                for event in await self._friend_feed(user_id, friend_ids, fetch, before)
+            ]
+            if timeline_type == "social":
+                events = friend_events
+            else:
+                # "combined" merges the user's own events with the friend feed
+                own_events = await self._merge_streams([own_query], fetch, before)
+                events = list(itertools.islice(
+                    heapq.merge(own_events, friend_events, key=_event_sort_key, reverse=True), fetch
+                ))
+        
+        events = events[offset:]
+        
+        # Enrich events with additional data
+        enriched_events = await self._enrich_timeline_events(events, user_id)
+        
+        return {
+            "events": enriched_events,
+            "next_cursor": encode_feed_cursor(events[-1]) if events and len(events) == limit else None
+        }
+
     async def get_friend_activities_timeline(self, user_id: str, limit: int = 15, 
                                            offset: int = 0) -> List[Dict[str, Any]]:
         """Get timeline of friend activities"""
         try:
-            # Get user's friends
-            friends = await self._get_user_friends(user_id)
-            friend_ids = [friend["id"] for friend in friends]
-            
-            if not friend_ids:
-                return []
-            
-            # Get friends' personal timeline events that are visible to friends
-            query = {
-                "user_id": {"$in": friend_ids},
-                "event_type": "personal",
-                "visibility": {"$in": ["friends", "public"]}
-            }
+            page = await self.get_friend_activities_page(user_id, limit, offset=offset)
+            return page["activities"]
             
-            events = await self.db.timeline_events.find(query)\
-                .sort("event_date", -1)\
-                .skip(offset)\
+        except Exception as e:
+            logger.error(f"Get friend activities timeline error: {str(e)}")
+            return []
+
+    async def get_friend_activities_page(self, user_id: str, limit: int = 15,
+                                         cursor: Optional[str] = None, offset: int = 0) -> Dict[str, Any]:
+        """Get one page of friend activities plus the cursor for the next page"""
+        before = decode_feed_cursor(cursor)
+        
+        # Get user's friends
+        friend_ids = await friend_graph.friends_of(user_id)
+        if not friend_ids:
+            return {"activities": [], "next_cursor": None}
+        
+        events = (await self._friend_feed(user_id, friend_ids, limit + offset, before))[offset:]
+        
+        # Enrich events with reactions and friend information
+        enriched_events = await self._enrich_timeline_events(events, user_id, with_friend_info=True)
+        
+        return {
+            "activities": enriched_events,
+            "next_cursor": encode_feed_cursor(events[-1]) if events and len(events) == limit else None
+        }
+
+    # ===== FAN-OUT-ON-READ FEED =====
+
+    def _before(self, query: Dict[str, Any], before: Optional[Tuple[datetime, str]]) -> Dict[str, Any]:
+        """Restrict ``query`` to events strictly older than the cursor position"""
+        if before is None:
+            return query
+        event_date, event_id = before
+        return {"$and": [query, {"$or": [
+            {"event_date": {"$lt": event_date}},
+            {"event_date": event_date, "id": {"$lt": event_id}}
+        ]}]}
+
+    async def _merge_streams(self, queries: List[Dict[str, Any]], limit: int,
+                             before: Optional[Tuple[datetime, str]] = None) -> List[Dict[str, Any]]:
+        """Newest-first k-way merge of the first ``limit`` events of each query"""
+        async def fetch(query):
+            return await self.db.timeline_events.find(self._before(query, before))\
+                .sort([("event_date", -1), ("id", -1)])\
                 .limit(limit)\
                 .to_list(None)
+        
+        streams = await asyncio.gather(*(fetch(query) for query in queries))
+        return list(itertools.islice(heapq.merge(*streams, key=_event_sort_key, reverse=True), limit))
+
+    async def _friend_feed(self, user_id: str, friend_ids: List[str], limit: int,
+                           before: Optional[Tuple[datetime, str]] = None) -> List[Dict[str, Any]]:
+        """Friends' shareable events, newest first, from the inbox when possible"""
+        if not friend_ids:
+            return []
+        
+        client = None
+        if self.inbox_min_friends and len(friend_ids) >= self.inbox_min_friends:
+            client = await redis_manager.get_client(db=0, decode_responses=True)
+            if client is not None:
+                events = await self._read_inbox(client, user_id, friend_ids, limit, before)
+                if events is not None:
+                    return events
+        
+        # Each chunk is one $in range scan on (user_id, event_date); MongoDB merges within it
+        queries = [
+            {
+                "user_id": {"$in": friend_ids[start:start + self.merge_chunk_size]},
+                "event_type": "personal",
+                "visibility": {"$in": FEED_VISIBILITY}
+            }
+            for start in range(0, len(friend_ids), self.merge_chunk_size)
+        ]
+        
+        if client is not None and before is None:
+            events = await self._merge_streams(queries, max(limit, self.inbox_size))
+            await self._store_inbox(client, user_id, events)
+            return events[:limit]
+        
+        return await self._merge_streams(queries, limit, before)
+
+    def _inbox_key(self, user_id: str) -> str:
+        return f"{self.INBOX_PREFIX}{user_id}"
+
+    async def _read_inbox(self, client, user_id: str, friend_ids: List[str], limit: int,
+                          before: Optional[Tuple[datetime, str]]) -> Optional[List[Dict[str, Any]]]:
+        """Serve a page from the inbox, or None when it is missing or too short"""
+        try:
+            event_ids = await client.zrevrange(self._inbox_key(user_id), 0, -1)
+        except Exception as e:
+            redis_manager.report_error(e, db=0, decode_responses=True)
+            return None
+        if not event_ids:
+            return None
+        
+        friends = set(friend_ids)
+        events = await self.db.timeline_events.find({
+            "id": {"$in": event_ids},
+            "event_type": "personal",
+            "visibility": {"$in": FEED_VISIBILITY}
+        }).to_list(None)
+        events = [
+            event for event in events
+            if event["user_id"] in friends and (before is None or _event_sort_key(event) < before)
+        ]
+        events.sort(key=_event_sort_key, reverse=True)
+        
+        # A full inbox was trimmed, so older events may exist beyond it
+        if len(events) < limit and len(event_ids) >= self.inbox_size:
+            return None
+        return events[:limit]
+
+    async def _store_inbox(self, client, user_id: str, events: List[Dict[str, Any]]):
+        if not events:
+            return
+        try:
+            key = self._inbox_key(user_id)
+            pipe = client.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.zadd(key, {event["id"]: _timestamp(event["event_date"]) for event in events[:self.inbox_size]})
+            pipe.expire(key, self.inbox_ttl)
+            await pipe.execute()
+        except Exception as e:
+            redis_manager.report_error(e, db=0, decode_responses=True)
+            logger.warning(f"Timeline inbox build failed for {user_id}: {str(e)}")
+
+    async def _push_to_inboxes(self, author_id: str, event: Dict[str, Any]):
+        """Add a new event to the inboxes friends already have (never creates one)"""
+        if not self.inbox_min_friends:
+            return
+        client = await redis_manager.get_client(db=0, decode_responses=True)
+        if client is None:
+            return
+        
+        try:
+            friend_ids = await friend_graph.friends_of(author_id)
+            if not friend_ids:
+                return
             
-            # Enrich events with friend information
-            enriched_events = []
-            for event in events:
-                enriched_event = await self._enrich_timeline_event(event, user_id)
-                # Add friend information
-                friend_info = next((f for f in friends if f["id"] == event["user_id"]), None)
-                if friend_info:
-                    enriched_event["friend_info"] = {
-                        "name": friend_info.get("full_name", "Friend"),
-                        "avatar": friend_info.get("avatar", "boy"),
-                        "university": friend_info.get("university")
-                    }
-                enriched_events.append(enriched_event)
-            
-            return enriched_events
+            pipe = client.pipeline(transaction=False)
+            for friend_id in friend_ids:
+                pipe.exists(self._inbox_key(friend_id))
+            existing = await pipe.execute()
+            
+            pipe = client.pipeline(transaction=False)
+            score = _timestamp(event["event_date"])
+            for friend_id, exists in zip(friend_ids, existing):
+                if exists:
+                    key = self._inbox_key(friend_id)
+                    pipe.zadd(key, {event["id"]: score})
+                    pipe.zremrangebyrank(key, 0, -(self.inbox_size + 1))
+            await pipe.execute()
             
         except Exception as e:
-            logger.error(f"Get friend activities timeline error: {str(e)}")
-            return []
+            redis_manager.report_error(e, db=0, decode_responses=True)
+            logger.warning(f"Timeline inbox push failed for {author_id}: {str(e)}")
+
+    def _as_friend_activity(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Present a friend's personal event the way it appears in the viewer's social timeline"""
+        activity = event.copy()
+        activity.update({
+            "event_type": "social",
+            "title": f"Friend Activity: {event['title']}",
+            "related_user_id": event["user_id"],
+            "related_entity_id": event["id"]
+        })
+        return activity
 
     async def add_reaction_to_event(self, user_id: str, event_id: str, reaction_type: str) -> bool:
         """Add a reaction to a timeline event"""
@@ -297,34 +481,27 @@ class TimelineService:
     async def get_timeline_stats(self, user_id: str) -> Dict[str, Any]:
         """Get timeline statistics for user"""
         try:
-            # Count events by category
+            # Count events, reactions (the per-event reaction_count counter), featured
+            # and recent events by category in a single pass over the user's events
+            week_ago = datetime.now(timezone.utc) - timedelta(days=7)
             pipeline = [
                 {"$match": {"user_id": user_id}},
                 {"$group": {
                     "_id": "$category",
                     "count": {"$sum": 1},
-                    "total_reactions": {"$sum": "$reaction_count"}
+                    "total_reactions": {"$sum": "$reaction_count"},
+                    "featured": {"$sum": {"$cond": [{"$eq": ["$is_featured", True]}, 1, 0]}},
+                    "recent": {"$sum": {"$cond": [{"$gte": ["$created_at", week_ago]}, 1, 0]}}
                 }}
             ]
             
             category_stats = await self.db.timeline_events.aggregate(pipeline).to_list(None)
             
             # Get total stats
-            total_events = await self.db.timeline_events.count_documents({"user_id": user_id})
-            total_reactions = await self.db.timeline_reactions.count_documents({"timeline_event_id": {"$in": 
-                [event["id"] for event in await self.db.timeline_events.find({"user_id": user_id}).to_list(None)]}})
-            
-            # Get featured events count
-            featured_events = await self.db.timeline_events.count_documents({
-                "user_id": user_id,
-                "is_featured": True
-            })
-            
-            # Get recent activity
-            recent_events = await self.db.timeline_events.find({
-                "user_id": user_id,
-                "created_at": {"$gte": datetime.now(timezone.utc) - timedelta(days=7)}
-            }).count()
+            total_events = sum(stat["count"] for stat in category_stats)
+            total_reactions = sum(stat["total_reactions"] for stat in category_stats)
+            featured_events = sum(stat["featured"] for stat in category_stats)
+            recent_events = sum(stat["recent"] for stat in category_stats)
             
             return {
                 "total_events": total_events,
@@ -339,110 +516,82 @@ class TimelineService:
             logger.error(f"Get timeline stats error: {str(e)}")
             return {}
 
-    async def _enrich_timeline_event(self, event: Dict[str, Any], viewer_user_id: str) -> Dict[str, Any]:
-        """Enrich timeline event with additional data"""
+    async def _reaction_summaries(self, event_ids: List[str], viewer_user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Reaction counts by type and the viewer's own reaction for many events in one aggregation"""
+        rows = await self.db.timeline_reactions.aggregate([
+            {"$match": {"timeline_event_id": {"$in": event_ids}}},
+            {"$group": {
+                "_id": {"event_id": "$timeline_event_id", "reaction_type": "$reaction_type"},
+                "count": {"$sum": 1},
+                "by_viewer": {"$max": {"$cond": [{"$eq": ["$user_id", viewer_user_id]}, 1, 0]}}
+            }}
+        ]).to_list(None)
+        
+        summaries: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            summary = summaries.setdefault(row["_id"]["event_id"], {"reactions": {}, "user_reaction": None})
+            summary["reactions"][row["_id"]["reaction_type"]] = row["count"]
+            if row["by_viewer"]:
+                summary["user_reaction"] = row["_id"]["reaction_type"]
+        return summaries
+
+    async def _enrich_timeline_events(self, events: List[Dict[str, Any]], viewer_user_id: str,
+                                      with_friend_info: bool = False) -> List[Dict[str, Any]]:
+        """
+        Enrich a page of events with reactions, relative time and user info using
+        one reactions aggregation and one user lookup for the whole page
+        """
+        if not events:
+            return []
+        
         try:
-            enriched_event = event.copy()
-            
-            # Get reactions for this event
-            reactions = await self.db.timeline_reactions.find({
-                "timeline_event_id": event["id"]
-            }).to_list(None)
+            summaries = await self._reaction_summaries([event["id"] for event in events], viewer_user_id)
             
-            # Group reactions by type
-            reaction_summary = {}
-            for reaction in reactions:
-                reaction_type = reaction["reaction_type"]
-                reaction_summary[reaction_type] = reaction_summary.get(reaction_type, 0) + 1
+            user_ids = {
+                event["related_user_id"] for event in events
+                if event["event_type"] == "social" and event.get("related_user_id")
+            }
+            if with_friend_info:
+                user_ids.update(event["user_id"] for event in events)
+            users = await friend_graph.hydrate_users(user_ids, ["full_name", "avatar", "university"])
             
-            enriched_event["reactions"] = reaction_summary
+        except Exception as e:
+            logger.error(f"Enrich timeline events error: {str(e)}")
+            return events
+        
+        enriched_events = []
+        for event in events:
+            enriched_event = event.copy()
             
-            # Check if current user reacted
-            user_reaction = next(
-                (r["reaction_type"] for r in reactions if r["user_id"] == viewer_user_id),
-                None
-            )
-            enriched_event["user_reaction"] = user_reaction
+            summary = summaries.get(event["id"], {})
+            enriched_event["reactions"] = summary.get("reactions", {})
+            enriched_event["user_reaction"] = summary.get("user_reaction")
             
             # Add relative time
             enriched_event["relative_time"] = self._get_relative_time(event["event_date"])
             
             # Add user info if it's a social event
             if event["event_type"] == "social" and event.get("related_user_id"):
-                related_user = await get_user_by_id(event["related_user_id"])
+                related_user = users.get(event["related_user_id"])
                 if related_user:
                     enriched_event["related_user_info"] = {
                         "name": related_user.get("full_name", "User"),
                         "avatar": related_user.get("avatar", "boy")
                     }
             
-            return enriched_event
-            
-        except Exception as e:
-            logger.error(f"Enrich timeline event error: {str(e)}")
-            return event
-
-    async def _create_friend_timeline_events(self, user_id: str, personal_event: Dict[str, Any]):
-        """Create social timeline events for user's friends"""
-        try:
-            # Get user's friends
-            friends = await self._get_user_friends(user_id)
-            
-            if not friends:
-                return
-            
-            # Create social events for friends' timelines
-            for friend in friends:
-                social_event_data = {
-                    "event_type": "social",
-                    "category": personal_event["category"],
-                    "subcategory": personal_event.get("subcategory"),
-                    "title": f"Friend Activity: {personal_event['title']}",
-                    "description": personal_event["description"],
-                    "amount": personal_event.get("amount"),
-                    "metadata": personal_event.get("metadata", {}),
-                    "related_user_id": user_id,
-                    "related_entity_id": personal_event["id"],
-                    "icon": personal_event.get("icon", "👥"),
-                    "color": personal_event.get("color", "#6B7280"),
-                    "event_date": personal_event["event_date"],
-                    "visibility": "friends"
-                }
-                
-                await self.create_timeline_event(friend["id"], social_event_data)
-            
-        except Exception as e:
-            logger.error(f"Create friend timeline events error: {str(e)}")
-
-    async def _get_user_friends(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get user's friends list"""
-        try:
-            # Get friendships where user is involved (FIXED: use user1_id/user2_id)
-            friendships = await self.db.friendships.find({
-                "$or": [
-                    {"user1_id": user_id},
-                    {"user2_id": user_id}
-                ],
-                "status": "active"
-            }).to_list(None)
-            
-            friend_ids = []
-            for friendship in friendships:
-                friend_id = friendship["user2_id"] if friendship["user1_id"] == user_id else friendship["user1_id"]
-                friend_ids.append(friend_id)
-            
-            # Get friend user details
-            friends = []
-            for friend_id in friend_ids:
-                friend = await get_user_by_id(friend_id)
-                if friend:
-                    friends.append(friend)
-            
-            return friends
+            # Add friend information
+            if with_friend_info:
+                friend_info = users.get(event["user_id"])
+                if friend_info:
+                    enriched_event["friend_info"] = {
+                        "name": friend_info.get("full_name", "Friend"),
+                        "avatar": friend_info.get("avatar", "boy"),
+                        "university": friend_info.get("university")
+                    }
             
-        except Exception as e:
-            logger.error(f"Get user friends error: {str(e)}")
-            return []
+            enriched_events.append(enriched_event)
+        
+        return enriched_events
 
     async def _create_reaction_notification(self, reactor_user_id: str, event: Dict[str, Any], reaction_type: str):
         """Create notification for event owner about reaction"""
@@ -466,7 +615,7 @@ class TimelineService:
                 }
             }
             
-            await self.db.in_app_notifications.insert_one(notification_data)
+            await notification_store.insert(notification_data)
             
         except Exception as e:
             logger.error(f"Create reaction notification error: {str(e)}")
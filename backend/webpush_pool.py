@@ -0,0 +1,279 @@
+"""
+Async WebPush Delivery Pool
+Delivers Web Push messages from a bounded set of worker tasks over keep-alive
+HTTP connections per push-service origin, with cached VAPID signatures,
+per-endpoint retry/backoff and pruning of subscriptions that are gone
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from py_vapid import Vapid
+from pywebpush import WebPusher
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Push service responses meaning the subscription will never work again
+GONE_STATUSES = (404, 410)
+
+
+def _origin(endpoint: str) -> str:
+    url = urlparse(endpoint)
+    return f"{url.scheme}://{url.netloc}"
+
+
+class WebPushPool:
+    """
+    ``send()`` queues a push and awaits its outcome; ``workers`` tasks drain
+    the queue, so that many pushes are in flight at most and at most
+    ``max_queue`` wait (beyond that a push is dropped rather than buffered).
+    Payload encryption runs on a small thread pool, each push-service origin
+    gets its own keep-alive ``httpx.AsyncClient``, and the VAPID JWT for an
+    origin (the JWT audience) is signed once and reused until it nears expiry.
+    429/5xx responses and network errors are retried with exponential backoff
+    (honouring Retry-After); 404/410 deactivate the subscription.
+    """
+
+    def __init__(self, vapid_private_key: Optional[str], vapid_subject: str,
+                 workers: int = 16, max_queue: int = 10000, connections_per_origin: int = 10,
+                 max_retries: int = 3, timeout: float = 10.0, ttl: int = 86400,
+                 crypto_threads: int = 4, vapid_ttl: int = 12 * 3600):
+        self.vapid_private_key = vapid_private_key
+        self.vapid_claims = {"sub": vapid_subject}
+        self.workers = workers
+        self.max_queue = max_queue
+        self.connections_per_origin = connections_per_origin
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.ttl = ttl
+        self.vapid_ttl = vapid_ttl
+        self.backoff_base = 0.5
+        self.backoff_max = 30.0
+
+        self.executor = ThreadPoolExecutor(max_workers=crypto_threads, thread_name_prefix="webpush")
+        self._vapid: Optional[Vapid] = None
+        self._vapid_cache: Dict[str, Tuple[int, Dict[str, str]]] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.stats = {
+            'queued': 0, 'sent': 0, 'failed': 0, 'rejected': 0, 'dropped': 0,
+            'retries': 0, 'pruned': 0, 'vapid_signed': 0, 'vapid_cache_hits': 0,
+        }
+
+    def configure(self, vapid_private_key: Optional[str], vapid_subject: Optional[str] = None):
+        """Set the VAPID key (PushNotificationService reads it once the .env is loaded)"""
+        if vapid_private_key != self.vapid_private_key:
+            self.vapid_private_key = vapid_private_key
+            self._vapid = None
+            self._vapid_cache.clear()
+        if vapid_subject:
+            self.vapid_claims = {"sub": vapid_subject}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.vapid_private_key)
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def send(self, subscription_info: Dict[str, Any], payload: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Queue one push and wait for its delivery; False if dropped, rejected or failed"""
+        if not self.configured:
+            logger.warning("VAPID keys not configured, skipping push notification")
+            return False
+
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((subscription_info, json.dumps(payload).encode(), ttl or self.ttl, future))
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            logger.warning(f"⚠️ WebPush queue full ({self.max_queue}) - dropping push")
+            return False
+        self.stats['queued'] += 1
+        return await future
+
+    async def send_many(self, deliveries: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]) -> int:
+        """Queue (subscription_info, payload) pairs together; returns how many were delivered"""
+        results = await asyncio.gather(*(self.send(subscription_info, payload) for subscription_info, payload in deliveries))
+        return sum(1 for result in results if result)
+
+    async def _worker(self):
+        while True:
+            subscription_info, data, ttl, future = await self._queue.get()
+            try:
+                result = await self._deliver(subscription_info, data, ttl)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.set_result(False)
+                raise
+            except Exception as e:
+                logger.error(f"WebPush delivery error: {str(e)}")
+                self.stats['failed'] += 1
+                result = False
+            finally:
+                self._queue.task_done()
+            if not future.done():
+                future.set_result(result)
+
+    def _encrypt(self, subscription_info: Dict[str, Any], data: bytes) -> bytes:
+        return WebPusher(subscription_info).encode(data, content_encoding="aes128gcm")["body"]
+
+    def _vapid_headers(self, audience: str) -> Dict[str, str]:
+        """Authorization header for ``audience``, re-signed when less than a quarter of its lifetime is left"""
+        now = int(time.time())
+        cached = self._vapid_cache.get(audience)
+        if cached is not None and cached[0] - now > self.vapid_ttl // 4:
+            self.stats['vapid_cache_hits'] += 1
+            return cached[1]
+
+        if self._vapid is None:
+            if os.path.isfile(self.vapid_private_key):
+                self._vapid = Vapid.from_file(private_key_file=self.vapid_private_key)
+            else:
+                self._vapid = Vapid.from_string(private_key=self.vapid_private_key)
+
+        expires = now + self.vapid_ttl
+        headers = self._vapid.sign({**self.vapid_claims, "aud": audience, "exp": expires})
+        self._vapid_cache[audience] = (expires, headers)
+        self.stats['vapid_signed'] += 1
+        return headers
+
+    def _client(self, origin: str) -> httpx.AsyncClient:
+        client = self._clients.get(origin)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.connections_per_origin,
+                    max_keepalive_connections=self.connections_per_origin,
+                    keepalive_expiry=60.0
+                )
+            )
+            self._clients[origin] = client
+        return client
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                try:
+                    return min(max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()), self.backoff_max)
+                except (TypeError, ValueError):
+                    pass
+        return min(self.backoff_base * (2 ** attempt) * random.uniform(0.5, 1.5), self.backoff_max)
+
+    async def _deliver(self, subscription_info: Dict[str, Any], data: bytes, ttl: int) -> bool:
+        endpoint = subscription_info["endpoint"]
+        origin = _origin(endpoint)
+        body = await asyncio.get_running_loop().run_in_executor(self.executor, self._encrypt, subscription_info, data)
+        headers = {
+            **self._vapid_headers(origin),
+            "Content-Encoding": "aes128gcm",
+            "Content-Type": "application/octet-stream",
+            "TTL": str(ttl),
+        }
+        client = self._client(origin)
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = await client.post(endpoint, content=body, headers=headers)
+            except httpx.HTTPError as e:
+                logger.warning(f"WebPush to {origin} failed (attempt {attempt + 1}): {str(e)}")
+            else:
+                if response.status_code < 300:
+                    self.stats['sent'] += 1
+                    return True
+                if response.status_code in GONE_STATUSES:
+                    await self._prune(endpoint)
+                    return False
+                if response.status_code != 429 and response.status_code < 500:
+                    self.stats['rejected'] += 1
+                    logger.error(f"WebPush to {origin} rejected: {response.status_code} {response.text[:200]}")
+                    return False
+
+            if attempt == self.max_retries:
+                break
+            self.stats['retries'] += 1
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+        self.stats['failed'] += 1
+        logger.error(f"WebPush to {origin} failed after {self.max_retries + 1} attempts")
+        return False
+
+    async def _prune(self, endpoint: str):
+        """Deactivate every subscription using an endpoint the push service reports gone"""
+        try:
+            from database import get_database
+            db = await get_database("notifications")
+            result = await db.push_subscriptions.update_many(
+                {"subscription_data.endpoint": endpoint, "is_active": True},
+                {"$set": {"is_active": False, "deactivated_at": datetime.now(timezone.utc)}}
+            )
+            self.stats['pruned'] += result.modified_count
+        except Exception as e:
+            logger.error(f"Prune push subscription error: {str(e)}")
+
+    async def close(self):
+        """Stop the workers, fail anything still queued and close the origin connections"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                *_, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_result(False)
+            self._queue = None
+
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        self.executor.shutdown(wait=False)
+        logger.info("✅ WebPush pool closed")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'configured': self.configured,
+            'workers': len(self._tasks),
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'origins': list(self._clients),
+        }
+
+
+# Global WebPush delivery pool instance
+webpush_pool = WebPushPool(
+    vapid_private_key=os.environ.get('VAPID_PRIVATE_KEY'),
+    vapid_subject=os.environ.get('VAPID_SUBJECT', 'mailto:admin@earnest.app'),
+    workers=int(os.environ.get('WEBPUSH_WORKERS', '16')),
+    max_queue=int(os.environ.get('WEBPUSH_MAX_QUEUE', '10000')),
+    connections_per_origin=int(os.environ.get('WEBPUSH_CONNECTIONS_PER_ORIGIN', '10')),
+    max_retries=int(os.environ.get('WEBPUSH_MAX_RETRIES', '3')),
+    timeout=float(os.environ.get('WEBPUSH_TIMEOUT', '10'))
+)
+
+# Export for use in other modules
+__all__ = ['WebPushPool', 'webpush_pool', 'GONE_STATUSES']
@@ -0,0 +1,232 @@
+"""
+WebSocket Pub/Sub Backplane
+Routes real-time messages between uvicorn workers so a notification raised on
+one worker reaches sockets held by another, and tracks presence cluster-wide
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from redis_pool import redis_manager
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# deliver(kind, target, message) - kind is "user", "admin" or "broadcast"
+DeliverHandler = Callable[[str, Optional[str], Dict[str, Any]], Awaitable[None]]
+
+
+class InMemoryBackplane:
+    """
+    Single-process stand-in for the Redis backplane (tests and Redis-less
+    deployments). Publishing hands the message straight back to this worker.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._deliver: Optional[DeliverHandler] = None
+        self._presence: Dict[str, Set[str]] = {"user": set(), "admin": set()}
+        self.published = 0
+
+    async def start(self, deliver: DeliverHandler):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    async def subscribe_user(self, user_id: str):
+        pass
+
+    async def unsubscribe_user(self, user_id: str):
+        pass
+
+    async def publish(self, kind: str, target: Optional[str], message: Dict[str, Any]):
+        self.published += 1
+        if self._deliver is not None:
+            await self._deliver(kind, target, message)
+
+    async def set_presence(self, kind: str, member_id: str, online: bool):
+        if online:
+            self._presence[kind].add(member_id)
+        else:
+            self._presence[kind].discard(member_id)
+
+    async def count_presence(self, kind: str) -> int:
+        return len(self._presence[kind])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'worker_id': self.worker_id, 'published': self.published}
+
+
+class RedisBackplane:
+    """
+    Redis pub/sub backplane.
+
+    Every worker subscribes to the admin and broadcast channels and to one
+    ``ws:user:{id}`` channel per locally connected user, so Redis only forwards
+    user messages to the worker(s) holding that user's sockets. Presence is kept
+    in per-worker sets that expire unless the worker keeps heart-beating, so a
+    crashed worker's users drop out of the cluster-wide counts on their own.
+    """
+
+    name = "redis"
+    CHANNEL_PREFIX = "ws"
+    WORKERS_KEY = "ws:workers"
+
+    def __init__(self, heartbeat_interval: int = 30):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.presence_ttl = heartbeat_interval * 3
+
+        self._client = None
+        self._pubsub = None
+        self._deliver: Optional[DeliverHandler] = None
+        self._tasks = []
+
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def _channel(self, kind: str, target: Optional[str] = None) -> str:
+        return f"{self.CHANNEL_PREFIX}:{kind}:{target}" if target else f"{self.CHANNEL_PREFIX}:{kind}"
+
+    def _presence_key(self, kind: str, worker_id: Optional[str] = None) -> str:
+        return f"ws:presence:{worker_id or self.worker_id}:{kind}"
+
+    async def start(self, deliver: DeliverHandler) -> bool:
+        """Connect and subscribe to the shared channels; False if Redis is unavailable"""
+        self._client = await redis_manager.get_client(db=0, decode_responses=True)
+        if self._client is None:
+            return False
+
+        self._deliver = deliver
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self._channel("admin"), self._channel("broadcast"))
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._heartbeat())
+        ]
+        logger.info(f"📡 WebSocket backplane subscribed via Redis ({self.worker_id})")
+        return True
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        try:
+            if self._pubsub is not None:
+                await self._pubsub.aclose()
+            if self._client is not None:
+                pipe = self._client.pipeline(transaction=False)
+                pipe.delete(self._presence_key("user"), self._presence_key("admin"))
+                pipe.zrem(self.WORKERS_KEY, self.worker_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"WebSocket backplane shutdown error: {str(e)}")
+
+    async def _listen(self):
+        """Hand every received message to the local connection manager"""
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+
+                envelope = json.loads(message["data"])
+                self.received += 1
+                await self._deliver(envelope["kind"], envelope.get("target"), envelope["message"])
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"WebSocket backplane receive error: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _heartbeat(self):
+        """Keep this worker's presence sets alive and drop workers that stopped beating"""
+        while True:
+            try:
+                now = time.time()
+                pipe = self._client.pipeline(transaction=False)
+                pipe.zadd(self.WORKERS_KEY, {self.worker_id: now})
+                pipe.zremrangebyscore(self.WORKERS_KEY, 0, now - self.presence_ttl)
+                pipe.expire(self._presence_key("user"), self.presence_ttl)
+                pipe.expire(self._presence_key("admin"), self.presence_ttl)
+                await pipe.execute()
+                await asyncio.sleep(self.heartbeat_interval)
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.errors += 1
+                redis_manager.report_error(e, db=0, decode_responses=True)
+                logger.error(f"WebSocket backplane heartbeat error: {str(e)}")
+                await asyncio.sleep(self.heartbeat_interval)
+
+    async def subscribe_user(self, user_id: str):
+        await self._pubsub.subscribe(self._channel("user", user_id))
+
+    async def unsubscribe_user(self, user_id: str):
+        await self._pubsub.unsubscribe(self._channel("user", user_id))
+
+    async def publish(self, kind: str, target: Optional[str], message: Dict[str, Any]):
+        envelope = json.dumps({"kind": kind, "target": target, "message": message, "origin": self.worker_id})
+        channel = self._channel("user", target) if kind == "user" else self._channel(kind)
+        async with redis_manager.measure("ws_publish"):
+            await self._client.publish(channel, envelope)
+        self.published += 1
+
+    async def set_presence(self, kind: str, member_id: str, online: bool):
+        key = self._presence_key(kind)
+        pipe = self._client.pipeline(transaction=False)
+        if online:
+            pipe.sadd(key, member_id)
+            pipe.expire(key, self.presence_ttl)
+            pipe.zadd(self.WORKERS_KEY, {self.worker_id: time.time()})
+        else:
+            pipe.srem(key, member_id)
+        await pipe.execute()
+
+    async def count_presence(self, kind: str) -> int:
+        """Distinct members present on any live worker"""
+        workers = await self._client.zrangebyscore(self.WORKERS_KEY, time.time() - self.presence_ttl, "+inf")
+        keys = [self._presence_key(kind, worker_id) for worker_id in workers]
+        if not keys:
+            return 0
+        return len(await self._client.sunion(keys))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'backend': self.name,
+            'worker_id': self.worker_id,
+            'published': self.published,
+            'received': self.received,
+            'errors': self.errors,
+        }
+
+
+async def create_backplane(deliver: DeliverHandler):
+    """Start the Redis backplane when Redis is reachable, otherwise the in-memory stand-in"""
+    if os.environ.get('WEBSOCKET_BACKPLANE', 'redis') == 'redis':
+        backplane = RedisBackplane()
+        if await backplane.start(deliver):
+            return backplane
+        logger.info("⚠️ Redis not available - WebSocket fan-out limited to this worker")
+
+    backplane = InMemoryBackplane()
+    await backplane.start(deliver)
+    return backplane
+
+
+# Export for use in other modules
+__all__ = ['InMemoryBackplane', 'RedisBackplane', 'create_backplane']
@@ -6,13 +6,64 @@ Handles real-time communication for admin requests, approvals, and system notifi
 import asyncio
 import json
 import logging
+import os
 from typing import Dict, List, Set, Optional, Any
 from fastapi import WebSocket, WebSocketDisconnect
 from datetime import datetime, timezone
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from websocket_backplane import InMemoryBackplane, create_backplane
+from notification_aggregator import notification_aggregator
+
 logger = logging.getLogger(__name__)
 
+class ConnectionWriter:
+    """
+    Bounded outbound queue for one socket, drained by its own writer task so a
+    slow client only ever delays itself. When the queue is full the
+    ``drop_oldest`` policy discards the oldest pending message; ``disconnect``
+    makes ``offer()`` refuse so the manager can drop the connection.
+    """
+    
+    def __init__(self, websocket: WebSocket, user_id: str, on_failure, max_queue: int = 100,
+                 policy: str = "drop_oldest", send_timeout: float = 10.0):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._on_failure = on_failure
+        self._task = asyncio.create_task(self._run())
+    
+    def offer(self, text: str) -> bool:
+        """Queue a serialized message without blocking; False means the consumer is too slow"""
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            if self.policy == "disconnect":
+                return False
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.queue.put_nowait(text)
+            return True
+    
+    async def _run(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(text), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Hand cleanup to a separate task - it cancels this writer
+            asyncio.create_task(self._on_failure(self.websocket, e))
+    
+    def close(self):
+        self._task.cancel()
+
+
 class ConnectionManager:
     """Manages WebSocket connections for real-time communication with memory leak prevention"""
     
@@ -31,18 +82,78 @@ class ConnectionManager:
         self.connection_timeout = 300
         # Background cleanup task
         self._cleanup_task = None
+        # Cross-worker fan-out; replaced by the Redis backplane in start_backplane()
+        self.backplane = InMemoryBackplane()
+        # Per-socket bounded send queues
+        self._writers: Dict[WebSocket, ConnectionWriter] = {}
+        self.send_queue_size = int(os.environ.get('WEBSOCKET_SEND_QUEUE_SIZE', '100'))
+        self.slow_consumer_policy = os.environ.get('WEBSOCKET_SLOW_CONSUMER_POLICY', 'drop_oldest')
+        self.slow_consumer_disconnects = 0
+        self.send_failures = 0
+        
+    async def start_backplane(self):
+        """Attach this worker to the cluster-wide pub/sub backplane (application startup)"""
+        self.backplane = await create_backplane(self._deliver_local)
+    
+    async def stop_backplane(self):
+        """Detach from the backplane (application shutdown)"""
+        await self.backplane.stop()
+    
+    async def _user_online(self, user_id: str):
+        """First local socket for a user: subscribe to their channel and mark presence"""
+        try:
+            await self.backplane.subscribe_user(user_id)
+            await self.backplane.set_presence("user", user_id, True)
+        except Exception as e:
+            logger.error(f"Backplane subscribe failed for user {user_id}: {str(e)}")
+    
+    async def _user_offline(self, user_id: str):
+        """Last local socket for a user closed"""
+        try:
+            await self.backplane.unsubscribe_user(user_id)
+            await self.backplane.set_presence("user", user_id, False)
+        except Exception as e:
+            logger.error(f"Backplane unsubscribe failed for user {user_id}: {str(e)}")
+    
+    async def _admin_presence(self, user_id: str, online: bool):
+        try:
+            await self.backplane.set_presence("admin", user_id, online)
+        except Exception as e:
+            logger.error(f"Backplane presence update failed for admin {user_id}: {str(e)}")
+    
+    async def _publish(self, kind: str, target: Optional[str], message: Dict[str, Any]):
+        """Publish through the backplane, delivering locally if it is unreachable"""
+        try:
+            await self.backplane.publish(kind, target, message)
+        except Exception as e:
+            logger.error(f"Backplane publish failed ({kind}), delivering locally: {str(e)}")
+            await self._deliver_local(kind, target, message)
+    
+    async def _deliver_local(self, kind: str, target: Optional[str], message: Dict[str, Any]):
+        """Deliver a backplane message to the sockets held by this worker"""
+        if kind == "user":
+            await self._send_local_user(target, message)
+        elif kind == "admin":
+            await self._send_local_admins(message["notification"], message["admin_type"])
+        elif kind == "broadcast":
+            await self._broadcast_local(message)
         
     async def connect_user(self, websocket: WebSocket, user_id: str):
         """Connect a regular user for notifications"""
         await websocket.accept()
         
-        if user_id not in self.user_connections:
+        first_connection = user_id not in self.user_connections
+        if first_connection:
             self.user_connections[user_id] = set()
         
         self.user_connections[user_id].add(websocket)
         self.connection_timestamps[websocket] = datetime.now(timezone.utc)
+        self._attach_writer(websocket, user_id)
         logger.info(f"User {user_id} connected via WebSocket")
         
+        if first_connection:
+            await self._user_online(user_id)
+        
         # Start cleanup task if not running
         if self._cleanup_task is None or self._cleanup_task.done():
             self._cleanup_task = asyncio.create_task(self._periodic_cleanup())
@@ -57,16 +168,7 @@ class ConnectionManager:
     async def connect_admin(self, websocket: WebSocket, user_id: str, admin_type: str = "campus_admin"):
         """Connect an admin user (campus admin or system admin)"""
         await websocket.accept()
-        
-        if user_id not in self.admin_connections:
-            self.admin_connections[user_id] = set()
-        
-        self.admin_connections[user_id].add(websocket)
-        self.connection_timestamps[websocket] = datetime.now(timezone.utc)
-        
-        # Add to system admin connections if applicable
-        if admin_type == "system_admin":
-            self.system_admin_connections.add(websocket)
+        await self.register_admin_connection(websocket, user_id, admin_type)
         
         logger.info(f"Admin {user_id} ({admin_type}) connected via WebSocket")
         
@@ -82,24 +184,93 @@ class ConnectionManager:
             "timestamp": datetime.now(timezone.utc).isoformat()
         }, websocket)
 
-    async def disconnect_user(self, websocket: WebSocket, user_id: str):
-        """Disconnect a user and clean up resources"""
+    async def register_admin_connection(self, websocket: WebSocket, user_id: str, admin_type: str = "campus_admin"):
+        """Track an already-accepted admin socket"""
+        first_connection = user_id not in self.admin_connections
+        if first_connection:
+            self.admin_connections[user_id] = set()
+        
+        self.admin_connections[user_id].add(websocket)
+        self.connection_timestamps[websocket] = datetime.now(timezone.utc)
+        self._attach_writer(websocket, user_id)
+        
+        # Add to system admin connections if applicable
+        if admin_type == "system_admin":
+            self.system_admin_connections.add(websocket)
+        
+        if first_connection:
+            await self._admin_presence(user_id, True)
+
+    def _attach_writer(self, websocket: WebSocket, user_id: str):
+        if websocket not in self._writers:
+            self._writers[websocket] = ConnectionWriter(
+                websocket, user_id, self._on_writer_failure,
+                max_queue=self.send_queue_size, policy=self.slow_consumer_policy
+            )
+    
+    async def _forget_socket(self, websocket: WebSocket, user_id: Optional[str] = None):
+        """Remove a socket from every registry and stop its writer"""
+        writer = self._writers.pop(websocket, None)
+        if writer is not None:
+            writer.close()
+            user_id = user_id or writer.user_id
+        
         if user_id in self.user_connections:
             self.user_connections[user_id].discard(websocket)
             if not self.user_connections[user_id]:
                 del self.user_connections[user_id]
+                await self._user_offline(user_id)
         
         # Also remove from admin connections if applicable
         if user_id in self.admin_connections:
             self.admin_connections[user_id].discard(websocket)
             if not self.admin_connections[user_id]:
                 del self.admin_connections[user_id]
+                await self._admin_presence(user_id, False)
         
         # Remove from system admin connections
         self.system_admin_connections.discard(websocket)
         
         # Remove from timestamp tracking
         self.connection_timestamps.pop(websocket, None)
+    
+    async def _drop_connection(self, websocket: WebSocket, user_id: Optional[str] = None,
+                               code: int = 1000, reason: str = ""):
+        await self._forget_socket(websocket, user_id)
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception as e:
+            logger.debug(f"Error closing WebSocket (may already be closed): {str(e)}")
+    
+    async def _on_writer_failure(self, websocket: WebSocket, error: Exception):
+        self.send_failures += 1
+        logger.warning(f"WebSocket send failed, dropping connection: {str(error)}")
+        await self._drop_connection(websocket, code=1011, reason="Send failed")
+    
+    def _enqueue(self, websocket: WebSocket, text: str):
+        """Queue serialized text for a socket, applying the slow-consumer policy"""
+        writer = self._writers.get(websocket)
+        if writer is None or writer.offer(text):
+            return
+        # Stop queueing right away; registry cleanup and close happen in the background
+        self._writers.pop(websocket, None)
+        writer.close()
+        self.slow_consumer_disconnects += 1
+        logger.warning(f"Disconnecting slow WebSocket consumer {writer.user_id} "
+                       f"({self.send_queue_size} messages queued)")
+        asyncio.create_task(self._drop_connection(websocket, writer.user_id, code=1013, reason="Slow consumer"))
+    
+    def _fan_out(self, sockets, message: Dict[str, Any]):
+        """Serialize once and queue for every socket - never waits on a client"""
+        if not sockets:
+            return
+        text = json.dumps(message)
+        for websocket in sockets:
+            self._enqueue(websocket, text)
+
+    async def disconnect_user(self, websocket: WebSocket, user_id: str):
+        """Disconnect a user and clean up resources"""
+        await self._forget_socket(websocket, user_id)
         
         # Close WebSocket connection properly
         try:
@@ -133,28 +304,7 @@ class ConnectionManager:
         # Clean up stale connections
         for websocket in stale_connections:
             logger.info(f"Cleaning up stale connection (inactive for {self.connection_timeout}s)")
-            
-            # Remove from all connection sets
-            for user_id, connections in list(self.user_connections.items()):
-                if websocket in connections:
-                    connections.discard(websocket)
-                    if not connections:
-                        del self.user_connections[user_id]
-            
-            for admin_id, connections in list(self.admin_connections.items()):
-                if websocket in connections:
-                    connections.discard(websocket)
-                    if not connections:
-                        del self.admin_connections[user_id]
-            
-            self.system_admin_connections.discard(websocket)
-            self.connection_timestamps.pop(websocket, None)
-            
-            # Try to close the connection
-            try:
-                await websocket.close()
-            except:
-                pass
+            await self._drop_connection(websocket)
         
         if stale_connections:
             logger.info(f"Cleaned up {len(stale_connections)} stale connections")
@@ -166,30 +316,29 @@ class ConnectionManager:
     async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
         """Send message to specific WebSocket connection"""
         try:
-            await websocket.send_text(json.dumps(message))
+            if websocket in self._writers:
+                self._enqueue(websocket, json.dumps(message))
+            else:
+                await websocket.send_text(json.dumps(message))
             # Update timestamp on successful message send
             await self.update_connection_timestamp(websocket)
         except Exception as e:
             logger.error(f"Error sending personal message: {str(e)}")
 
     async def send_user_notification(self, user_id: str, notification: Dict[str, Any]):
-        """Send notification to specific user's all connections"""
-        if user_id in self.user_connections:
-            disconnected_sockets = set()
-            
-            for websocket in self.user_connections[user_id].copy():
-                try:
-                    await websocket.send_text(json.dumps(notification))
-                except Exception as e:
-                    logger.error(f"Error sending to user {user_id}: {str(e)}")
-                    disconnected_sockets.add(websocket)
-            
-            # Clean up disconnected sockets
-            for socket in disconnected_sockets:
-                self.user_connections[user_id].discard(socket)
+        """Send notification to all of a user's connections, on whichever worker holds them"""
+        await self._publish("user", user_id, notification)
+
+    async def _send_local_user(self, user_id: str, notification: Dict[str, Any]):
+        """Send notification to the user's connections held by this worker"""
+        self._fan_out(self.user_connections.get(user_id), notification)
 
     async def send_admin_notification(self, notification: Dict[str, Any], admin_type: str = "all"):
-        """Send notification to admin users"""
+        """Send notification to admin users on every worker"""
+        await self._publish("admin", None, {"notification": notification, "admin_type": admin_type})
+
+    async def _send_local_admins(self, notification: Dict[str, Any], admin_type: str = "all"):
+        """Send notification to admin connections held by this worker"""
         target_connections = set()
         
         if admin_type == "system_admin":
@@ -205,49 +354,46 @@ class ConnectionManager:
                 target_connections.update(connections)
             target_connections.update(self.system_admin_connections)
         
-        disconnected_sockets = set()
-        
-        for websocket in target_connections:
-            try:
-                await websocket.send_text(json.dumps(notification))
-            except Exception as e:
-                logger.error(f"Error sending admin notification: {str(e)}")
-                disconnected_sockets.add(websocket)
-        
-        # Clean up disconnected sockets
-        for socket in disconnected_sockets:
-            self.system_admin_connections.discard(socket)
+        self._fan_out(target_connections, notification)
 
     async def broadcast_system_message(self, message: Dict[str, Any]):
-        """Broadcast message to all connected users"""
-        all_connections = set()
-        
-        # Collect all user connections
-        for user_id, connections in self.user_connections.items():
-            all_connections.update(connections)
-        
-        # Collect all admin connections
-        for admin_id, connections in self.admin_connections.items():
-            all_connections.update(connections)
-        
-        all_connections.update(self.system_admin_connections)
-        
-        disconnected_sockets = set()
-        
-        for websocket in all_connections:
-            try:
-                await websocket.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error broadcasting: {str(e)}")
-                disconnected_sockets.add(websocket)
+        """Broadcast message to all connected users on every worker"""
+        await self._publish("broadcast", None, message)
 
-    def get_connected_users_count(self) -> int:
-        """Get total number of connected users"""
-        return len(self.user_connections)
+    async def _broadcast_local(self, message: Dict[str, Any]):
+        """Broadcast message to the connections held by this worker"""
+        # Every tracked socket has a writer: users, campus and system admins
+        self._fan_out(list(self._writers), message)
 
-    def get_connected_admins_count(self) -> int:
-        """Get total number of connected admins"""
-        return len(self.admin_connections) + len(self.system_admin_connections)
+    async def get_connected_users_count(self) -> int:
+        """Get number of users connected to any worker"""
+        try:
+            return await self.backplane.count_presence("user")
+        except Exception as e:
+            logger.error(f"Backplane presence count failed: {str(e)}")
+            return len(self.user_connections)
+
+    async def get_connected_admins_count(self) -> int:
+        """Get number of admins connected to any worker"""
+        try:
+            return await self.backplane.count_presence("admin")
+        except Exception as e:
+            logger.error(f"Backplane presence count failed: {str(e)}")
+            return len(self.admin_connections)
+
+    def get_local_stats(self) -> Dict[str, Any]:
+        """Connections held by this worker and backplane counters"""
+        return {
+            "local_users": len(self.user_connections),
+            "local_admins": len(self.admin_connections),
+            "local_sockets": len(self.connection_timestamps),
+            "queued_messages": sum(writer.queue.qsize() for writer in self._writers.values()),
+            "dropped_messages": sum(writer.dropped for writer in self._writers.values()),
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "send_failures": self.send_failures,
+            "backplane": self.backplane.get_stats()
+        }
 
 
 class RealTimeNotificationService:
@@ -378,9 +524,9 @@ class RealTimeNotificationService:
         await self.connection_manager.broadcast_system_message(notification)
 
     async def create_and_notify_in_app_notification(self, user_id: str, notification_data: Dict[str, Any]):
-        """Create in-app notification and send real-time notification"""
+        """Create in-app notification and send real-time notification (coalesced per user and type)"""
         try:
-            # Create in-app notification in database
+            now = datetime.now(timezone.utc)
             notification_doc = {
                 "user_id": user_id,
                 "notification_type": notification_data.get("type", "general"),
@@ -388,29 +534,22 @@ class RealTimeNotificationService:
                 "message": notification_data.get("message", ""),
                 "action_url": notification_data.get("action_url"),
                 "is_read": False,
-                "created_at": datetime.now(timezone.utc),
+                "created_at": now,
                 "related_id": notification_data.get("related_id"),
                 "data": notification_data.get("data", {})
             }
             
-            # Insert into database
-            result = await self.db.in_app_notifications.insert_one(notification_doc)
-            notification_doc["id"] = str(result.inserted_id)
-            
-            # Send real-time notification
             real_time_notification = {
                 "type": notification_data.get("type", "general"),
                 "title": notification_data.get("title", ""),
                 "message": notification_data.get("message", ""),
                 "data": notification_data.get("data", {}),
-                "notification_id": notification_doc["id"],
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "timestamp": now.isoformat(),
                 "priority": notification_data.get("priority", "medium")
             }
             
-            await self.connection_manager.send_user_notification(user_id, real_time_notification)
-            
-            return notification_doc
+            # Written and pushed by the aggregator when this (user, type) window closes
+            return notification_aggregator.submit(user_id, notification_doc, real_time_notification)
             
         except Exception as e:
             logger.error(f"Error creating and sending notification: {str(e)}")
@@ -419,6 +558,7 @@ class RealTimeNotificationService:
 
 # Global connection manager instance
 connection_manager = ConnectionManager()
+notification_aggregator.attach(connection_manager.send_user_notification)
 
 # Function to get notification service
 async def get_notification_service(db: AsyncIOMotorDatabase = None) -> RealTimeNotificationService:
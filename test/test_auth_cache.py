@@ -0,0 +1,70 @@
+import pytest
+
+import auth_cache
+from auth_cache import PrincipalCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = PrincipalCache(ttl_seconds=15)
+    cache.set("u1", {"_id": "oid", "id": "u1", "full_name": "A"})
+
+    clock[0] += 14.9
+    assert cache.get("u1") == {"id": "u1", "full_name": "A"}
+
+    clock[0] += 0.1
+    assert cache.get("u1") is None
+    assert cache.stats["expired"] == 1
+    assert cache.get_stats()["size"] == 0
+
+
+def test_set_refreshes_ttl(clock):
+    cache = PrincipalCache(ttl_seconds=10)
+    cache.set("u1", {"id": "u1"})
+    clock[0] += 8
+    cache.set("u1", {"id": "u1", "level": 2})
+    clock[0] += 8
+
+    assert cache.get("u1") == {"id": "u1", "level": 2}
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = PrincipalCache(max_entries=2)
+    cache.set("u1", {"id": "u1"})
+    cache.set("u2", {"id": "u2"})
+    cache.get("u1")  # u2 is now the least recently used
+    cache.set("u3", {"id": "u3"})
+
+    assert cache.get("u2") is None
+    assert cache.get("u1") == {"id": "u1"}
+    assert cache.get("u3") == {"id": "u3"}
+    assert cache.stats["evictions"] == 1
+
+
+def test_returned_documents_are_copies(clock):
+    cache = PrincipalCache()
+    user = {"id": "u1", "level": 1}
+    cache.set("u1", user)
+    user["level"] = 5
+    cache.get("u1")["level"] = 9
+
+    assert cache.get("u1") == {"id": "u1", "level": 1}
+
+
+def test_invalidate_and_stats(clock):
+    cache = PrincipalCache()
+    cache.set("u1", {"id": "u1"})
+    cache.invalidate("u1")
+    cache.invalidate("missing")
+
+    assert cache.get("u1") is None
+    stats = cache.get_stats()
+    assert stats["invalidations"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.0
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from financial_rollups import FinancialRollupService
+from mongo_pool import mongo_manager
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length):
+        return list(self.rows)
+
+
+class FakeRollups:
+    """Rollup collection whose first CAS write can race one concurrent apply"""
+
+    def __init__(self, doc=None, race=None):
+        self.doc = doc
+        self.race = race
+
+    async def find_one(self, query, projection=None, session=None):
+        return dict(self.doc) if self.doc is not None else None
+
+    async def insert_one(self, doc, session=None):
+        self.doc = doc
+
+    async def replace_one(self, query, doc, session=None):
+        if self.race is not None:
+            self.race(self)
+            self.race = None
+        expected = query["revision"]
+        current = self.doc.get("revision")
+        matches = "revision" not in self.doc if isinstance(expected, dict) else current == expected
+        if matches:
+            self.doc = doc
+        return SimpleNamespace(matched_count=int(matches))
+
+
+class FakeDaily:
+    def __init__(self):
+        self.rows = []
+
+    async def delete_many(self, query, session=None):
+        self.rows = []
+
+    async def insert_many(self, rows, ordered=True, session=None):
+        self.rows.extend(rows)
+
+
+class FakeTransactions:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def aggregate(self, pipeline, session=None):
+        return FakeCursor(self.rows)
+
+
+class FakeDB(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+def income_row(day, amount, count=1):
+    when = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return {"_id": {"type": "income", "day": day, "category": "salary"},
+            "total": amount, "count": count, "first": when, "last": when}
+
+
+def service_with(monkeypatch, rollups, rows):
+    service = FinancialRollupService(rebuild_attempts=3)
+    db = FakeDB({service.COLLECTION: rollups, service.DAILY_COLLECTION: FakeDaily(),
+                 "transactions": FakeTransactions(rows)})
+
+    async def get_db():
+        return db
+
+    async def standalone():
+        return False
+
+    monkeypatch.setattr(service, "_get_db", get_db)
+    monkeypatch.setattr(mongo_manager, "supports_transactions", standalone)
+    return service, db
+
+
+def test_rebuild_stores_when_revision_unchanged(monkeypatch):
+    rollups = FakeRollups({"user_id": "u1", "revision": 4, "lifetime": {"income": 1.0}})
+    service, db = service_with(monkeypatch, rollups, [income_row("2024-05-01", 100.0)])
+
+    doc = asyncio.run(service.rebuild_user("u1"))
+
+    assert doc["lifetime"]["income"] == 100.0
+    assert rollups.doc["revision"] == 4
+    assert rollups.doc["lifetime"]["income"] == 100.0
+    assert len(db[service.DAILY_COLLECTION].rows) == 1
+    assert service.stats["rebuild_conflicts"] == 0
+
+
+def test_rebuild_retries_instead_of_overwriting_concurrent_apply(monkeypatch):
+    rows = [income_row("2024-05-01", 100.0)]
+
+    def concurrent_apply(collection):
+        # Another worker inserts a transaction and $incs the rollup mid-rebuild
+        rows.append(income_row("2024-05-02", 50.0))
+        collection.doc = {**collection.doc, "revision": collection.doc["revision"] + 1}
+
+    rollups = FakeRollups({"user_id": "u1", "revision": 1}, race=concurrent_apply)
+    service, _ = service_with(monkeypatch, rollups, rows)
+
+    asyncio.run(service.rebuild_user("u1"))
+
+    assert service.stats["rebuild_conflicts"] == 1
+    assert rollups.doc["revision"] == 2
+    assert rollups.doc["lifetime"]["income"] == 150.0
+
+
+def test_rebuild_without_revision_matches_legacy_document(monkeypatch):
+    rollups = FakeRollups({"user_id": "u1", "lifetime": {"income": 1.0}})
+    service, _ = service_with(monkeypatch, rollups, [income_row("2024-05-01", 10.0)])
+
+    asyncio.run(service.rebuild_user("u1"))
+
+    assert rollups.doc["lifetime"]["income"] == 10.0
+    assert rollups.doc["revision"] == 0
+
+
+def test_rebuild_inserts_first_rollup(monkeypatch):
+    rollups = FakeRollups()
+    service, _ = service_with(monkeypatch, rollups, [income_row("2024-05-01", 10.0, count=2)])
+
+    asyncio.run(service.rebuild_user("u1"))
+
+    assert rollups.doc["lifetime"]["income_count"] == 2
+    assert rollups.doc["revision"] == 0
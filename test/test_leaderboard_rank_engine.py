@@ -0,0 +1,201 @@
+import asyncio
+import random
+
+import pytest
+
+from leaderboard_rank_engine import LeaderboardRankEngine, OrderStatisticSkipList, _LocalBoard
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeLeaderboards:
+    """db.leaderboards: rows keyed by user_id for a single board"""
+
+    def __init__(self, rows):
+        self.rows = {row["user_id"]: dict(row) for row in rows}
+        self.writes = []
+
+    def find(self, query, projection):
+        return FakeCursor([{"user_id": row["user_id"], "score": row["score"]} for row in self.rows.values()])
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            user_id = operation._filter["user_id"]
+            self.rows.setdefault(user_id, {"user_id": user_id}).update(operation._doc["$set"])
+            self.writes.append((user_id, operation._doc["$set"]["rank"]))
+
+
+class FakeDB:
+    def __init__(self, rows=()):
+        self.leaderboards = FakeLeaderboards(rows)
+
+
+def local_engine(rows=()):
+    engine = LeaderboardRankEngine()
+    db = FakeDB(rows)
+
+    async def get_db():
+        return db
+
+    async def get_redis():
+        return None
+
+    engine._get_db = get_db
+    engine._get_redis = get_redis
+    return engine, db
+
+
+BOARD = ("savings", "weekly", None)
+
+
+def test_skip_list_matches_sorted_reference():
+    random.seed(7)
+    skip_list = OrderStatisticSkipList()
+    reference = []
+    for _ in range(2000):
+        key = random.randint(0, 500)
+        if key in reference and random.random() < 0.5:
+            assert skip_list.delete(key)
+            reference.remove(key)
+        elif key not in reference:
+            skip_list.insert(key)
+            reference.append(key)
+    reference.sort()
+
+    assert len(skip_list) == len(reference)
+    assert skip_list.slice(0, len(reference)) == reference
+    for position, key in enumerate(reference):
+        assert skip_list.rank(key) == position + 1
+    assert skip_list.slice(10, 5) == reference[10:15]
+
+
+def test_skip_list_missing_keys_and_bounds():
+    skip_list = OrderStatisticSkipList()
+    for key in (5, 1, 3):
+        skip_list.insert(key)
+
+    assert skip_list.rank(2) is None
+    assert not skip_list.delete(2)
+    assert skip_list.slice(3, 1) == []
+    assert skip_list.slice(-1, 2) == []
+    assert skip_list.slice(1, 10) == [3, 5]
+
+
+def test_local_board_orders_by_score_then_user_id():
+    board = _LocalBoard()
+    board.set_score("b", 10)
+    board.set_score("a", 10)
+    board.set_score("c", 30)
+
+    assert board.top(0, 10) == [("c", 30), ("a", 10), ("b", 10)]
+    assert board.rank("a") == 2
+    assert board.rank("missing") is None
+
+
+def test_local_board_score_update_and_remove():
+    board = _LocalBoard()
+    for user_id, score in (("a", 1), ("b", 2), ("c", 3)):
+        board.set_score(user_id, score)
+
+    board.set_score("a", 5)
+    assert board.top(0, 3) == [("a", 5), ("c", 3), ("b", 2)]
+    assert len(board.ordering) == 3
+
+    board.remove("c")
+    assert board.rank("b") == 2
+    assert board.top(1, 5) == [("b", 2)]
+
+
+@pytest.mark.parametrize("old_rank,new_rank,size,expected", [
+    (5, 5, 10, None),
+    (8, 2, 10, (2, 8)),
+    (2, 8, 10, (2, 8)),
+    (None, 4, 10, (4, 10)),
+    (4, None, 9, (4, 9)),
+    (10, None, 9, None),
+])
+def test_shifted_range(old_rank, new_rank, size, expected):
+    assert LeaderboardRankEngine._shifted_range(old_rank, new_rank, size) == expected
+
+
+def test_engine_rank_and_top_k():
+    engine, _ = local_engine([{"user_id": "a", "score": 10}, {"user_id": "b", "score": 20}])
+
+    async def scenario():
+        assert await engine.update_score(*BOARD, "c", 15) == 2
+        assert await engine.get_rank(*BOARD, "a") == 3
+        top = await engine.get_top(*BOARD, limit=2)
+        assert [(entry["user_id"], entry["rank"]) for entry in top] == [("b", 1), ("c", 2)]
+        assert await engine.get_entry(*BOARD, "c") == (2, 15.0)
+
+    asyncio.run(scenario())
+
+
+def test_reconcile_writes_only_the_shifted_range():
+    rows = [{"user_id": f"u{i}", "score": 100 - i} for i in range(10)]
+    engine, db = local_engine(rows)
+
+    async def scenario():
+        await engine.get_rank(*BOARD, "u0")
+        # The bootstrap rewrites every stored rank once
+        assert await engine.reconcile() == 10
+        db.leaderboards.writes.clear()
+
+        # u7 (rank 8) overtakes u4 (rank 5): ranks 5-8 move, nothing else does
+        await engine.update_score(*BOARD, "u7", 96.5)
+        assert await engine.reconcile() == 4
+        assert sorted(db.leaderboards.writes) == [("u4", 6), ("u5", 7), ("u6", 8), ("u7", 5)]
+
+        db.leaderboards.writes.clear()
+        assert await engine.reconcile() == 0
+
+    asyncio.run(scenario())
+
+
+def test_reconcile_rewrites_a_rank_that_returns_to_an_earlier_value():
+    engine, db = local_engine([{"user_id": "a", "score": 3}, {"user_id": "b", "score": 2}])
+
+    async def scenario():
+        await engine.reconcile()
+        await engine.get_rank(*BOARD, "a")
+        await engine.reconcile()
+
+        await engine.update_score(*BOARD, "b", 5)
+        await engine.reconcile()
+        assert db.leaderboards.rows["b"]["rank"] == 1
+        # Another writer stores a stale rank; the next move back must still be written
+        db.leaderboards.rows["b"]["rank"] = 7
+        await engine.update_score(*BOARD, "b", 1)
+        await engine.reconcile()
+        assert db.leaderboards.rows["b"]["rank"] == 2
+        assert db.leaderboards.rows["a"]["rank"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_reconcile_after_removal():
+    engine, db = local_engine([{"user_id": u, "score": s} for u, s in (("a", 3), ("b", 2), ("c", 1))])
+
+    async def scenario():
+        await engine.get_rank(*BOARD, "a")
+        await engine.reconcile()
+        db.leaderboards.writes.clear()
+
+        await engine.remove_member(*BOARD, "a")
+        assert await engine.reconcile() == 2
+        assert sorted(db.leaderboards.writes) == [("b", 1), ("c", 2)]
+
+    asyncio.run(scenario())
@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import notification_aggregator
+from notification_aggregator import NotificationAggregator
+
+
+class FakeStore:
+    """notification_store stand-in; ``failures`` are raised by the next insert_many calls"""
+
+    def __init__(self):
+        self.written = []
+        self.failures = []
+
+    async def insert_many(self, docs):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.written.extend(dict(doc) for doc in docs)
+        return docs
+
+
+@pytest.fixture
+def store(monkeypatch):
+    fake = FakeStore()
+    monkeypatch.setattr(notification_aggregator, "notification_store", fake)
+    return fake
+
+
+def make_aggregator(**kwargs):
+    aggregator = NotificationAggregator(**{"window": 60, **kwargs})
+    sent = []
+
+    async def send(user_id, message):
+        sent.append((user_id, message))
+
+    aggregator.attach(send)
+    return aggregator, sent
+
+
+def notification(user_id, notification_type, title):
+    doc = {"user_id": user_id, "notification_type": notification_type, "title": title,
+           "message": title, "created_at": title}
+    return doc, {"type": "notification", "title": title}
+
+
+def test_repeats_merge_into_one_document(store):
+    async def scenario():
+        aggregator, sent = make_aggregator()
+        first = aggregator.submit("u1", *notification("u1", "friend_request", "one"))
+        aggregator.submit("u1", *notification("u1", "friend_request", "two"))
+        aggregator.submit("u1", *notification("u1", "friend_request", "three"))
+        await aggregator.stop()
+        return first, aggregator, sent
+
+    first, aggregator, sent = asyncio.run(scenario())
+
+    assert len(store.written) == 1
+    doc = store.written[0]
+    assert doc["id"] == first["id"]
+    assert doc["title"] == "three"
+    assert doc["count"] == 3
+    assert doc["created_at"] == "one" and doc["updated_at"] == "three"
+    assert sent == [("u1", {"type": "notification", "title": "three", "notification_id": doc["id"], "count": 3})]
+    assert aggregator.stats["coalesced"] == 2
+
+
+def test_one_frame_per_user_per_flush(store):
+    async def scenario():
+        aggregator, sent = make_aggregator()
+        aggregator.submit("u1", *notification("u1", "friend_request", "a"))
+        aggregator.submit("u1", *notification("u1", "achievement", "b"))
+        aggregator.submit("u2", *notification("u2", "achievement", "c"))
+        await aggregator.flush()
+        return sent
+
+    sent = dict(asyncio.run(scenario()))
+
+    assert len(store.written) == 3
+    assert sent["u1"]["type"] == "notification_batch"
+    assert sent["u1"]["count"] == 2
+    assert sent["u2"]["title"] == "c"
+
+
+def test_failed_write_is_requeued_without_a_frame(store):
+    async def scenario():
+        aggregator, sent = make_aggregator()
+        aggregator.submit("u1", *notification("u1", "achievement", "a"))
+        store.failures.append(RuntimeError("primary stepped down"))
+        await aggregator.flush()
+        after_failure = (list(sent), len(aggregator._pending))
+        await aggregator.flush()
+        return aggregator, sent, after_failure
+
+    aggregator, sent, (sent_after_failure, pending_after_failure) = asyncio.run(scenario())
+
+    assert sent_after_failure == []
+    assert pending_after_failure == 1
+    assert len(store.written) == 1
+    assert len(sent) == 1
+    assert aggregator.stats["write_failures"] == 1
+    assert aggregator.stats["written"] == 1
+
+
+def test_requeued_entry_merges_into_newer_window(store):
+    async def scenario():
+        aggregator, _ = make_aggregator()
+        aggregator.submit("u1", *notification("u1", "achievement", "old"))
+        batch = list(aggregator._pending.values())
+        aggregator._pending.clear()
+        aggregator.submit("u1", *notification("u1", "achievement", "new"))
+        aggregator._requeue(batch)
+        await aggregator.stop()
+
+    asyncio.run(scenario())
+
+    assert len(store.written) == 1
+    assert store.written[0]["title"] == "new"
+    assert store.written[0]["count"] == 2
+
+
+def test_duplicate_key_errors_count_as_written(store):
+    async def scenario():
+        aggregator, sent = make_aggregator()
+        aggregator.submit("u1", *notification("u1", "achievement", "a"))
+        aggregator.submit("u2", *notification("u2", "achievement", "b"))
+        store.failures.append(BulkWriteError({"writeErrors": [
+            {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+            {"index": 1, "code": 121, "errmsg": "validation failed"},
+        ]}))
+        await aggregator.flush()
+        return aggregator, sent
+
+    aggregator, sent = asyncio.run(scenario())
+
+    assert [user_id for user_id, _ in sent] == ["u1"]
+    assert list(aggregator._pending) == [("u2", "achievement")]
+
+
+def test_gives_up_after_max_retries(store):
+    async def scenario():
+        aggregator, sent = make_aggregator(max_retries=2)
+        aggregator.submit("u1", *notification("u1", "achievement", "a"))
+        store.failures.extend(RuntimeError("down") for _ in range(3))
+        for _ in range(3):
+            await aggregator.flush()
+        return aggregator, sent
+
+    aggregator, sent = asyncio.run(scenario())
+
+    assert not aggregator._pending
+    assert sent == []
+    assert aggregator.stats["dropped"] == 1
+
+
+def test_stop_drains_in_flight_batch(store):
+    async def scenario():
+        aggregator, sent = make_aggregator(window=0)
+        release = asyncio.Event()
+        insert_many = store.insert_many
+
+        async def slow_insert_many(docs):
+            await release.wait()
+            return await insert_many(docs)
+
+        store.insert_many = slow_insert_many
+        aggregator.submit("u1", *notification("u1", "achievement", "a"))
+        await asyncio.sleep(0)  # the flusher has popped the batch and is writing it
+        assert not aggregator._pending
+
+        stopping = asyncio.create_task(aggregator.stop())
+        await asyncio.sleep(0)
+        release.set()
+        await stopping
+        return aggregator, sent
+
+    aggregator, sent = asyncio.run(scenario())
+
+    assert len(store.written) == 1
+    assert len(sent) == 1
+    assert aggregator._task is None
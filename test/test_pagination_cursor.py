@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+from database import decode_cursor, encode_cursor, keyset_filter
+
+
+@pytest.mark.parametrize("sort_value,tiebreaker", [
+    (datetime(2024, 5, 1, 12, 30, 15, 123000, tzinfo=timezone.utc), ObjectId("65f1c2a4e4b0a1b2c3d4e5f6")),
+    (42, "user-7"),
+    (99.5, 3),
+    ("Mumbai", None),
+])
+def test_cursor_round_trip(sort_value, tiebreaker):
+    cursor = encode_cursor(sort_value, tiebreaker)
+
+    assert isinstance(cursor, str)
+    assert decode_cursor(cursor) == (sort_value, tiebreaker)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("a/b+c?" * 10, ObjectId())
+
+    assert not set(cursor) & set("/+?&")
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "W10=", "eyJhIjoxfQ==", "%%%"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_keyset_filter_descending():
+    created_at = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    oid = ObjectId()
+    query = {"user_id": "u1"}
+
+    result = keyset_filter(query, encode_cursor(created_at, oid), "created_at")
+
+    assert result == {"$and": [query, {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": oid}}
+    ]}]}
+
+
+def test_keyset_filter_ascending_with_custom_tiebreaker():
+    result = keyset_filter({}, encode_cursor(10, "u5"), "rank", sort_order=1, tiebreak_field="user_id")
+
+    assert result["$and"][1] == {"$or": [
+        {"rank": {"$gt": 10}},
+        {"rank": 10, "user_id": {"$gt": "u5"}}
+    ]}
+
+
+def test_keyset_filter_rejects_malformed_cursor():
+    with pytest.raises(ValueError):
+        keyset_filter({}, "garbage", "created_at")
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from reminder_scheduler import ReminderScheduler
+
+NEW_YORK = {"daily_reminders": True, "reminder_time": "19:00", "timezone": "America/New_York"}
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("after,expected", [
+    # Spring forward (2024-03-10): 19:00 EST (UTC-5) the day before, 19:00 EDT (UTC-4) from then on
+    (utc(2024, 3, 9, 23, 30), utc(2024, 3, 10, 0, 0)),
+    (utc(2024, 3, 10, 0, 0), utc(2024, 3, 10, 23, 0)),
+    (utc(2024, 3, 10, 23, 0), utc(2024, 3, 11, 23, 0)),
+    # Fall back (2024-11-03): 19:00 EDT the day before, 19:00 EST on the day
+    (utc(2024, 11, 2, 22, 0), utc(2024, 11, 2, 23, 0)),
+    (utc(2024, 11, 2, 23, 0), utc(2024, 11, 4, 0, 0)),
+    (utc(2024, 11, 4, 0, 0), utc(2024, 11, 5, 0, 0)),
+])
+def test_next_slot_keeps_local_time_across_dst(after, expected):
+    assert ReminderScheduler().next_slot(NEW_YORK, after) == expected
+
+
+def test_next_slot_in_skipped_hour_still_advances():
+    scheduler = ReminderScheduler()
+    preferences = {**NEW_YORK, "reminder_time": "02:30"}  # does not exist on 2024-03-10
+
+    slot = scheduler.next_slot(preferences, utc(2024, 3, 10, 5, 0))
+
+    assert slot > utc(2024, 3, 10, 5, 0)
+    assert slot == utc(2024, 3, 10, 7, 30)  # 03:30 EDT
+    assert scheduler.next_slot(preferences, slot) == utc(2024, 3, 11, 6, 30)
+
+
+def test_next_slot_in_repeated_hour_fires_once():
+    scheduler = ReminderScheduler()
+    preferences = {**NEW_YORK, "reminder_time": "01:30"}  # happens twice on 2024-11-03
+
+    first = scheduler.next_slot(preferences, utc(2024, 11, 3, 4, 0))
+    second = scheduler.next_slot(preferences, first)
+
+    assert first == utc(2024, 11, 3, 5, 30)  # 01:30 EDT
+    assert second == utc(2024, 11, 4, 6, 30)  # 01:30 EST the next day
+
+
+def test_next_slot_rounds_down_to_bucket():
+    preferences = {**NEW_YORK, "reminder_time": "19:14"}
+
+    assert ReminderScheduler(bucket_minutes=15).next_slot(preferences, utc(2024, 6, 1)) == utc(2024, 6, 1, 23, 0)
+
+
+@pytest.mark.parametrize("preferences", [
+    {"daily_reminders": False},
+    {**NEW_YORK, "streak_reminders": False},
+    {**NEW_YORK, "reminder_time": "7pm"},
+])
+def test_next_slot_none_when_off_or_invalid(preferences):
+    assert ReminderScheduler().next_slot(preferences, utc(2024, 6, 1)) is None
+
+
+def test_unknown_timezone_falls_back_to_default():
+    preferences = {**NEW_YORK, "timezone": "Mars/Olympus_Mons"}
+
+    assert ReminderScheduler().next_slot(preferences, utc(2024, 6, 1)) == utc(2024, 6, 1, 19, 0)